@@ -0,0 +1,162 @@
+"""Offline batch mode: replay a JSONL workload of user queries through the chatbot.
+
+Each input line is a JSON object with a "query" and optionally an "id" and a "session_id".
+Queries sharing a session_id run in order within one conversation; independent sessions
+run in parallel. Results are written as JSONL and nothing is printed to stdout.
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from chatbot import ChatResources, EcommerceChatbot, add_chat_arguments, apply_chat_arguments, load_resources
+from metrics import summarize_latencies
+from tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_workload(path: str) -> List[Dict[str, Any]]:
+    """Read query rows from a JSONL file, skipping blank lines."""
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            query = row.get('query') or row.get('message')
+            if not query:
+                raise ValueError(f"{path}:{line_number}: row has no 'query' field")
+            rows.append(dict(row, query=query, id=row.get('id', line_number)))
+    return rows
+
+
+def group_sessions(rows: Iterable[Dict[str, Any]]) -> "OrderedDict[str, List[Dict[str, Any]]]":
+    """Group rows by session_id; rows without one each get a session of their own."""
+    sessions: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for row in rows:
+        session_id = str(row.get('session_id') or f"row-{row['id']}")
+        sessions.setdefault(session_id, []).append(row)
+    return sessions
+
+
+class BatchRunner:
+    """Runs sessions concurrently on shared resources and streams results to a JSONL file."""
+
+    def __init__(self, resources: ChatResources, concurrency: int = 4):
+        self.resources = resources
+        self.concurrency = concurrency
+        self._write_lock = threading.Lock()
+        self.results: List[Dict[str, Any]] = []
+
+    def _run_session(self, session_id: str, rows: List[Dict[str, Any]], out) -> None:
+        transcript: List[str] = []
+        chatbot = EcommerceChatbot(output=transcript.append, resources=self.resources)
+        for row in rows:
+            transcript.clear()
+            result = {'id': row['id'], 'session_id': session_id, 'query': row['query']}
+            try:
+                turn = chatbot.process_user_input(row['query'])
+                result.update({
+                    'actions': turn.actions,
+                    'retrieved_ids': turn.retrieved_ids,
+                    'final_message': turn.final_message,
+                    'prompt_tokens': turn.prompt_tokens,
+                    'completion_tokens': turn.completion_tokens,
+                    'stage_seconds': turn.stage_seconds,
+                    'total_seconds': turn.total_seconds,
+                    'turn_kind': turn.turn_kind,
+                    'model_tier': turn.model_tier,
+                    'routing_saved_usd': turn.routing_saved_usd,
+                    'transcript': list(transcript),
+                    'error': None,
+                })
+            except Exception as e:
+                logger.exception("Query %s in session %s failed", row['id'], session_id)
+                result.update({'error': str(e), 'total_seconds': None})
+
+            with self._write_lock:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                self.results.append(result)
+
+    def run(self, rows: List[Dict[str, Any]], output_path: str) -> Dict[str, Any]:
+        """Run every row and return a throughput and latency summary."""
+        sessions = group_sessions(rows)
+        started = time.perf_counter()
+        with open(output_path, 'w', encoding='utf-8') as out:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [executor.submit(self._run_session, session_id, session_rows, out)
+                           for session_id, session_rows in sessions.items()]
+                for future in futures:
+                    future.result()
+        wall_seconds = time.perf_counter() - started
+        return summarize_results(self.results, wall_seconds, len(sessions))
+
+
+def summarize_results(results: List[Dict[str, Any]], wall_seconds: float, session_count: int) -> Dict[str, Any]:
+    """Throughput, token totals and latency percentiles (overall and per stage)."""
+    completed = [result for result in results if result.get('error') is None]
+    stage_latencies: Dict[str, List[float]] = {}
+    for result in completed:
+        for stage, seconds in result['stage_seconds'].items():
+            stage_latencies.setdefault(stage, []).append(seconds)
+
+    return {
+        'queries': len(results),
+        'sessions': session_count,
+        'errors': len(results) - len(completed),
+        'wall_seconds': wall_seconds,
+        'queries_per_second': len(results) / wall_seconds if wall_seconds else 0.0,
+        'prompt_tokens': sum(result['prompt_tokens'] for result in completed),
+        'completion_tokens': sum(result['completion_tokens'] for result in completed),
+        'avg_documents_per_turn': (sum(len(result['retrieved_ids']) for result in completed) / len(completed)
+                                   if completed else 0.0),
+        'model_tiers': dict(Counter(result['model_tier'] for result in completed if result.get('model_tier'))),
+        'routing_saved_usd': sum(result.get('routing_saved_usd', 0.0) for result in completed),
+        'latency_seconds': summarize_latencies([result['total_seconds'] for result in completed]),
+        'stage_latency_seconds': {stage: summarize_latencies(values)
+                                  for stage, values in sorted(stage_latencies.items())},
+        'span_latency_seconds': tracer.latency_summary(),
+    }
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 4,
+              resources: Optional[ChatResources] = None) -> Dict[str, Any]:
+    """Replay a JSONL workload and write per-query results plus a summary."""
+    rows = read_workload(input_path)
+    runner = BatchRunner(resources or load_resources(), concurrency=concurrency)
+    return runner.run(rows, output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a JSONL query workload through the E-commerce AI Chatbot")
+    parser.add_argument("input", help="JSONL file with one {\"query\": ...} object per line")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="Where to write per-query results")
+    parser.add_argument("--summary", help="Where to write the run summary (default: <output>.summary.json)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Sessions to run in parallel")
+    add_chat_arguments(parser)
+    args = parser.parse_args()
+
+    # Progress and the summary go to stderr via logging; stdout stays untouched
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    apply_chat_arguments(args)
+
+    summary = run_batch(args.input, args.output, concurrency=args.concurrency)
+    summary_path = args.summary or f"{args.output}.summary.json"
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    logger.info("Ran %d queries in %d sessions in %.1fs (%.2f queries/s), p50=%.2fs p95=%.2fs, summary in %s",
+                summary['queries'], summary['sessions'], summary['wall_seconds'], summary['queries_per_second'],
+                summary['latency_seconds']['p50'], summary['latency_seconds']['p95'], summary_path)
+
+
+if __name__ == "__main__":
+    main()
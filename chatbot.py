@@ -1,11 +1,29 @@
+import json
+import sys
+import time
 import yaml
 import argparse
-from typing import Dict, List, Any, Optional, Protocol, Union
-from gemini_config import configure_gemini
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Any, Optional, Protocol, Union
+from gemini_config import MODEL_BACKENDS, configure_gemini, configure_light_model
 from text_utils import extract_yaml_from_markdown
-from chroma_db_config import get_chromadb
-from exceptions import ChatbotError, InvalidActionError, CollectionNotFoundError, GeminiAPIError
-from models import ActionType, CollectionType, GeminiResponse, QueryParameters, DisplayParameters, SummarizeParameters, ChatbotConfig
+from chroma_db_config import get_chromadb, get_embedding_function, get_query_embedder
+from chunking import COLLAPSE_KEYS, collapse_results
+from diversify import DIVERSITY_STRATEGIES, diversify_results
+from product_fields import fuse_field_results
+from retrieval_cutoff import RetrievalCutoff, apply_cutoff, load_cutoffs
+from review_join import ReviewJoinIndex, fetch_product_reviews, open_review_join
+from session_state import SessionState
+from index_versions import IndexManifest, IndexWatcher
+from model_router import ModelRouter, RouteDecision, template_reply
+from exceptions import ChatbotError, InvalidActionError, CollectionNotFoundError, GeminiAPIError, RateLimitError
+from metrics import registry
+from profiling import PROFILE_MODES, profiler
+from plan_cache import SemanticPlanCache, is_context_free
+from summarizer import MapReduceSummarizer
+from tracing import tracer
+from models import ActionType, CollectionType, GeminiResponse, QueryParameters, DisplayParameters, SummarizeParameters, ChatbotConfig, ModelTier, OutputMode, TurnRecord
 
 
 
@@ -20,10 +38,126 @@ class ActionHandler(Protocol):
         ...
 
 
+# Output sink used instead of print so served and batch sessions can capture replies
+OutputSink = Callable[[str], None]
+
+
 # Configuration instance
 config = ChatbotConfig()
 
 
+@dataclass
+class ChatResources:
+    """Models and collections shared by every chatbot session in a worker process."""
+    main_model: Any
+    summarization_model: Any
+    client: Any
+    product_meta_collection: Any
+    product_review_collection: Any
+    plan_cache: Optional[SemanticPlanCache] = None
+    embedding_function: Any = None
+    retrieval_cutoffs: Optional[Dict[str, RetrievalCutoff]] = None
+    light_model: Any = None
+    router: Optional[ModelRouter] = None
+    review_join: Optional[ReviewJoinIndex] = None
+
+
+def create_plan_cache(embedding_function: Any = None) -> Optional[SemanticPlanCache]:
+    """Create the semantic plan cache configured in ChatbotConfig, or None when disabled."""
+    if not config.plan_cache_enabled:
+        return None
+    return SemanticPlanCache(embedding_function or get_embedding_function(),
+                             similarity_threshold=config.plan_cache_similarity,
+                             max_entries=config.plan_cache_max_entries,
+                             ttl_seconds=config.plan_cache_ttl_seconds)
+
+
+def create_retrieval_cutoffs() -> Dict[str, RetrievalCutoff]:
+    """Per-collection distance cutoffs from config.retrieval_cutoff_file, or none."""
+    return load_cutoffs(config.retrieval_cutoff_file) if config.retrieval_cutoff_file else {}
+
+
+def create_router() -> tuple:
+    """Light planner model and router when config.model_routing is set, else (None, None)."""
+    if not config.model_routing:
+        return None, None
+    light_model = configure_light_model(output_mode=config.output_mode, backend=config.model_backend)
+    return light_model, ModelRouter(latency_budget_seconds=config.routing_latency_budget_seconds,
+                                    cost_budget_usd=config.routing_cost_budget_usd,
+                                    max_words=config.routing_max_words)
+
+
+def with_side_index(review_collection: Any, embedding_function: Any) -> Any:
+    """Wrap the review collection in its quantized side index when config.review_side_index is set."""
+    if not config.review_side_index:
+        return review_collection
+    # Imported lazily: the side index needs numpy, which plain Chroma sessions do not
+    from quantized_index import QuantizedCollection, QuantizedIndex
+    return QuantizedCollection(review_collection, QuantizedIndex(config.review_side_index),
+                               embedding_function=embedding_function,
+                               rescore_factor=config.side_index_rescore_factor)
+
+
+def open_collections(path: Optional[str], embedding_function: Any) -> tuple:
+    """Client and collections of the index version at path (the active one when None), as sessions use them.
+
+    Startup and index swaps both go through here, so the review side index is never dropped.
+    """
+    client, product_meta_collection, product_review_collection = get_chromadb(path)
+    return client, product_meta_collection, with_side_index(product_review_collection, embedding_function)
+
+
+def load_resources() -> ChatResources:
+    """Configure Gemini and open ChromaDB once so sessions can share them.
+
+    With config.query_embed_wait_ms > 0 the sessions share a micro-batching query embedder, so
+    concurrent turns embed their queries in one batch.
+    """
+    main_model, summarization_model = configure_gemini(output_mode=config.output_mode, backend=config.model_backend)
+    if config.query_embed_wait_ms > 0:
+        embedding_function = get_query_embedder(config.query_embed_batch_size, config.query_embed_wait_ms / 1000)
+    else:
+        embedding_function = get_embedding_function()
+    client, product_meta_collection, product_review_collection = open_collections(None, embedding_function)
+    light_model, router = create_router()
+    return ChatResources(main_model, summarization_model, client,
+                         product_meta_collection, product_review_collection,
+                         plan_cache=create_plan_cache(embedding_function),
+                         embedding_function=embedding_function,
+                         retrieval_cutoffs=create_retrieval_cutoffs(),
+                         light_model=light_model, router=router,
+                         review_join=open_review_join(IndexManifest().active_path()))
+
+
+def history_to_records(conversation: Any) -> List[Dict[str, str]]:
+    """Convert a Gemini chat history into plain {role, text} records for a session store."""
+    records = []
+    for content in conversation.history:
+        text = "".join(getattr(part, 'text', '') for part in content.parts)
+        records.append({'role': content.role, 'text': text})
+    return records
+
+
+def records_to_history(records: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Convert stored {role, text} records back into Gemini chat history entries."""
+    return [{'role': record['role'], 'parts': [record['text']]} for record in records]
+
+
+def state_to_history(state: SessionState) -> List[Dict[str, Any]]:
+    """Rebuild Gemini chat history from a compact session state, without any RAG payloads."""
+    history = []
+    context = state.context_note()
+    if context:
+        history.append({'role': 'user', 'parts': [context]})
+        history.append({'role': 'model', 'parts': [format_response(
+            GeminiResponse(action=ActionType.DISPLAY, parameters={"message": "Noted."}))]})
+    for digest in state.turns:
+        history.append({'role': 'user', 'parts': [digest.user]})
+        history.append({'role': 'model', 'parts': [format_response(
+            GeminiResponse(action=ActionType.DISPLAY, parameters={"message": digest.reply}))]})
+    return history
+
+
 def parse_yaml_response(gemini_response: str) -> GeminiResponse:
     """Parse YAML from Gemini response and return structured data."""
     cleaned_response = extract_yaml_from_markdown(gemini_response)
@@ -55,35 +189,140 @@ def parse_yaml_response(gemini_response: str) -> GeminiResponse:
 
 def _fallback_parse_response(gemini_response: str) -> GeminiResponse:
     """Fallback parsing when YAML structure is invalid."""
+    # A fallback is a parse failure even though no exception escapes
+    _parse_failures(OutputMode.YAML).inc()
     # Simple fallback: assume it's a display action with the raw response as message
     return GeminiResponse(
         action=ActionType.DISPLAY,
         parameters={
             'message': f"I received your request but had trouble processing it. Here's what I got: {gemini_response[:200]}",
             'needs_refinement': True
-        }
+        },
+        fallback=True
     )
 
 
-def display_token_usage(usage_metadata: Any, label: str = "") -> None:
+def _parse_failures(mode: OutputMode):
+    return registry.counter("chatbot_parse_failures_total", "Planner responses that failed to parse",
+                            labels={"mode": mode.value})
+
+
+def validate_response(raw_data: Any) -> GeminiResponse:
+    """Validate decoded JSON into a GeminiResponse using the action parameter dataclasses."""
+    if not isinstance(raw_data, dict):
+        raise InvalidActionError("Response must be a JSON object")
+    try:
+        action = ActionType(str(raw_data.get('action', '')).strip().upper())
+    except ValueError:
+        raise InvalidActionError(f"Unknown action '{raw_data.get('action')}'")
+
+    raw_parameters = raw_data.get('parameters') or {}
+    if not isinstance(raw_parameters, dict):
+        raise InvalidActionError(f"Parameters for {action.value} must be an object")
+
+    try:
+        if action == ActionType.QUERY:
+            validated = QueryParameters(
+                query_text=raw_parameters['query_text'],
+                collection=CollectionType(raw_parameters['collection']),
+                n_results=int(raw_parameters.get('n_results', config.default_query_results)),
+                parent_asins=raw_parameters.get('parent_asins')
+            )
+            if not validated.query_text.strip():
+                raise ValueError("query_text is empty")
+            if validated.parent_asins is not None and not isinstance(validated.parent_asins, list):
+                raise ValueError("parent_asins must be a list")
+            parameters = {key: value for key, value in asdict(validated).items() if value is not None}
+            parameters["collection"] = validated.collection.value
+        elif action == ActionType.DISPLAY:
+            validated = DisplayParameters(
+                message=raw_parameters['message'],
+                data=raw_parameters.get('data'),
+                snippet_source=raw_parameters.get('snippet_source'),
+                needs_refinement=bool(raw_parameters.get('needs_refinement', False))
+            )
+            parameters = {key: value for key, value in asdict(validated).items() if value is not None}
+        else:
+            validated = SummarizeParameters(text_to_summarize=raw_parameters['text_to_summarize'])
+            parameters = asdict(validated)
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidActionError(f"Invalid parameters for {action.value}: {e}") from e
+
+    return GeminiResponse(action=action, parameters=parameters)
+
+
+def parse_json_response(gemini_response: str) -> GeminiResponse:
+    """Parse a schema-constrained JSON response; raises InvalidActionError so the turn is retried."""
+    text = gemini_response.strip()
+    if text.startswith('```'):
+        # Tolerate a fenced block even though JSON mode should not produce one
+        text = text.split('\n', 1)[-1].rsplit('```', 1)[0]
+    try:
+        raw_data = json.loads(text)
+    except ValueError as e:
+        _parse_failures(OutputMode.JSON).inc()
+        raise InvalidActionError(f"Response is not valid JSON: {e}") from e
+    try:
+        return validate_response(raw_data)
+    except InvalidActionError:
+        _parse_failures(OutputMode.JSON).inc()
+        raise
+
+
+def parse_response(gemini_response: str) -> GeminiResponse:
+    """Parse a planner response in the configured output mode."""
+    registry.counter("chatbot_parse_attempts_total", "Planner responses parsed",
+                     labels={"mode": config.output_mode.value}).inc()
+    if config.output_mode == OutputMode.JSON:
+        return parse_json_response(gemini_response)
+    return parse_yaml_response(gemini_response)
+
+
+def format_response(response: GeminiResponse) -> str:
+    """Planner response text for a plan made without the planner, in the configured output mode."""
+    body = {"action": response.action.value, "parameters": response.parameters}
+    if config.output_mode == OutputMode.JSON:
+        return json.dumps(body)
+    return yaml.safe_dump(body, sort_keys=False)
+
+
+def response_format_name() -> str:
+    """Name of the response format the planner is asked for, used inside prompts."""
+    return config.output_mode.value.upper()
+
+
+def flatten_ids(results: Any) -> List[str]:
+    """Flatten the per-query id lists of a Chroma query result."""
+    if not isinstance(results, dict):
+        return []
+    return [doc_id for query_ids in results.get('ids') or [] for doc_id in query_ids or []]
+
+
+def display_token_usage(usage_metadata: Any, label: str = "", output: OutputSink = print) -> None:
     """Display token usage information."""
     if usage_metadata:
         label_text = f" ({label})" if label else ""
-        print(f"Token Usage{label_text}: Prompt={usage_metadata.prompt_token_count}, "
+        output(f"Token Usage{label_text}: Prompt={usage_metadata.prompt_token_count}, "
               f"Completion={usage_metadata.candidates_token_count}")
 
 
+def display_stage_timings(turn: TurnRecord, output: OutputSink = print) -> None:
+    """Display how long each pipeline stage of a turn took."""
+    stages = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in turn.stage_seconds.items())
+    output(f"Turn latency: {turn.total_seconds * 1000:.0f}ms ({stages})")
+
+
 def display_results(message: str, data: Optional[List[Any]] = None, snippet_source: Optional[str] = None,
-                   needs_refinement: bool = False) -> None:
+                   needs_refinement: bool = False, output: OutputSink = print) -> None:
     """Display chatbot response and handle refinement if needed."""
-    print(f"\nChatbot: {message}")
+    output(f"\nChatbot: {message}")
     if data:
         for item in data:
             if isinstance(item, dict) and item.get('type') == 'snippet':
                 source = item.get('source', snippet_source or 'RAG')
-                print(f"  Snippet from {source}: \"{item.get('content')}\"")
+                output(f"  Snippet from {source}: \"{item.get('content')}\"")
             else:
-                print(f"- {item}")
+                output(f"- {item}")
 
     if needs_refinement:
         # For iterative RAG
@@ -93,17 +332,157 @@ def display_results(message: str, data: Optional[List[Any]] = None, snippet_sour
         else:
             refinement_msg = ("I couldn't find specific results matching your query. "
                              "Could you please rephrase or provide more details?")
-        print(f"\nChatbot: {refinement_msg}")
+        output(f"\nChatbot: {refinement_msg}")
 
 
 class EcommerceChatbot:
     """E-commerce chatbot using Gemini and ChromaDB for RAG."""
 
-    def __init__(self, debug: bool = False):
+    def __init__(self, debug: bool = False, output: Optional[OutputSink] = None,
+                 resources: Optional[ChatResources] = None,
+                 history: Optional[List[Dict[str, str]]] = None,
+                 state: Optional[SessionState] = None):
         self.debug = debug
-        self.main_model, self.summarization_model = configure_gemini()
-        self.client, self.product_meta_collection, self.product_review_collection = get_chromadb()
-        self.conversation = self.main_model.start_chat()
+        self.output = output or print
+        if resources is None:
+            # Standalone session: load models and collections for this chatbot only
+            self.main_model, self.summarization_model = configure_gemini(output_mode=config.output_mode, backend=config.model_backend)
+            self.embedding_function = get_embedding_function()
+            self.client, self.product_meta_collection, self.product_review_collection = open_collections(
+                None, self.embedding_function)
+            self.plan_cache = create_plan_cache(self.embedding_function)
+            self.retrieval_cutoffs = create_retrieval_cutoffs()
+            self.light_model, self.router = create_router()
+            self.review_join = open_review_join(IndexManifest().active_path())
+        else:
+            self.main_model = resources.main_model
+            self.summarization_model = resources.summarization_model
+            self.client = resources.client
+            self.product_meta_collection = resources.product_meta_collection
+            self.product_review_collection = resources.product_review_collection
+            self.plan_cache = resources.plan_cache
+            self.embedding_function = resources.embedding_function
+            self.retrieval_cutoffs = resources.retrieval_cutoffs or {}
+            self.light_model, self.router = resources.light_model, resources.router
+            self.review_join = resources.review_join
+        self.summarizer = MapReduceSummarizer(self.summarization_model,
+                                              chunk_tokens=config.summary_chunk_tokens,
+                                              max_workers=config.summary_max_workers)
+        self.turn: Optional[TurnRecord] = None
+        # Compact state of the conversation, updated after every turn for session stores
+        self.state = state or SessionState()
+        if history:
+            self.conversation = self.main_model.start_chat(history=records_to_history(history))
+        elif state is not None:
+            self.conversation = self.main_model.start_chat(history=state_to_history(state))
+        else:
+            self.conversation = self.main_model.start_chat()
+
+    @contextmanager
+    def _stage(self, name: str, **attributes: Any):
+        """Time a pipeline stage of the current turn and trace it as a span."""
+        started = time.perf_counter()
+        try:
+            with tracer.span(name, **attributes), profiler.section(name):
+                yield
+        finally:
+            if self.turn is not None:
+                elapsed = time.perf_counter() - started
+                self.turn.stage_seconds[name] = self.turn.stage_seconds.get(name, 0.0) + elapsed
+
+    def _record_usage(self, usage_metadata: Any) -> None:
+        """Add a response's token counts to the current turn."""
+        if self.turn is None or not usage_metadata:
+            return
+        self.turn.prompt_tokens += getattr(usage_metadata, 'prompt_token_count', 0) or 0
+        self.turn.completion_tokens += getattr(usage_metadata, 'candidates_token_count', 0) or 0
+
+    def _record_results(self, results: Any) -> None:
+        if self.turn is not None:
+            self.turn.retrieved_ids.extend(flatten_ids(results))
+
+    def _query_collection(self, collection: Any, query_text: str, n_results: int) -> Any:
+        """Query a collection, tracing query embedding and the vector search as separate spans.
+
+        With config.collapse_hits_by or config.diversify_strategy set, n_results *
+        config.retrieval_overfetch hits are fetched, collapsed to the best hit per review
+        (chunked indexes) or product, and diversified across products down to n_results.
+        With config.meta_field_fusion, product_meta hits are instead fused across the
+        title/features/description documents of each product (see product_fields.py).
+        Finally, hits beyond the collection's calibrated distance cutoff (config.retrieval_cutoff_file)
+        are dropped; the distances before the cut are traced for calibration.
+        """
+        collection_name = getattr(collection, 'name', '')
+        collapse_by, strategy = config.collapse_hits_by, config.diversify_strategy
+        fuse_fields = config.meta_field_fusion and collection_name == "product_meta"
+        if fuse_fields:
+            # Fusion already leaves one hit per product
+            collapse_by = None
+        fetch = n_results * config.retrieval_overfetch if collapse_by or strategy or fuse_fields else n_results
+        query_options = {"n_results": fetch}
+        if strategy == "mmr":
+            query_options["include"] = ["documents", "metadatas", "distances", "embeddings"]
+        if self.embedding_function is None:
+            # No local embedder: Chroma embeds inside the query, so only the total is visible
+            with tracer.span("search", collection=collection_name, n_results=fetch, embedded_by="chroma"):
+                results = collection.query(query_texts=[query_text], **query_options)
+        else:
+            with tracer.span("embed", collection=collection_name):
+                query_embeddings = [list(embedding) for embedding in self.embedding_function([query_text])]
+            with tracer.span("search", collection=collection_name, n_results=fetch):
+                results = collection.query(query_embeddings=query_embeddings, **query_options)
+
+        if not isinstance(results, dict):
+            return results
+        if fuse_fields:
+            with tracer.span("fuse_fields", candidates=len((results.get("ids") or [[]])[0])):
+                results = fuse_field_results(results, fetch if strategy else n_results, config.meta_field_weights)
+        if collapse_by:
+            results = collapse_results(results, fetch if strategy else n_results, collapse_by)
+        if strategy:
+            with tracer.span("diversify", strategy=strategy, candidates=len((results.get("ids") or [[]])[0])):
+                results = diversify_results(results, n_results, strategy, per_group=config.diversify_per_product,
+                                            mmr_lambda=config.diversify_lambda)
+        if strategy == "mmr":
+            # Embeddings were only fetched for re-ranking; keep them out of the prompt
+            results["embeddings"] = None
+        return self._cut_results(collection_name, results)
+
+    def _product_reviews(self, collection: Any, query_text: str, parent_asins: List[str],
+                         n_results: int) -> Dict[str, Any]:
+        """Reviews of the given products only, nearest to query_text when an embedder is available.
+
+        Ranked results go through the same distance cutoff as _query_collection.
+        """
+        with tracer.span("join_fetch", products=len(parent_asins), n_results=n_results,
+                         join_index=self.review_join is not None):
+            query_embedding = None
+            if self.embedding_function is not None:
+                query_embedding = list(self.embedding_function([query_text])[0])
+            results = fetch_product_reviews(collection, parent_asins, n_results,
+                                            join_index=self.review_join, query_embedding=query_embedding)
+        registry.counter("chatbot_join_fetches_total", "Review fetches scoped to products by parent_asin").inc()
+        return self._cut_results(getattr(collection, 'name', ''), results)
+
+    def _cut_results(self, collection_name: str, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop hits beyond the collection's distance cutoff, if one is configured."""
+        distances = (results.get("distances") or [None])[0]
+        if distances is None:
+            return results
+        cutoff = self.retrieval_cutoffs.get(collection_name)
+        with tracer.span("cutoff", collection=collection_name, distances=[round(float(d), 4) for d in distances]) as span:
+            if cutoff is not None:
+                results = apply_cutoff(results, cutoff)
+            span.set_attribute("kept", len(results["distances"][0]))
+        return results
+
+    def use_index(self, path: str) -> None:
+        """Switch this session to the collections of the index version at path."""
+        self.client, self.product_meta_collection, self.product_review_collection = open_collections(
+            path, self.embedding_function)
+        self.review_join = open_review_join(path)
+        if self.debug:
+            self.output(f"DEBUG: Switched to index {path}")
 
     def get_collection(self, collection_type: CollectionType) -> Any:
         """Get the appropriate collection based on enum type."""
@@ -121,15 +500,24 @@ class EcommerceChatbot:
             query_params = QueryParameters(
                 query_text=parameters.get('query_text', ''),
                 collection=CollectionType(parameters.get('collection', '')),
-                n_results=parameters.get('n_results', config.default_query_results)
+                n_results=parameters.get('n_results', config.default_query_results),
+                parent_asins=parameters.get('parent_asins')
             )
             collection = self.get_collection(query_params.collection)
         except (ValueError, CollectionNotFoundError) as e:
-            print(f"Error: {e}")
+            self.output(f"Error: {e}")
             return
 
-        print(f"\nQuerying ChromaDB for: '{query_params.query_text}' in '{query_params.collection.value}'\n")
-        results = collection.query(query_texts=[query_params.query_text], n_results=query_params.n_results)
+        self.output(f"\nQuerying ChromaDB for: '{query_params.query_text}' in '{query_params.collection.value}'\n")
+        if self.turn is not None:
+            self.turn.queries.append(query_params.query_text)
+        with self._stage("retrieval"):
+            if query_params.parent_asins and query_params.collection == CollectionType.PRODUCT_REVIEW:
+                results = self._product_reviews(collection, query_params.query_text, query_params.parent_asins,
+                                                query_params.n_results)
+            else:
+                results = self._query_collection(collection, query_params.query_text, query_params.n_results)
+        self._record_results(results)
 
         # Send RAG results back to Gemini for processing
         rag_prompt = f"""
@@ -142,18 +530,23 @@ class EcommerceChatbot:
         User's last query: "{query_params.query_text}"
         RAG Results: {results}
 
-        Response MUST be in YAML format.
+        Response MUST be in {response_format_name()} format.
         """
 
-        self.conversation.send_message(rag_prompt)
+        with self._stage("rag_followup"):
+            self.conversation.send_message(rag_prompt)
         gemini_response_after_rag = self.conversation.last.text
+        self._record_usage(self.conversation.last.usage_metadata)
         if self.debug:
-            print(f"\nGemini Response (after RAG):\n{gemini_response_after_rag}\n")
+            self.output(f"\nGemini Response (after RAG):\n{gemini_response_after_rag}\n")
 
         try:
-            response = parse_yaml_response(gemini_response_after_rag)
+            with self._stage("parse"):
+                response = parse_response(gemini_response_after_rag)
             action = response.action
             params = response.parameters
+            if self.turn is not None:
+                self.turn.actions.append(action.value)
 
             # Use strategy pattern - map actions to handlers
             action_handlers = {
@@ -168,9 +561,9 @@ class EcommerceChatbot:
                 raise InvalidActionError(f"Unknown action '{action.value}' after RAG processing.")
 
         except yaml.YAMLError as e:
-            print("I'm sorry, I encountered an issue processing the information after a search. Please try rephrasing your request.")
+            self.output("I'm sorry, I encountered an issue processing the information after a search. Please try rephrasing your request.")
         except Exception as e:
-            print("I'm sorry, an unexpected error occurred while processing your request. Please try again.")
+            self.output("I'm sorry, an unexpected error occurred while processing your request. Please try again.")
 
     def handle_display_action(self, parameters: Dict[str, Any]) -> None:
         """Handle DISPLAY action."""
@@ -189,10 +582,13 @@ class EcommerceChatbot:
             needs_refinement=needs_refinement
         )
 
-        display_results(display_params.message, display_params.data,
-                       display_params.snippet_source, display_params.needs_refinement)
-        if self.debug:
-            display_token_usage(self.conversation.last.usage_metadata, "DISPLAY")
+        with self._stage("display"):
+            display_results(display_params.message, display_params.data,
+                           display_params.snippet_source, display_params.needs_refinement, output=self.output)
+        if self.turn is not None:
+            self.turn.messages.append(display_params.message)
+        if self.debug and getattr(self.conversation, 'last', None) is not None:
+            display_token_usage(self.conversation.last.usage_metadata, "DISPLAY", output=self.output)
 
     def handle_summarize_action(self, parameters: Dict[str, Any], user_input: str) -> None:
         """Handle SUMMARIZE action with enhanced comprehensive querying for 'tell me more' requests."""
@@ -201,54 +597,58 @@ class EcommerceChatbot:
                 text_to_summarize=parameters.get('text_to_summarize', '')
             )
         except ValueError:
-            print("\nChatbot: I don't have any valid text to summarize. Please try rephrasing your request.")
+            self.output("\nChatbot: I don't have any valid text to summarize. Please try rephrasing your request.")
             return
 
         if not summarize_params.text_to_summarize.strip():
-            print("\nChatbot: I don't have any valid text to summarize. Please try rephrasing your request.")
+            self.output("\nChatbot: I don't have any valid text to summarize. Please try rephrasing your request.")
             return
 
         # Use AI to classify if this request needs comprehensive information
-        is_comprehensive_request = self._classify_comprehensive_request(summarize_params.text_to_summarize)
+        with self._stage("classification"):
+            is_comprehensive_request = self._classify_comprehensive_request(summarize_params.text_to_summarize)
 
+        summary_usage = None
         if is_comprehensive_request:
             # For comprehensive requests, gather extensive data from both collections
-            print("\nGathering comprehensive information for detailed summary...")
+            self.output("\nGathering comprehensive information for detailed summary...")
 
             try:
                 # Query product metadata with broader results
-                meta_results = self.product_meta_collection.query(
-                    query_texts=[user_input],
-                    n_results=config.comprehensive_meta_results
-                )
+                with self._stage("retrieval"):
+                    meta_results = self._query_collection(
+                        self.product_meta_collection, user_input, config.comprehensive_meta_results)
 
-                # Query product reviews for detailed feedback
-                review_results = self.product_review_collection.query(
-                    query_texts=[user_input],
-                    n_results=config.comprehensive_review_results
-                )
+                    # Query product reviews for detailed feedback
+                    review_results = self._query_collection(
+                        self.product_review_collection, user_input, config.comprehensive_review_results)
+                self._record_results(meta_results)
+                self._record_results(review_results)
 
                 # Validate query results structure
                 if not isinstance(meta_results, dict) or not isinstance(review_results, dict):
                     if self.debug:
-                        print(f"DEBUG: Invalid query results structure - meta: {type(meta_results)}, review: {type(review_results)}")
+                        self.output(f"DEBUG: Invalid query results structure - meta: {type(meta_results)}, review: {type(review_results)}")
                     raise GeminiAPIError("Invalid query results structure")
 
                 meta_count = len(meta_results.get('documents', []))
                 review_count = len(review_results.get('documents', []))
 
                 if self.debug:
-                    print(f"DEBUG: Found {meta_count} meta results and {review_count} review results")
-                    print(f"DEBUG: Meta results keys: {list(meta_results.keys())}")
-                    print(f"DEBUG: Review results keys: {list(review_results.keys())}")
+                    self.output(f"DEBUG: Found {meta_count} meta results and {review_count} review results")
+                    self.output(f"DEBUG: Meta results keys: {list(meta_results.keys())}")
+                    self.output(f"DEBUG: Review results keys: {list(review_results.keys())}")
+
+                use_map_reduce = False
 
                 # Check if we have any data
                 if meta_count == 0 and review_count == 0:
                     if self.debug:
-                        print("DEBUG: No data found, falling back to basic summarization")
-                    print("\nChatbot: I couldn't find detailed information about that product. Let me provide a basic summary instead.")
+                        self.output("DEBUG: No data found, falling back to basic summarization")
+                    self.output("\nChatbot: I couldn't find detailed information about that product. Let me provide a basic summary instead.")
                     # Fallback to regular summarization
-                    summary_response = self.summarization_model.generate_content(summarize_params.text_to_summarize.strip())
+                    with self._stage("summarization"):
+                        summary_response = self.summarization_model.generate_content(summarize_params.text_to_summarize.strip())
                 else:
                     # Combine data for concise, conversational summarization
                     comprehensive_data = f"""
@@ -261,53 +661,66 @@ Product Data ({meta_count} products, {review_count} reviews):
 Please provide a very brief, conversational summary in 3-4 sentences maximum that naturally answers the user's question. Focus on the most relevant insights and recommendations. Keep it concise and conversational, like you're chatting with a friend about products.
 """
 
-                    # Limit the prompt size to avoid token limits (rough estimate)
-                    max_length = 25000  # Conservative limit
-                    if len(comprehensive_data) > max_length:
-                        if self.debug:
-                            print(f"DEBUG: Truncating prompt from {len(comprehensive_data)} to {max_length} characters")
-                        comprehensive_data = comprehensive_data[:max_length] + "\n\n[Content truncated due to length]"
+                    # Past the prompt budget, summarize chunks in parallel instead of truncating
+                    use_map_reduce = len(comprehensive_data) > config.summary_prompt_budget_chars
 
-                print(f"\nGenerating concise summary from {meta_count} products and {review_count} reviews...")
+                self.output(f"\nGenerating concise summary from {meta_count} products and {review_count} reviews...")
 
                 try:
-                    summary_response = self.summarization_model.generate_content(comprehensive_data)
+                    if use_map_reduce:
+                        with self._stage("summarization"):
+                            result = self.summarizer.summarize(summarize_params.text_to_summarize, meta_results, review_results)
+                        summary_response = result.response
+                        # Every map and reduce call counts towards the turn, not only the final response
+                        summary_usage = result.usage_metadata
+                        if self.debug:
+                            self.output(f"DEBUG: Map-reduce over {result.chunk_count} chunks "
+                                        f"(map {result.map_seconds:.2f}s, reduce {result.reduce_seconds:.2f}s)")
+                    else:
+                        with self._stage("summarization"):
+                            summary_response = self.summarization_model.generate_content(comprehensive_data)
 
                     if self.debug:
-                        print(f"DEBUG: Comprehensive summary generated successfully")
+                        self.output(f"DEBUG: Comprehensive summary generated successfully")
 
                 except Exception as e:
                     if self.debug:
-                        print(f"DEBUG: Comprehensive summarization failed: {e}")
+                        self.output(f"DEBUG: Comprehensive summarization failed: {e}")
                     raise GeminiAPIError(f"Failed to generate comprehensive summary: {e}") from e
 
             except GeminiAPIError as e:
                 if self.debug:
-                    print(f"DEBUG: Falling back to basic summarization due to: {e}")
-                print(f"\nChatbot: I'm sorry, I encountered an issue gathering comprehensive data. Using basic summary instead.")
+                    self.output(f"DEBUG: Falling back to basic summarization due to: {e}")
+                self.output(f"\nChatbot: I'm sorry, I encountered an issue gathering comprehensive data. Using basic summary instead.")
                 # Fallback to basic summarization
                 try:
-                    summary_response = self.summarization_model.generate_content(summarize_params.text_to_summarize.strip())
+                    with self._stage("summarization"):
+                        summary_response = self.summarization_model.generate_content(summarize_params.text_to_summarize.strip())
                 except Exception as fallback_error:
                     if self.debug:
-                        print(f"DEBUG: Fallback summarization also failed: {fallback_error}")
-                    print("\nChatbot: I'm sorry, I'm having trouble generating any summary right now. Please try again later.")
+                        self.output(f"DEBUG: Fallback summarization also failed: {fallback_error}")
+                    self.output("\nChatbot: I'm sorry, I'm having trouble generating any summary right now. Please try again later.")
                     return
 
         else:
             # Standard summarization for regular cases
-            print(f"\nSummarizing text using a cheaper model...")
+            self.output(f"\nSummarizing text using a cheaper model...")
             try:
-                summary_response = self.summarization_model.generate_content(summarize_params.text_to_summarize.strip())
+                with self._stage("summarization"):
+                    summary_response = self.summarization_model.generate_content(summarize_params.text_to_summarize.strip())
             except Exception as e:
                 raise GeminiAPIError(f"Failed to generate summary: {e}") from e
 
         try:
-            print(f"\nChatbot (Summary): {summary_response.text}")
+            self.output(f"\nChatbot (Summary): {summary_response.text}")
+            if self.turn is not None:
+                self.turn.messages.append(summary_response.text)
+            usage_metadata = summary_usage or summary_response.usage_metadata
+            self._record_usage(usage_metadata)
             if self.debug:
-                display_token_usage(summary_response.usage_metadata, "Summarization")
+                display_token_usage(usage_metadata, "Summarization", output=self.output)
         except Exception as e:
-            print(f"\nChatbot: I'm sorry, I encountered an issue while summarizing the text. It might be too long or contain unsupported content.")
+            self.output(f"\nChatbot: I'm sorry, I encountered an issue while summarizing the text. It might be too long or contain unsupported content.")
 
     def _is_preference_discovery_response(self, message: str, data: Optional[List[Any]]) -> bool:
         """Detect if a DISPLAY response is a preference discovery list that shouldn't trigger refinement."""
@@ -365,37 +778,164 @@ User request: "{text.strip()}"
 Classification:"""
 
         try:
+            # Not the light planner: it carries the planner prompt and schema, so it would answer with a plan
             response = self.summarization_model.generate_content(classification_prompt)
+            self._record_usage(getattr(response, 'usage_metadata', None))
             result = response.text.strip().upper()
 
             # Debug logging (only in debug mode)
             if self.debug:
-                print(f"Classification result for '{text[:50]}...': {result}")
+                self.output(f"Classification result for '{text[:50]}...': {result}")
 
             return result == "COMPREHENSIVE"
 
         except Exception as e:
             # Fallback to simple string matching if AI classification fails
             if self.debug:
-                print(f"AI classification failed ({e}), using fallback method")
+                self.output(f"AI classification failed ({e}), using fallback method")
 
             fallback_keywords = ["tell me more", "more about", "more information",
                                "comprehensive", "detailed", "extensive", "what else"]
             return any(keyword in text.lower() for keyword in fallback_keywords)
 
-    def process_user_input(self, user_input: str) -> None:
-        """Process a single user input and handle all responses internally."""
+    def _lookup_cached_plan(self, user_input: str) -> tuple:
+        """Look up a cached plan for first-turn or context-free messages.
+
+        Returns (cached GeminiResponse or None, embedding or None); the embedding is reused
+        to cache the fresh plan on a miss.
+        """
+        if self.plan_cache is None:
+            return None, None
+        if self.conversation.history and not is_context_free(user_input):
+            return None, None
+
+        try:
+            embedding = self.plan_cache.embed(user_input)
+        except Exception as e:
+            if self.debug:
+                self.output(f"DEBUG: Plan cache embedding failed ({e}), calling Gemini")
+            return None, None
+
+        cached = self.plan_cache.get(embedding)
+        if cached is None:
+            return None, embedding
+
+        # Record the exchange so later turns still see it in the conversation history
+        self.conversation.history = list(self.conversation.history) + [
+            {'role': 'user', 'parts': [user_input]},
+            {'role': 'model', 'parts': [cached.response_text]},
+        ]
+        if self.debug:
+            self.output(f"DEBUG: Reusing cached plan for '{cached.user_input}' (hit rate {self.plan_cache.hit_rate:.0%})")
+        return GeminiResponse(action=cached.response.action, parameters=dict(cached.response.parameters)), embedding
+
+    def _route_turn(self, user_input: str) -> Optional[RouteDecision]:
+        """Pick the planning tier for this turn, or None when model routing is off."""
+        if self.router is None:
+            return None
+        route = self.router.route(user_input, self.conversation.history)
+        self.turn.turn_kind = route.kind.value
+        if self.debug:
+            self.output(f"DEBUG: Routing {route.kind.value} turn to the {route.tier.value} tier")
+        return route
+
+    def _record_route(self, route: Optional[RouteDecision], seconds: float, usage_metadata: Any = None) -> None:
+        if route is None:
+            return
+        saved_usd = self.router.record(route, seconds,
+                                       getattr(usage_metadata, 'prompt_token_count', 0) or 0,
+                                       getattr(usage_metadata, 'candidates_token_count', 0) or 0)
+        self.turn.model_tier = route.tier.value
+        self.turn.routing_saved_usd += saved_usd
+
+    def _template_plan(self, user_input: str, route: RouteDecision) -> GeminiResponse:
+        """Answer a greeting locally and record the exchange in the conversation history."""
+        response = GeminiResponse(action=ActionType.DISPLAY, parameters={"message": template_reply(user_input)})
+        self.conversation.history = list(self.conversation.history) + [
+            {'role': 'user', 'parts': [user_input]},
+            {'role': 'model', 'parts': [format_response(response)]},
+        ]
+        self._record_route(route, 0.0)
+        return response
+
+    def _plan(self, user_input: str, route: Optional[RouteDecision]) -> Any:
+        """Send the message to the routed planner; returns its last response."""
+        planner = self.conversation
+        if route is not None and route.tier == ModelTier.LIGHT:
+            planner = self.light_model.start_chat(history=list(self.conversation.history))
+        started = time.perf_counter()
+        with self._stage("planning", tier=route.tier.value if route else ModelTier.FULL.value):
+            response = planner.send_message(user_input)
+        self._record_route(route, time.perf_counter() - started, response.usage_metadata)
+        if planner is not self.conversation:
+            # Later turns, and the RAG follow-up on the full model, continue from the light exchange.
+            # Reading history clears planner.last, so the response is kept from send_message.
+            self.conversation.history = planner.history
+        return response
+
+    def process_user_input(self, user_input: str) -> TurnRecord:
+        """Process a single user input and handle all responses internally.
+
+        Returns the TurnRecord describing the turn (also kept as self.turn).
+        """
+        self.turn = TurnRecord(user_input=user_input)
+        started = time.perf_counter()
+        with tracer.span("turn", output_mode=config.output_mode.value) as span, profiler.section("turn"):
+            parse_retries = self._run_turn(user_input)
+            span.set_attribute("actions", ",".join(self.turn.actions))
+            span.set_attribute("parse_retries", parse_retries)
+            span.set_attribute("prompt_tokens", self.turn.prompt_tokens)
+            span.set_attribute("completion_tokens", self.turn.completion_tokens)
+            span.set_attribute("documents", len(self.turn.retrieved_ids))
+            if self.turn.model_tier:
+                span.set_attribute("model_tier", self.turn.model_tier)
+
+        registry.histogram("chatbot_parse_retries_per_turn", "Planner calls repeated because the response did not parse",
+                           labels={"mode": config.output_mode.value}, buckets=(0, 1, 2, 3, 5)).observe(parse_retries)
+        registry.histogram("chatbot_documents_per_turn", "Retrieved documents sent to Gemini per turn",
+                           buckets=(0, 1, 2, 5, 10, 20, 50)).observe(len(self.turn.retrieved_ids))
+        self.turn.total_seconds = time.perf_counter() - started
+        self.state.record_turn(self.turn)
+        if self.debug:
+            display_stage_timings(self.turn, output=self.output)
+        return self.turn
+
+    def _run_turn(self, user_input: str) -> int:
+        """Plan and handle one user message, retrying unparseable plans; returns the retry count."""
+        parse_retries = 0
+        route = None
         for retry_count in range(config.max_retries):
             try:
-                self.conversation.send_message(user_input)
-                gemini_response = self.conversation.last.text
+                response, plan_embedding = None, None
+                if retry_count == 0:
+                    route = self._route_turn(user_input)
+                    if route is not None and route.tier == ModelTier.TEMPLATE:
+                        response = self._template_plan(user_input, route)
+                    else:
+                        with self._stage("plan_cache"):
+                            response, plan_embedding = self._lookup_cached_plan(user_input)
+                elif route is not None and route.tier == ModelTier.LIGHT:
+                    # The light model's plan did not parse; let the full model try
+                    route = self.router.escalate(route)
+                if response is None:
+                    planned = self._plan(user_input, route)
+                    gemini_response = planned.text
+                    self._record_usage(planned.usage_metadata)
 
-                if self.debug:
-                    display_token_usage(self.conversation.last.usage_metadata)
+                    if self.debug:
+                        display_token_usage(planned.usage_metadata, output=self.output)
+
+                    with self._stage("parse"):
+                        response = parse_response(gemini_response)
+                    if response.fallback and route is not None and route.tier == ModelTier.LIGHT:
+                        # Never show the light model's raw output; re-plan on the full model instead
+                        raise InvalidActionError("Light planner response did not parse")
+                    if plan_embedding is not None and response.action == ActionType.QUERY:
+                        self.plan_cache.put(plan_embedding, user_input, gemini_response, response)
 
-                response = parse_yaml_response(gemini_response)
                 action = response.action
                 parameters = response.parameters
+                self.turn.actions.append(action.value)
 
                 # Use strategy pattern - map actions to handlers
                 action_handlers: Dict[ActionType, ActionHandler] = {
@@ -413,38 +953,120 @@ Classification:"""
                 break  # Successfully processed, exit retry loop
 
             except (yaml.YAMLError, InvalidActionError) as e:
-                print(f"Error parsing YAML response (Attempt {retry_count + 1}/{config.max_retries}): {e}")
+                parse_retries += 1
+                self.output(f"Error parsing {response_format_name()} response (Attempt {retry_count + 1}/{config.max_retries}): {e}")
                 if retry_count == config.max_retries - 1:
-                    print("Failed to get a proper YAML format after multiple retries.")
+                    self.output(f"Failed to get a proper {response_format_name()} format after multiple retries.")
+            except RateLimitError:
+                self.output("I'm sorry, I'm receiving too many requests right now. Please try again in a moment.")
+                break  # Retries with backoff already happened in the Gemini client
             except GeminiAPIError as e:
-                print(f"I'm sorry, I encountered an API error: {e}")
+                self.output(f"I'm sorry, I encountered an API error: {e}")
                 break  # Don't retry API errors
             except Exception as e:
-                print("I'm sorry, an unexpected error occurred while processing your request. Please try again.")
+                self.output("I'm sorry, an unexpected error occurred while processing your request. Please try again.")
                 break  # Don't retry unexpected errors
+        return parse_retries
 
     def start_chat(self) -> None:
         """Start the interactive chat session."""
-        print("Welcome to the E-commerce Chatbot! How can I help you today? Type 'exit' to terminate session.")
+        self.output("Welcome to the E-commerce Chatbot! How can I help you today? Type 'exit' to terminate session.")
+        # Pick up a newly activated index version between turns, never during one
+        index_watcher = IndexWatcher(IndexManifest(), self.use_index)
 
         while True:
             user_input = input("You: ")
             if user_input.lower() == config.exit_command:
-                print("Goodbye!")
+                self.output("Goodbye!")
                 break
 
+            index_watcher.check()
             self.process_user_input(user_input)
 
 
+def add_chat_arguments(parser: argparse.ArgumentParser) -> None:
+    """Model and retrieval options shared by the chatbot, server and batch runner command lines."""
+    parser.add_argument("--output-mode", choices=[mode.value for mode in OutputMode], default=config.output_mode.value,
+                        help="Ask the planner for free-form YAML or schema-constrained JSON")
+    parser.add_argument("--model-backend", choices=sorted(MODEL_BACKENDS), default=config.model_backend,
+                        help="Model backend; 'fake' runs a deterministic local stand-in with no network")
+    parser.add_argument("--trace-file", default=config.trace_file,
+                        help="Append per-turn tracing spans to this file as OpenTelemetry-style JSON lines")
+    parser.add_argument("--collapse-hits", choices=COLLAPSE_KEYS, default=config.collapse_hits_by,
+                        help="Over-fetch and keep the best hit per review (chunked indexes) or per product")
+    parser.add_argument("--diversify", choices=DIVERSITY_STRATEGIES, default=config.diversify_strategy,
+                        help="Over-fetch and spread results across products with a per-product cap or MMR re-ranking")
+    parser.add_argument("--per-product", type=int, default=config.diversify_per_product,
+                        help="Most hits kept per product when diversifying")
+    parser.add_argument("--meta-field-fusion", action="store_true", default=config.meta_field_fusion,
+                        help="Fuse product hits across their title, features and description documents")
+    parser.add_argument("--retrieval-cutoffs", default=config.retrieval_cutoff_file, metavar="FILE",
+                        help="Drop hits beyond the per-collection distance cutoffs in FILE (see retrieval_cutoff.py)")
+    parser.add_argument("--review-side-index", default=config.review_side_index,
+                        help="Search reviews through this quantized side index (see quantized_index.py)")
+    parser.add_argument("--query-embed-wait-ms", type=float, default=config.query_embed_wait_ms,
+                        help="How long concurrent turns wait to share a query embedding batch (0, the default outside "
+                             "the server, disables batching)")
+    parser.add_argument("--plan-cache", action="store_true", default=config.plan_cache_enabled,
+                        help="Reuse planning responses for similar context-free messages (see plan_cache.py)")
+    parser.add_argument("--model-routing", action="store_true", default=config.model_routing,
+                        help="Plan greetings locally and short follow-ups on the light model (see model_router.py)")
+    parser.add_argument("--routing-latency-budget", type=float, default=config.routing_latency_budget_seconds,
+                        metavar="SECONDS", help="Expected planning latency a routed turn may take")
+    parser.add_argument("--routing-cost-budget", type=float, default=config.routing_cost_budget_usd,
+                        metavar="USD", help="Expected planning cost a routed turn may take")
+
+
+def apply_chat_arguments(args: argparse.Namespace) -> None:
+    """Copy the options added by add_chat_arguments into config and start exporting traces."""
+    config.output_mode = OutputMode(args.output_mode)
+    config.model_backend = args.model_backend
+    config.trace_file = args.trace_file
+    config.collapse_hits_by = args.collapse_hits
+    config.diversify_strategy = args.diversify
+    config.diversify_per_product = args.per_product
+    config.meta_field_fusion = args.meta_field_fusion
+    config.retrieval_cutoff_file = args.retrieval_cutoffs
+    config.review_side_index = args.review_side_index
+    config.query_embed_wait_ms = args.query_embed_wait_ms
+    config.plan_cache_enabled = args.plan_cache
+    config.model_routing = args.model_routing
+    config.routing_latency_budget_seconds = args.routing_latency_budget
+    config.routing_cost_budget_usd = args.routing_cost_budget
+    if config.trace_file:
+        tracer.export_to(config.trace_file)
+
+
 def start_chat():
     """Main entry point for the chatbot."""
+    if "--serve" in sys.argv[1:]:
+        # Imported lazily so the terminal chat does not depend on the server module; the server
+        # parses the command line itself, as it has options of its own
+        from server import start_server
+        start_server()
+        return
+
     parser = argparse.ArgumentParser(description="E-commerce AI Chatbot")
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug output")
+    parser.add_argument("--serve", action="store_true",
+                        help="Serve the chat over HTTP/WebSocket instead of the terminal (see server.py --help)")
+    add_chat_arguments(parser)
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="Profile each turn and stage with cProfile or a sampling profiler (plus tracemalloc)")
+    parser.add_argument("--profile-dir", default="profiles", help="Where to write profiles and collapsed stacks")
     args = parser.parse_args()
+    apply_chat_arguments(args)
+    if args.profile:
+        profiler.enable(args.profile, args.profile_dir)
 
-    chatbot = EcommerceChatbot(debug=args.debug)
-    chatbot.start_chat()
+    try:
+        chatbot = EcommerceChatbot(debug=args.debug)
+        chatbot.start_chat()
+    finally:
+        summary_path = profiler.close()
+        if summary_path:
+            print(f"Profiles written to {args.profile_dir} (summary: {summary_path})")
 
 
 if __name__ == "__main__":
-    start_chat()
\ No newline at end of file
+    start_chat()
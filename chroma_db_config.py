@@ -1,8 +1,26 @@
-import chromadb
+import logging
+import os
+import threading
 
-def get_chromadb():
-    chroma_db_name = 'chromadb_v1'
-    client = chromadb.PersistentClient(path=f"./chromadbs/{chroma_db_name}")
+from index_versions import IndexManifest
+from query_embedder import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_SECONDS, MicroBatchEmbedder
+
+
+logger = logging.getLogger(__name__)
+
+VECTOR_BACKEND_ENV = "CHATBOT_VECTOR_BACKEND"
+
+# Where builders run with --export-npy write the NumPy copy of each collection, inside the index version
+NUMPY_EXPORT_DIRNAME = "numpy"
+
+# Shared by every session of the process; see get_query_embedder()
+_query_embedder = None
+_query_embedder_lock = threading.Lock()
+
+
+def _open_chroma(path):
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
     product_meta_collection = client.get_or_create_collection(
         name="product_meta",
         metadata={"description": "Product metadata collection"}
@@ -11,6 +29,67 @@ def get_chromadb():
         name="product_review",
         metadata={"description": "Product review collection"}
     )
-    print("Models configured and ChromaDB initialized.")
-    
-    return client, product_meta_collection, product_review_collection
\ No newline at end of file
+    return client, product_meta_collection, product_review_collection
+
+
+def _open_numpy(path):
+    from numpy_search import NumpyClient
+    client = NumpyClient(os.path.join(path, NUMPY_EXPORT_DIRNAME), embedding_function=get_embedding_function())
+    return client, client.get_collection("product_meta"), client.get_collection("product_review")
+
+
+# Vector backends selectable through get_chromadb(backend=...) or CHATBOT_VECTOR_BACKEND
+VECTOR_BACKENDS = {
+    "chroma": _open_chroma,
+    "numpy": _open_numpy,
+}
+
+
+def get_chromadb(path=None, backend=None):
+    """Open the product collections at path, or in the active index version (./chromadbs/chromadb_v1 without a manifest).
+
+    The "numpy" backend serves the read-only export written by the builders' --export-npy; it is
+    also used when chromadb is not installed but the index version has an export.
+    """
+    path = path or IndexManifest().active_path()
+    backend = backend or os.getenv(VECTOR_BACKEND_ENV, "chroma")
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend '{backend}'. Choose one of: {', '.join(VECTOR_BACKENDS)}")
+    if backend == "chroma":
+        try:
+            import chromadb  # noqa: F401
+        except ImportError:
+            if not os.path.isdir(os.path.join(path, NUMPY_EXPORT_DIRNAME)):
+                raise
+            logger.warning("chromadb is not installed; serving the NumPy export instead.")
+            backend = "numpy"
+    client, product_meta_collection, product_review_collection = VECTOR_BACKENDS[backend](path)
+    # Logged rather than printed: batch mode keeps stdout clean
+    logger.info("Models configured and ChromaDB initialized.")
+
+    return client, product_meta_collection, product_review_collection
+
+
+def get_embedding_function():
+    """Return the embedding function the collections use, for embedding text outside a query."""
+    try:
+        from chromadb.utils import embedding_functions
+    except ImportError:
+        # Without Chroma, embed with the same all-MiniLM-L6-v2 model through sentence-transformers
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("all-MiniLM-L6-v2")
+        return lambda texts: model.encode(list(texts)).tolist()
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def get_query_embedder(max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+    """Return the process-wide micro-batching wrapper around get_embedding_function().
+
+    Every session in the process shares it, so concurrent query embeddings run as one batch.
+    The settings of the first call win.
+    """
+    global _query_embedder
+    with _query_embedder_lock:
+        if _query_embedder is None:
+            _query_embedder = MicroBatchEmbedder(get_embedding_function(), max_batch_size, max_wait_seconds)
+        return _query_embedder
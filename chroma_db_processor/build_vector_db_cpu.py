@@ -1,12 +1,26 @@
 import chromadb
 from chromadb.config import Settings
 chroma_db_name = 'chromadb_v1'
-import uuid
 import threading
+import argparse
+import os
+import sys
 
-def create_chroma_collections():
+# Shared dataset and profiling helpers live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset_io import open_dataset
+from document_ids import last_per_id, meta_document_id, review_document_id
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_WORDS, chunk_documents
+from product_fields import expand_product_fields, parse_fields
+from profiling import PROFILE_MODES, profiler
+from index_versions import DEFAULT_GRACE_SECONDS, DEFAULT_INDEX_ROOT, IndexManifest, build_and_activate
+from ingest_metrics import StageFailures
+from chroma_db_config import NUMPY_EXPORT_DIRNAME, get_embedding_function
+from review_join import JOIN_INDEX_FILENAME, ReviewJoinIndex
+
+def create_chroma_collections(path=f"./chromadbs/{chroma_db_name}"):
     # Create persistent ChromaDB client
-    client = chromadb.PersistentClient(path=f"./chromadbs/{chroma_db_name}")
+    client = chromadb.PersistentClient(path=path)
 
     # Create or get collections
     product_meta_col = client.get_or_create_collection(
@@ -32,10 +46,10 @@ ppprint = lambda x: print(json.dumps(x, indent=2)) if isinstance(x, dict) else p
 
 curr_line_review = 0
 
-def read_reviews(batch_size=1000):
+def read_reviews(batch_size=1000, path=file_review):
     batch_docs, batch_reviews = [], []
     global curr_line_review
-    with open(file_review, 'rb') as f:
+    with open_dataset(path) as f:
         for line in f:
             curr_line_review += 1
             if curr_line_review % 1000 == 0:
@@ -65,10 +79,10 @@ def print_progress_line():
     global curr_line_review, curr_line_meta
     print(f"Reviews line: {curr_line_review} | Meta line: {curr_line_meta}", end='\r') 
 
-def read_meta(batch_size=1000):
+def read_meta(batch_size=1000, path=file_meta):
     batch_docs, batch_products = [], []
     global curr_line_meta
-    with open(file_meta, 'rb') as f:
+    with open_dataset(path) as f:
         for line in f:
             curr_line_meta += 1
             if curr_line_meta % 1000 == 0:
@@ -94,7 +108,7 @@ def read_meta(batch_size=1000):
 
 def read_meta_by_line():
 
-    with open(file_meta, 'rb') as f:
+    with open_dataset(file_meta) as f:
         for line in f:
             global curr_line
             curr_line += 1
@@ -124,30 +138,70 @@ def safe_lower(val):
         return ''
 
 
-def populate_chroma_db():
+def populate_chroma_db(product_meta_col, product_review_col, review_path=file_review, meta_path=file_meta, batch_size=5000,
+                       chunk_words=None, chunk_overlap=DEFAULT_CHUNK_OVERLAP, export_dir=None, meta_fields=("title",),
+                       join_index_path=None):
+    """Ingest reviews and product metadata; with chunk_words, long reviews are indexed as overlapping windows.
+
+    meta_fields beyond the title index every product as one document per field (see product_fields.py).
+
+    With export_dir, documents are embedded here instead of inside upsert so the same vectors can
+    also be appended to a memory-mapped NumPy export of each collection (see numpy_search.py).
+
+    With join_index_path, every review document is also recorded under its parent_asin (see review_join.py).
+
+    Raises IngestError if either insert thread failed.
+    """
+    failures = StageFailures()
+    join_index = ReviewJoinIndex(join_index_path) if join_index_path else None
+    writers = {}
+    if export_dir:
+        from numpy_search import EmbeddingExportWriter
+        embed = get_embedding_function()
+        writers = {name: EmbeddingExportWriter(os.path.join(export_dir, name), name)
+                   for name in ('product_review', 'product_meta')}
+
+    def upsert(collection, documents, metadatas, ids):
+        if collection.name not in writers:
+            collection.upsert(documents=documents, metadatas=metadatas, ids=ids)
+            return
+        embeddings = embed(documents)
+        collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+        writers[collection.name].append(ids, documents, metadatas, embeddings)
+
     def insert_reviews():
-        for batch_docs, batch_reviews in read_reviews(5000):
-            metadatas = [{"parent_asin": review['parent_asin']} for review in batch_reviews]
-            ids = [f"review_{review['parent_asin']}_{uuid.uuid4()}" for review in batch_reviews]
-            print("\nInserting product review start...")
-            product_review_col.upsert(
-                documents=batch_docs,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print("Inserting product review finished...")
+        with failures.guard("insert_reviews"), profiler.section("insert_reviews"):
+            for batch_docs, batch_reviews in read_reviews(batch_size, review_path):
+                metadatas = [{"parent_asin": review['parent_asin']} for review in batch_reviews]
+                ids = [review_document_id(review) for review in batch_reviews]
+                ids, batch_docs, metadatas = last_per_id(ids, batch_docs, metadatas)
+                if chunk_words:
+                    batch_docs, ids, metadatas = chunk_documents(batch_docs, ids, metadatas, chunk_words, chunk_overlap)
+                print("\nInserting product review start...")
+                # Chroma embeds the documents inside upsert, so this covers encoding and insertion
+                with profiler.section("inserter"):
+                    # Chunking can grow a batch past Chroma's maximum upsert size, so insert it in slices
+                    for start in range(0, len(ids), batch_size):
+                        end = start + batch_size
+                        upsert(product_review_col, batch_docs[start:end], metadatas[start:end], ids[start:end])
+                        if join_index is not None:
+                            join_index.add(ids[start:end], metadatas[start:end])
+                print("Inserting product review finished...")
 
     def insert_meta():
-        for batch_docs, batch_products in read_meta(5000):
-            metadatas = [{"parent_asin": product['parent_asin'], "average_rating": product['average_rating']} for product in batch_products]
-            ids = [f"meta_{product['parent_asin']}_{uuid.uuid4()}" for product in batch_products]
-            print("\nInserting product meta start...")
-            product_meta_col.upsert(
-                documents=batch_docs,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print("Inserting product meta finished...")
+        with failures.guard("insert_meta"), profiler.section("insert_meta"):
+            for batch_docs, batch_products in read_meta(batch_size, meta_path):
+                metadatas = [{"parent_asin": product['parent_asin'], "average_rating": product['average_rating']} for product in batch_products]
+                ids = [meta_document_id(product) for product in batch_products]
+                ids, batch_docs, batch_products, metadatas = last_per_id(ids, batch_docs, batch_products, metadatas)
+                if tuple(meta_fields) != ("title",):
+                    batch_docs, ids, metadatas = expand_product_fields(batch_products, ids, metadatas, meta_fields)
+                print("\nInserting product meta start...")
+                with profiler.section("inserter"):
+                    for start in range(0, len(ids), batch_size):
+                        end = start + batch_size
+                        upsert(product_meta_col, batch_docs[start:end], metadatas[start:end], ids[start:end])
+                print("Inserting product meta finished...")
             # this should be externalize to say database for later faster retrival duing chat
             # for product in batch_products:
             #     if product['parent_asin'] not in parent_asin_to_title:
@@ -159,6 +213,15 @@ def populate_chroma_db():
     t2.start()
     t1.join()
     t2.join()
+    if failures:
+        if join_index is not None:
+            join_index.close()
+        failures.raise_if_failed()
+    for writer in writers.values():
+        info = writer.close()
+        print(f"\nExported {info['count']} {info['collection']} embeddings to {writer.directory}")
+    if join_index is not None:
+        join_index.close()
 
 
 
@@ -187,22 +250,68 @@ def populate_chroma_db():
 
 
 if __name__ == "__main__":
-    # Example: create persistent ChromaDB collections and hashmap
-    client, product_meta_col, product_review_col, parent_asin_to_title = create_chroma_collections()
-    print("ChromaDB collections created and hashmap initialized.")
+    parser = argparse.ArgumentParser(description="Build the product ChromaDB collections on the CPU")
+    parser.add_argument("--populate", action="store_true", help="Ingest the datasets before the example query")
+    parser.add_argument("--review-file", default=file_review, help="Reviews dataset (.jsonl, .jsonl.gz or .jsonl.zst)")
+    parser.add_argument("--meta-file", default=file_meta, help="Product metadata dataset (.jsonl, .jsonl.gz or .jsonl.zst)")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="Profile the ingest threads, upserts and example query (plus tracemalloc)")
+    parser.add_argument("--profile-dir", default="profiles", help="Where to write profiles and collapsed stacks")
+    parser.add_argument("--chunk-words", nargs="?", type=int, const=DEFAULT_CHUNK_WORDS, metavar="WORDS",
+                        help=f"Index long reviews as overlapping windows of WORDS words (default {DEFAULT_CHUNK_WORDS})")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP,
+                        help="Words shared by consecutive review windows")
+    parser.add_argument("--meta-fields", type=parse_fields, default=("title",), metavar="FIELDS",
+                        help="Comma-separated product fields to embed separately: title, features, description")
+    parser.add_argument("--export-npy", action="store_true",
+                        help="Also write the embeddings as memory-mapped .npy files for the NumPy search backend")
+    parser.add_argument("--no-join-index", action="store_true",
+                        help=f"Do not write the parent_asin -> review ID index ({JOIN_INDEX_FILENAME})")
+    parser.add_argument("--new-version", action="store_true",
+                        help="Populate a new version under --index-root and make it active when ingestion succeeds")
+    parser.add_argument("--index-root", default=DEFAULT_INDEX_ROOT, help="Directory holding the versioned indexes")
+    parser.add_argument("--grace-seconds", type=float, default=DEFAULT_GRACE_SECONDS,
+                        help="How long retired versions are kept for in-flight queries before deletion")
+    args = parser.parse_args()
+    if args.new_version and not args.populate:
+        parser.error("--new-version needs --populate; an empty version would otherwise be made active")
+    if args.profile:
+        profiler.enable(args.profile, args.profile_dir)
+
+    def build(db_path):
+        # Example: create persistent ChromaDB collections and hashmap
+        collections = create_chroma_collections(db_path)
+        print("ChromaDB collections created and hashmap initialized.")
 
-    # Persist the database to disk
-    #populate_chroma_db()
+        # Persist the database to disk
+        if args.populate:
+            populate_chroma_db(collections[1], collections[2], review_path=args.review_file, meta_path=args.meta_file,
+                               chunk_words=args.chunk_words, chunk_overlap=args.chunk_overlap,
+                               export_dir=os.path.join(db_path, NUMPY_EXPORT_DIRNAME) if args.export_npy else None,
+                               meta_fields=args.meta_fields,
+                               join_index_path=None if args.no_join_index else os.path.join(db_path, JOIN_INDEX_FILENAME))
+        return collections
+
+    if args.new_version:
+        collections = build_and_activate(IndexManifest(args.index_root), build, args.grace_seconds)
+    else:
+        collections = build(f"./chromadbs/{chroma_db_name}")
+    client, product_meta_col, product_review_col, parent_asin_to_title = collections
 
     # Example query to ChromaDB
     query_text = "recommend me compression sleeves"
     print(f"\nQuerying ChromaDB for: '{query_text}'\n")
     try:
-        results = product_meta_col.query(
-            query_texts=[query_text],
-            n_results=5
-        )
+        with profiler.section("query"):
+            results = product_meta_col.query(
+                query_texts=[query_text],
+                n_results=5
+            )
         print("Query Results:")
         ppprint(results)
     except Exception as e:
         print(f"ChromaDB query failed: {e}")
+    finally:
+        summary_path = profiler.close()
+        if summary_path:
+            print(f"Profiles written to {args.profile_dir} (summary: {summary_path})")
@@ -3,13 +3,29 @@ from chromadb.config import Settings
 from chromadb.utils.batch_utils import create_batches
 from sentence_transformers import SentenceTransformer
 import torch
-import uuid
 import threading
 import queue
 import orjson
 import json
 import time
 import logging
+import argparse
+import os
+import sys
+
+# Shared dataset, profiling and metrics helpers live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset_io import open_dataset
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_WORDS, chunk_documents
+from product_fields import expand_product_fields, parse_fields
+from profiling import PROFILE_MODES, profiler
+from dedup import NearDuplicateIndex, ReviewDeduplicator
+from document_ids import last_per_id, meta_document_id, review_document_id
+from ingest_metrics import IngestProgress, serve_progress
+from index_versions import DEFAULT_GRACE_SECONDS, IndexManifest, build_and_activate
+from chroma_db_config import NUMPY_EXPORT_DIRNAME
+from numpy_search import EmbeddingExportWriter
+from review_join import JOIN_INDEX_FILENAME, ReviewJoinIndex
 
 # Check GPU availability
 print(f"CUDA available: {torch.cuda.is_available()}")
@@ -33,16 +49,6 @@ QUEUE_SIZE = 1000
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Progress tracking
-progress_lock = threading.Lock()
-processed_items = 0
-total_items = 0
-
-def count_total_lines(file_path):
-    """Count total lines in a file (approximates total items)."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return sum(1 for _ in f)
-
 class ChromaEmbeddingFunction:
     """Embedding function for ChromaDB using SentenceTransformers on GPU."""
 
@@ -73,9 +79,9 @@ def safe_lower(val):
     else:
         return ''
 
-def create_chroma_collections():
+def create_chroma_collections(path=CHROMA_DB_DIR):
     """Creates and returns ChromaDB client and collections for product metadata and reviews."""
-    client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    client = chromadb.PersistentClient(path=path)
     product_meta_col = client.get_or_create_collection(
         name="product_meta",
         embedding_function=embedding_function,
@@ -89,19 +95,24 @@ def create_chroma_collections():
     parent_asin_to_title = {}
     return client, product_meta_col, product_review_col, parent_asin_to_title
 
-def print_progress(line_count, data_type):
-    print(f"{data_type.capitalize()} line: {line_count}", end='\r')
+def gpu_utilization():
+    """Current GPU utilization in percent, or None when the driver cannot report it (needs pynvml)."""
+    if not torch.cuda.is_available():
+        return None
+    try:
+        return float(torch.cuda.utilization())
+    except Exception:
+        return None
 
-def read_reviews(batch_size=BATCH_SIZE):
-    """Generator that reads review data in batches from the dataset file."""
+def read_reviews(batch_size=BATCH_SIZE, path=DATASET_REVIEW_FILE, progress=None):
+    """Generator that reads review data in batches from the dataset file (.jsonl, .jsonl.gz or .jsonl.zst).
+
+    When progress is given, the byte offset reached in the file on disk is reported after every batch.
+    """
     batch_docs = []
     batch_reviews = []
-    line_count = 0
-    with open(DATASET_REVIEW_FILE, 'rb') as f:
+    with open_dataset(path) as f:
         for line in f:
-            line_count += 1
-            if line_count % 1000 == 0:
-                print_progress(line_count, 'reviews')
             review = orjson.loads(line.strip())
             fields = []
             if review.get('text'):
@@ -112,21 +123,24 @@ def read_reviews(batch_size=BATCH_SIZE):
             batch_docs.append(review_doc)
             batch_reviews.append(review)
             if len(batch_docs) >= batch_size:
+                if progress is not None:
+                    progress.advance('reviews', f.tell())
                 yield batch_docs, batch_reviews
                 batch_docs, batch_reviews = [], []
+        if progress is not None:
+            progress.advance('reviews', f.tell())
         if batch_docs:
             yield batch_docs, batch_reviews
 
-def read_meta(batch_size=BATCH_SIZE):
-    """Generator that reads product metadata in batches from the dataset file."""
+def read_meta(batch_size=BATCH_SIZE, path=DATASET_META_FILE, progress=None):
+    """Generator that reads product metadata in batches from the dataset file (.jsonl, .jsonl.gz or .jsonl.zst).
+
+    When progress is given, the byte offset reached in the file on disk is reported after every batch.
+    """
     batch_docs = []
     batch_products = []
-    line_count = 0
-    with open(DATASET_META_FILE, 'rb') as f:
+    with open_dataset(path) as f:
         for line in f:
-            line_count += 1
-            if line_count % 1000 == 0:
-                print_progress(line_count, 'meta')
             product = orjson.loads(line.strip())
             fields = []
             for k in ['title']:
@@ -139,25 +153,71 @@ def read_meta(batch_size=BATCH_SIZE):
             batch_docs.append(product_meta_doc)
             batch_products.append(product)
             if len(batch_docs) >= batch_size:
+                if progress is not None:
+                    progress.advance('meta', f.tell())
                 yield batch_docs, batch_products
                 batch_docs, batch_products = [], []
+        if progress is not None:
+            progress.advance('meta', f.tell())
         if batch_docs:
             yield batch_docs, batch_products
 
-def producer_reviews(job_queue):
-    """Producer thread: reads review batches and puts them into the job queue."""
-    for docs, reviews in read_reviews():
-        job_queue.put(('review', docs, reviews))
+def producer_reviews(job_queue, progress, path=DATASET_REVIEW_FILE, deduplicator=None, chunk_words=None,
+                     chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """Producer thread: reads review batches, drops duplicates when a deduplicator is given, and queues them.
+
+    With chunk_words, long reviews are split into overlapping windows of that many words.
+    """
+    with progress.failures.guard("producer_reviews"), profiler.section("producer"):
+        started = time.perf_counter()
+        for docs, reviews in read_reviews(path=path, progress=progress):
+            if progress.failures:
+                # Another stage failed; the build will not be activated, so stop reading
+                break
+            # Prepare metadatas and ids for reviews
+            metadatas = [{"parent_asin": r['parent_asin']} for r in reviews]
+            ids = [review_document_id(r) for r in reviews]
+            ids, docs, reviews, metadatas = last_per_id(ids, docs, reviews, metadatas)
+            if deduplicator is not None:
+                docs, reviews, ids, metadatas = deduplicator.filter_batch(docs, reviews, ids, metadatas)
+            if chunk_words:
+                docs, ids, metadatas = chunk_documents(docs, ids, metadatas, chunk_words, chunk_overlap)
+            progress.record('producer_reviews', len(docs), time.perf_counter() - started)
+            # Chunking can grow a batch past Chroma's maximum upsert size, so queue it in slices
+            for start in range(0, len(docs), BATCH_SIZE):
+                end = start + BATCH_SIZE
+                job_queue.put(('review', docs[start:end], metadatas[start:end], ids[start:end]))
+            started = time.perf_counter()
     logger.info("Producer-Reviews: Finished reading reviews")
 
-def producer_meta(job_queue):
-    """Producer thread: reads meta batches and puts them into the job queue."""
-    for docs, products in read_meta():
-        job_queue.put(('meta', docs, products))
+def producer_meta(job_queue, progress, path=DATASET_META_FILE, meta_fields=("title",)):
+    """Producer thread: reads meta batches and puts them into the job queue.
+
+    With meta_fields beyond the title, every product is indexed as one document per field.
+    """
+    with progress.failures.guard("producer_meta"), profiler.section("producer"):
+        started = time.perf_counter()
+        for docs, products in read_meta(path=path, progress=progress):
+            if progress.failures:
+                break
+            # Prepare metadatas and ids for meta
+            metadatas = [{"parent_asin": p['parent_asin'], "average_rating": p.get('average_rating')} for p in products]
+            ids = [meta_document_id(p) for p in products]
+            ids, docs, products, metadatas = last_per_id(ids, docs, products, metadatas)
+            if tuple(meta_fields) != ("title",):
+                docs, ids, metadatas = expand_product_fields(products, ids, metadatas, meta_fields)
+            progress.record('producer_meta', len(docs), time.perf_counter() - started)
+            for start in range(0, len(docs), BATCH_SIZE):
+                end = start + BATCH_SIZE
+                job_queue.put(('meta', docs[start:end], metadatas[start:end], ids[start:end]))
+            started = time.perf_counter()
     logger.info("Producer-Meta: Finished reading meta")
 
-def encoder(job_queue, insert_queue_reviews, insert_queue_meta):
-    """Encoder thread: gets batches from job_queue, encodes them individually, and puts into insert queues."""
+def encoder(job_queue, insert_queue_reviews, insert_queue_meta, progress):
+    """Encoder thread: gets batches from job_queue, encodes them individually, and puts into insert queues.
+
+    After any stage has failed, batches are only drained so the producers never block on a full queue.
+    """
     while True:
         item = job_queue.get()
         if item is None:
@@ -165,92 +225,144 @@ def encoder(job_queue, insert_queue_reviews, insert_queue_meta):
             insert_queue_reviews.put(None)
             insert_queue_meta.put(None)
             return
-        batch_type, docs, data = item
-        logger.info(f"Encoding {len(docs)} documents")
-        print(f"GPU now processing batch of {len(docs)} items")
-        embeddings = embedding_function(docs)
-        print(f"GPU processed batch, embeddings generated for {len(docs)} items")
-        logger.info(f"Encoded {len(docs)} documents")
-        if batch_type == 'review':
-            # Prepare metadatas for reviews
-            metadatas = [{"parent_asin": r['parent_asin']} for r in data]
-            # Prepare ids for reviews
-            ids = [f"review_{r['parent_asin']}_{uuid.uuid4()}" for r in data]
-            # Put into reviews insert queue
-            insert_queue_reviews.put((docs, metadatas, ids, embeddings))
-        else:
-            # Prepare metadatas for meta
-            metadatas = [{"parent_asin": p['parent_asin'], "average_rating": p.get('average_rating')} for p in data]
-            # Prepare ids for meta
-            ids = [f"meta_{p['parent_asin']}_{uuid.uuid4()}" for p in data]
-            # Put into meta insert queue
-            insert_queue_meta.put((docs, metadatas, ids, embeddings))
-
-def inserter_reviews(insert_queue, collection):
-    """Inserter thread for reviews: gets from insert_queue and upserts into collection."""
+        if progress.failures:
+            continue
+        batch_type, docs, metadatas, ids = item
+        with progress.failures.guard("encoder"):
+            with profiler.section("encoder"):
+                started = time.perf_counter()
+                embeddings = embedding_function(docs)
+                progress.record('encoder', len(docs), time.perf_counter() - started)
+                logger.debug(f"Encoded {len(docs)} documents")
+            if batch_type == 'review':
+                # Put into reviews insert queue
+                insert_queue_reviews.put((docs, metadatas, ids, embeddings))
+            else:
+                # Put into meta insert queue
+                insert_queue_meta.put((docs, metadatas, ids, embeddings))
+
+def inserter_reviews(insert_queue, collection, progress, writer=None, join_index=None, encoders=1):
+    """Inserter thread for reviews: gets from insert_queue and upserts into collection (and the export and join index, if any).
+
+    Runs until every one of the encoders has sent its stop marker; after a failure it only drains the queue.
+    """
     while True:
         item = insert_queue.get()
         if item is None:
-            return
+            encoders -= 1
+            if encoders == 0:
+                return
+            continue
+        if progress.failures:
+            continue
         docs, metadatas, ids, embeddings = item
-        collection.upsert(
-            documents=docs,
-            metadatas=metadatas,
-            ids=ids,
-            embeddings=embeddings
-        )
-        logger.info(f"Inserted review batch of {len(docs)} items")
-        with progress_lock:
-            global processed_items
-            processed_items += len(docs)
-            print(f"Progress: {processed_items}/{total_items} items processed", end='\r')
-
-def inserter_meta(insert_queue, collection):
-    """Inserter thread for meta: gets from insert_queue and upserts into collection."""
+        with progress.failures.guard("inserter_reviews"), profiler.section("inserter"):
+            started = time.perf_counter()
+            collection.upsert(
+                documents=docs,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings
+            )
+            if writer is not None:
+                writer.append(ids, docs, metadatas, embeddings)
+            if join_index is not None:
+                join_index.add(ids, metadatas)
+            progress.record('inserter_reviews', len(docs), time.perf_counter() - started)
+        logger.debug(f"Inserted review batch of {len(docs)} items")
+
+def inserter_meta(insert_queue, collection, progress, writer=None, encoders=1):
+    """Inserter thread for meta: gets from insert_queue and upserts into collection (and the export, if any)."""
     while True:
         item = insert_queue.get()
         if item is None:
-            return
+            encoders -= 1
+            if encoders == 0:
+                return
+            continue
+        if progress.failures:
+            continue
         docs, metadatas, ids, embeddings = item
-        collection.upsert(
-            documents=docs,
-            metadatas=metadatas,
-            ids=ids,
-            embeddings=embeddings
-        )
-        logger.info(f"Inserted meta batch of {len(docs)} items")
-        with progress_lock:
-            global processed_items
-            processed_items += len(docs)
-            print(f"Progress: {processed_items}/{total_items} items processed", end='\r')
-
-def populate_chroma_db(product_meta_col, product_review_col):
-    """Run the pipelined population process for ChromaDB."""
+        with progress.failures.guard("inserter_meta"), profiler.section("inserter"):
+            started = time.perf_counter()
+            collection.upsert(
+                documents=docs,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings
+            )
+            if writer is not None:
+                writer.append(ids, docs, metadatas, embeddings)
+            progress.record('inserter_meta', len(docs), time.perf_counter() - started)
+        logger.debug(f"Inserted meta batch of {len(docs)} items")
+
+def finish_dedup(deduplicator, collection, progress, writer=None):
+    """Record duplicate counts and source ids on the representatives and add the dedup report."""
+    updates = list(deduplicator.representative_updates())
+    for start in range(0, len(updates), BATCH_SIZE):
+        batch = updates[start:start + BATCH_SIZE]
+        collection.update(ids=[doc_id for doc_id, _ in batch], metadatas=[metadata for _, metadata in batch])
+        if writer is not None:
+            writer.update_metadatas([doc_id for doc_id, _ in batch], [metadata for _, metadata in batch])
+
+    # Embedding and insert time per review, to estimate what the dropped duplicates would have cost
+    stages = progress.snapshot()["stages"]
+    seconds_per_doc = sum(stages[stage]["busy_seconds"] / stages[stage]["docs"]
+                          for stage in ('encoder', 'inserter_reviews') if stages.get(stage, {}).get("docs"))
+    report = deduplicator.report(seconds_per_doc)
+    progress.annotate("dedup", report)
+    logger.info(f"Dedup removed {report['exact_duplicates']} exact and {report['near_duplicates']} near duplicate reviews "
+                f"({report['dedup_ratio']:.1%}), saving ~{report['estimated_net_seconds_saved']:.0f}s of encode/insert time")
+
+def populate_chroma_db(product_meta_col, product_review_col, review_path=DATASET_REVIEW_FILE, meta_path=DATASET_META_FILE,
+                       metrics_port=None, summary_path=None, dedup_threshold=None, chunk_words=None,
+                       chunk_overlap=DEFAULT_CHUNK_OVERLAP, export_dir=None, meta_fields=("title",),
+                       join_index_path=None):
+    """Run the pipelined population process for ChromaDB.
+
+    Progress (per-stage docs/sec, queue depths, CPU/GPU utilization and a byte-offset ETA) is
+    logged periodically, served on metrics_port when given, and returned as a final summary.
+    With dedup_threshold, near-duplicate reviews (MinHash Jaccard >= threshold) are dropped
+    before encoding and counted on the review they duplicate. With chunk_words, reviews longer
+    than that are indexed as overlapping windows (see chunking.py). With export_dir, the inserters
+    also append every batch to a memory-mapped NumPy export of each collection (see numpy_search.py).
+    meta_fields selects the product fields indexed as separate documents (see product_fields.py).
+    With join_index_path, every review document is also recorded under its parent_asin (see review_join.py).
+
+    Raises IngestError if any producer, encoder or inserter thread failed, so a partial index
+    is never activated.
+    """
     logger.info("Starting ChromaDB population with GPU optimization")
 
-    # Initialize progress tracking
-    global processed_items, total_items
-    processed_items = 0
-    total_reviews = count_total_lines(DATASET_REVIEW_FILE)
-    total_meta = count_total_lines(DATASET_META_FILE)
-    total_items = total_reviews + total_meta
-    print(f"Total lines to process: {total_items}")
-
     # Create queues
     job_queue = queue.Queue(maxsize=QUEUE_SIZE)
     insert_queue_reviews = queue.Queue(maxsize=QUEUE_SIZE)
     insert_queue_meta = queue.Queue(maxsize=QUEUE_SIZE)
 
+    progress = IngestProgress(
+        files={'reviews': review_path, 'meta': meta_path},
+        queues={'job': job_queue, 'insert_reviews': insert_queue_reviews, 'insert_meta': insert_queue_meta},
+        gpu_probe=gpu_utilization,
+    )
+    progress.start_reporting()
+    httpd = serve_progress(progress, port=metrics_port) if metrics_port else None
+    deduplicator = ReviewDeduplicator(NearDuplicateIndex(threshold=dedup_threshold)) if dedup_threshold else None
+    writers = {name: EmbeddingExportWriter(os.path.join(export_dir, name), name)
+               for name in ('product_review', 'product_meta')} if export_dir else {}
+    join_index = ReviewJoinIndex(join_index_path) if join_index_path else None
+
     # Number of encoder threads (configurable for GPU saturation)
     num_encoders = 50
 
     # Start threads for producers, encoders, and inserters
-    encoder_threads = [threading.Thread(target=encoder, args=(job_queue, insert_queue_reviews, insert_queue_meta)) for _ in range(num_encoders)]
+    encoder_threads = [threading.Thread(target=encoder, args=(job_queue, insert_queue_reviews, insert_queue_meta, progress)) for _ in range(num_encoders)]
     threads = [
-        threading.Thread(target=producer_reviews, args=(job_queue,)),
-        threading.Thread(target=producer_meta, args=(job_queue,)),
-        threading.Thread(target=inserter_reviews, args=(insert_queue_reviews, product_review_col)),
-        threading.Thread(target=inserter_meta, args=(insert_queue_meta, product_meta_col))
+        threading.Thread(target=producer_reviews, args=(job_queue, progress, review_path, deduplicator, chunk_words, chunk_overlap)),
+        threading.Thread(target=producer_meta, args=(job_queue, progress, meta_path, meta_fields)),
+        threading.Thread(target=inserter_reviews, args=(insert_queue_reviews, product_review_col, progress,
+                                                        writers.get('product_review'), join_index, num_encoders)),
+        threading.Thread(target=inserter_meta, args=(insert_queue_meta, product_meta_col, progress,
+                                                     writers.get('product_meta'), num_encoders))
     ] + encoder_threads
 
     for t in threads:
@@ -268,12 +380,82 @@ def populate_chroma_db(product_meta_col, product_review_col):
     for t in threads[2:]:
         t.join()
 
-    logger.info("ChromaDB population completed")
+    if progress.failures:
+        if join_index is not None:
+            join_index.close()
+        progress.finish(summary_path)
+        if httpd is not None:
+            httpd.shutdown()
+        progress.failures.raise_if_failed()
+
+    if deduplicator is not None:
+        finish_dedup(deduplicator, product_review_col, progress, writers.get('product_review'))
+    if writers:
+        progress.annotate("numpy_export", {name: writer.close() for name, writer in writers.items()})
+    if join_index is not None:
+        join_index.close()
+
+    summary = progress.finish(summary_path)
+    if httpd is not None:
+        httpd.shutdown()
+    logger.info("ChromaDB population completed: " + progress.status_line())
+    if summary_path:
+        logger.info(f"Ingest summary written to {summary_path}")
+    return summary
 
 if __name__ == "__main__":
-    client, product_meta_col, product_review_col, parent_asin_to_title = create_chroma_collections()
-    print("ChromaDB collections created and hashmap initialized.")
-    populate_chroma_db(product_meta_col, product_review_col)
+    parser = argparse.ArgumentParser(description="Build the product ChromaDB collections on the GPU")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="Profile the producer, encoder and inserter stages (plus tracemalloc)")
+    parser.add_argument("--profile-dir", default="profiles", help="Where to write profiles and collapsed stacks")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve live ingest metrics on http://127.0.0.1:<port>/metrics and /progress")
+    parser.add_argument("--summary-file", default="ingest_summary.json", help="Where to write the final ingest summary")
+    parser.add_argument("--review-file", default=DATASET_REVIEW_FILE, help="Reviews dataset (.jsonl, .jsonl.gz or .jsonl.zst)")
+    parser.add_argument("--meta-file", default=DATASET_META_FILE, help="Product metadata dataset (.jsonl, .jsonl.gz or .jsonl.zst)")
+    parser.add_argument("--dedup", nargs="?", type=float, const=0.8, metavar="THRESHOLD",
+                        help="Collapse near-duplicate reviews (MinHash Jaccard >= THRESHOLD, default 0.8) before encoding")
+    parser.add_argument("--chunk-words", nargs="?", type=int, const=DEFAULT_CHUNK_WORDS, metavar="WORDS",
+                        help=f"Index long reviews as overlapping windows of WORDS words (default {DEFAULT_CHUNK_WORDS})")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP,
+                        help="Words shared by consecutive review windows")
+    parser.add_argument("--meta-fields", type=parse_fields, default=("title",), metavar="FIELDS",
+                        help="Comma-separated product fields to embed separately: title, features, description")
+    parser.add_argument("--export-npy", action="store_true",
+                        help="Also write the embeddings as memory-mapped .npy files for the NumPy search backend")
+    parser.add_argument("--no-join-index", action="store_true",
+                        help=f"Do not write the parent_asin -> review ID index ({JOIN_INDEX_FILENAME})")
+    parser.add_argument("--new-version", action="store_true",
+                        help="Build into a new version under --index-root and make it active when the build succeeds")
+    parser.add_argument("--index-root", default="../chromadbs", help="Directory holding the versioned indexes")
+    parser.add_argument("--grace-seconds", type=float, default=DEFAULT_GRACE_SECONDS,
+                        help="How long retired versions are kept for in-flight queries before deletion")
+    args = parser.parse_args()
+    if args.profile:
+        profiler.enable(args.profile, args.profile_dir)
+
+    def build(db_path):
+        collections = create_chroma_collections(db_path)
+        print("ChromaDB collections created and hashmap initialized.")
+        populate_chroma_db(collections[1], collections[2], review_path=args.review_file, meta_path=args.meta_file,
+                           metrics_port=args.metrics_port, summary_path=args.summary_file, dedup_threshold=args.dedup,
+                           chunk_words=args.chunk_words, chunk_overlap=args.chunk_overlap,
+                           export_dir=os.path.join(db_path, NUMPY_EXPORT_DIRNAME) if args.export_npy else None,
+                           meta_fields=args.meta_fields,
+                           join_index_path=None if args.no_join_index else os.path.join(db_path, JOIN_INDEX_FILENAME))
+        return collections
+
+    try:
+        if args.new_version:
+            # populate_chroma_db raises if any pipeline thread failed, so a partial build is never activated
+            collections = build_and_activate(IndexManifest(args.index_root), build, args.grace_seconds)
+        else:
+            collections = build(CHROMA_DB_DIR)
+    finally:
+        summary_path = profiler.close()
+        if summary_path:
+            logger.info(f"Profiles written to {args.profile_dir} (summary: {summary_path})")
+    client, product_meta_col, product_review_col, parent_asin_to_title = collections
     query_text = "recommend me compression sleeves"
     print(f"\nQuerying ChromaDB for: '{query_text}'\n")
     try:
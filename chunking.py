@@ -0,0 +1,103 @@
+"""Overlapping-window chunking of long reviews, and collapsing chunk hits at query time.
+
+all-MiniLM-L6-v2 truncates its input at 256 word pieces, so most of a long review is never
+embedded. With chunking, a review longer than the window is indexed as several overlapping
+windows that carry the review's id in their `review_id` metadata. Query results are then
+collapsed back to the best hit per review (or per product), over-fetching so that n_results
+distinct hits remain.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+# ~128 words stays inside MiniLM's 256 word-piece window for typical review English
+DEFAULT_CHUNK_WORDS = 128
+DEFAULT_CHUNK_OVERLAP = 32
+
+# Metadata keys query hits can be collapsed on
+COLLAPSE_KEYS = ("review_id", "parent_asin")
+
+# Per-hit fields of a Chroma query result; the rest (e.g. 'included') are copied unchanged
+_RESULT_FIELDS = ("ids", "documents", "metadatas", "distances", "embeddings", "uris", "data")
+
+
+def chunk_text(text: str, max_words: int = DEFAULT_CHUNK_WORDS, overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[str]:
+    """Split text into windows of max_words words, consecutive windows sharing overlap words."""
+    if not 0 <= overlap < max_words:
+        raise ValueError("overlap must be at least 0 and smaller than max_words")
+    words = text.split()
+    if len(words) <= max_words:
+        return [text]
+    stride = max_words - overlap
+    chunks = []
+    for start in range(0, len(words), stride):
+        chunks.append(" ".join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return chunks
+
+
+def chunk_documents(docs: Sequence[str], ids: Sequence[str], metadatas: Sequence[Dict[str, Any]],
+                    max_words: int = DEFAULT_CHUNK_WORDS,
+                    overlap: int = DEFAULT_CHUNK_OVERLAP) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """Chunk a batch of documents; returns (docs, ids, metadatas) with one entry per chunk.
+
+    The first chunk keeps the document's id (so later metadata updates by id still apply) and
+    later chunks are '<id>#<n>'. Every chunk's metadata gains review_id, chunk_index and
+    chunk_count.
+    """
+    chunk_docs, chunk_ids, chunk_metadatas = [], [], []
+    for doc, doc_id, metadata in zip(docs, ids, metadatas):
+        chunks = chunk_text(doc, max_words, overlap)
+        for index, chunk in enumerate(chunks):
+            chunk_docs.append(chunk)
+            chunk_ids.append(doc_id if index == 0 else f"{doc_id}#{index}")
+            chunk_metadatas.append(dict(metadata, review_id=doc_id, chunk_index=index, chunk_count=len(chunks)))
+    return chunk_docs, chunk_ids, chunk_metadatas
+
+
+def _select(values: Optional[List[Any]], positions: List[int]) -> Optional[List[Any]]:
+    return None if values is None else [values[position] for position in positions]
+
+
+def hit_groups(results: Dict[str, Any], query_index: int, key: str) -> List[str]:
+    """Group of every hit of one query: its metadata value for key, or its own id when missing."""
+    ids = results["ids"][query_index]
+    all_metadatas = results.get("metadatas")
+    metadatas = all_metadatas[query_index] if all_metadatas else [None] * len(ids)
+    return [(metadata or {}).get(key) or doc_id for doc_id, metadata in zip(ids, metadatas)]
+
+
+def select_hits(results: Dict[str, Any], selections: List[List[int]]) -> Dict[str, Any]:
+    """Chroma query result restricted to the given hit positions of every query."""
+    selected = {name: value for name, value in results.items() if name not in _RESULT_FIELDS}
+    for name in _RESULT_FIELDS:
+        if name not in results:
+            continue
+        per_query = results[name]
+        selected[name] = None if per_query is None else [
+            _select(values, positions) for values, positions in zip(per_query, selections)]
+    return selected
+
+
+def collapse_results(results: Dict[str, Any], n_results: int, key: str = "review_id",
+                     per_group: int = 1) -> Dict[str, Any]:
+    """Keep the best-ranked per_group hits per metadata key in a Chroma query result, at most n_results per query.
+
+    Hits without the key (e.g. documents indexed before chunking) count as their own group.
+    """
+    if key not in COLLAPSE_KEYS:
+        raise ValueError(f"Unknown collapse key '{key}'; expected one of {', '.join(COLLAPSE_KEYS)}")
+    selections = []
+    for query_index in range(len(results.get("ids") or [])):
+        taken: Dict[str, int] = {}
+        positions = []
+        for position, group in enumerate(hit_groups(results, query_index, key)):
+            if taken.get(group, 0) >= per_group:
+                continue
+            taken[group] = taken.get(group, 0) + 1
+            positions.append(position)
+            if len(positions) == n_results:
+                break
+        selections.append(positions)
+    return select_hits(results, selections)
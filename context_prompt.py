@@ -28,7 +28,7 @@ You have access to two ChromaDB collections:
 When constructing a `QUERY` action, consider the following strategies to get good results from the vector database:
 *   **Semantic Relevance:** Use the user's query directly or rephrase it to capture the semantic meaning relevant to product attributes.
 *   **Field-Specific Queries:** If the user mentions specific attributes (e.g., "blue shirt under $50"), try to map these to relevant fields in the `product_meta` collection (e.g., `main_category`, `title`, `price`).
-*   **Leverage Reviews for Sentiment/Details:** Use the `product_review` collection to answer questions about product sentiment ("What do people say about this product?") or to find specific positive/negative feedback. You can use `parent_asin` to link reviews to products found in `product_meta`.
+*   **Leverage Reviews for Sentiment/Details:** Use the `product_review` collection to answer questions about product sentiment ("What do people say about this product?") or to find specific positive/negative feedback. You can use `parent_asin` to link reviews to products found in `product_meta`; to read the reviews of products you have already found, pass their `parent_asin` values in `parent_asins` instead of searching all reviews.
 *   **Iterative Refinement:** If initial results are not satisfactory or if the user's query is ambiguous, use the `DISPLAY` action with `needs_refinement: true` to ask clarifying questions. This allows for a more targeted subsequent query.
 *   **Preference Discovery Queries:** If the user asks what preferences or information is needed for a product (e.g., "what preferences do you need for tennis shoes"), first use a `QUERY` action to search for the product in `product_meta` collection. This will provide data to analyze common attributes in the next step.
 
@@ -38,6 +38,7 @@ Actions:
     query_text: The specific query string to use for the RAG search.
     collection: The collection to search (e.g., "product_meta", "product_review").
     n_results: The number of results to retrieve.
+    parent_asins: (Optional, product_review only) A list of `parent_asin` values. Only reviews of these products are returned, ranked by similarity to query_text.
 - DISPLAY: Use this when you have information to show to the user, either from a RAG query or a direct answer.
   Parameters:
     message: The message to display to the user.
@@ -106,4 +107,9 @@ parameters:
 ```
 
 Always strive to provide the most helpful and concise response.
-"""
\ No newline at end of file
+"""
+
+json_mode_instruction = """
+**Output format override:** Respond with a single JSON object instead of YAML. Use exactly the same
+`action` and `parameters` fields shown in the YAML examples above, without markdown code fences.
+"""
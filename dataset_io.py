@@ -0,0 +1,128 @@
+"""Streaming readers for plain, gzip and zstd compressed JSONL datasets.
+
+Compressed dumps are read directly instead of being decompressed to disk first. When a
+decompressor binary is available (pigz/gzip, zstd) it runs as a separate process reading the
+same open file, so decompression overlaps with JSON parsing in the builder. Because the child
+shares the file descriptor, the parent can still report how many compressed bytes have been
+consumed, which keeps byte-offset progress and ETAs working. The child's stderr goes to an
+anonymous temporary file rather than a pipe, so a chatty decompressor can never fill a pipe
+nobody reads and stall the ingest; it is read back only to report a failure.
+"""
+
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Iterator, List, Optional
+
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Tail of the decompressor's stderr included in the error when it fails
+MAX_STDERR_BYTES = 4096
+
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Return 'gzip', 'zstd' or None based on the file extension."""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def decompressor_command(compression: str) -> Optional[List[str]]:
+    """Command that decompresses stdin to stdout, or None when no suitable binary is installed."""
+    if compression == "gzip":
+        tool = shutil.which("pigz") or shutil.which("gzip")
+    elif compression == "zstd":
+        tool = shutil.which("zstd")
+    else:
+        return None
+    return [tool, "-dc"] if tool else None
+
+
+class DatasetReader:
+    """Iterates the lines of a dataset file and reports how far into the file it has read.
+
+    tell() is the offset in the file on disk (compressed bytes for .gz/.zst), so it can be
+    compared against os.path.getsize(path) for progress.
+    """
+
+    def __init__(self, path: str, buffer_size: int = DEFAULT_BUFFER_SIZE, parallel: bool = True):
+        self.path = path
+        self.compression = detect_compression(path)
+        self._process: Optional[subprocess.Popen] = None
+        self._stderr = None
+        self._closed = False
+
+        command = decompressor_command(self.compression) if self.compression and parallel else None
+        if command:
+            # Unbuffered so the child's reads are the only ones moving the shared file offset
+            self._raw = open(path, 'rb', buffering=0)
+            self._stderr = tempfile.TemporaryFile()
+            self._process = subprocess.Popen(command, stdin=self._raw, stdout=subprocess.PIPE,
+                                             stderr=self._stderr, bufsize=buffer_size)
+            self._stream = self._process.stdout
+            self.decompressor = os.path.basename(command[0])
+        else:
+            self._raw = open(path, 'rb', buffering=buffer_size)
+            self._stream = self._open_in_process(buffer_size)
+            self.decompressor = "in-process" if self.compression else None
+
+    def _open_in_process(self, buffer_size: int):
+        if self.compression is None:
+            return self._raw
+        if self.compression == "gzip":
+            return io.BufferedReader(gzip.GzipFile(fileobj=self._raw, mode='rb'), buffer_size=buffer_size)
+        try:
+            import zstandard
+        except ImportError:
+            self._raw.close()
+            raise ValueError(f"Reading {self.path} needs the zstd binary or the 'zstandard' package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(self._raw), buffer_size=buffer_size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for line in self._stream:
+            yield line
+        self._check_process()
+
+    def tell(self) -> int:
+        """Bytes of the underlying file consumed so far."""
+        if self._process is not None:
+            return os.lseek(self._raw.fileno(), 0, os.SEEK_CUR)
+        return self._raw.tell()
+
+    def _check_process(self) -> None:
+        if self._process is None:
+            return
+        returncode = self._process.wait()
+        if returncode != 0:
+            size = self._stderr.seek(0, os.SEEK_END)
+            self._stderr.seek(max(0, size - MAX_STDERR_BYTES))
+            error = self._stderr.read().decode('utf-8', 'replace').strip()
+            raise IOError(f"{self.decompressor} failed on {self.path} (exit {returncode}): {error}")
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._process is not None and self._process.poll() is None:
+            # Stopped before the end of the file; the decompressor is no longer needed
+            self._process.kill()
+            self._process.wait()
+        if self._stderr is not None:
+            self._stderr.close()
+        self._stream.close()
+        self._raw.close()
+
+    def __enter__(self) -> "DatasetReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_dataset(path: str, buffer_size: int = DEFAULT_BUFFER_SIZE, parallel: bool = True) -> DatasetReader:
+    """Open a .jsonl, .jsonl.gz or .jsonl.zst dataset for line-by-line streaming."""
+    return DatasetReader(path, buffer_size=buffer_size, parallel=parallel)
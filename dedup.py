@@ -0,0 +1,222 @@
+"""Near-duplicate detection for review text before it is embedded.
+
+Texts are normalized and checked for exact duplicates first (a dict lookup on a 16-byte
+digest of the text), then for near duplicates with MinHash signatures over word shingles and
+locality-sensitive hashing: the signature is split into bands, and any earlier text sharing
+a band is a candidate whose estimated Jaccard similarity is checked against the threshold.
+Signatures are packed into one uint32 array, read only to check those candidates, so memory
+per review stays small on a streaming build. Duplicates are folded into the first text seen
+(the representative). Only a representative that actually absorbs a duplicate gets a
+DuplicateCluster record with the count and (up to MAX_SOURCE_IDS) source IDs; every other
+text costs its digest, signature, bucket entries and document ID.
+
+Texts are only compared within a scope (the review's parent_asin), so a review is never
+folded into another product's representative and every product keeps its own reviews.
+"""
+
+import hashlib
+import random
+import re
+import time
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+_MASK = (1 << 64) - 1
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+# Maximum source IDs written into a representative's metadata (Chroma metadata values are scalars)
+MAX_SOURCE_IDS = 50
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial edits compare equal."""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+
+
+def shingles(normalized: str, size: int = 3) -> List[int]:
+    """Hashes of the word n-grams of a normalized text (the whole text when it is shorter)."""
+    words = normalized.split()
+    if len(words) <= size:
+        return [zlib.crc32(normalized.encode("utf-8"))]
+    return list({zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)})
+
+
+class MinHasher:
+    """MinHash signatures using multiply-shift hash permutations."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(num_perm)]
+
+    def signature(self, shingle_hashes: Sequence[int]) -> Tuple[int, ...]:
+        return tuple(min(((a * h + b) & _MASK) >> 32 for h in shingle_hashes) for a, b in self._params)
+
+
+def estimated_jaccard(left: Sequence[int], right: Sequence[int]) -> float:
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+def _digest(scope: Optional[str], normalized: str) -> bytes:
+    return hashlib.blake2b(f"{scope or ''}\x00{normalized}".encode("utf-8"), digest_size=16).digest()
+
+
+@dataclass
+class DuplicateCluster:
+    """A representative text and the duplicates folded into it.
+
+    metadata is that of the first duplicate; texts only match within a scope (the product), so
+    it carries the representative's parent_asin.
+    """
+    doc_id: str
+    metadata: Dict[str, Any]
+    duplicates: int = 0
+    source_ids: List[str] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        """Texts in the cluster, the representative included."""
+        return 1 + self.duplicates
+
+    def fold(self, source_id: str) -> None:
+        self.duplicates += 1
+        if len(self.source_ids) < MAX_SOURCE_IDS:
+            self.source_ids.append(source_id)
+
+
+class NearDuplicateIndex:
+    """Finds the representative that a text duplicates, or registers it as a new one."""
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 8, shingle_size: int = 3,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.hasher = MinHasher(num_perm, seed)
+        # Representative index -> cluster, only for representatives that absorbed a duplicate
+        self.clusters: Dict[int, DuplicateCluster] = {}
+        self._doc_ids: List[str] = []
+        # blake2b digest of (scope, normalized text) -> representative index
+        self._exact: Dict[bytes, int] = {}
+        # Signature of representative i at [i * num_perm, (i + 1) * num_perm); MinHash values fit in 32 bits
+        self._signatures = array("I")
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+
+    def _band_keys(self, signature: Tuple[int, ...], scope: Optional[str]) -> List[int]:
+        return [hash((scope, signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def _signature(self, index: int) -> array:
+        return self._signatures[index * self.num_perm:(index + 1) * self.num_perm]
+
+    def _fold(self, index: int, source_id: str, metadata: Dict[str, Any]) -> DuplicateCluster:
+        cluster = self.clusters.get(index)
+        if cluster is None:
+            cluster = self.clusters[index] = DuplicateCluster(doc_id=self._doc_ids[index], metadata=dict(metadata))
+        cluster.fold(source_id)
+        return cluster
+
+    def add(self, text: str, doc_id: str, source_id: str, metadata: Dict[str, Any],
+            scope: Optional[str] = None) -> Tuple[Optional[DuplicateCluster], str]:
+        """Return (cluster, kind) where kind is 'new', 'exact' or 'near'; only texts of the same scope match.
+
+        cluster is the representative's cluster for a duplicate and None for a new text.
+        """
+        normalized = normalize_text(text)
+        digest = _digest(scope, normalized)
+        index = self._exact.get(digest)
+        if index is not None:
+            return self._fold(index, source_id, metadata), "exact"
+
+        signature = self.hasher.signature(shingles(normalized, self.shingle_size))
+        band_keys = self._band_keys(signature, scope)
+        candidates = {index for band, key in enumerate(band_keys) for index in self._buckets[band].get(key, ())}
+        best, best_similarity = None, self.threshold
+        for index in candidates:
+            similarity = estimated_jaccard(signature, self._signature(index))
+            if similarity >= best_similarity:
+                best, best_similarity = index, similarity
+        if best is not None:
+            self._exact[digest] = best
+            return self._fold(best, source_id, metadata), "near"
+
+        index = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._signatures.extend(signature)
+        self._exact[digest] = index
+        for band, key in enumerate(band_keys):
+            self._buckets[band].setdefault(key, []).append(index)
+        return None, "new"
+
+    def __len__(self) -> int:
+        """Representatives registered so far."""
+        return len(self._doc_ids)
+
+
+def review_source_id(review: Dict[str, Any]) -> str:
+    """Stable identifier of a raw review (reviews have no ID field of their own)."""
+    return f"{review.get('parent_asin')}:{review.get('user_id')}:{review.get('timestamp')}"
+
+
+class ReviewDeduplicator:
+    """Drops duplicate reviews from ingest batches and tracks what they were folded into."""
+
+    def __init__(self, index: Optional[NearDuplicateIndex] = None):
+        self.index = index or NearDuplicateIndex()
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.seconds = 0.0
+
+    def filter_batch(self, docs: List[str], reviews: List[Dict[str, Any]], ids: List[str],
+                     metadatas: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]], List[str], List[Dict[str, Any]]]:
+        """Return the docs, reviews, ids and metadatas that are not duplicates of earlier reviews."""
+        started = time.perf_counter()
+        kept = ([], [], [], [])
+        for doc, review, doc_id, metadata in zip(docs, reviews, ids, metadatas):
+            self.seen += 1
+            # Scoped to the product, so no product loses a review to another product's representative
+            _, kind = self.index.add(doc, doc_id, review_source_id(review), metadata,
+                                     scope=review.get("parent_asin"))
+            if kind == "new":
+                for column, value in zip(kept, (doc, review, doc_id, metadata)):
+                    column.append(value)
+            elif kind == "exact":
+                self.exact_duplicates += 1
+            else:
+                self.near_duplicates += 1
+        self.seconds += time.perf_counter() - started
+        return kept
+
+    @property
+    def removed(self) -> int:
+        return self.exact_duplicates + self.near_duplicates
+
+    def representative_updates(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(doc_id, metadata) for every representative that absorbed duplicates."""
+        for index in sorted(self.index.clusters):
+            cluster = self.index.clusters[index]
+            yield cluster.doc_id, dict(cluster.metadata,
+                                       duplicate_count=cluster.count,
+                                       duplicate_ids=",".join(cluster.source_ids))
+
+    def report(self, seconds_per_doc: float = 0.0) -> Dict[str, Any]:
+        """Dedup ratio and the embed/insert time saved, given the measured cost per document."""
+        saved = self.removed * seconds_per_doc
+        return {
+            "reviews_seen": self.seen,
+            "reviews_kept": self.seen - self.removed,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "dedup_ratio": self.removed / self.seen if self.seen else 0.0,
+            "dedup_seconds": self.seconds,
+            "estimated_seconds_saved": saved,
+            "estimated_net_seconds_saved": saved - self.seconds,
+        }
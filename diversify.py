@@ -0,0 +1,72 @@
+"""Diversification of retrieval hits so each result slot covers a different product.
+
+Review queries often return several reviews of the same product, which wastes result slots
+and prompt tokens on redundant context. Retrieval over-fetches and then either caps the hits
+per product ("cap") or re-ranks with maximal marginal relevance ("mmr"), which trades each
+hit's relevance against its similarity to the hits already chosen while still respecting
+the per-product cap.
+"""
+
+import math
+from typing import Any, Dict, List, Sequence
+
+from chunking import collapse_results, hit_groups, select_hits
+
+
+DIVERSITY_STRATEGIES = ("cap", "mmr")
+
+
+def _cosine(left: Sequence[float], right: Sequence[float]) -> float:
+    dot = sum(a * b for a, b in zip(left, right))
+    norm = math.sqrt(sum(a * a for a in left)) * math.sqrt(sum(b * b for b in right))
+    return dot / norm if norm else 0.0
+
+
+def _relevance(distances: Sequence[float]) -> List[float]:
+    """Distances rescaled to [0, 1] relevance, 1 being the nearest hit."""
+    nearest, farthest = min(distances), max(distances)
+    if farthest == nearest:
+        return [1.0] * len(distances)
+    return [(farthest - distance) / (farthest - nearest) for distance in distances]
+
+
+def mmr_order(relevance: Sequence[float], embeddings: Sequence[Sequence[float]], groups: Sequence[str],
+              n_results: int, mmr_lambda: float = 0.5, per_group: int = 1) -> List[int]:
+    """Positions picked greedily by lambda * relevance - (1 - lambda) * max similarity to earlier picks."""
+    redundancy = [0.0] * len(relevance)
+    taken: Dict[str, int] = {}
+    remaining = list(range(len(relevance)))
+    selected: List[int] = []
+    while remaining and len(selected) < n_results:
+        eligible = [position for position in remaining if taken.get(groups[position], 0) < per_group]
+        if not eligible:
+            break
+        best = max(eligible, key=lambda position: mmr_lambda * relevance[position] - (1 - mmr_lambda) * redundancy[position])
+        selected.append(best)
+        remaining.remove(best)
+        taken[groups[best]] = taken.get(groups[best], 0) + 1
+        for position in remaining:
+            redundancy[position] = max(redundancy[position], _cosine(embeddings[position], embeddings[best]))
+    return selected
+
+
+def diversify_results(results: Dict[str, Any], n_results: int, strategy: str = "cap", key: str = "parent_asin",
+                      per_group: int = 1, mmr_lambda: float = 0.5) -> Dict[str, Any]:
+    """Reduce an over-fetched Chroma query result to n_results diverse hits per query.
+
+    "mmr" needs the result to include embeddings and distances; without them it falls back
+    to "cap".
+    """
+    if strategy not in DIVERSITY_STRATEGIES:
+        raise ValueError(f"Unknown diversity strategy '{strategy}'; expected one of {', '.join(DIVERSITY_STRATEGIES)}")
+    if strategy == "cap" or results.get("embeddings") is None or results.get("distances") is None:
+        return collapse_results(results, n_results, key, per_group)
+
+    selections = []
+    for query_index, distances in enumerate(results["distances"]):
+        if len(distances) == 0:
+            selections.append([])
+            continue
+        selections.append(mmr_order(_relevance(distances), results["embeddings"][query_index],
+                                    hit_groups(results, query_index, key), n_results, mmr_lambda, per_group))
+    return select_hits(results, selections)
@@ -0,0 +1,36 @@
+"""Stable Chroma document IDs, shared by the batch builders and streaming ingest.
+
+IDs are derived from the record rather than generated, so a review or product that is built
+into an index version and later streamed (or replayed) again upserts the same document
+instead of adding a second copy, and a product update replaces the built document.
+
+    review_<parent_asin>_<16 hex digits of sha1(parent_asin:user_id:timestamp)>
+    meta_<parent_asin>
+"""
+
+import hashlib
+from typing import Any, Dict, List, Sequence, Tuple
+
+from dedup import review_source_id
+
+
+def review_document_id(review: Dict[str, Any]) -> str:
+    """ID of a review's document; reviews have no ID field, so it is a digest of their source."""
+    digest = hashlib.sha1(review_source_id(review).encode('utf-8')).hexdigest()[:16]
+    return f"review_{review['parent_asin']}_{digest}"
+
+
+def meta_document_id(product: Dict[str, Any]) -> str:
+    """ID of a product's (title) document; per-field documents append '#<field>'."""
+    return f"meta_{product['parent_asin']}"
+
+
+def last_per_id(ids: Sequence[str], *columns: Sequence[Any]) -> Tuple[List[Any], ...]:
+    """(ids, *columns) keeping only the last row of each repeated id.
+
+    Chroma rejects an upsert that names the same id twice, and a file can repeat a record
+    (or update a product further down); the later line wins, as it would across batches.
+    """
+    last = {doc_id: row for row, doc_id in enumerate(ids)}
+    rows = [row for row, doc_id in enumerate(ids) if last[doc_id] == row]
+    return ([ids[row] for row in rows],) + tuple([column[row] for row in rows] for column in columns)
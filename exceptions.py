@@ -18,4 +18,24 @@ class CollectionNotFoundError(ChatbotError):
 
 class GeminiAPIError(ChatbotError):
     """Raised when there's an error with Gemini API calls."""
-    pass
\ No newline at end of file
+    pass
+
+
+class ServerOverloadedError(ChatbotError):
+    """Raised when the server has too many pending turns to accept another."""
+    pass
+
+
+class RateLimitError(GeminiAPIError):
+    """Raised when Gemini keeps rejecting calls as rate limited after all retries."""
+    pass
+
+
+class IndexVersionError(ChatbotError):
+    """Raised when an index version to activate does not exist."""
+    pass
+
+
+class IngestError(ChatbotError):
+    """Raised when a stage of a vector DB build failed, so the build must not be activated."""
+    pass
@@ -0,0 +1,284 @@
+"""Deterministic local stand-ins for Gemini models.
+
+FakeGeminiEndpoint mimics the model surface the chatbot uses (generate_content, start_chat)
+and can inject throttling errors, latency and token-count distributions. LocalResponder
+produces valid QUERY/DISPLAY/SUMMARIZE responses from rules or recorded replies, so the
+whole pipeline can be load-tested without network or API quota.
+"""
+
+import ast
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import yaml
+
+from models import ActionType, CollectionType, FakeModelConfig, OutputMode
+
+
+class ResourceExhausted(Exception):
+    """Mimics google.api_core.exceptions.ResourceExhausted (HTTP 429)."""
+    code = 429
+
+
+class ServiceUnavailable(Exception):
+    """Mimics google.api_core.exceptions.ServiceUnavailable (HTTP 503)."""
+    code = 503
+
+
+@dataclass
+class FakeUsageMetadata:
+    """Token counts in the shape of Gemini's usage_metadata."""
+    prompt_token_count: int
+    candidates_token_count: int
+
+    @property
+    def total_token_count(self) -> int:
+        return self.prompt_token_count + self.candidates_token_count
+
+
+@dataclass
+class FakeResponse:
+    """Response exposing the text and usage_metadata attributes the chatbot reads."""
+    text: str
+    usage_metadata: FakeUsageMetadata
+
+
+@dataclass
+class FakePart:
+    text: str
+
+
+@dataclass
+class FakeContent:
+    """History entry in the shape of Gemini's Content (role plus text parts)."""
+    role: str
+    parts: List[FakePart]
+
+
+def to_content(entry: Any) -> FakeContent:
+    """Convert a {'role', 'parts'} history dict into a FakeContent."""
+    if isinstance(entry, FakeContent):
+        return entry
+    return FakeContent(entry['role'], [FakePart(str(part)) for part in entry['parts']])
+
+
+def make_response(prompt: Any, text: str, completion_scale: float = 1.0) -> FakeResponse:
+    """Build a response with token counts estimated from prompt and reply length."""
+    completion_tokens = max(1, int(len(text) / 4 * completion_scale))
+    return FakeResponse(text, FakeUsageMetadata(max(1, len(str(prompt)) // 4), completion_tokens))
+
+
+def _prompt_rng(prompt: Any, seed: int) -> random.Random:
+    """Random source derived from the prompt so replays are deterministic across threads."""
+    return random.Random(zlib.crc32(str(prompt).encode("utf-8")) ^ seed)
+
+
+class FakeGeminiEndpoint:
+    """In-process stand-in for a Gemini model endpoint.
+
+    Replies come from a fixed string or a callable, and the first ``fail_times`` calls
+    raise throttling errors so retry and backoff paths can be tested without network.
+    """
+
+    def __init__(self, reply: Union[str, Callable[[Any], str]] = "ok", fail_times: int = 0,
+                 error: type = ResourceExhausted, latency: float = 0.0, model_name: str = "fake-gemini",
+                 latency_sigma: float = 0.0, completion_token_sigma: float = 0.0, seed: int = 0):
+        self.reply = reply
+        self.fail_times = fail_times
+        self.error = error
+        self.latency = latency
+        self.model_name = model_name
+        self.latency_sigma = latency_sigma
+        self.completion_token_sigma = completion_token_sigma
+        self.seed = seed
+        self.calls: List[Any] = []
+        self._lock = threading.Lock()
+
+    def sample_latency(self, contents: Any) -> float:
+        """Latency for a prompt: log-normal around the median ``latency``."""
+        if not self.latency or not self.latency_sigma:
+            return self.latency
+        return _prompt_rng(contents, self.seed).lognormvariate(math.log(self.latency), self.latency_sigma)
+
+    def _respond(self, contents: Any) -> FakeResponse:
+        with self._lock:
+            self.calls.append(contents)
+            should_fail = len(self.calls) <= self.fail_times
+        latency = self.sample_latency(contents)
+        if latency:
+            time.sleep(latency)
+        if should_fail:
+            raise self.error(f"{self.error.__name__}: quota exceeded for {self.model_name}")
+        text = self.reply(contents) if callable(self.reply) else self.reply
+        completion_scale = 1.0
+        if self.completion_token_sigma:
+            completion_scale = _prompt_rng(contents, self.seed + 1).lognormvariate(0.0, self.completion_token_sigma)
+        return make_response(contents, text, completion_scale)
+
+    def generate_content(self, contents: Any, **kwargs: Any) -> FakeResponse:
+        return self._respond(contents)
+
+    def start_chat(self, history: Optional[List[Any]] = None, **kwargs: Any) -> "FakeChatSession":
+        return FakeChatSession(self, history)
+
+
+class FakeChatSession:
+    """Chat session keeping history the way the Gemini SDK does."""
+
+    def __init__(self, endpoint: FakeGeminiEndpoint, history: Optional[List[Any]] = None):
+        self.endpoint = endpoint
+        self.history = history or []
+
+    @property
+    def history(self) -> List[FakeContent]:
+        # Like the SDK, reading history commits the last exchange and clears `last`
+        if self.last is not None:
+            self._history.extend(self._last_exchange)
+            self._last_exchange = []
+            self.last = None
+        return self._history
+
+    @history.setter
+    def history(self, history: List[Any]) -> None:
+        # Accept {'role', 'parts'} dicts the same way the SDK's history setter does
+        self._history = [to_content(entry) for entry in history]
+        self._last_exchange: List[FakeContent] = []
+        self.last: Optional[FakeResponse] = None
+
+    def send_message(self, content: Any, **kwargs: Any) -> FakeResponse:
+        self.history  # commit the previous exchange before sending, as the SDK does
+        response = self.endpoint._respond(content)
+        # Like the SDK, history only changes once a call succeeds
+        self._last_exchange = [FakeContent('user', [FakePart(str(content))]),
+                               FakeContent('model', [FakePart(response.text)])]
+        self.last = response
+        return response
+
+
+# Latency of the fake light planner relative to the fake main model
+LIGHT_LATENCY_SCALE = 0.3
+
+# Phrases used by the rule-based responder to pick an action
+GREETING_PATTERN = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening))\b", re.IGNORECASE)
+SUMMARIZE_PATTERN = re.compile(r"\b(tell me more|more about|summari[sz]e|overview|what else)\b", re.IGNORECASE)
+REVIEW_PATTERN = re.compile(r"\b(reviews?|people say|reviewers|customers think|experience)\b", re.IGNORECASE)
+COMPREHENSIVE_PATTERN = re.compile(r"\b(tell me more|more about|more information|comprehensive|detailed|what else)\b",
+                                   re.IGNORECASE)
+
+
+def load_recordings(path: str) -> List[Tuple["re.Pattern", str]]:
+    """Load recorded replies from JSONL lines of {"match": <regex>, "response": <text>}."""
+    recordings = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings.append((re.compile(entry["match"], re.IGNORECASE | re.DOTALL), entry["response"]))
+    return recordings
+
+
+def _extract_rag_results(prompt: str) -> Dict[str, Any]:
+    """Recover the results dict embedded in a RAG follow-up prompt."""
+    match = re.search(r"RAG Results: (\{.*\})\s*\n", prompt, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        results = ast.literal_eval(match.group(1))
+    except (ValueError, SyntaxError):
+        return {}
+    return results if isinstance(results, dict) else {}
+
+
+class LocalResponder:
+    """Produces replies to chatbot prompts from recordings first, then from rules.
+
+    The planner role answers with QUERY/DISPLAY/SUMMARIZE actions in the configured output
+    mode; the summarizer role answers classification prompts and free-text summaries.
+    """
+
+    def __init__(self, role: str = "planner", output_mode: OutputMode = OutputMode.YAML,
+                 recordings: Optional[List[Tuple["re.Pattern", str]]] = None):
+        self.role = role
+        self.output_mode = output_mode
+        self.recordings = recordings or []
+
+    def _format(self, action: ActionType, parameters: Dict[str, Any]) -> str:
+        body = {"action": action.value, "parameters": parameters}
+        if self.output_mode == OutputMode.JSON:
+            return json.dumps(body)
+        return yaml.safe_dump(body, sort_keys=False)
+
+    def _plan(self, prompt: str) -> str:
+        if "RAG Results:" in prompt:
+            results = _extract_rag_results(prompt)
+            documents = [doc for query_docs in results.get('documents') or [] for doc in query_docs or []]
+            if not documents:
+                return self._format(ActionType.DISPLAY, {
+                    "message": "I couldn't find matching products. Could you tell me more about what you need?",
+                    "needs_refinement": True,
+                })
+            return self._format(ActionType.DISPLAY, {
+                "message": f"I found {len(documents)} matching items.",
+                "data": [{"type": "snippet", "content": str(documents[0])[:200], "source": "RAG"}],
+            })
+        if GREETING_PATTERN.search(prompt):
+            return self._format(ActionType.DISPLAY, {"message": "Hello! What kind of product are you looking for?"})
+        if SUMMARIZE_PATTERN.search(prompt):
+            return self._format(ActionType.SUMMARIZE, {"text_to_summarize": prompt.strip()})
+        collection = CollectionType.PRODUCT_REVIEW if REVIEW_PATTERN.search(prompt) else CollectionType.PRODUCT_META
+        return self._format(ActionType.QUERY, {
+            "query_text": prompt.strip(), "collection": collection.value, "n_results": 5,
+        })
+
+    def _summarize(self, prompt: str) -> str:
+        if "Classify whether" in prompt:
+            request = prompt.rsplit("User request:", 1)[-1]
+            return "COMPREHENSIVE" if COMPREHENSIVE_PATTERN.search(request) else "STANDARD"
+        first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), "")
+        return f"Here is a short summary based on the available product data. {first_line[:160]}"
+
+    def __call__(self, prompt: Any) -> str:
+        prompt = str(prompt)
+        for pattern, response in self.recordings:
+            if pattern.search(prompt):
+                return response
+        return self._plan(prompt) if self.role == "planner" else self._summarize(prompt)
+
+
+def configure_fake_models(output_mode: OutputMode = OutputMode.YAML,
+                          fake_config: Optional[FakeModelConfig] = None) -> Tuple[FakeGeminiEndpoint, FakeGeminiEndpoint]:
+    """Create deterministic planner and summarization models that need no network."""
+    fake_config = fake_config or FakeModelConfig()
+    recordings = load_recordings(fake_config.recordings_path) if fake_config.recordings_path else []
+
+    return (_fake_endpoint("planner", output_mode, fake_config, recordings),
+            _fake_endpoint("summarizer", output_mode, fake_config, recordings))
+
+
+def configure_fake_light_model(output_mode: OutputMode = OutputMode.YAML,
+                               fake_config: Optional[FakeModelConfig] = None) -> FakeGeminiEndpoint:
+    """Create a deterministic light planner, LIGHT_LATENCY_SCALE times as slow as the main one."""
+    fake_config = fake_config or FakeModelConfig()
+    recordings = load_recordings(fake_config.recordings_path) if fake_config.recordings_path else []
+    return _fake_endpoint("planner", output_mode, fake_config, recordings,
+                          latency_scale=LIGHT_LATENCY_SCALE, model_name="fake-light-planner")
+
+
+def _fake_endpoint(role: str, output_mode: OutputMode, fake_config: FakeModelConfig,
+                   recordings: List[Tuple["re.Pattern", str]], latency_scale: float = 1.0,
+                   model_name: Optional[str] = None) -> FakeGeminiEndpoint:
+    return FakeGeminiEndpoint(
+        reply=LocalResponder(role, output_mode, recordings),
+        latency=fake_config.latency_median_seconds * latency_scale,
+        latency_sigma=fake_config.latency_sigma,
+        completion_token_sigma=fake_config.completion_token_sigma,
+        seed=fake_config.seed,
+        model_name=model_name or f"fake-{role}",
+    )
@@ -0,0 +1,235 @@
+"""Rate-limit-aware wrapper around Gemini models.
+
+Adds token-bucket limiting on requests and tokens, exponential backoff with jitter
+for retryable errors, and single-flight coalescing of identical in-flight
+generate_content calls.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from exceptions import RateLimitError
+from metrics import registry
+from models import GeminiClientConfig
+
+
+# Error class names raised by google.api_core for throttling and transient failures
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "DeadlineExceeded", "InternalServerError",
+}
+RETRYABLE_STATUS_CODES = {429, 500, 503, 504}
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Roughly estimate prompt tokens (about 4 characters per token)."""
+    return max(1, len(str(contents)) // 4)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True for throttling and transient server errors."""
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return code in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a fixed rate."""
+
+    def __init__(self, rate_per_second: float, capacity: float,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until amount tokens are available and take them; return seconds waited."""
+        # Requests larger than the bucket would never fit, so cap them at capacity
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def debit(self, amount: float) -> None:
+        """Take tokens without waiting, e.g. to reconcile actual usage after a call."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+class RateLimiter:
+    """Request and token budgets shared by every model using the same quota."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, **bucket_kwargs: Any):
+        # Buckets hold six seconds of budget so short bursts pass without smoothing every call
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 10.0), **bucket_kwargs)
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, max(1.0, tokens_per_minute / 10.0), **bucket_kwargs)
+        self._wait_seconds = registry.histogram("gemini_rate_limit_wait_seconds", "Time spent waiting on the Gemini rate limiter")
+
+    def acquire(self, estimated_tokens: int) -> None:
+        waited = self.requests.acquire(1) + self.tokens.acquire(estimated_tokens)
+        self._wait_seconds.observe(waited)
+
+    def reconcile(self, estimated_tokens: int, usage_metadata: Any) -> None:
+        """Charge the difference between the estimate and the tokens actually used."""
+        total = getattr(usage_metadata, "total_token_count", None)
+        if isinstance(total, int) and total > estimated_tokens:
+            self.tokens.debit(total - estimated_tokens)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into a single execution."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._coalesced = registry.counter("gemini_coalesced_requests_total", "Gemini calls served by an identical in-flight call")
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+        if not leader:
+            self._coalesced.inc()
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for retryable Gemini errors."""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float,
+                 sleep: Callable[[float], None] = time.sleep, rng: Optional[random.Random] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._retries = registry.counter("gemini_retries_total", "Gemini calls retried after a retryable error")
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number attempt (0-based)."""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        for attempt in range(self.max_attempts):
+            try:
+                return fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_attempts - 1:
+                    raise RateLimitError(f"Gemini still unavailable after {self.max_attempts} attempts: {e}") from e
+                self._retries.inc()
+                self._sleep(self.backoff(attempt))
+
+
+class RateLimitedChatSession:
+    """Chat session proxy whose send_message goes through the limiter and retry policy."""
+
+    def __init__(self, session: Any, limiter: RateLimiter, retry: RetryPolicy):
+        self._session = session
+        self._limiter = limiter
+        self._retry = retry
+
+    def send_message(self, content: Any, **kwargs: Any) -> Any:
+        # The chat history is part of every request, so count it against the token budget
+        estimated = estimate_tokens(content) + estimate_tokens(getattr(self._session, "history", ""))
+
+        def call():
+            self._limiter.acquire(estimated)
+            return self._session.send_message(content, **kwargs)
+
+        response = self._retry.call(call)
+        self._limiter.reconcile(estimated, getattr(response, "usage_metadata", None))
+        return response
+
+    @property
+    def history(self) -> Any:
+        return self._session.history
+
+    @history.setter
+    def history(self, value: Any) -> None:
+        self._session.history = value
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+
+class RateLimitedModel:
+    """GenerativeModel proxy adding rate limiting, retries and request coalescing."""
+
+    def __init__(self, model: Any, limiter: RateLimiter, retry: RetryPolicy, coalesce: bool = True):
+        self._model = model
+        self._limiter = limiter
+        self._retry = retry
+        self._single_flight = SingleFlight() if coalesce else None
+        self._requests = registry.counter("gemini_requests_total", "Gemini generate_content calls issued")
+
+    def generate_content(self, contents: Any, **kwargs: Any) -> Any:
+        estimated = estimate_tokens(contents)
+
+        def call():
+            self._limiter.acquire(estimated)
+            self._requests.inc()
+            return self._model.generate_content(contents, **kwargs)
+
+        def call_with_retry():
+            response = self._retry.call(call)
+            self._limiter.reconcile(estimated, getattr(response, "usage_metadata", None))
+            return response
+
+        if self._single_flight is None or kwargs.get("stream"):
+            return call_with_retry()
+        key = (getattr(self._model, "model_name", id(self._model)), repr(contents), repr(sorted(kwargs.items())))
+        return self._single_flight.do(key, call_with_retry)
+
+    def start_chat(self, **kwargs: Any) -> RateLimitedChatSession:
+        return RateLimitedChatSession(self._model.start_chat(**kwargs), self._limiter, self._retry)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model, name)
+
+
+def wrap_models(*models: Any, client_config: Optional[GeminiClientConfig] = None) -> tuple:
+    """Wrap models that share one API quota behind a common limiter and retry policy."""
+    client_config = client_config or GeminiClientConfig()
+    limiter = RateLimiter(client_config.requests_per_minute, client_config.tokens_per_minute)
+    retry = RetryPolicy(client_config.max_attempts, client_config.base_delay, client_config.max_delay)
+    return tuple(RateLimitedModel(model, limiter, retry, coalesce=client_config.coalesce_requests)
+                 for model in models)
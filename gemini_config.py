@@ -1,18 +1,28 @@
-import google.generativeai as genai
 import os
-from context_prompt import context_prompt
+from typing import Optional
+from context_prompt import context_prompt, json_mode_instruction
+from fake_gemini import configure_fake_light_model, configure_fake_models
+from gemini_client import wrap_models
+from models import GEMINI_RESPONSE_SCHEMA, FakeModelConfig, GeminiClientConfig, OutputMode
+
+# Environment variable selecting the model backend when none is passed explicitly
+MODEL_BACKEND_ENV = "CHATBOT_MODEL_BACKEND"
+
+# Cheaper, faster model that plans simple turns when model routing is on (see model_router.py)
+LIGHT_MODEL_NAME = "gemini-1.5-flash-8b"
 
 def _configure_api():
-    """Helper to configure the Gemini API key."""
+    """Helper to configure the Gemini API key and return the SDK module."""
+    # Imported lazily so the fake backend runs on machines without the SDK or network
+    import google.generativeai as genai
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_API_KEY environment variable not set.")
     genai.configure(api_key=api_key)
+    return genai
 
-def configure_gemini():
-    """Configures and returns the text-based models for the chatbot."""
-    _configure_api()
-    
+def _model_settings():
+    """Generation config and safety settings shared by the text models."""
     generation_config = {
       "temperature": 0.9,
       "top_p": 1,
@@ -38,11 +48,28 @@ def configure_gemini():
         "threshold": "BLOCK_MEDIUM_AND_ABOVE"
       },
     ]
+    return generation_config, safety_settings
+
+def _planner_settings(generation_config, output_mode: OutputMode):
+    """Generation config and system instruction for a model that plans turns."""
+    main_generation_config = dict(generation_config)
+    system_instruction = context_prompt
+    if output_mode == OutputMode.JSON:
+        main_generation_config["response_mime_type"] = "application/json"
+        main_generation_config["response_schema"] = GEMINI_RESPONSE_SCHEMA
+        system_instruction = context_prompt + json_mode_instruction
+    return main_generation_config, system_instruction
+
+def _configure_gemini_models(output_mode: OutputMode):
+    """Create the Gemini planner and summarization models."""
+    genai = _configure_api()
+    generation_config, safety_settings = _model_settings()
+    main_generation_config, system_instruction = _planner_settings(generation_config, output_mode)
 
     main_model = genai.GenerativeModel(model_name="gemini-1.5-flash",
-                                  generation_config=generation_config,
+                                  generation_config=main_generation_config,
                                   safety_settings=safety_settings,
-                                  system_instruction=context_prompt)
+                                  system_instruction=system_instruction)
     
     summarization_model = genai.GenerativeModel(model_name="gemini-1.5-flash",
                                                 generation_config=generation_config, # Reusing generation config, but could be tuned separately
@@ -50,9 +77,71 @@ def configure_gemini():
 
     return main_model, summarization_model
 
+def _configure_gemini_light_model(output_mode: OutputMode):
+    """Create the cheaper planner model, with the same instructions as the main one."""
+    genai = _configure_api()
+    generation_config, safety_settings = _model_settings()
+    light_generation_config, system_instruction = _planner_settings(generation_config, output_mode)
+    return genai.GenerativeModel(model_name=LIGHT_MODEL_NAME,
+                                 generation_config=light_generation_config,
+                                 safety_settings=safety_settings,
+                                 system_instruction=system_instruction)
+
+def _fake_model_config() -> FakeModelConfig:
+    return FakeModelConfig(
+        latency_median_seconds=float(os.getenv("FAKE_MODEL_LATENCY", "0")),
+        latency_sigma=float(os.getenv("FAKE_MODEL_LATENCY_SIGMA", "0")),
+        completion_token_sigma=float(os.getenv("FAKE_MODEL_TOKEN_SIGMA", "0")),
+        seed=int(os.getenv("FAKE_MODEL_SEED", "0")),
+        recordings_path=os.getenv("FAKE_MODEL_RECORDINGS"),
+    )
+
+def _configure_fake_models(output_mode: OutputMode):
+    """Create the deterministic local models used for load and performance testing."""
+    return configure_fake_models(output_mode, _fake_model_config())
+
+def _configure_fake_light_model(output_mode: OutputMode):
+    return configure_fake_light_model(output_mode, _fake_model_config())
+
+# Model backends selectable through configure_gemini(backend=...) or CHATBOT_MODEL_BACKEND
+MODEL_BACKENDS = {
+    "gemini": _configure_gemini_models,
+    "fake": _configure_fake_models,
+}
+
+LIGHT_MODEL_BACKENDS = {
+    "gemini": _configure_gemini_light_model,
+    "fake": _configure_fake_light_model,
+}
+
+def configure_gemini(client_config: Optional[GeminiClientConfig] = None, output_mode: OutputMode = OutputMode.YAML,
+                     backend: Optional[str] = None):
+    """Configures and returns the text-based models for the chatbot.
+
+    Both models share one rate limiter and retry policy since they draw on the same API quota.
+    In JSON output mode the main model is constrained to GEMINI_RESPONSE_SCHEMA.
+    """
+    backend = backend or os.getenv(MODEL_BACKEND_ENV, "gemini")
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}'. Choose one of: {', '.join(MODEL_BACKENDS)}")
+    main_model, summarization_model = MODEL_BACKENDS[backend](output_mode)
+    return wrap_models(main_model, summarization_model, client_config=client_config)
+
+def configure_light_model(client_config: Optional[GeminiClientConfig] = None, output_mode: OutputMode = OutputMode.YAML,
+                          backend: Optional[str] = None):
+    """Configures and returns the light planner model used by model routing.
+
+    It has a rate limiter of its own, since Gemini quotas are per model.
+    """
+    backend = backend or os.getenv(MODEL_BACKEND_ENV, "gemini")
+    if backend not in LIGHT_MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}'. Choose one of: {', '.join(LIGHT_MODEL_BACKENDS)}")
+    light_model, = wrap_models(LIGHT_MODEL_BACKENDS[backend](output_mode), client_config=client_config)
+    return light_model
+
 def configure_vision_model():
     """Configures and returns the vision-enabled model."""
-    _configure_api()
+    genai = _configure_api()
 
     generation_config = {
         "temperature": 0.4,
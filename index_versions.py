@@ -0,0 +1,216 @@
+"""Blue/green versioning of the Chroma index directories.
+
+Each build writes a fresh version directory under the index root (./chromadbs by default).
+manifest.json in the root names the active version; activating a new one rewrites the
+manifest atomically (temp file + os.replace) and marks the previous version retired. Running
+chatbots poll the manifest with an IndexWatcher and swap to the new collections between turns,
+so in-flight queries finish on the version they started with. Retired versions are deleted
+once their grace period has passed. build_and_activate() only activates a version whose
+build returned normally; a failed build is retired so cleanup() removes it.
+
+Command line:
+    python index_versions.py list
+    python index_versions.py activate <version>      # also used to roll back
+    python index_versions.py cleanup [--grace-seconds N]
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from exceptions import IndexVersionError
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_ROOT = "./chromadbs"
+MANIFEST_NAME = "manifest.json"
+
+# Unversioned index used when no manifest exists
+LEGACY_VERSION = "chromadb_v1"
+
+DEFAULT_GRACE_SECONDS = 3600.0
+
+T = TypeVar("T")
+
+
+class IndexManifest:
+    """Reads and atomically updates the manifest of one index root."""
+
+    def __init__(self, root: str = DEFAULT_INDEX_ROOT, clock: Callable[[], float] = time.time):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def read(self) -> Dict[str, Any]:
+        """The manifest contents, or an empty manifest when none has been written."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"active": None, "versions": {}}
+
+    def _write(self, manifest: Dict[str, Any]) -> None:
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def version_path(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def active_version(self) -> Optional[str]:
+        return self.read().get("active")
+
+    def active_path(self) -> str:
+        """Directory of the active version, falling back to the legacy unversioned index."""
+        return self.version_path(self.active_version() or LEGACY_VERSION)
+
+    def new_version(self) -> str:
+        """Create and register an empty version directory for a build; returns its name."""
+        version = "chromadb_" + datetime.fromtimestamp(self._clock(), timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        os.makedirs(self.version_path(version))
+        with self._lock:
+            manifest = self.read()
+            manifest.setdefault("versions", {})[version] = {"created_at": self._clock(), "activated_at": None,
+                                                            "retired_at": None}
+            self._write(manifest)
+        return version
+
+    def activate(self, version: str) -> Optional[str]:
+        """Point the manifest at version and retire the previous one; returns the previous version."""
+        if not os.path.isdir(self.version_path(version)):
+            raise IndexVersionError(f"Index version '{version}' does not exist under {self.root}")
+        with self._lock:
+            manifest = self.read()
+            versions = manifest.setdefault("versions", {})
+            previous = manifest.get("active")
+            now = self._clock()
+            if previous and previous != version and previous in versions:
+                versions[previous]["retired_at"] = now
+            entry = versions.setdefault(version, {"created_at": now})
+            entry.update(activated_at=now, retired_at=None)
+            manifest["active"] = version
+            self._write(manifest)
+        logger.info(f"Activated index version {version} (previous: {previous})")
+        return previous
+
+    def retire(self, version: str) -> None:
+        """Mark a version that was never activated (e.g. a failed build) for cleanup."""
+        with self._lock:
+            manifest = self.read()
+            entry = manifest.setdefault("versions", {}).get(version)
+            if entry is None or manifest.get("active") == version:
+                return
+            entry["retired_at"] = self._clock()
+            self._write(manifest)
+        logger.info(f"Retired index version {version}")
+
+    def cleanup(self, grace_seconds: float = DEFAULT_GRACE_SECONDS) -> List[str]:
+        """Delete versions retired more than grace_seconds ago; returns the deleted versions."""
+        with self._lock:
+            manifest = self.read()
+            now = self._clock()
+            expired = [version for version, entry in manifest.get("versions", {}).items()
+                       if version != manifest.get("active") and entry.get("retired_at") is not None
+                       and now - entry["retired_at"] >= grace_seconds]
+            for version in expired:
+                shutil.rmtree(self.version_path(version), ignore_errors=True)
+                del manifest["versions"][version]
+            if expired:
+                self._write(manifest)
+        for version in expired:
+            logger.info(f"Removed retired index version {version}")
+        return expired
+
+
+def build_and_activate(manifest: IndexManifest, build: Callable[[str], T],
+                       grace_seconds: float = DEFAULT_GRACE_SECONDS) -> T:
+    """Build a new version with build(path) and activate it only if build returns normally.
+
+    If build raises, the previous version stays active, the new one is retired and the
+    exception propagates. Returns what build returned.
+    """
+    version = manifest.new_version()
+    try:
+        result = build(manifest.version_path(version))
+    except BaseException:
+        manifest.retire(version)
+        raise
+    # Running chatbots pick the new version up on their next poll
+    manifest.activate(version)
+    manifest.cleanup(grace_seconds)
+    return result
+
+
+class IndexWatcher:
+    """Polls a manifest and calls on_change(path) when a different version becomes active."""
+
+    def __init__(self, manifest: IndexManifest, on_change: Callable[[str], None], interval_seconds: float = 5.0):
+        self.manifest = manifest
+        self.on_change = on_change
+        self.interval_seconds = interval_seconds
+        self.current = manifest.active_version()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """Swap if the active version changed since the last check; returns whether it did."""
+        active = self.manifest.active_version()
+        if active is None or active == self.current:
+            return False
+        self.on_change(self.manifest.version_path(active))
+        self.current = active
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep serving the current version; the next poll retries
+                logger.error(f"Index reload failed: {e}")
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage blue/green Chroma index versions")
+    parser.add_argument("--root", default=DEFAULT_INDEX_ROOT, help="Directory holding the index versions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show the versions and which one is active")
+    activate = commands.add_parser("activate", help="Make a version active (also rolls back)")
+    activate.add_argument("version")
+    cleanup = commands.add_parser("cleanup", help="Delete versions retired longer than the grace period")
+    cleanup.add_argument("--grace-seconds", type=float, default=DEFAULT_GRACE_SECONDS)
+    args = parser.parse_args()
+
+    manifest = IndexManifest(args.root)
+    if args.command == "list":
+        print(json.dumps(manifest.read(), indent=2, sort_keys=True))
+    elif args.command == "activate":
+        manifest.activate(args.version)
+        print(f"Active index version: {args.version}")
+    else:
+        removed = manifest.cleanup(args.grace_seconds)
+        print(f"Removed {len(removed)} retired version(s): {', '.join(removed) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Live ingestion metrics for the vector DB builders.
+
+IngestProgress tracks docs/sec per pipeline stage, queue depths, CPU and GPU utilization
+and an ETA derived from how far the readers are into their input files (byte offsets, so no
+pre-count pass is needed). It feeds the shared metrics registry, can be served over HTTP
+(/metrics and /progress), logs a status line periodically and produces a final JSON summary.
+
+StageFailures collects exceptions raised in the builders' pipeline threads, which would
+otherwise end only their own thread, so the main thread can fail the build after join().
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from exceptions import IngestError
+from metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageFailures:
+    """Exceptions raised by pipeline threads, kept for the main thread to re-raise."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._errors: List[Tuple[str, BaseException]] = []
+
+    def __bool__(self) -> bool:
+        with self._lock:
+            return bool(self._errors)
+
+    @contextmanager
+    def guard(self, stage: str) -> Iterator[None]:
+        """Record an exception raised inside the block instead of letting it end the thread silently."""
+        try:
+            yield
+        except Exception as e:
+            logger.exception(f"Ingest stage {stage} failed")
+            registry.counter("ingest_stage_failures_total", "Pipeline stage errors during ingest",
+                             labels={"stage": stage}).inc()
+            with self._lock:
+                self._errors.append((stage, e))
+
+    def describe(self) -> List[Dict[str, str]]:
+        with self._lock:
+            return [{"stage": stage, "error": repr(error)} for stage, error in self._errors]
+
+    def raise_if_failed(self) -> None:
+        """Raise IngestError, chained to the first failure, if any stage failed."""
+        with self._lock:
+            if not self._errors:
+                return
+            stage, error = self._errors[0]
+            count = len(self._errors)
+        raise IngestError(f"{count} ingest stage failure(s); first in {stage}: {error!r}") from error
+
+
+class IngestProgress:
+    """Tracks throughput, backlog and ETA for one ingest run."""
+
+    def __init__(self, files: Dict[str, str], queues: Optional[Dict[str, Any]] = None,
+                 gpu_probe: Optional[Callable[[], Optional[float]]] = None,
+                 rate_window_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.files = dict(files)
+        self.queues = dict(queues or {})
+        self.gpu_probe = gpu_probe
+        self.rate_window_seconds = rate_window_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._started = clock()
+        self._finished: Optional[float] = None
+        self._total_bytes = {name: os.path.getsize(path) for name, path in self.files.items()}
+        self._offsets = {name: 0 for name in self.files}
+        self._docs: Dict[str, int] = {}
+        self._busy_seconds: Dict[str, float] = {}
+        self._history: Deque[Tuple[float, Dict[str, int]]] = deque()
+        self._annotations: Dict[str, Any] = {}
+        self._cpu_sample = (clock(), time.process_time())
+        self._cpu_percent = 0.0
+        self._reporter: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Shared by the pipeline threads; a non-empty list means the build failed
+        self.failures = StageFailures()
+
+    # Updates from pipeline threads
+
+    def advance(self, name: str, offset: int) -> None:
+        """Record how many bytes of an input file have been consumed."""
+        with self._lock:
+            self._offsets[name] = offset
+        registry.gauge("ingest_bytes_read", "Bytes of input consumed by the readers", labels={"file": name}).set(offset)
+
+    def record(self, stage: str, docs: int, seconds: float = 0.0) -> None:
+        """Record that a stage finished docs documents, spending seconds of work on them."""
+        with self._lock:
+            self._docs[stage] = self._docs.get(stage, 0) + docs
+            self._busy_seconds[stage] = self._busy_seconds.get(stage, 0.0) + seconds
+        registry.counter("ingest_docs_total", "Documents processed per ingest stage", labels={"stage": stage}).inc(docs)
+
+    def annotate(self, key: str, value: Any) -> None:
+        """Attach extra results (e.g. a dedup report) to snapshots and the final summary."""
+        with self._lock:
+            self._annotations[key] = value
+
+    # Derived figures
+
+    def _sample_cpu(self, now: float) -> float:
+        """Process CPU time over wall time since the last sample, as a percentage of one core."""
+        last_wall, last_cpu = self._cpu_sample
+        cpu = time.process_time()
+        if now - last_wall >= 0.5:
+            self._cpu_percent = 100.0 * (cpu - last_cpu) / (now - last_wall)
+            self._cpu_sample = (now, cpu)
+        return self._cpu_percent
+
+    def _recent_rates(self, now: float, docs: Dict[str, int]) -> Dict[str, float]:
+        self._history.append((now, dict(docs)))
+        while len(self._history) > 1 and now - self._history[0][0] > self.rate_window_seconds:
+            self._history.popleft()
+        since, old_docs = self._history[0]
+        elapsed = now - since
+        if elapsed <= 0:
+            return {stage: 0.0 for stage in docs}
+        return {stage: (count - old_docs.get(stage, 0)) / elapsed for stage, count in docs.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current throughput, queue depths, utilization and ETA."""
+        now = self._finished or self._clock()
+        with self._lock:
+            docs = dict(self._docs)
+            busy = dict(self._busy_seconds)
+            offsets = dict(self._offsets)
+            annotations = dict(self._annotations)
+            recent = self._recent_rates(now, docs)
+            cpu_percent = self._sample_cpu(now)
+        elapsed = max(now - self._started, 1e-9)
+
+        bytes_read, total_bytes = sum(offsets.values()), sum(self._total_bytes.values())
+        fraction = bytes_read / total_bytes if total_bytes else 1.0
+        bytes_per_second = bytes_read / elapsed
+        eta = (total_bytes - bytes_read) / bytes_per_second if bytes_per_second > 0 else None
+
+        queues = {name: {"depth": q.qsize(), "maxsize": q.maxsize} for name, q in self.queues.items()}
+        gpu_percent = self.gpu_probe() if self.gpu_probe else None
+
+        registry.gauge("ingest_cpu_percent", "Process CPU time per wall second, in percent of one core").set(cpu_percent)
+        if gpu_percent is not None:
+            registry.gauge("ingest_gpu_percent", "GPU utilization reported by the device").set(gpu_percent)
+        registry.gauge("ingest_eta_seconds", "Estimated seconds until all input has been read").set(eta or 0.0)
+        for name, depth in queues.items():
+            registry.gauge("ingest_queue_depth", "Items waiting in a pipeline queue", labels={"queue": name}).set(depth["depth"])
+
+        return {
+            "elapsed_seconds": elapsed,
+            "finished": self._finished is not None,
+            "stages": {
+                stage: {
+                    "docs": count,
+                    "docs_per_second": count / elapsed,
+                    "recent_docs_per_second": recent.get(stage, 0.0),
+                    "busy_seconds": busy.get(stage, 0.0),
+                }
+                for stage, count in sorted(docs.items())
+            },
+            "queues": queues,
+            "input": {
+                name: {"bytes_read": offsets[name], "total_bytes": self._total_bytes[name]} for name in self.files
+            },
+            "bytes_read": bytes_read,
+            "total_bytes": total_bytes,
+            "fraction_read": fraction,
+            "eta_seconds": eta,
+            "cpu_percent": cpu_percent,
+            "gpu_percent": gpu_percent,
+            **({"failures": self.failures.describe()} if self.failures else {}),
+            **annotations,
+        }
+
+    def status_line(self) -> str:
+        snapshot = self.snapshot()
+        stages = ", ".join(f"{stage}={stats['recent_docs_per_second']:.0f}/s" for stage, stats in snapshot["stages"].items())
+        queues = ", ".join(f"{name}={q['depth']}/{q['maxsize']}" for name, q in snapshot["queues"].items())
+        eta = f"{snapshot['eta_seconds']:.0f}s" if snapshot["eta_seconds"] is not None else "?"
+        gpu = f" gpu={snapshot['gpu_percent']:.0f}%" if snapshot["gpu_percent"] is not None else ""
+        return (f"{snapshot['fraction_read']:.1%} read, ETA {eta} | {stages} | queues {queues} | "
+                f"cpu={snapshot['cpu_percent']:.0f}%{gpu}")
+
+    # Lifecycle
+
+    def start_reporting(self, interval_seconds: float = 10.0) -> None:
+        """Log a status line every interval_seconds until finish()."""
+        def report():
+            while not self._stop.wait(interval_seconds):
+                logger.info(self.status_line())
+
+        self._reporter = threading.Thread(target=report, name="ingest-progress", daemon=True)
+        self._reporter.start()
+
+    def finish(self, summary_path: Optional[str] = None) -> Dict[str, Any]:
+        """Stop reporting and return (and optionally write) the final summary."""
+        self._stop.set()
+        if self._reporter is not None:
+            self._reporter.join()
+        self._finished = self._clock()
+        summary = self.snapshot()
+        if summary_path:
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+
+def serve_progress(progress: IngestProgress, host: str = "127.0.0.1", port: int = 9100) -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus text) and /progress (JSON) from a background thread."""
+
+    class ProgressHandler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+
+        def do_GET(self) -> None:
+            if self.path == "/progress":
+                payload, content_type = json.dumps(progress.snapshot()).encode("utf-8"), "application/json"
+            elif self.path == "/metrics":
+                progress.snapshot()  # refresh the gauges before rendering
+                payload, content_type = registry.render().encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    httpd = ThreadingHTTPServer((host, port), ProgressHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="ingest-metrics-http", daemon=True).start()
+    return httpd
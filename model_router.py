@@ -0,0 +1,181 @@
+"""Routing of simple chat turns to a cheaper model or a local template.
+
+Every turn used to be planned by the full model, however little it asked for. ModelRouter
+classifies each user message before it is planned:
+
+    greeting       "hi", "thanks!", "bye"           -> local template, no model call
+    clarification  short question about the answer  -> light or full model
+    follow_up      other short message mid-session  -> light or full model
+    request        everything else                  -> full model
+
+Of the tiers a kind allows, the router picks the most capable one whose expected latency
+and cost fit the per-turn budget, and the cheapest one when none does. Expected latency is
+a moving average of observed planning calls per tier; expected cost comes from per-token
+prices and the estimated prompt. RAG synthesis after a QUERY and summarization always run on
+the full models, so a light plan only ever decides what to do next. Decisions and estimated
+savings against planning the turn on the full model are exported as metrics.
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from context_prompt import context_prompt
+from gemini_client import estimate_tokens
+from metrics import registry
+from models import ModelTier, TurnKind
+
+
+# USD per million (prompt, completion) tokens
+DEFAULT_PRICES_PER_MILLION: Dict[ModelTier, Tuple[float, float]] = {
+    ModelTier.TEMPLATE: (0.0, 0.0),
+    ModelTier.LIGHT: (0.0375, 0.15),
+    ModelTier.FULL: (0.075, 0.30),
+}
+
+# Starting estimates of a planning call's latency, replaced by observations as turns run
+DEFAULT_LATENCY_SECONDS: Dict[ModelTier, float] = {
+    ModelTier.TEMPLATE: 0.0,
+    ModelTier.LIGHT: 0.5,
+    ModelTier.FULL: 1.2,
+}
+
+# Tiers each kind of turn may be planned on, cheapest first
+ALLOWED_TIERS: Dict[TurnKind, Tuple[ModelTier, ...]] = {
+    TurnKind.GREETING: (ModelTier.TEMPLATE,),
+    TurnKind.CLARIFICATION: (ModelTier.LIGHT, ModelTier.FULL),
+    TurnKind.FOLLOW_UP: (ModelTier.LIGHT, ModelTier.FULL),
+    TurnKind.REQUEST: (ModelTier.FULL,),
+}
+
+EXPECTED_COMPLETION_TOKENS = 150
+SYSTEM_PROMPT_TOKENS = estimate_tokens(context_prompt)
+
+GREETING_PATTERN = re.compile(
+    r"^(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks|thank you|thx|cheers|"
+    r"bye|goodbye|see you)( there| so much| a lot| again| bot)?$",
+    re.IGNORECASE,
+)
+FAREWELL_PATTERN = re.compile(r"^(bye|goodbye|see you)", re.IGNORECASE)
+THANKS_PATTERN = re.compile(r"^(thanks|thank you|thx|cheers)", re.IGNORECASE)
+# Messages that need retrieval synthesis or summarization whatever their length
+FULL_MODEL_PATTERN = re.compile(
+    r"\b(summari[sz]e|review(s|ers?)?|compare|comparison|recommend|tell me more|more about|details?|comprehensive)\b",
+    re.IGNORECASE,
+)
+QUESTION_PATTERN = re.compile(r"^(what|which|why|how|who|where|when|is|are|does|do|can|could|did)\b",
+                              re.IGNORECASE)
+
+TEMPLATE_REPLIES = {
+    "greeting": "Hello! What kind of product are you looking for today?",
+    "thanks": "You're welcome! Is there anything else I can help you find?",
+    "farewell": "Goodbye! Come back any time you need help finding a product.",
+}
+
+
+def _normalize(user_input: str) -> str:
+    return re.sub(r"[^\w\s']", "", user_input).strip()
+
+
+def template_reply(user_input: str) -> str:
+    """Canned reply to a greeting, thanks or farewell."""
+    text = _normalize(user_input)
+    if FAREWELL_PATTERN.match(text):
+        return TEMPLATE_REPLIES["farewell"]
+    if THANKS_PATTERN.match(text):
+        return TEMPLATE_REPLIES["thanks"]
+    return TEMPLATE_REPLIES["greeting"]
+
+
+def classify_turn(user_input: str, has_history: bool, max_words: int = 8) -> TurnKind:
+    """Kind of a user message, judged from its wording and whether a conversation is under way."""
+    text = _normalize(user_input)
+    if GREETING_PATTERN.match(text):
+        return TurnKind.GREETING
+    if not has_history or len(text.split()) > max_words or FULL_MODEL_PATTERN.search(text):
+        return TurnKind.REQUEST
+    if user_input.strip().endswith("?") or QUESTION_PATTERN.match(text):
+        return TurnKind.CLARIFICATION
+    return TurnKind.FOLLOW_UP
+
+
+@dataclass
+class RouteDecision:
+    """Tier chosen to plan one turn."""
+    kind: TurnKind
+    tier: ModelTier
+    prompt_tokens: int
+    within_budget: bool = True
+
+
+class ModelRouter:
+    """Picks a planning tier per turn under a latency and cost budget; shared across sessions."""
+
+    def __init__(self, latency_budget_seconds: float = 1.0, cost_budget_usd: float = 0.0002, max_words: int = 8,
+                 prices: Optional[Dict[ModelTier, Tuple[float, float]]] = None,
+                 latency_seconds: Optional[Dict[ModelTier, float]] = None, smoothing: float = 0.2):
+        self.latency_budget_seconds = latency_budget_seconds
+        self.cost_budget_usd = cost_budget_usd
+        self.max_words = max_words
+        self.prices = dict(prices or DEFAULT_PRICES_PER_MILLION)
+        self.smoothing = smoothing
+        self._latency = dict(latency_seconds or DEFAULT_LATENCY_SECONDS)
+        self._lock = threading.Lock()
+        self._saved_usd = registry.counter("chatbot_routing_saved_usd_total",
+                                           "Estimated planning cost saved against the full model")
+        self._saved_seconds = registry.counter("chatbot_routing_saved_seconds_total",
+                                               "Estimated planning latency saved against the full model")
+
+    def expected_latency(self, tier: ModelTier) -> float:
+        with self._lock:
+            return self._latency[tier]
+
+    def cost(self, tier: ModelTier, prompt_tokens: int, completion_tokens: int = EXPECTED_COMPLETION_TOKENS) -> float:
+        """USD for a planning call on tier."""
+        prompt_price, completion_price = self.prices[tier]
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def fits_budget(self, tier: ModelTier, prompt_tokens: int) -> bool:
+        return (self.expected_latency(tier) <= self.latency_budget_seconds
+                and self.cost(tier, prompt_tokens) <= self.cost_budget_usd)
+
+    def route(self, user_input: str, history: Sequence[Any] = ()) -> RouteDecision:
+        """Most capable allowed tier within budget, or the cheapest allowed tier."""
+        kind = classify_turn(user_input, bool(history), self.max_words)
+        prompt_tokens = SYSTEM_PROMPT_TOKENS + estimate_tokens(user_input)
+        if history:
+            prompt_tokens += estimate_tokens(history)
+        allowed = ALLOWED_TIERS[kind]
+        affordable = [tier for tier in allowed if self.fits_budget(tier, prompt_tokens)]
+        tier = affordable[-1] if affordable else allowed[0]
+        registry.counter("chatbot_routing_decisions_total", "Turns routed per kind and tier",
+                         labels={"kind": kind.value, "tier": tier.value}).inc()
+        return RouteDecision(kind, tier, prompt_tokens, within_budget=bool(affordable))
+
+    def escalate(self, decision: RouteDecision) -> RouteDecision:
+        """Decision to re-plan a turn on the full model, e.g. after an unparseable light plan."""
+        registry.counter("chatbot_routing_escalations_total", "Turns re-planned on the full model",
+                         labels={"tier": decision.tier.value}).inc()
+        return RouteDecision(decision.kind, ModelTier.FULL, decision.prompt_tokens, decision.within_budget)
+
+    def record(self, decision: RouteDecision, seconds: float, prompt_tokens: int = 0,
+               completion_tokens: int = 0) -> float:
+        """Learn the tier's latency and return the estimated USD saved against the full model.
+
+        Token counts default to the decision's prompt estimate and EXPECTED_COMPLETION_TOKENS,
+        which is all a template turn has.
+        """
+        prompt_tokens = prompt_tokens or decision.prompt_tokens
+        completion_tokens = completion_tokens or EXPECTED_COMPLETION_TOKENS
+        with self._lock:
+            if decision.tier != ModelTier.TEMPLATE:
+                previous = self._latency[decision.tier]
+                self._latency[decision.tier] = previous + self.smoothing * (seconds - previous)
+            full_latency = self._latency[ModelTier.FULL]
+        saved_usd = max(0.0, self.cost(ModelTier.FULL, prompt_tokens, completion_tokens)
+                        - self.cost(decision.tier, prompt_tokens, completion_tokens))
+        if decision.tier != ModelTier.FULL:
+            self._saved_usd.inc(saved_usd)
+            self._saved_seconds.inc(max(0.0, full_latency - seconds))
+        return saved_usd
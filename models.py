@@ -1,6 +1,6 @@
 """Data models for the ecommerce chatbot."""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Any, Optional
 from enum import Enum
 
@@ -13,6 +13,27 @@ class ActionType(Enum):
     SUMMARIZE = "SUMMARIZE"
 
 
+class OutputMode(Enum):
+    """Format the planning model is asked to respond in."""
+    YAML = "yaml"
+    JSON = "json"
+
+
+class ModelTier(Enum):
+    """Where a turn is planned, cheapest first (see model_router.py)."""
+    TEMPLATE = "template"
+    LIGHT = "light"
+    FULL = "full"
+
+
+class TurnKind(Enum):
+    """How demanding a user message looks before it is planned."""
+    GREETING = "greeting"
+    CLARIFICATION = "clarification"
+    FOLLOW_UP = "follow_up"
+    REQUEST = "request"
+
+
 class CollectionType(Enum):
     """Enumeration of available ChromaDB collections."""
     PRODUCT_META = "product_meta"
@@ -25,6 +46,8 @@ class GeminiResponse:
     """Structured representation of Gemini's YAML response."""
     action: ActionType
     parameters: Dict[str, Any]
+    # Set when the YAML did not parse and the raw text was wrapped in a DISPLAY
+    fallback: bool = False
 
 
 @dataclass
@@ -33,6 +56,8 @@ class QueryParameters:
     query_text: str
     collection: CollectionType
     n_results: int = 5
+    # product_review only: fetch reviews of these products through the join index
+    parent_asins: Optional[List[str]] = None
 
 
 @dataclass
@@ -50,6 +75,44 @@ class SummarizeParameters:
     text_to_summarize: str
 
 
+# Response schema for JSON output mode. Gemini's schema subset has no oneOf, so the
+# parameters of every action live in one object and are validated per action after parsing.
+GEMINI_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": [action.value for action in ActionType]},
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query_text": {"type": "string"},
+                "collection": {"type": "string", "enum": [collection.value for collection in CollectionType]},
+                "n_results": {"type": "integer"},
+                "parent_asins": {"type": "array", "items": {"type": "string"}},
+                "message": {"type": "string"},
+                "data": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "type": {"type": "string"},
+                            "content": {"type": "string"},
+                            "source": {"type": "string"},
+                            "product_name": {"type": "string"},
+                            "price": {"type": "string"},
+                            "preference": {"type": "string"},
+                        },
+                    },
+                },
+                "snippet_source": {"type": "string"},
+                "needs_refinement": {"type": "boolean"},
+                "text_to_summarize": {"type": "string"},
+            },
+        },
+    },
+    "required": ["action", "parameters"],
+}
+
+
 @dataclass
 class ChatbotConfig:
     """Configuration class for chatbot settings."""
@@ -57,4 +120,83 @@ class ChatbotConfig:
     exit_command: str = "exit"
     default_query_results: int = 5
     comprehensive_meta_results: int = 20
-    comprehensive_review_results: int = 30
\ No newline at end of file
+    comprehensive_review_results: int = 30
+    output_mode: OutputMode = OutputMode.YAML
+    model_backend: Optional[str] = None
+    plan_cache_enabled: bool = False
+    plan_cache_similarity: float = 0.92
+    plan_cache_max_entries: int = 1024
+    plan_cache_ttl_seconds: float = 3600.0
+    summary_prompt_budget_chars: int = 25000
+    summary_chunk_tokens: int = 3000
+    summary_max_workers: int = 4
+    trace_file: Optional[str] = None
+    collapse_hits_by: Optional[str] = None
+    diversify_strategy: Optional[str] = None
+    diversify_per_product: int = 1
+    diversify_lambda: float = 0.5
+    retrieval_overfetch: int = 4
+    review_side_index: Optional[str] = None
+    side_index_rescore_factor: int = 4
+    meta_field_fusion: bool = False
+    meta_field_weights: Optional[Dict[str, float]] = None
+    query_embed_batch_size: int = 64
+    query_embed_wait_ms: float = 0.0  # a lone CLI session has no one to batch with; the server defaults it on
+    retrieval_cutoff_file: Optional[str] = None
+    model_routing: bool = False
+    routing_latency_budget_seconds: float = 1.0
+    routing_cost_budget_usd: float = 0.0002
+    routing_max_words: int = 8
+
+@dataclass
+class ServerConfig:
+    """Configuration for the HTTP/WebSocket serving mode."""
+    host: str = "127.0.0.1"
+    port: int = 8080
+    session_store: str = "memory"
+    max_workers: int = 8
+    max_pending_turns: int = 32
+    index_poll_seconds: float = 5.0
+    query_embed_wait_ms: float = 2.0
+
+
+@dataclass
+class GeminiClientConfig:
+    """Rate limiting, retry and coalescing settings for Gemini calls."""
+    requests_per_minute: int = 60
+    tokens_per_minute: int = 1_000_000
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    coalesce_requests: bool = True
+
+
+@dataclass
+class FakeModelConfig:
+    """Latency and token-count distributions for the local fake model backend."""
+    latency_median_seconds: float = 0.0
+    latency_sigma: float = 0.0
+    completion_token_sigma: float = 0.0
+    seed: int = 0
+    recordings_path: Optional[str] = None
+
+
+@dataclass
+class TurnRecord:
+    """What happened during one chat turn: actions, retrievals, replies, tokens and stage latency."""
+    user_input: str
+    actions: List[str] = field(default_factory=list)
+    retrieved_ids: List[str] = field(default_factory=list)
+    queries: List[str] = field(default_factory=list)
+    messages: List[str] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    total_seconds: float = 0.0
+    turn_kind: Optional[str] = None
+    model_tier: Optional[str] = None
+    routing_saved_usd: float = 0.0
+
+    @property
+    def final_message(self) -> Optional[str]:
+        return self.messages[-1] if self.messages else None
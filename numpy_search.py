@@ -0,0 +1,257 @@
+"""Embedding export to memory-mapped .npy files and an exact NumPy search backend.
+
+An export directory holds one collection:
+
+    embeddings.npy   float32 (count, dim), contiguous, loaded with mmap_mode="r"
+    table.sqlite     rows(position, id, document, metadata) parallel to the embedding rows
+    info.json        count, dim, metric and collection name
+
+EmbeddingExportWriter appends batches while a builder runs and writes the final .npy header
+on close(), so no second copy of the vectors is ever made. NumpySearchEngine answers top-k
+queries exactly with blocked matrix multiplication, the blocks spread across threads (NumPy
+releases the GIL in matmul). NumpyCollection puts the engine behind the read-only part of the
+Chroma collection API, which makes it the exact ground truth for benchmarks and a fallback
+backend for get_chromadb that does not need Chroma.
+"""
+
+import json
+import os
+import sqlite3
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from quantized_index import DEFAULT_BLOCK_ROWS, METRICS, normalize, top_k
+
+# Fixed .npy header size, so the header can be rewritten in place once the row count is known
+_HEADER_BYTES = 128
+
+
+def _npy_header(shape: Tuple[int, int]) -> bytes:
+    header = repr({"descr": "<f4", "fortran_order": False, "shape": tuple(shape)}).encode("latin1")
+    length = _HEADER_BYTES - 10  # magic (6) + version (2) + header length (2)
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", length) + header.ljust(length - 1) + b"\n"
+
+
+class EmbeddingExportWriter:
+    """Appends embeddings, ids, documents and metadata to an export directory; thread-safe."""
+
+    def __init__(self, directory: str, name: str = "", metric: str = "l2"):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'; expected one of {', '.join(METRICS)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.metric = metric
+        self.rows = 0
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._vectors = open(os.path.join(directory, "embeddings.npy"), 'wb')
+        self._vectors.write(_npy_header((0, 0)))
+        table_path = os.path.join(directory, "table.sqlite")
+        if os.path.exists(table_path):
+            os.remove(table_path)
+        self._table = sqlite3.connect(table_path, check_same_thread=False)
+        self._table.execute("CREATE TABLE rows (position INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)")
+
+    def append(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict[str, Any]],
+               embeddings: Any) -> None:
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+            self._vectors.write(vectors.tobytes())
+            self._table.executemany(
+                "INSERT INTO rows (position, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(self.rows + i, doc_id, document, json.dumps(metadata))
+                 for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas))])
+            self.rows += len(vectors)
+
+    def update_metadatas(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Replace the metadata of already exported rows (e.g. dedup counts)."""
+        with self._lock:
+            self._table.executemany("UPDATE rows SET metadata = ? WHERE id = ?",
+                                    [(json.dumps(metadata), doc_id) for doc_id, metadata in zip(ids, metadatas)])
+
+    def close(self) -> Dict[str, Any]:
+        """Write the final .npy header and info.json; returns the info."""
+        with self._lock:
+            self._vectors.seek(0)
+            self._vectors.write(_npy_header((self.rows, self.dim or 0)))
+            self._vectors.close()
+            self._table.commit()
+            self._table.close()
+        info = {"count": self.rows, "dim": self.dim or 0, "metric": self.metric, "collection": self.name}
+        with open(os.path.join(self.directory, "info.json"), 'w', encoding='utf-8') as f:
+            json.dump(info, f, indent=2)
+        return info
+
+
+def export_collection(collection: Any, directory: str, metric: str = "l2", page_size: int = 5000) -> Dict[str, Any]:
+    """Export an existing Chroma collection; returns the info.json contents."""
+    writer = EmbeddingExportWriter(directory, getattr(collection, "name", ""), metric)
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        writer.append(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+        offset += len(page["ids"])
+    return writer.close()
+
+
+class NumpySearchEngine:
+    """Exact top-k search over a memory-mapped embedding matrix."""
+
+    def __init__(self, directory: str, threads: Optional[int] = None, block_rows: int = DEFAULT_BLOCK_ROWS):
+        with open(os.path.join(directory, "info.json"), 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self.metric = self.info["metric"]
+        self.embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        self.block_rows = block_rows
+        self._executor = ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1,
+                                            thread_name_prefix="numpy-search")
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def _block_scores(self, start: int, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (positions, scores) of one block for every query; higher scores are nearer."""
+        block = np.asarray(self.embeddings[start:start + self.block_rows], dtype=np.float32)
+        if self.metric == "cosine":
+            block = normalize(block)
+        scores = queries @ block.T
+        if self.metric == "l2":
+            # -||x - q||^2 up to the per-query constant ||q||^2, added back in search()
+            scores = 2 * scores - np.einsum("ij,ij->i", block, block)[None, :]
+        positions = np.stack([top_k(row, k) for row in scores])
+        return positions + start, np.take_along_axis(scores, positions, axis=1)
+
+    def search(self, query_embeddings: Any, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions, distances) arrays of shape (queries, k), nearest first.
+
+        Distances follow Chroma: squared L2, 1 - cosine similarity or 1 - inner product.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self.metric == "cosine":
+            queries = normalize(queries)
+        k = min(k, len(self))
+        if k == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty
+        parts = list(self._executor.map(lambda start: self._block_scores(start, queries, k),
+                                        range(0, len(self), self.block_rows)))
+        positions = np.concatenate([part[0] for part in parts], axis=1)
+        scores = np.concatenate([part[1] for part in parts], axis=1)
+        best = np.stack([top_k(row, k) for row in scores])
+        positions = np.take_along_axis(positions, best, axis=1)
+        scores = np.take_along_axis(scores, best, axis=1)
+        if self.metric == "l2":
+            distances = np.einsum("ij,ij->i", queries, queries)[:, None] - scores
+        else:
+            distances = 1.0 - scores
+        return positions, distances
+
+
+class NumpyCollection:
+    """Read-only stand-in for a Chroma collection backed by an export directory."""
+
+    def __init__(self, directory: str, name: str, embedding_function: Optional[Callable] = None,
+                 threads: Optional[int] = None):
+        self.name = name
+        self.directory = directory
+        self.engine = NumpySearchEngine(directory, threads=threads)
+        self.embedding_function = embedding_function
+        self._table = sqlite3.connect(f"file:{os.path.join(directory, 'table.sqlite')}?mode=ro", uri=True,
+                                      check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return len(self.engine)
+
+    def _fetch(self, column: str, values: Sequence[Any]) -> Dict[Any, Tuple[int, str, str, Dict[str, Any]]]:
+        placeholders = ",".join("?" * len(values))
+        with self._lock:
+            rows = self._table.execute(
+                f"SELECT position, id, document, metadata FROM rows WHERE {column} IN ({placeholders})",
+                list(values)).fetchall()
+        key = 0 if column == "position" else 1
+        return {row[key]: (row[0], row[1], row[2], json.loads(row[3])) for row in rows}
+
+    def _columns(self, rows: List[Tuple[int, str, str, Dict[str, Any]]], include: Sequence[str]) -> Dict[str, Any]:
+        return {
+            "ids": [row[1] for row in rows],
+            "documents": [row[2] for row in rows] if "documents" in include else None,
+            "metadatas": [row[3] for row in rows] if "metadatas" in include else None,
+            "embeddings": [self.engine.embeddings[row[0]].tolist() for row in rows] if "embeddings" in include else None,
+        }
+
+    def get(self, ids: Optional[Sequence[str]] = None, include: Optional[List[str]] = None,
+            limit: Optional[int] = None, offset: int = 0, where: Any = None) -> Dict[str, Any]:
+        if where is not None:
+            raise ValueError("The NumPy backend does not support where filters")
+        include = include or ["documents", "metadatas"]
+        if ids is not None:
+            found = self._fetch("id", list(ids))
+            rows = [found[doc_id] for doc_id in ids if doc_id in found]
+        else:
+            end = len(self.engine) if limit is None else min(len(self.engine), offset + limit)
+            found = self._fetch("position", list(range(offset, end)))
+            rows = [found[position] for position in range(offset, end)]
+        return dict(self._columns(rows, include), included=include)
+
+    def query(self, query_embeddings: Any = None, query_texts: Optional[List[str]] = None, n_results: int = 10,
+              where: Any = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        if where is not None:
+            raise ValueError("The NumPy backend does not support where filters")
+        if query_embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("query_texts needs an embedding function; pass query_embeddings instead")
+            query_embeddings = self.embedding_function(query_texts)
+        include = include or ["documents", "metadatas", "distances"]
+        positions, distances = self.engine.search(query_embeddings, n_results)
+
+        results: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": [], "embeddings": [], "distances": []}
+        for query_positions, query_distances in zip(positions, distances):
+            found = self._fetch("position", [int(position) for position in query_positions])
+            columns = self._columns([found[int(position)] for position in query_positions], include)
+            for name, values in columns.items():
+                results[name].append(values)
+            results["distances"].append([float(distance) for distance in query_distances])
+        return {
+            "ids": results["ids"],
+            "documents": results["documents"] if "documents" in include else None,
+            "metadatas": results["metadatas"] if "metadatas" in include else None,
+            "embeddings": results["embeddings"] if "embeddings" in include else None,
+            "distances": results["distances"] if "distances" in include else None,
+            "included": include,
+        }
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise NotImplementedError("The NumPy backend is read-only; rebuild or re-export the index instead")
+
+    add = upsert = update = delete = _read_only
+
+
+class NumpyClient:
+    """Opens the collections exported under one index version."""
+
+    def __init__(self, directory: str, embedding_function: Optional[Callable] = None):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self._collections: Dict[str, NumpyCollection] = {}
+
+    def get_collection(self, name: str, **kwargs: Any) -> NumpyCollection:
+        if name not in self._collections:
+            self._collections[name] = NumpyCollection(os.path.join(self.directory, name), name,
+                                                      embedding_function=self.embedding_function)
+        return self._collections[name]
+
+    get_or_create_collection = get_collection
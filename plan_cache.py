@@ -0,0 +1,144 @@
+"""Semantic cache of planning responses for repeated, context-free user intents."""
+
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+
+from metrics import registry
+from models import GeminiResponse
+
+
+# Words that make a message depend on earlier turns ("tell me more about that one")
+CONTEXT_REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|them|they|one|ones|more|else|above|previous|same|"
+    r"again|instead|cheaper|another|other|first|second|third|last)\b",
+    re.IGNORECASE,
+)
+
+
+def is_context_free(user_input: str) -> bool:
+    """Return True when a message can be understood without the conversation so far."""
+    return not CONTEXT_REFERENCE_PATTERN.search(user_input)
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+@dataclass
+class CachedPlan:
+    """A planning response that can be replayed for a similar request."""
+    user_input: str
+    response_text: str
+    response: GeminiResponse
+    expires_at: float
+
+
+class SemanticPlanCache:
+    """LRU cache of planner responses keyed by the embedding of the user input.
+
+    Entries expire after ttl_seconds, and the least recently used entry is evicted
+    once max_entries is reached. Lookups return the closest entry whose cosine
+    similarity reaches the threshold.
+
+    Embeddings live in one preallocated (max_entries, dim) float32 matrix, one row per
+    entry, so a lookup is a single matrix-vector product rather than a Python loop over
+    every cached plan while holding the lock.
+    """
+
+    def __init__(self, embedding_function: Callable[[List[str]], Any], similarity_threshold: float = 0.92,
+                 max_entries: int = 1024, ttl_seconds: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.embedding_function = embedding_function
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        # Row -> plan, least recently used first
+        self._entries: "OrderedDict[int, CachedPlan]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # allocated on the first put, once the dimension is known
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._hits = registry.counter("plan_cache_hits_total", "Planning calls answered from the semantic cache")
+        self._misses = registry.counter("plan_cache_misses_total", "Planning lookups that missed the semantic cache")
+        self._evictions = registry.counter("plan_cache_evictions_total", "Plans evicted because the cache was full")
+        self._expirations = registry.counter("plan_cache_expirations_total", "Plans dropped because their TTL passed")
+        self._size = registry.gauge("plan_cache_entries", "Plans currently held in the semantic cache")
+
+    def embed(self, user_input: str) -> List[float]:
+        """Embed and normalize a user message so lookups are plain dot products."""
+        return _normalize(list(self.embedding_function([user_input])[0]))
+
+    def _release(self, row: int) -> None:
+        del self._entries[row]
+        self._live[row] = False
+        self._free_rows.append(row)
+
+    def _purge_expired(self, now: float) -> None:
+        expired = np.flatnonzero(self._live & (self._expires_at <= now))
+        for row in expired.tolist():
+            self._release(row)
+        if len(expired):
+            self._expirations.inc(len(expired))
+
+    def get(self, embedding: List[float]) -> Optional[CachedPlan]:
+        """Return the most similar unexpired plan above the threshold, if any."""
+        with self._lock:
+            self._purge_expired(self._clock())
+            self._size.set(len(self._entries))
+            best_row = None
+            if self._entries:
+                similarities = self._matrix @ np.asarray(embedding, dtype=np.float32)
+                similarities[~self._live] = -np.inf
+                row = int(np.argmax(similarities))
+                if similarities[row] >= self.similarity_threshold:
+                    best_row = row
+            if best_row is None:
+                self.misses += 1
+                self._misses.inc()
+                return None
+            self._entries.move_to_end(best_row)
+            self.hits += 1
+            self._hits.inc()
+            return self._entries[best_row]
+
+    def put(self, embedding: List[float], user_input: str, response_text: str, response: GeminiResponse) -> None:
+        """Cache a plan, evicting the least recently used entry when full."""
+        with self._lock:
+            now = self._clock()
+            self._purge_expired(now)
+            while not self._free_rows:
+                self._release(next(iter(self._entries)))
+                self._evictions.inc()
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+            row = self._free_rows.pop()
+            self._matrix[row] = embedding
+            self._live[row] = True
+            expires_at = now + self.ttl_seconds
+            self._expires_at[row] = expires_at
+            self._entries[row] = CachedPlan(
+                user_input=user_input,
+                response_text=response_text,
+                response=response,
+                expires_at=expires_at,
+            )
+            self._size.set(len(self._entries))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
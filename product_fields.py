@@ -0,0 +1,113 @@
+"""Multi-field product documents, and fusing their hits back into one ranked hit per product.
+
+Product metadata used to be indexed by title alone, so a query naming a feature or something
+from the description could only match by luck. With multi-field indexing every product gets
+one document per field (title, features, description), each embedded on its own and tagged
+with a `field` metadata key. At query time the meta collection is over-fetched and the field
+hits of each product are combined with weighted reciprocal rank fusion, which needs no
+calibration between the distance scales of different fields.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from chunking import hit_groups, select_hits
+
+
+PRODUCT_FIELDS = ("title", "features", "description")
+
+# A title match is the strongest evidence; descriptions are long and match loosely
+DEFAULT_FIELD_WEIGHTS = {"title": 1.0, "features": 0.7, "description": 0.5}
+
+# Reciprocal rank fusion smoothing constant (Cormack et al.)
+RRF_K = 60
+
+
+def parse_fields(spec: str) -> Tuple[str, ...]:
+    """Fields from a comma-separated list such as 'title,features'; title is always indexed."""
+    fields = tuple(field.strip() for field in spec.split(",") if field.strip())
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown product field(s) {', '.join(unknown)}; expected {', '.join(PRODUCT_FIELDS)}")
+    return tuple(field for field in PRODUCT_FIELDS if field in fields or field == "title")
+
+
+def field_text(product: Dict[str, Any], field: str) -> str:
+    """Lowercased text of one product field; list fields (features, description) are joined."""
+    value = product.get(field)
+    if isinstance(value, list):
+        value = " ".join(str(item) for item in value if item)
+    return str(value).strip().lower() if value else ""
+
+
+def expand_product_fields(products: Sequence[Dict[str, Any]], ids: Sequence[str], metadatas: Sequence[Dict[str, Any]],
+                          fields: Sequence[str] = PRODUCT_FIELDS) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """One document per non-empty field of every product; returns (docs, ids, metadatas).
+
+    The title document keeps the product's id and other fields are '<id>#<field>'. Every
+    document's metadata gains field; non-title documents also carry the title, so a fused hit
+    can name the product whichever field matched.
+    """
+    field_docs, field_ids, field_metadatas = [], [], []
+    for product, doc_id, metadata in zip(products, ids, metadatas):
+        title = field_text(product, "title")
+        for field in fields:
+            text = field_text(product, field)
+            if not text:
+                continue
+            field_docs.append(text)
+            if field == "title":
+                field_ids.append(doc_id)
+                field_metadatas.append(dict(metadata, field=field))
+            else:
+                field_ids.append(f"{doc_id}#{field}")
+                field_metadatas.append(dict(metadata, field=field, title=title))
+    return field_docs, field_ids, field_metadatas
+
+
+def _field_order(field: str) -> int:
+    return PRODUCT_FIELDS.index(field) if field in PRODUCT_FIELDS else len(PRODUCT_FIELDS)
+
+
+def fuse_field_results(results: Dict[str, Any], n_results: int, weights: Optional[Dict[str, float]] = None,
+                       rrf_k: int = RRF_K) -> Dict[str, Any]:
+    """Reduce an over-fetched meta query result to one hit per product, ranked by fused field score.
+
+    A product scores the sum over its matched fields of weight / (rrf_k + rank). Each fused
+    hit keeps its product's best-ranked hit (id, distance, embedding). Its document joins the
+    title with the other matched fields, and its metadata gains fused_score and
+    matched_fields. Hits without a field key (title-only indexes) count as title hits.
+    """
+    weights = weights or DEFAULT_FIELD_WEIGHTS
+    all_documents, all_metadatas = results.get("documents"), results.get("metadatas")
+    selections, fused = [], []
+    for query_index, ids in enumerate(results.get("ids") or []):
+        metadatas = all_metadatas[query_index] if all_metadatas else [None] * len(ids)
+        scores: Dict[str, float] = {}
+        matched: Dict[str, Dict[str, int]] = {}
+        for rank, group in enumerate(hit_groups(results, query_index, "parent_asin")):
+            field = (metadatas[rank] or {}).get("field", "title")
+            fields = matched.setdefault(group, {})
+            if field not in fields:
+                fields[field] = rank
+                scores[group] = scores.get(group, 0.0) + weights.get(field, 0.0) / (rrf_k + rank + 1)
+        # sorted() is stable and matched is in first-hit order, so ties keep the better-ranked product first
+        ranked = sorted(matched, key=lambda group: -scores[group])[:n_results]
+        selections.append([min(matched[group].values()) for group in ranked])
+        fused.append([(scores[group], matched[group]) for group in ranked])
+
+    selected = select_hits(results, selections)
+    for query_index, query_fused in enumerate(fused):
+        for position, (score, fields) in enumerate(query_fused):
+            best = selections[query_index][position]
+            metadata = (all_metadatas[query_index][best] if all_metadatas else None) or {}
+            names = sorted(fields, key=_field_order)
+            if selected.get("metadatas") is not None:
+                selected["metadatas"][query_index][position] = dict(metadata, fused_score=score,
+                                                                    matched_fields=",".join(names))
+            if selected.get("documents") is not None:
+                documents = all_documents[query_index]
+                title = documents[fields["title"]] if "title" in fields else metadata.get("title")
+                parts = [title] if title else []
+                parts += [f"{name}: {documents[fields[name]]}" for name in names if name != "title"]
+                selected["documents"][query_index][position] = " | ".join(parts)
+    return selected
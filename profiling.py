@@ -0,0 +1,225 @@
+"""Opt-in profiling of chat turns and builder pipeline stages.
+
+Code marks regions with `profiler.section(name)`. Until `profiler.enable(...)` is called a
+section is a shared no-op context manager, so the hooks cost one attribute check.
+
+Modes:
+    cprofile  deterministic cProfile per top-level section, merged by name into <name>.prof.
+              From Python 3.12 only one profiler can be active per process, so a thread whose
+              section starts while another thread is profiled is sampled instead (and, as
+              3.12 profiles every thread, its calls also show up in the other section's .prof)
+    sample    a background thread samples every thread inside a section and writes
+              collapsed stacks (<name>.collapsed) for flamegraph.pl / speedscope
+
+Both modes also run tracemalloc and record the peak traced memory reached while each
+section was active, plus the top allocation sites at the end of the run.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as TallyCounter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Set
+
+
+PROFILE_MODES = ("cprofile", "sample")
+
+_NULL_SECTION = nullcontext()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """Collects per-section profiles; disabled (and free) until enable() is called."""
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.output_dir = "profiles"
+        self.sample_interval = 0.005
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles: Dict[str, List[cProfile.Profile]] = {}
+        self._active: Dict[int, List[str]] = {}
+        # Threads sampled in cprofile mode because another thread holds the process's profiler
+        self._sampled: Set[int] = set()
+        self._stacks: Dict[str, TallyCounter] = {}
+        self._calls: TallyCounter = TallyCounter()
+        self._samples: TallyCounter = TallyCounter()
+        self._seconds: Dict[str, float] = {}
+        self._memory_peaks: Dict[str, int] = {}
+        self._overall_peak = 0
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode is not None
+
+    def enable(self, mode: str, output_dir: str = "profiles", sample_interval: float = 0.005) -> None:
+        """Start profiling sections in the given mode, writing results to output_dir on close()."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'; expected one of {', '.join(PROFILE_MODES)}")
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.mode = mode
+        if mode == "sample":
+            self._start_sampler()
+
+    def _start_sampler(self) -> None:
+        if self._sampler is None:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+
+    def section(self, name: str):
+        """Context manager that profiles the enclosed block under name."""
+        if self.mode is None:
+            return _NULL_SECTION
+        return self._profile_section(name)
+
+    @contextmanager
+    def _profile_section(self, name: str) -> Iterator[None]:
+        path = getattr(self._local, "path", None)
+        if path is None:
+            path = self._local.path = []
+        ident = threading.get_ident()
+        top_level = not path
+
+        # cProfile cannot nest on one thread, so only the outermost section is profiled
+        profile = cProfile.Profile() if top_level and self.mode == "cprofile" else None
+        path.append(name)
+        with self._lock:
+            self._record_memory_peak()
+            self._active[ident] = list(path)
+        started = time.perf_counter()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: another thread's section holds the only profiler slot
+                profile = None
+                with self._lock:
+                    self._sampled.add(ident)
+                    self._start_sampler()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            elapsed = time.perf_counter() - started
+            path.pop()
+            with self._lock:
+                self._record_memory_peak()
+                if top_level:
+                    self._sampled.discard(ident)
+                if path:
+                    self._active[ident] = list(path)
+                else:
+                    self._active.pop(ident, None)
+                self._calls[name] += 1
+                self._seconds[name] = self._seconds.get(name, 0.0) + elapsed
+                if profile is not None:
+                    self._profiles.setdefault(name, []).append(profile)
+
+    def _record_memory_peak(self) -> None:
+        """Credit the peak since the last reset to every active section, then reset it (lock held).
+
+        Called whenever a section starts or ends, so each peak interval is attributed to all
+        sections of any thread that were active during it.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        self._overall_peak = max(self._overall_peak, peak)
+        for name in {name for path in self._active.values() for name in path}:
+            if peak > self._memory_peaks.get(name, 0):
+                self._memory_peaks[name] = peak
+        tracemalloc.reset_peak()
+
+    def _sample_loop(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = {ident: path for ident, path in self._active.items()
+                          if ident != own_ident and (self.mode == "sample" or ident in self._sampled)}
+            for ident, path in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                key = ";".join(path + stack[::-1])
+                with self._lock:
+                    self._stacks.setdefault(path[0], TallyCounter())[key] += 1
+                    self._samples.update(set(path))
+
+    def close(self) -> Optional[str]:
+        """Stop profiling, write all results and return the summary path (None if disabled)."""
+        if self.mode is None:
+            return None
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+        for name, profiles in self._profiles.items():
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+        for name, stacks in self._stacks.items():
+            with open(os.path.join(self.output_dir, f"{name}.collapsed"), 'w', encoding='utf-8') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+
+        with self._lock:
+            self._record_memory_peak()
+        top_allocations = [str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:20]]
+        tracemalloc.stop()
+
+        summary = {
+            "mode": self.mode,
+            "sections": {
+                name: {
+                    "calls": self._calls[name],
+                    "seconds": self._seconds.get(name, 0.0),
+                    "samples": self._samples[name],
+                    "peak_traced_bytes": self._memory_peaks.get(name, 0),
+                }
+                for name in sorted(self._calls)
+            },
+            "peak_traced_bytes": self._overall_peak,
+            "top_allocations": top_allocations,
+        }
+        summary_path = os.path.join(self.output_dir, "profile_summary.json")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+        self.mode = None
+        self._profiles.clear()
+        self._stacks.clear()
+        self._calls.clear()
+        self._samples.clear()
+        self._seconds.clear()
+        self._memory_peaks.clear()
+        self._overall_peak = 0
+        return summary_path
+
+
+# Process-wide profiler used by the chatbot and the builders
+profiler = Profiler()
@@ -0,0 +1,377 @@
+"""Compact float16 / int8 side index for first-pass search over the review collection.
+
+The review collection's float32 vectors dominate disk and memory. export_quantized_index()
+copies a collection's embeddings (L2-normalized, for cosine similarity) into a directory of
+memory-mapped .npy files:
+
+    index.json   dtype, dim, count, distance metric and whether exact vectors were kept
+    ids.sqlite   collection ids by row number, read only for the rows a query returns
+    codes.npy    float16 vectors, or int8 codes with a per-vector scale in scales.npy
+    exact.npy    optional float32 vectors used to re-score the shortlist
+
+QuantizedCollection wraps the Chroma collection. It scans the codes block by block for a
+shortlist of n_results * rescore_factor candidates, re-scores the shortlist at full precision
+(exact.npy, or the embeddings stored in Chroma), then reads documents and metadata by id.
+It re-checks the collection's row count every stale_check_seconds and queries Chroma directly
+while the side index no longer covers the collection (e.g. after a streaming ingest).
+Ranking is by cosine similarity, but distances are reported in the collection's metric
+(index.json "metric", Chroma's default "l2" unless exported otherwise) so they are on the same
+scale as Chroma and the numpy backend: 2 - 2 * cosine for l2, 1 - cosine for cosine and ip,
+which are exact for the unit-length vectors the embedding model produces.
+
+Command line:
+    python quantized_index.py export --dtype int8 --output indexes/review_int8 [--metric l2]
+    python quantized_index.py evaluate --index indexes/review_int8 [--queries 200 --k 10]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_DTYPES = ("float16", "int8")
+
+# Distance functions, matching Chroma's hnsw:space values
+METRICS = ("l2", "cosine", "ip")
+
+DEFAULT_BLOCK_ROWS = 65536
+DEFAULT_RESCORE_FACTOR = 4
+DEFAULT_STALE_CHECK_SECONDS = 30.0
+
+IDS_FILENAME = "ids.sqlite"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(codes, scales) for float32 rows; scales is None for float16."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        safe = np.where(scales == 0, 1.0, scales)
+        codes = np.clip(np.rint(vectors / safe[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization dtype '{dtype}'; expected one of {', '.join(QUANTIZATION_DTYPES)}")
+
+
+def cosine_to_distance(similarities: np.ndarray, metric: str) -> np.ndarray:
+    """Distances in Chroma's metric for unit vectors with the given cosine similarities."""
+    if metric == "l2":
+        return 2.0 - 2.0 * similarities
+    return 1.0 - similarities
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first."""
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def iter_collection_embeddings(collection: Any, page_size: int = 5000):
+    """Yield (ids, float32 embeddings) pages of a Chroma collection."""
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page["ids"], np.asarray(page["embeddings"], dtype=np.float32)
+        offset += len(page["ids"])
+
+
+def export_quantized_index(collection: Any, directory: str, dtype: str = "int8", keep_exact: bool = True,
+                           page_size: int = 5000, metric: str = "l2") -> Dict[str, Any]:
+    """Write a collection's embeddings as a quantized side index; returns the index.json contents."""
+    if dtype not in QUANTIZATION_DTYPES:
+        raise ValueError(f"Unknown quantization dtype '{dtype}'; expected one of {', '.join(QUANTIZATION_DTYPES)}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'; expected one of {', '.join(METRICS)}")
+    os.makedirs(directory, exist_ok=True)
+    count = collection.count()
+    ids_path = os.path.join(directory, IDS_FILENAME)
+    if os.path.exists(ids_path):
+        os.remove(ids_path)
+    ids_db = sqlite3.connect(ids_path)
+    ids_db.execute("CREATE TABLE ids (row INTEGER PRIMARY KEY, id TEXT NOT NULL)")
+    rows = 0
+    codes = scales = exact = None
+    for page_ids, embeddings in iter_collection_embeddings(collection, page_size):
+        if codes is None:
+            dim = embeddings.shape[1]
+            codes = np.lib.format.open_memmap(os.path.join(directory, "codes.npy"), mode="w+",
+                                              dtype=np.dtype(dtype), shape=(count, dim))
+            if dtype == "int8":
+                scales = np.lib.format.open_memmap(os.path.join(directory, "scales.npy"), mode="w+",
+                                                   dtype=np.float32, shape=(count,))
+            if keep_exact:
+                exact = np.lib.format.open_memmap(os.path.join(directory, "exact.npy"), mode="w+",
+                                                  dtype=np.float32, shape=(count, dim))
+        start, end = rows, rows + len(page_ids)
+        if end > count:
+            raise ValueError(f"Collection grew during export ({end} > {count} rows); export again")
+        vectors = normalize(embeddings)
+        page_codes, page_scales = quantize(vectors, dtype)
+        codes[start:end] = page_codes
+        if scales is not None:
+            scales[start:end] = page_scales
+        if exact is not None:
+            exact[start:end] = vectors
+        ids_db.executemany("INSERT INTO ids (row, id) VALUES (?, ?)", enumerate(page_ids, start))
+        rows = end
+    ids_db.commit()
+    ids_db.close()
+
+    if codes is None:
+        raise ValueError(f"Collection '{getattr(collection, 'name', '')}' has no embeddings to export")
+    for array in (codes, scales, exact):
+        if array is not None:
+            array.flush()
+    info = {"dtype": dtype, "dim": int(codes.shape[1]), "count": rows,
+            "metric": metric, "exact": bool(keep_exact), "collection": getattr(collection, "name", "")}
+    with open(os.path.join(directory, "index.json"), 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+class QuantizedIndex:
+    """Memory-mapped quantized vectors with blocked brute-force search.
+
+    Row ids stay on disk in ids.sqlite; for millions of reviews a Python list of them would
+    outweigh the int8 codes.
+    """
+
+    def __init__(self, directory: str, block_rows: int = DEFAULT_BLOCK_ROWS):
+        self.directory = directory
+        self.block_rows = block_rows
+        with open(os.path.join(directory, "index.json"), 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self._ids_db = sqlite3.connect(f"file:{os.path.join(directory, IDS_FILENAME)}?mode=ro", uri=True,
+                                       check_same_thread=False)
+        self._ids_lock = threading.Lock()
+        self.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+        scales_path = os.path.join(directory, "scales.npy")
+        self.scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        exact_path = os.path.join(directory, "exact.npy")
+        self.exact = np.load(exact_path, mmap_mode="r") if os.path.exists(exact_path) else None
+
+    def __len__(self) -> int:
+        return int(self.info["count"])
+
+    def ids_at(self, positions: Sequence[int]) -> List[str]:
+        """Collection ids of the given rows, in the same order."""
+        positions = [int(position) for position in positions]
+        if not positions:
+            return []
+        with self._ids_lock:
+            found = dict(self._ids_db.execute(
+                f"SELECT row, id FROM ids WHERE row IN ({','.join('?' * len(positions))})", positions).fetchall())
+        return [found[position] for position in positions]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes scanned by the first pass (codes and scales)."""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def search(self, query: Sequence[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions, approximate cosine similarities) of the k best rows, best first."""
+        query = normalize(np.asarray(query, dtype=np.float32))
+        best_positions = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            block = np.asarray(self.codes[start:start + self.block_rows], dtype=np.float32)
+            scores = block @ query
+            if self.scales is not None:
+                scores *= self.scales[start:start + self.block_rows]
+            local = top_k(scores, k)
+            best_positions = np.concatenate([best_positions, local + start])
+            best_scores = np.concatenate([best_scores, scores[local]])
+            keep = top_k(best_scores, k)
+            best_positions, best_scores = best_positions[keep], best_scores[keep]
+        return best_positions, best_scores
+
+
+class QuantizedCollection:
+    """Chroma collection whose query() searches a quantized side index and re-scores exactly.
+
+    Everything except query() is delegated to the wrapped collection. Queries with a where
+    filter, or against an index that no longer covers the collection, fall back to Chroma.
+    Coverage is checked on construction (so on every index swap) and then at most every
+    stale_check_seconds.
+    """
+
+    def __init__(self, collection: Any, index: QuantizedIndex, embedding_function: Optional[Callable] = None,
+                 rescore_factor: int = DEFAULT_RESCORE_FACTOR,
+                 stale_check_seconds: float = DEFAULT_STALE_CHECK_SECONDS):
+        self._collection = collection
+        self.index = index
+        self.embedding_function = embedding_function
+        self.rescore_factor = rescore_factor
+        self.stale_check_seconds = stale_check_seconds
+        self._stale = False
+        self._checked_at = 0.0
+        self._check_stale()
+
+    def _check_stale(self) -> None:
+        count = self._collection.count()
+        stale = count != len(self.index)
+        if stale and not self._stale:
+            logger.warning(f"Side index {self.index.directory} has {len(self.index)} rows but the collection has "
+                           f"{count}; querying Chroma directly until it is exported again")
+        self._stale = stale
+        self._checked_at = time.monotonic()
+
+    @property
+    def stale(self) -> bool:
+        """Whether the side index no longer covers the collection, re-checked every stale_check_seconds."""
+        if time.monotonic() - self._checked_at >= self.stale_check_seconds:
+            self._check_stale()
+        return self._stale
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+    def _exact_vectors(self, positions: np.ndarray) -> np.ndarray:
+        if self.index.exact is not None:
+            return np.asarray(self.index.exact[positions], dtype=np.float32)
+        ids = self.index.ids_at(positions)
+        stored = self._collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(stored["ids"], stored["embeddings"]))
+        return normalize(np.asarray([by_id[doc_id] for doc_id in ids], dtype=np.float32))
+
+    def _query_one(self, query: np.ndarray, n_results: int) -> Tuple[List[str], List[float], np.ndarray]:
+        positions, _ = self.index.search(query, n_results * self.rescore_factor)
+        vectors = self._exact_vectors(positions)
+        scores = vectors @ normalize(query)
+        order = top_k(scores, n_results)
+        distances = cosine_to_distance(scores[order], self.index.info.get("metric", "l2"))
+        return self.index.ids_at(positions[order]), [float(distance) for distance in distances], vectors[order]
+
+    def query(self, query_embeddings: Any = None, query_texts: Optional[List[str]] = None, n_results: int = 10,
+              where: Any = None, include: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if self.stale or where is not None or kwargs or (query_embeddings is None and self.embedding_function is None):
+            return self._collection.query(query_embeddings=query_embeddings, query_texts=query_texts,
+                                          n_results=n_results, where=where,
+                                          include=include or ["documents", "metadatas", "distances"], **kwargs)
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        include = include or ["documents", "metadatas", "distances"]
+
+        results: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": [],
+                                   "embeddings": [] if "embeddings" in include else None, "included": include}
+        for query in query_embeddings:
+            ids, distances, vectors = self._query_one(np.asarray(query, dtype=np.float32), n_results)
+            stored = self._collection.get(ids=ids, include=["documents", "metadatas"])
+            by_id = {doc_id: (document, metadata) for doc_id, document, metadata
+                     in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+            results["ids"].append(ids)
+            results["documents"].append([by_id.get(doc_id, (None, None))[0] for doc_id in ids])
+            results["metadatas"].append([by_id.get(doc_id, (None, None))[1] for doc_id in ids])
+            results["distances"].append(distances)
+            if results["embeddings"] is not None:
+                results["embeddings"].append(vectors.tolist())
+        return results
+
+
+def evaluate(collection: Any, index: QuantizedIndex, query_count: int = 200, k: int = 10,
+             rescore_factor: int = DEFAULT_RESCORE_FACTOR, seed: int = 0) -> Dict[str, Any]:
+    """Memory reduction and recall@k of the side index against exact search over the collection.
+
+    Queries are stored vectors sampled from the collection; ground truth is exact cosine search
+    over every stored float32 vector.
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(index), size=min(query_count, len(index)), replace=False)
+    queries = normalize(index.exact[sample] if index.exact is not None else
+                        np.asarray([index.codes[i] for i in sample], dtype=np.float32))
+
+    # Exact top-k per query, merged page by page over the float32 vectors stored in Chroma
+    truth_ids = [np.empty(0, dtype=object) for _ in queries]
+    truth_scores = [np.empty(0, dtype=np.float32) for _ in queries]
+    float32_bytes = 0
+    for page_ids, embeddings in iter_collection_embeddings(collection):
+        float32_bytes += embeddings.nbytes
+        page_scores = normalize(embeddings) @ queries.T
+        page_ids = np.asarray(page_ids, dtype=object)
+        for q in range(len(queries)):
+            scores = np.concatenate([truth_scores[q], page_scores[:, q]])
+            ids = np.concatenate([truth_ids[q], page_ids])
+            keep = top_k(scores, k)
+            truth_ids[q], truth_scores[q] = ids[keep], scores[keep]
+
+    wrapped = QuantizedCollection(collection, index, rescore_factor=rescore_factor)
+    first_pass_hits = rescored_hits = 0
+    latencies = []
+    for q, query in enumerate(queries):
+        expected = set(truth_ids[q])
+        positions, _ = index.search(query, k)
+        first_pass_hits += len(expected & set(index.ids_at(positions)))
+        started = time.perf_counter()
+        ids, _, _ = wrapped._query_one(query, k)
+        latencies.append(time.perf_counter() - started)
+        rescored_hits += len(expected & set(ids))
+
+    total = len(queries) * k
+    return {
+        "dtype": index.info["dtype"],
+        "vectors": len(index),
+        "float32_bytes": float32_bytes,
+        "quantized_bytes": index.nbytes,
+        "memory_reduction": 1.0 - index.nbytes / float32_bytes if float32_bytes else 0.0,
+        f"first_pass_recall_at_{k}": first_pass_hits / total if total else 0.0,
+        f"rescored_recall_at_{k}": rescored_hits / total if total else 0.0,
+        f"recall_delta_at_{k}": rescored_hits / total - 1.0 if total else 0.0,
+        "rescore_factor": rescore_factor,
+        "mean_query_seconds": float(np.mean(latencies)) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    from chroma_db_config import get_chromadb
+
+    parser = argparse.ArgumentParser(description="Quantized side index for the review collection")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write the collection's vectors as a quantized side index")
+    export.add_argument("--dtype", choices=QUANTIZATION_DTYPES, default="int8")
+    export.add_argument("--output", required=True, help="Directory for the side index")
+    export.add_argument("--metric", choices=METRICS, default="l2",
+                        help="Distance metric of the collection (its hnsw:space), used for reported distances")
+    export.add_argument("--no-exact", action="store_true",
+                        help="Do not keep float32 vectors; re-score from the embeddings stored in Chroma")
+    report = commands.add_parser("evaluate", help="Report memory reduction and recall against exact search")
+    report.add_argument("--index", required=True, help="Side index directory")
+    report.add_argument("--queries", type=int, default=200, help="Stored vectors sampled as queries")
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--rescore-factor", type=int, default=DEFAULT_RESCORE_FACTOR)
+    args = parser.parse_args()
+
+    _, _, review_collection = get_chromadb()
+    if args.command == "export":
+        info = export_quantized_index(review_collection, args.output, args.dtype, keep_exact=not args.no_exact,
+                                      metric=args.metric)
+        print(json.dumps(info, indent=2))
+    else:
+        print(json.dumps(evaluate(review_collection, QuantizedIndex(args.index), args.queries, args.k,
+                                  args.rescore_factor), indent=2))
+
+
+if __name__ == "__main__":
+    main()
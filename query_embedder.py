@@ -0,0 +1,91 @@
+"""Micro-batching of query embeddings across concurrent sessions.
+
+Every chat turn embeds one short query, and a batch of one leaves the embedding model's
+matrix multiplies mostly idle. MicroBatchEmbedder wraps an embedding function: the first
+caller of a window waits up to max_wait_seconds (or until max_batch_size texts are pending)
+for concurrent callers, embeds every pending text in one call, and hands each caller its own
+slice. There is no background thread; the caller that opens a window does the embedding.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence, Tuple
+
+from metrics import registry
+
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_SECONDS = 0.002
+
+
+class MicroBatchEmbedder:
+    """Embedding function that batches concurrent calls; usable anywhere the wrapped one is."""
+
+    def __init__(self, embedding_function: Callable[[List[str]], Any], max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS):
+        self.embedding_function = embedding_function
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._condition = threading.Condition()
+        self._pending: List[Tuple[List[str], Future, float]] = []
+        self._pending_texts = 0
+        self._collecting = False
+        self._batch_sizes = registry.histogram("query_embedder_batch_size", "Texts embedded per micro-batch",
+                                               buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+        self._wait_seconds = registry.histogram("query_embedder_wait_seconds",
+                                                "Time a query waited for its micro-batch to start",
+                                                buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1))
+        self._requests = registry.counter("query_embedder_requests_total", "Embedding calls served by the micro-batcher")
+
+    def __call__(self, input: Sequence[str]) -> List[Any]:
+        texts = list(input)
+        if not texts:
+            return []
+        future: Future = Future()
+        with self._condition:
+            self._pending.append((texts, future, time.perf_counter()))
+            self._pending_texts += len(texts)
+            leader = not self._collecting
+            if leader:
+                self._collecting = True
+            elif self._pending_texts >= self.max_batch_size:
+                self._condition.notify_all()
+        self._requests.inc()
+        if leader:
+            self._embed(self._collect())
+        return future.result()
+
+    def _collect(self) -> List[Tuple[List[str], Future, float]]:
+        """Wait for the window to close, then take every pending request."""
+        with self._condition:
+            deadline = time.perf_counter() + self.max_wait_seconds
+            while self._pending_texts < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._pending, self._pending_texts = self._pending, [], 0
+            self._collecting = False
+        return batch
+
+    def _embed(self, batch: List[Tuple[List[str], Future, float]]) -> None:
+        started = time.perf_counter()
+        texts = [text for request_texts, _, _ in batch for text in request_texts]
+        for _, _, submitted_at in batch:
+            self._wait_seconds.observe(started - submitted_at)
+        self._batch_sizes.observe(len(texts))
+        try:
+            embeddings = list(self.embedding_function(texts))
+        except BaseException as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for request_texts, future, _ in batch:
+            future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    def name(self) -> str:
+        inner = getattr(self.embedding_function, "name", None)
+        return f"micro-batched-{inner() if callable(inner) else type(self.embedding_function).__name__}"
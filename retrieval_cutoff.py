@@ -0,0 +1,144 @@
+"""Adaptive n_results: drop retrieval hits that are too far away to be worth prompt tokens.
+
+n_results is an upper bound. Per collection, a RetrievalCutoff keeps at least min_results
+hits and drops every hit farther than max_distance, or past the first gap of at least min_gap
+between consecutive distances (sorted nearest first). The cutoffs are calibrated from the
+`cutoff` spans of a trace file (chatbot --trace-file), which record the distances of every
+result list before it is cut.
+
+Command line:
+    python retrieval_cutoff.py calibrate --trace-file spans.jsonl --output retrieval_cutoffs.json
+"""
+
+import argparse
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from chunking import select_hits
+from metrics import percentile
+
+
+DEFAULT_DISTANCE_QUANTILE = 90.0
+DEFAULT_GAP_QUANTILE = 99.0
+
+
+@dataclass
+class RetrievalCutoff:
+    """Where one collection's hits stop being worth sending to Gemini."""
+    max_distance: Optional[float] = None
+    min_gap: Optional[float] = None
+    min_results: int = 1
+
+    def limit(self, distances: Sequence[float]) -> float:
+        """Largest distance kept for one query's hits."""
+        limit = self.max_distance if self.max_distance is not None else float("inf")
+        if self.min_gap is not None:
+            ordered = sorted(distances)
+            for previous, current in zip(ordered, ordered[1:]):
+                if current - previous >= self.min_gap:
+                    limit = min(limit, previous)
+                    break
+        return limit
+
+    def keep(self, distances: Sequence[float]) -> List[int]:
+        """Positions of the hits to keep, in their original order."""
+        limit = self.limit(distances)
+        return [position for position, distance in enumerate(distances)
+                if position < self.min_results or distance <= limit]
+
+
+def apply_cutoff(results: Dict[str, Any], cutoff: RetrievalCutoff) -> Dict[str, Any]:
+    """Chroma query result without the hits beyond the cutoff; unchanged without distances."""
+    if not results.get("distances"):
+        return results
+    return select_hits(results, [cutoff.keep(distances) for distances in results["distances"]])
+
+
+def calibrate(samples: Sequence[Sequence[float]], distance_quantile: float = DEFAULT_DISTANCE_QUANTILE,
+              gap_quantile: float = DEFAULT_GAP_QUANTILE, min_results: int = 1) -> RetrievalCutoff:
+    """Cutoff from logged per-query distances.
+
+    max_distance is the distance_quantile percentile of all logged hit distances, so the
+    farthest tail of hits is dropped. min_gap is the gap_quantile percentile of the gaps
+    between consecutive hits, so only an unusually large jump ends a result list early.
+    """
+    distances = [distance for sample in samples for distance in sample]
+    gaps = [current - previous for sample in samples
+            for previous, current in zip(sorted(sample), sorted(sample)[1:])]
+    return RetrievalCutoff(max_distance=percentile(distances, distance_quantile) if distances else None,
+                           min_gap=percentile(gaps, gap_quantile) if gaps else None,
+                           min_results=min_results)
+
+
+def _attribute(value: Dict[str, Any]) -> Any:
+    if "arrayValue" in value:
+        return [_attribute(item) for item in value["arrayValue"].get("values", [])]
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+def read_logged_distances(trace_path: str) -> Dict[str, List[List[float]]]:
+    """Per-collection result distances of every `cutoff` span in a trace file."""
+    samples: Dict[str, List[List[float]]] = {}
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            span = json.loads(line)
+            if span.get("name") != "cutoff":
+                continue
+            attributes = {item["key"]: _attribute(item["value"]) for item in span.get("attributes", [])}
+            if attributes.get("distances"):
+                samples.setdefault(attributes.get("collection", ""), []).append(
+                    [float(distance) for distance in attributes["distances"]])
+    return samples
+
+
+def load_cutoffs(path: str) -> Dict[str, RetrievalCutoff]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return {collection: RetrievalCutoff(**values) for collection, values in json.load(f).items()}
+
+
+def save_cutoffs(path: str, cutoffs: Dict[str, RetrievalCutoff]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({collection: asdict(cutoff) for collection, cutoff in cutoffs.items()}, f, indent=2, sort_keys=True)
+
+
+def cutoff_report(samples: Sequence[Sequence[float]], cutoff: RetrievalCutoff) -> Dict[str, float]:
+    """Average hits per query with and without the cutoff over the logged queries."""
+    kept = [len(cutoff.keep(sample)) for sample in samples]
+    return {
+        "queries": len(samples),
+        "avg_hits_before": sum(len(sample) for sample in samples) / max(1, len(samples)),
+        "avg_hits_after": sum(kept) / max(1, len(samples)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate per-collection retrieval cutoffs from logged queries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="Fit cutoffs to the cutoff spans of a trace file")
+    calibrate_parser.add_argument("--trace-file", required=True, help="JSON lines written by --trace-file")
+    calibrate_parser.add_argument("--output", default="retrieval_cutoffs.json", help="Where to write the cutoffs")
+    calibrate_parser.add_argument("--distance-quantile", type=float, default=DEFAULT_DISTANCE_QUANTILE,
+                                  help="Percentile of logged hit distances used as max_distance")
+    calibrate_parser.add_argument("--gap-quantile", type=float, default=DEFAULT_GAP_QUANTILE,
+                                  help="Percentile of consecutive-hit gaps used as min_gap")
+    calibrate_parser.add_argument("--min-results", type=int, default=1, help="Hits always kept per query")
+    args = parser.parse_args()
+
+    samples = read_logged_distances(args.trace_file)
+    cutoffs = {collection: calibrate(collection_samples, args.distance_quantile, args.gap_quantile, args.min_results)
+               for collection, collection_samples in samples.items()}
+    save_cutoffs(args.output, cutoffs)
+    for collection, cutoff in sorted(cutoffs.items()):
+        print(f"{collection}: {asdict(cutoff)} {json.dumps(cutoff_report(samples[collection], cutoff))}")
+    print(f"Cutoffs written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
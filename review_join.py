@@ -0,0 +1,145 @@
+"""Join index from each product's parent_asin to the IDs of its reviews.
+
+Answering "what do reviewers say about product X" with a semantic query over every review
+only hopes the right product's reviews come back. The builders (and streaming ingest) record
+each review document's parent_asin in a SQLite table clustered by (parent_asin, review_id),
+stored as review_join.sqlite next to the collections of an index version. Reviews of known
+products are then fetched by ID with collection.get, and optionally ranked by similarity to
+the query inside that subset only.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+JOIN_INDEX_FILENAME = "review_join.sqlite"
+
+# Most candidate reviews embedded and ranked for one fetch
+MAX_CANDIDATES = 2000
+
+
+class ReviewJoinIndex:
+    """parent_asin -> review document IDs, in a WITHOUT ROWID table sorted by product."""
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS review_join ("
+                    "parent_asin TEXT NOT NULL, review_id TEXT NOT NULL, "
+                    "PRIMARY KEY (parent_asin, review_id)) WITHOUT ROWID"
+                )
+        self._lock = threading.Lock()
+
+    def add(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Record review documents; documents without a parent_asin are skipped."""
+        rows = [(metadata["parent_asin"], doc_id) for doc_id, metadata in zip(ids, metadatas)
+                if metadata and metadata.get("parent_asin")]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO review_join (parent_asin, review_id) VALUES (?, ?)", rows)
+
+    def review_ids(self, parent_asins: Sequence[str], limit: Optional[int] = None) -> Dict[str, List[str]]:
+        """Review IDs per product, at most limit per product."""
+        found: Dict[str, List[str]] = {}
+        with self._lock:
+            for parent_asin in dict.fromkeys(parent_asins):
+                rows = self._conn.execute(
+                    "SELECT review_id FROM review_join WHERE parent_asin = ? ORDER BY review_id LIMIT ?",
+                    (parent_asin, -1 if limit is None else limit)
+                ).fetchall()
+                if rows:
+                    found[parent_asin] = [row[0] for row in rows]
+        return found
+
+    def count(self, parent_asin: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM review_join WHERE parent_asin = ?",
+                                      (parent_asin,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_review_join(index_path: str) -> Optional[ReviewJoinIndex]:
+    """Read-only join index of the index version at index_path, or None if it was built without one."""
+    path = os.path.join(index_path, JOIN_INDEX_FILENAME)
+    return ReviewJoinIndex(path, read_only=True) if os.path.exists(path) else None
+
+
+def _interleave(ids_per_product: Dict[str, List[str]]) -> List[str]:
+    """Round-robin over products so a few heavily reviewed products do not crowd out the rest."""
+    columns = list(ids_per_product.values())
+    return [ids[index] for index in range(max(map(len, columns), default=0)) for ids in columns if index < len(ids)]
+
+
+def _empty_results(with_distances: bool) -> Dict[str, Any]:
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]] if with_distances else None}
+
+
+def _in_order(found: Dict[str, Any], candidates: Sequence[str], columns: Sequence[str]) -> Dict[str, List[Any]]:
+    """Columns of a collection.get result reordered to match candidates; get does not keep the request order."""
+    position = {doc_id: index for index, doc_id in enumerate(found["ids"])}
+    rows = [position[doc_id] for doc_id in candidates if doc_id in position]
+    return {column: [found[column][row] for row in rows] for column in columns}
+
+
+def _squared_l2(query: Sequence[float], embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+    """Squared L2 distance from query to every row of embeddings."""
+    differences = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1) - \
+        np.asarray(query, dtype=np.float32)
+    return np.einsum("ij,ij->i", differences, differences)
+
+
+def fetch_product_reviews(collection: Any, parent_asins: Sequence[str], n_results: int = 5,
+                          join_index: Optional[ReviewJoinIndex] = None,
+                          query_embedding: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """Reviews of the given products, shaped like a one-query Chroma query result.
+
+    With a join index the reviews are fetched by ID; without one, through a where filter on
+    parent_asin (which the NumPy backend does not support). With query_embedding they are the
+    n_results nearest reviews of those products, with squared-L2 distances like Chroma's
+    default space; without it, up to n_results reviews taken round-robin across the products.
+    """
+    if join_index is None:
+        where = {"parent_asin": {"$in": list(parent_asins)}}
+        if query_embedding is not None:
+            return collection.query(query_embeddings=[list(query_embedding)], n_results=n_results, where=where)
+        found = collection.get(where=where, limit=n_results, include=["documents", "metadatas"])
+        return {"ids": [found["ids"]], "documents": [found["documents"]], "metadatas": [found["metadatas"]],
+                "distances": None}
+
+    limit = None if query_embedding is not None else n_results
+    candidates = _interleave(join_index.review_ids(parent_asins, limit=limit))
+    if not candidates:
+        # Chroma rejects get(ids=[])
+        return _empty_results(query_embedding is not None)
+    if query_embedding is None:
+        candidates = candidates[:n_results]
+        found = _in_order(collection.get(ids=candidates, include=["documents", "metadatas"]), candidates,
+                          ("ids", "documents", "metadatas"))
+        return {"ids": [found["ids"]], "documents": [found["documents"]], "metadatas": [found["metadatas"]],
+                "distances": None}
+
+    candidates = candidates[:MAX_CANDIDATES]
+    found = _in_order(collection.get(ids=candidates, include=["documents", "metadatas", "embeddings"]), candidates,
+                      ("ids", "documents", "metadatas", "embeddings"))
+    if not found["ids"]:
+        return _empty_results(True)
+    distances = _squared_l2(query_embedding, found["embeddings"])
+    order = np.argsort(distances, kind="stable")[:n_results].tolist()
+    return {
+        "ids": [[found["ids"][position] for position in order]],
+        "documents": [[found["documents"][position] for position in order]],
+        "metadatas": [[found["metadatas"][position] for position in order]],
+        "distances": [[float(distances[position]) for position in order]],
+    }
@@ -32,6 +32,8 @@ def main():
     parser.add_argument("--coverage", action="store_true", help="Run tests with coverage report")
     parser.add_argument("--integration", action="store_true", help="Include integration tests")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument("--benchmark", action="store_true", help="Run the retrieval benchmarks and compare to the baseline")
+    parser.add_argument("--benchmark-sizes", help="Comma-separated record counts to benchmark (default: 10000,100000,1000000)")
     args = parser.parse_args()
 
     # Base pytest command
@@ -44,6 +46,11 @@ def main():
         # Skip integration tests by default
         cmd.extend(["-m", "not integration"])
 
+    if args.benchmark:
+        cmd.extend(["--benchmark", "-s"])
+        if args.benchmark_sizes:
+            cmd.extend(["--benchmark-sizes", args.benchmark_sizes])
+
     if args.coverage:
         cmd.extend(["--cov=.", "--cov-report=html", "--cov-report=term"])
 
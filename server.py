@@ -0,0 +1,381 @@
+"""HTTP/WebSocket serving mode for the ecommerce chatbot.
+
+Endpoints:
+    POST   /chat                 {"session_id": ..., "message": ...} -> streamed NDJSON reply chunks
+    GET    /ws?session_id=...    WebSocket; each text frame is a user message, replies stream back as frames
+    DELETE /sessions/<id>        Forget a session
+    GET    /metrics              Prometheus-style metrics
+    GET    /latency              p50/p95/p99 latency per pipeline span (JSON)
+    GET    /healthz              Liveness probe
+
+The server polls the index manifest (see index_versions.py) and swaps every new turn to a newly
+activated index version; turns already running finish on the version they started with.
+"""
+
+import argparse
+import base64
+import dataclasses
+import hashlib
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, Optional
+from urllib.parse import parse_qs, urlparse
+
+from chatbot import (ChatResources, EcommerceChatbot, add_chat_arguments, apply_chat_arguments, load_resources,
+                     open_collections)
+from exceptions import ServerOverloadedError
+from index_versions import IndexManifest, IndexWatcher
+from metrics import registry
+from models import ServerConfig
+from review_join import open_review_join
+from session_state import load_session_state
+from session_store import SessionStore, create_session_store
+from tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Fixed pool of session locks; a session always maps to the same stripe, and nothing is kept per session
+SESSION_LOCK_STRIPES = 256
+
+# Marker placed on a turn's output queue once the turn has finished
+_TURN_DONE = object()
+
+
+class WorkerPool:
+    """Bounded worker pool that rejects work instead of queueing without limit."""
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-worker")
+        self._max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pending_gauge = registry.gauge("chatbot_pending_turns", "Turns queued or running in the worker pool")
+        self._rejected = registry.counter("chatbot_rejected_turns_total", "Turns rejected because the server was overloaded")
+
+    def submit(self, fn: Callable[[], None]) -> None:
+        """Run fn on a worker, raising ServerOverloadedError when the pool is saturated."""
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self._rejected.inc()
+                raise ServerOverloadedError(f"Server is busy ({self._pending} turns pending). Please retry shortly.")
+            self._pending += 1
+            self._pending_gauge.set(self._pending)
+
+        def run():
+            try:
+                fn()
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    self._pending_gauge.set(self._pending)
+
+        self._executor.submit(run)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class ChatService:
+    """Runs chat turns for many sessions on top of shared models and collections."""
+
+    def __init__(self, resources: ChatResources, store: SessionStore, pool: WorkerPool, debug: bool = False):
+        self.resources = resources
+        self.store = store
+        self.pool = pool
+        self.debug = debug
+        self._session_locks = [threading.Lock() for _ in range(SESSION_LOCK_STRIPES)]
+        self._turns = registry.counter("chatbot_turns_total", "Chat turns completed")
+        self._turn_errors = registry.counter("chatbot_turn_errors_total", "Chat turns that raised an error")
+        self._active = registry.gauge("chatbot_active_turns", "Chat turns currently running")
+        self._latency = registry.histogram("chatbot_turn_latency_seconds", "End-to-end latency of a chat turn")
+        self._index_swaps = registry.counter("chatbot_index_swaps_total", "Index versions swapped in while serving")
+        self._state_bytes = registry.histogram("chatbot_session_state_bytes", "Serialized session state size",
+                                               buckets=(256, 1024, 4096, 16384, 65536))
+        self.index_watcher: Optional[IndexWatcher] = None
+
+    def swap_index(self, path: str) -> None:
+        """Open the index version at path and use it for every turn started from now on."""
+        client, meta_collection, review_collection = open_collections(path, self.resources.embedding_function)
+        # One reference assignment: running turns keep the resources they were built with
+        self.resources = dataclasses.replace(self.resources, client=client, product_meta_collection=meta_collection,
+                                             product_review_collection=review_collection,
+                                             review_join=open_review_join(path))
+        self._index_swaps.inc()
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        return self._session_locks[zlib.crc32(session_id.encode("utf-8")) % len(self._session_locks)]
+
+    def _run_turn(self, session_id: str, message: str, output: Callable[[str], None]) -> None:
+        # Turns of one session are serialized so state updates are never lost. Only the compact
+        # session state is stored, so the next turn can run in any worker process.
+        with self._session_lock(session_id):
+            self._active.inc()
+            started = time.perf_counter()
+            try:
+                state = load_session_state(self.store.load(session_id))
+                chatbot = EcommerceChatbot(debug=self.debug, output=output,
+                                           resources=self.resources, state=state)
+                chatbot.process_user_input(message)
+                data = chatbot.state.to_dict()
+                self._state_bytes.observe(len(json.dumps(data, separators=(",", ":"))))
+                self.store.save(session_id, data)
+                self._turns.inc()
+            except Exception:
+                self._turn_errors.inc()
+                logger.exception(f"Chat turn failed for session {session_id}")
+                output("I'm sorry, an unexpected error occurred while processing your request. Please try again.")
+            finally:
+                self._latency.observe(time.perf_counter() - started)
+                self._active.dec()
+
+    def stream_turn(self, session_id: str, message: str) -> Iterator[str]:
+        """Submit a turn and yield its reply chunks as the chatbot produces them.
+
+        Raises ServerOverloadedError before yielding anything if the pool is saturated.
+        """
+        chunks: "queue.Queue[Any]" = queue.Queue()
+
+        def job():
+            try:
+                self._run_turn(session_id, message, chunks.put)
+            finally:
+                chunks.put(_TURN_DONE)
+
+        self.pool.submit(job)
+
+        def iterate():
+            while True:
+                chunk = chunks.get()
+                if chunk is _TURN_DONE:
+                    return
+                yield chunk
+
+        return iterate()
+
+    def end_session(self, session_id: str) -> None:
+        self.store.delete(session_id)
+
+
+def _websocket_accept_key(key: str) -> str:
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def _read_websocket_frame(rfile) -> Optional[tuple]:
+    """Read a single client frame and return (opcode, payload), or None on EOF."""
+    header = rfile.read(2)
+    if len(header) < 2:
+        return None
+    opcode = header[0] & 0x0F
+    masked = header[1] & 0x80
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", rfile.read(8))[0]
+    mask = rfile.read(4) if masked else b""
+    payload = bytearray(rfile.read(length))
+    if masked:
+        for i in range(len(payload)):
+            payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def _encode_websocket_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Encode a single unmasked server frame."""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    """Routes HTTP and WebSocket requests to the ChatService."""
+
+    protocol_version = "HTTP/1.1"
+    service: ChatService = None  # Set by make_server
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Keep request logs off stdout; the chatbot owns the terminal in debug mode
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/metrics":
+            payload = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif url.path == "/latency":
+            self._send_json(200, tracer.latency_summary())
+        elif url.path == "/ws":
+            session_id = parse_qs(url.query).get("session_id", [str(uuid.uuid4())])[0]
+            self._handle_websocket(session_id)
+        else:
+            self._send_json(404, {"error": f"Unknown path '{url.path}'"})
+
+    def do_POST(self) -> None:
+        if urlparse(self.path).path != "/chat":
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            message = body["message"]
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": "Body must be JSON with a 'message' field"})
+            return
+        session_id = body.get("session_id") or str(uuid.uuid4())
+
+        try:
+            chunks = self.service.stream_turn(session_id, message)
+        except ServerOverloadedError as e:
+            self._send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Session-Id", session_id)
+        self.end_headers()
+        for chunk in chunks:
+            self._write_chunk((json.dumps({"type": "message", "text": chunk}) + "\n").encode("utf-8"))
+        self._write_chunk((json.dumps({"type": "done", "session_id": session_id}) + "\n").encode("utf-8"))
+        self._write_chunk(b"")
+
+    def do_DELETE(self) -> None:
+        path = urlparse(self.path).path
+        if not path.startswith("/sessions/"):
+            self._send_json(404, {"error": f"Unknown path '{path}'"})
+            return
+        self.service.end_session(path[len("/sessions/"):])
+        self._send_json(200, {"status": "deleted"})
+
+    def _handle_websocket(self, session_id: str) -> None:
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key or self.headers.get("Upgrade", "").lower() != "websocket":
+            self._send_json(400, {"error": "Expected a WebSocket upgrade request"})
+            return
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", _websocket_accept_key(key))
+        self.end_headers()
+
+        def send(body: Dict[str, Any]) -> None:
+            self.wfile.write(_encode_websocket_frame(json.dumps(body).encode("utf-8")))
+            self.wfile.flush()
+
+        send({"type": "session", "session_id": session_id})
+        while True:
+            frame = _read_websocket_frame(self.rfile)
+            if frame is None:
+                break
+            opcode, payload = frame
+            if opcode == 0x8:  # Close
+                self.wfile.write(_encode_websocket_frame(b"", opcode=0x8))
+                break
+            if opcode == 0x9:  # Ping
+                self.wfile.write(_encode_websocket_frame(payload, opcode=0xA))
+                continue
+            if opcode != 0x1:
+                continue
+            try:
+                for chunk in self.service.stream_turn(session_id, payload.decode("utf-8")):
+                    send({"type": "message", "text": chunk})
+                send({"type": "done"})
+            except ServerOverloadedError as e:
+                send({"type": "error", "error": str(e), "retry_after": 1})
+        self.close_connection = True
+
+
+def make_server(server_config: ServerConfig, resources: Optional[ChatResources] = None,
+                debug: bool = False) -> ThreadingHTTPServer:
+    """Build an HTTP server whose sessions all share one set of models and collections."""
+    service = ChatService(
+        resources=resources or load_resources(),
+        store=create_session_store(server_config.session_store),
+        pool=WorkerPool(server_config.max_workers, server_config.max_pending_turns),
+        debug=debug,
+    )
+    if server_config.index_poll_seconds > 0:
+        service.index_watcher = IndexWatcher(IndexManifest(), service.swap_index, server_config.index_poll_seconds)
+        service.index_watcher.start()
+    handler = type("BoundChatRequestHandler", (ChatRequestHandler,), {"service": service})
+    httpd = ThreadingHTTPServer((server_config.host, server_config.port), handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+def start_server():
+    """Main entry point for serving the chatbot over HTTP/WebSocket."""
+    defaults = ServerConfig()
+    parser = argparse.ArgumentParser(description="E-commerce AI Chatbot server")
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug output")
+    parser.add_argument("--host", default=defaults.host, help="Interface to bind")
+    parser.add_argument("--port", type=int, default=defaults.port, help="Port to bind")
+    parser.add_argument("--session-store", default=defaults.session_store,
+                        help="'memory' or 'sqlite:///<path>'")
+    parser.add_argument("--max-workers", type=int, default=defaults.max_workers,
+                        help="Concurrent chat turns per worker process")
+    parser.add_argument("--max-pending-turns", type=int, default=defaults.max_pending_turns,
+                        help="Turns accepted before new ones are rejected with 503")
+    parser.add_argument("--index-poll-seconds", type=float, default=defaults.index_poll_seconds,
+                        help="How often to check the index manifest for a new active version (0 disables)")
+    # Accepted so that `chatbot.py --serve ...` can hand its command line to the server
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    add_chat_arguments(parser)
+    # Concurrent sessions can share query embedding batches, so the server waits for them by default
+    parser.set_defaults(query_embed_wait_ms=defaults.query_embed_wait_ms)
+    args = parser.parse_args()
+    apply_chat_arguments(args)
+
+    server_config = ServerConfig(host=args.host, port=args.port, session_store=args.session_store,
+                                 max_workers=args.max_workers, max_pending_turns=args.max_pending_turns,
+                                 index_poll_seconds=args.index_poll_seconds)
+    httpd = make_server(server_config, debug=args.debug)
+    print(f"Serving E-commerce Chatbot on http://{server_config.host}:{server_config.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    start_server()
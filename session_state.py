@@ -0,0 +1,123 @@
+"""Compact, serializable conversation state so a session can resume in any worker process.
+
+The Gemini chat session keeps its history in-process, and that history carries every RAG
+prompt with its full results. SessionState keeps only what later turns need:
+
+    turns        a short digest per turn: user message, actions, reply and search query
+    ids          the product/review IDs retrieved by the latest search
+    constraints  what the shopper has asked for so far (last search, price bounds)
+
+to_dict()/from_dict() give the compact JSON form the session stores persist, and the chatbot
+rebuilds a chat history from it (chatbot.state_to_history) without replaying RAG payloads.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from models import TurnRecord
+
+
+STATE_VERSION = 1
+
+# Turns kept in a state; older ones fall off, like a sliding context window
+MAX_TURNS = 12
+# Longest reply and user message kept per turn digest
+DIGEST_CHARS = 300
+MAX_IDS = 20
+
+MAX_PRICE_PATTERN = re.compile(r"\b(?:under|below|less than|cheaper than|up to|max(?:imum)?)\s*\$?\s*(\d+(?:\.\d+)?)",
+                               re.IGNORECASE)
+MIN_PRICE_PATTERN = re.compile(r"\b(?:over|above|more than|at least|min(?:imum)?)\s*\$?\s*(\d+(?:\.\d+)?)",
+                               re.IGNORECASE)
+
+
+def _clip(text: Optional[str]) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= DIGEST_CHARS else text[:DIGEST_CHARS - 3] + "..."
+
+
+@dataclass
+class TurnDigest:
+    """What one turn asked and answered, without the retrieved documents."""
+    user: str
+    actions: List[str] = field(default_factory=list)
+    reply: str = ""
+    query: str = ""
+
+
+@dataclass
+class SessionState:
+    """Everything a new worker needs to continue a conversation."""
+    turns: List[TurnDigest] = field(default_factory=list)
+    last_retrieved_ids: List[str] = field(default_factory=list)
+    constraints: Dict[str, str] = field(default_factory=dict)
+
+    def record_turn(self, turn: TurnRecord) -> None:
+        """Fold a finished turn into the state."""
+        query = turn.queries[-1] if turn.queries else ""
+        self.turns.append(TurnDigest(user=_clip(turn.user_input), actions=list(turn.actions),
+                                     reply=_clip(turn.final_message), query=query))
+        del self.turns[:-MAX_TURNS]
+        if turn.retrieved_ids:
+            self.last_retrieved_ids = list(turn.retrieved_ids[:MAX_IDS])
+        if query:
+            self.constraints["query"] = query
+        for key, pattern in (("max_price", MAX_PRICE_PATTERN), ("min_price", MIN_PRICE_PATTERN)):
+            match = pattern.search(turn.user_input)
+            if match:
+                self.constraints[key] = match.group(1)
+
+    def context_note(self) -> Optional[str]:
+        """One message carrying the retrieved IDs and constraints into a rebuilt history."""
+        parts = []
+        if self.constraints:
+            parts.append("constraints: " + ", ".join(f"{key}={value}" for key, value in sorted(self.constraints.items())))
+        if self.last_retrieved_ids:
+            parts.append("last retrieved IDs: " + ", ".join(self.last_retrieved_ids))
+        return "Session context from earlier turns; " + "; ".join(parts) if parts else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact JSON-ready form: turns are [user, actions, reply, query] lists."""
+        data: Dict[str, Any] = {
+            "v": STATE_VERSION,
+            "turns": [[digest.user, ",".join(digest.actions), digest.reply, digest.query] for digest in self.turns],
+        }
+        if self.last_retrieved_ids:
+            data["ids"] = self.last_retrieved_ids
+        if self.constraints:
+            data["constraints"] = self.constraints
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionState":
+        if data.get("v") != STATE_VERSION:
+            raise ValueError(f"Unsupported session state version {data.get('v')!r}")
+        turns = [TurnDigest(user=user, actions=actions.split(",") if actions else [], reply=reply, query=query)
+                 for user, actions, reply, query in data.get("turns", [])]
+        return cls(turns=turns, last_retrieved_ids=list(data.get("ids", [])),
+                   constraints=dict(data.get("constraints", {})))
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, str]]) -> "SessionState":
+        """State from a full {role, text} history, as stored before session states existed.
+
+        RAG follow-up prompts are dropped; each user message keeps the last model reply after it.
+        """
+        state = cls()
+        for record in records:
+            if record["role"] == "user" and "RAG Results:" not in record["text"]:
+                state.turns.append(TurnDigest(user=_clip(record["text"])))
+            elif record["role"] == "model" and state.turns:
+                state.turns[-1].reply = _clip(record["text"])
+        del state.turns[:-MAX_TURNS]
+        return state
+
+
+def load_session_state(data: Any) -> SessionState:
+    """SessionState from what a session store returned: None, a state dict or a legacy history."""
+    if data is None:
+        return SessionState()
+    if isinstance(data, list):
+        return SessionState.from_records(data)
+    return SessionState.from_dict(data)
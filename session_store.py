@@ -0,0 +1,109 @@
+"""Pluggable session stores holding conversation state for served chats.
+
+The server saves a compact SessionState dict (see session_state.py). Sessions saved before
+that hold a full history, a list of {"role", "text"} records, which still loads.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Protocol, Union
+
+
+# A conversation history is a list of {"role": "user" | "model", "text": str} records
+History = List[Dict[str, str]]
+# What a store holds per session: a SessionState.to_dict() or a legacy History
+SessionData = Union[History, Dict[str, Any]]
+
+
+class SessionStore(Protocol):
+    """Protocol for session stores (Strategy pattern)."""
+
+    def load(self, session_id: str) -> Optional[SessionData]:
+        """Return the stored data for a session, or None if unknown."""
+        ...
+
+    def save(self, session_id: str, data: SessionData) -> None:
+        """Persist the data for a session."""
+        ...
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session."""
+        ...
+
+
+class InMemorySessionStore:
+    """Session store backed by a dict; sessions are lost on restart.
+
+    Sessions are kept as JSON text, like the SQLite store, so callers never share mutable state.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[SessionData]:
+        with self._lock:
+            data = self._sessions.get(session_id)
+        return json.loads(data) if data is not None else None
+
+    def save(self, session_id: str, data: SessionData) -> None:
+        encoded = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            self._sessions[session_id] = encoded
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Session store backed by a SQLite file, shared by all workers on a host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def load(self, session_id: str) -> Optional[SessionData]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id: str, data: SessionData) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, history, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at",
+                (session_id, json.dumps(data, separators=(",", ":")), time.time())
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(spec: str) -> SessionStore:
+    """Create a session store from a spec such as 'memory' or 'sqlite:///path/sessions.db'."""
+    if spec == "memory":
+        return InMemorySessionStore()
+    if spec.startswith("sqlite:///"):
+        # sqlite:///sessions.db is relative, sqlite:////var/lib/sessions.db is absolute
+        return SQLiteSessionStore(spec[len("sqlite:///"):] or "sessions.db")
+    raise ValueError(f"Unknown session store '{spec}'. Use 'memory' or 'sqlite:///<path>'.")
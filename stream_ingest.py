@@ -0,0 +1,312 @@
+"""Continuous ingestion of reviews appended to a JSONL file or a directory of JSONL files.
+
+New complete lines are tailed from the last committed offset, grouped into micro-batches that
+flush when they reach batch_size records or have waited max_wait_seconds, and upserted into the
+live collection (Chroma embeds them). Offsets are committed to a JSON file (atomic replace)
+only after the upsert succeeds. Record IDs are derived from the record the same way the
+builders derive them (see document_ids.py), so replaying a batch after a crash, or streaming
+a record that is already in a built index, overwrites instead of duplicating. A file that
+shrinks or is replaced (new inode) is read again from the start. Review upserts are also
+recorded in the index version's parent_asin join index (see review_join.py).
+
+Offsets belong to the index version they were committed against. When a new blue/green
+version is activated (or the ingester starts against a version other than the one in the
+offsets file), the streamed files are replayed from the start into it, since the new build
+does not contain what was streamed into the old one.
+
+Usage:
+    python stream_ingest.py --source datasets/incoming/ --offsets stream_offsets.json
+"""
+
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_WORDS, chunk_documents
+from document_ids import last_per_id, meta_document_id, review_document_id
+from metrics import registry
+from review_join import JOIN_INDEX_FILENAME, ReviewJoinIndex
+
+
+logger = logging.getLogger(__name__)
+
+STREAM_KINDS = ("reviews", "meta")
+
+
+@dataclass
+class FilePosition:
+    """How far into a file ingestion has got; inode detects a replaced file."""
+    offset: int = 0
+    inode: int = 0
+
+
+@dataclass
+class TailedRecord:
+    """A parsed line together with the position just after it."""
+    path: str
+    position: FilePosition
+    record: Dict[str, Any]
+    read_at: float
+
+
+class OffsetStore:
+    """Committed per-file positions of one index version, persisted as JSON with an atomic replace."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {}
+        self.index_path: Optional[str] = stored.get("index_path")
+        self._positions = {name: FilePosition(**position) for name, position in stored.get("files", {}).items()}
+
+    def get(self, path: str) -> FilePosition:
+        return self._positions.get(path, FilePosition())
+
+    def follow(self, index_path: str) -> bool:
+        """Tie the offsets to index_path; returns True when positions of another version were dropped.
+
+        Offsets without a recorded version are adopted as they are.
+        """
+        replay = self.index_path is not None and self.index_path != index_path
+        if replay:
+            self._positions = {}
+        if replay or self.index_path is None:
+            self.index_path = index_path
+            self.commit({})
+        return replay
+
+    def commit(self, positions: Dict[str, FilePosition]) -> None:
+        """Durably record positions; returns only once they are on disk."""
+        self._positions.update(positions)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"index_path": self.index_path,
+                       "files": {name: vars(position) for name, position in self._positions.items()}}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+
+class JsonlTailer:
+    """Reads complete new lines from a file, or from every matching file in a directory."""
+
+    def __init__(self, source: str, offsets: OffsetStore, pattern: str = "*.jsonl",
+                 clock: Callable[[], float] = time.time):
+        self.source = source
+        self.offsets = offsets
+        self.pattern = pattern
+        self._clock = clock
+        # Read positions run ahead of the committed ones while records wait in a batch
+        self._positions: Dict[str, FilePosition] = {}
+        self._malformed = registry.counter("stream_ingest_malformed_lines_total", "Tailed lines that were not valid JSON")
+
+    def files(self) -> List[str]:
+        if not os.path.isdir(self.source):
+            return [self.source] if os.path.exists(self.source) else []
+        return sorted(os.path.join(self.source, name) for name in os.listdir(self.source)
+                      if fnmatch.fnmatch(name, self.pattern))
+
+    def _start_position(self, path: str, stat: os.stat_result) -> FilePosition:
+        position = self._positions.get(path) or self.offsets.get(path)
+        if position.inode not in (0, stat.st_ino) or position.offset > stat.st_size:
+            logger.warning(f"{path} was replaced or truncated; reading it from the start")
+            return FilePosition(0, stat.st_ino)
+        return FilePosition(position.offset, stat.st_ino)
+
+    def read(self, max_records: int) -> List[TailedRecord]:
+        """Up to max_records records appended since the last read. A partial last line waits."""
+        records: List[TailedRecord] = []
+        for path in self.files():
+            if len(records) >= max_records:
+                break
+            stat = os.stat(path)
+            position = self._start_position(path, stat)
+            if position.offset == stat.st_size:
+                self._positions[path] = position
+                continue
+            with open(path, 'rb') as f:
+                f.seek(position.offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    position = FilePosition(position.offset + len(line), stat.st_ino)
+                    if line.strip():
+                        try:
+                            records.append(TailedRecord(path, position, json.loads(line), self._clock()))
+                        except ValueError:
+                            self._malformed.inc()
+                            logger.warning(f"Skipping malformed line ending at byte {position.offset} of {path}")
+                    if len(records) >= max_records:
+                        break
+            self._positions[path] = position
+        return records
+
+    def rewind(self) -> None:
+        """Forget uncommitted read positions, e.g. after a failed upsert."""
+        self._positions.clear()
+
+
+def review_document(review: Dict[str, Any]) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """(document, id, metadata) for a review, or None without text. The id is stable across replays."""
+    if not review.get('text') or not review.get('parent_asin'):
+        return None
+    return str(review['text']).lower(), review_document_id(review), {"parent_asin": review['parent_asin']}
+
+
+def meta_document(product: Dict[str, Any]) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """(document, id, metadata) for a product, or None without a title."""
+    if not product.get('title') or not product.get('parent_asin'):
+        return None
+    return (str(product['title']).lower(), meta_document_id(product),
+            {"parent_asin": product['parent_asin'], "average_rating": product.get('average_rating')})
+
+
+class StreamIngester:
+    """Micro-batches tailed records and upserts them, committing offsets after each upsert."""
+
+    def __init__(self, collection: Any, tailer: JsonlTailer, kind: str = "reviews", batch_size: int = 256,
+                 max_wait_seconds: float = 2.0, chunk_words: Optional[int] = None,
+                 chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, clock: Callable[[], float] = time.time,
+                 join_index: Optional[ReviewJoinIndex] = None):
+        if kind not in STREAM_KINDS:
+            raise ValueError(f"Unknown stream kind '{kind}'; expected one of {', '.join(STREAM_KINDS)}")
+        self.collection = collection
+        self.tailer = tailer
+        self.kind = kind
+        self.to_document = review_document if kind == "reviews" else meta_document
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.chunk_words = chunk_words
+        self.chunk_overlap = chunk_overlap
+        self.join_index = join_index
+        self._clock = clock
+        self._pending: List[TailedRecord] = []
+        self._records = registry.counter("stream_ingest_records_total", "Records upserted by streaming ingest",
+                                         labels={"kind": kind})
+        self._batch_sizes = registry.histogram("stream_ingest_batch_size", "Records per streaming upsert",
+                                               buckets=(1, 8, 32, 128, 512, 2048))
+        self._freshness = registry.histogram("stream_ingest_freshness_seconds",
+                                             "Seconds from reading a record to its upsert completing")
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.batch_size
+                or self._clock() - self._pending[0].read_at >= self.max_wait_seconds)
+
+    def poll(self) -> int:
+        """Read new records and flush a batch if one is due; returns the records upserted."""
+        self._pending.extend(self.tailer.read(self.batch_size - len(self._pending)))
+        return self.flush() if self._due() else 0
+
+    def flush(self) -> int:
+        """Upsert every pending record and commit their offsets."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, []
+        documents = [document for document in (self.to_document(item.record) for item in batch) if document]
+        if documents:
+            docs, ids, metadatas = (list(column) for column in zip(*documents))
+            ids, docs, metadatas = last_per_id(ids, docs, metadatas)
+            if self.chunk_words:
+                docs, ids, metadatas = chunk_documents(docs, ids, metadatas, self.chunk_words, self.chunk_overlap)
+            try:
+                self.collection.upsert(documents=docs, metadatas=metadatas, ids=ids)
+            except Exception:
+                # Nothing was committed, so the batch is read again on the next poll
+                self.tailer.rewind()
+                raise
+            if self.join_index is not None:
+                self.join_index.add(ids, metadatas)
+
+        positions: Dict[str, FilePosition] = {}
+        for item in batch:
+            positions[item.path] = item.position
+        self.tailer.offsets.commit(positions)
+
+        now = self._clock()
+        for item in batch:
+            self._freshness.observe(now - item.read_at)
+        self._records.inc(len(documents))
+        self._batch_sizes.observe(len(batch))
+        logger.info(f"Upserted {len(documents)} {self.kind} records ({len(batch) - len(documents)} skipped)")
+        return len(documents)
+
+    def run(self, stop: threading.Event, poll_interval_seconds: float = 0.5,
+            before_poll: Optional[Callable[[], Any]] = None) -> None:
+        """Poll until stop is set, then flush what is pending."""
+        while not stop.is_set():
+            if before_poll is not None:
+                before_poll()
+            try:
+                upserted = self.poll()
+            except Exception as e:
+                logger.error(f"Streaming upsert failed, retrying: {e}")
+                upserted = 0
+            if not upserted:
+                stop.wait(poll_interval_seconds)
+        self.flush()
+
+
+def main() -> None:
+    from chroma_db_config import get_chromadb
+    from index_versions import IndexManifest, IndexWatcher
+
+    parser = argparse.ArgumentParser(description="Stream appended reviews or products into the live collections")
+    parser.add_argument("--source", required=True, help="Append-only JSONL file, or a directory of *.jsonl files")
+    parser.add_argument("--offsets", default="stream_offsets.json", help="Where committed offsets are kept")
+    parser.add_argument("--kind", choices=STREAM_KINDS, default="reviews", help="What the stream contains")
+    parser.add_argument("--batch-size", type=int, default=256, help="Flush once this many records are waiting")
+    parser.add_argument("--max-wait", type=float, default=2.0, help="Flush once the oldest record has waited this long")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between checks for new lines")
+    parser.add_argument("--chunk-words", nargs="?", type=int, const=DEFAULT_CHUNK_WORDS, metavar="WORDS",
+                        help="Index long reviews as overlapping windows of WORDS words")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def open_join(path: str) -> Optional[ReviewJoinIndex]:
+        return ReviewJoinIndex(os.path.join(path, JOIN_INDEX_FILENAME)) if args.kind == "reviews" else None
+
+    active_path = IndexManifest().active_path()
+    offsets = OffsetStore(args.offsets)
+    if offsets.follow(active_path):
+        logger.info(f"Offsets were committed against another index version; replaying {args.source} into {active_path}")
+    _, meta_collection, review_collection = get_chromadb(active_path)
+    ingester = StreamIngester(review_collection if args.kind == "reviews" else meta_collection,
+                              JsonlTailer(args.source, offsets), kind=args.kind,
+                              batch_size=args.batch_size, max_wait_seconds=args.max_wait, chunk_words=args.chunk_words,
+                              join_index=open_join(active_path))
+
+    def follow_index(path: str) -> None:
+        # Keep writing to whichever index version the chatbots are serving
+        _, meta, reviews = get_chromadb(path)
+        ingester.flush()
+        ingester.collection = reviews if args.kind == "reviews" else meta
+        if ingester.join_index is not None:
+            ingester.join_index.close()
+        ingester.join_index = open_join(path)
+        # The new version was built without the streamed records, so send them all again
+        if offsets.follow(path):
+            ingester.tailer.rewind()
+            logger.info(f"Index version {path} activated; replaying {args.source} into it")
+
+    watcher = IndexWatcher(IndexManifest(), follow_index)
+    stop = threading.Event()
+    try:
+        ingester.run(stop, args.poll_interval, before_poll=watcher.check)
+    except KeyboardInterrupt:
+        stop.set()
+        ingester.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Map-reduce summarization of large RAG result sets."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+from metrics import registry
+from tracing import tracer
+
+
+# Rough characters-per-token ratio used to size chunks without a tokenizer
+CHARS_PER_TOKEN = 4
+
+MAP_PROMPT = """
+The user asked: "{request}"
+
+Below is part of the product data retrieved for this request ({label}).
+List the facts, product names, ratings and reviewer opinions that help answer the request,
+as short bullet points. Skip anything irrelevant.
+
+{chunk}
+"""
+
+REDUCE_PROMPT = """
+Based on the user's request: "{request}"
+
+Here are notes gathered from {chunk_count} batches of product data ({meta_count} products, {review_count} reviews):
+{notes}
+
+Please provide a very brief, conversational summary in 3-4 sentences maximum that naturally answers the user's question. Focus on the most relevant insights and recommendations. Keep it concise and conversational, like you're chatting with a friend about products.
+"""
+
+COMBINE_PROMPT = """
+The user asked: "{request}"
+
+Merge these notes into one shorter list of bullet points, keeping the facts that best answer the request:
+{notes}
+"""
+
+
+@dataclass
+class TokenUsage:
+    """Token counts summed over several calls, in the shape of Gemini's usage_metadata."""
+    prompt_token_count: int = 0
+    candidates_token_count: int = 0
+
+    def add(self, responses: Sequence[Any]) -> None:
+        for response in responses:
+            usage = getattr(response, 'usage_metadata', None)
+            self.prompt_token_count += getattr(usage, 'prompt_token_count', 0) or 0
+            self.candidates_token_count += getattr(usage, 'candidates_token_count', 0) or 0
+
+
+@dataclass
+class MapReduceResult:
+    """Final summary response plus timings for the map and reduce phases.
+
+    usage_metadata totals every map, combine and reduce call, not only the final response.
+    """
+    response: Any
+    chunk_count: int
+    map_seconds: float
+    reduce_seconds: float
+    usage_metadata: TokenUsage
+
+
+def format_results(results: Dict[str, Any], label: str) -> List[str]:
+    """Flatten a Chroma query result into one line per document, keeping its metadata."""
+    items = []
+    documents = results.get('documents') or []
+    metadatas = results.get('metadatas') or []
+    for query_index, query_documents in enumerate(documents):
+        query_metadatas = metadatas[query_index] if query_index < len(metadatas) and metadatas[query_index] else []
+        for doc_index, document in enumerate(query_documents or []):
+            metadata = query_metadatas[doc_index] if doc_index < len(query_metadatas) else None
+            details = ", ".join(f"{key}={value}" for key, value in (metadata or {}).items())
+            items.append(f"[{label}] ({details}) {document}" if details else f"[{label}] {document}")
+    return items
+
+
+def chunk_items(items: List[str], chunk_tokens: int) -> List[str]:
+    """Pack items into chunks of at most chunk_tokens; oversized items are split."""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks, current, current_length = [], [], 0
+    for item in items:
+        pieces = [item[start:start + max_chars] for start in range(0, len(item), max_chars)] or [item]
+        for piece in pieces:
+            if current and current_length + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, current_length = [], 0
+            current.append(piece)
+            current_length += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class MapReduceSummarizer:
+    """Summarizes chunks of retrieved data in parallel, then reduces the partial notes."""
+
+    def __init__(self, model: Any, chunk_tokens: int = 3000, max_workers: int = 4):
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.max_workers = max_workers
+        self._map_seconds = registry.histogram("summarizer_map_seconds", "Wall time of the parallel map phase")
+        self._reduce_seconds = registry.histogram("summarizer_reduce_seconds", "Wall time of the reduce phase")
+        self._chunks = registry.counter("summarizer_chunks_total", "Chunks summarized in the map phase")
+
+    def _map(self, request: str, labelled_chunks: List[tuple], usage: TokenUsage) -> List[str]:
+        def summarize_chunk(labelled_chunk):
+            label, chunk = labelled_chunk
+            return self.model.generate_content(MAP_PROMPT.format(request=request, label=label, chunk=chunk))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            responses = list(executor.map(summarize_chunk, labelled_chunks))
+        usage.add(responses)
+        return [response.text for response in responses]
+
+    def _reduce(self, request: str, notes: List[str], meta_count: int, review_count: int, chunk_count: int,
+                usage: TokenUsage) -> Any:
+        # Combine notes in parallel batches until they fit into a single reduce prompt
+        while len(notes) > 1 and sum(len(note) for note in notes) > self.chunk_tokens * CHARS_PER_TOKEN:
+            batches = chunk_items(notes, self.chunk_tokens)
+            if len(batches) == len(notes):
+                # Each note already fills a chunk; pair them up so the loop always makes progress
+                batches = ["\n".join(notes[i:i + 2]) for i in range(0, len(notes), 2)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                responses = list(executor.map(
+                    lambda batch: self.model.generate_content(COMBINE_PROMPT.format(request=request, notes=batch)),
+                    batches))
+            usage.add(responses)
+            notes = [response.text for response in responses]
+
+        response = self.model.generate_content(REDUCE_PROMPT.format(
+            request=request, notes="\n\n".join(notes), chunk_count=chunk_count,
+            meta_count=meta_count, review_count=review_count))
+        usage.add([response])
+        return response
+
+    def summarize(self, request: str, meta_results: Dict[str, Any], review_results: Dict[str, Any]) -> MapReduceResult:
+        """Summarize all meta and review results without truncating any of them."""
+        meta_items = format_results(meta_results, "product_meta")
+        review_items = format_results(review_results, "product_review")
+        labelled_chunks = ([("products", chunk) for chunk in chunk_items(meta_items, self.chunk_tokens)] +
+                           [("reviews", chunk) for chunk in chunk_items(review_items, self.chunk_tokens)])
+        self._chunks.inc(len(labelled_chunks))
+        usage = TokenUsage()
+
+        started = time.perf_counter()
+        with tracer.span("summarize_map", chunks=len(labelled_chunks)):
+            notes = self._map(request, labelled_chunks, usage)
+        map_seconds = time.perf_counter() - started
+        self._map_seconds.observe(map_seconds)
+
+        started = time.perf_counter()
+        with tracer.span("summarize_reduce"):
+            response = self._reduce(request, notes, len(meta_items), len(review_items), len(labelled_chunks), usage)
+        reduce_seconds = time.perf_counter() - started
+        self._reduce_seconds.observe(reduce_seconds)
+
+        return MapReduceResult(response=response, chunk_count=len(labelled_chunks),
+                               map_seconds=map_seconds, reduce_seconds=reduce_seconds, usage_metadata=usage)
@@ -15,4 +15,31 @@ def chroma_db_setup():
         return client, product_meta_collection, product_review_collection
     except Exception as e:
         pytest.skip(f"ChromaDB setup failed: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: marks retrieval benchmarks (skipped unless --benchmark is given)")
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", default=False,
+                     help="Run the retrieval benchmarks (slow; builds collections of every size)")
+    parser.addoption("--benchmark-sizes", default="10000,100000,1000000",
+                     help="Comma-separated record counts to benchmark")
+    parser.addoption("--benchmark-save", action="store_true", default=False,
+                     help="Write the measured results to the baseline file instead of comparing")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+def pytest_generate_tests(metafunc):
+    if "benchmark_size" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("--benchmark-sizes").split(",") if size.strip()]
+        metafunc.parametrize("benchmark_size", sizes, ids=[f"{size}" for size in sizes])
@@ -0,0 +1,156 @@
+"""Deterministic synthetic Amazon-style product metadata and reviews for benchmarks."""
+
+import json
+import os
+import random
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+
+ADJECTIVES = ["lightweight", "breathable", "waterproof", "stretchy", "slim fit", "oversized", "vintage",
+              "classic", "quick dry", "thermal", "cotton", "wool", "leather", "compression", "casual"]
+COLORS = ["black", "white", "navy", "grey", "red", "olive", "beige", "pink", "blue", "brown"]
+PRODUCTS = ["running shoes", "sneakers", "hoodie", "t-shirt", "leggings", "compression sleeves", "socks",
+            "rain jacket", "jeans", "sandals", "backpack", "sun hat", "scarf", "dress", "yoga pants"]
+AUDIENCES = ["for women", "for men", "for kids", "unisex", "for hiking", "for the gym", "for travel"]
+OPINIONS = ["fits true to size", "runs a little small", "runs large", "very comfortable", "great quality for the price",
+            "the stitching came loose after a week", "color is exactly as pictured", "washes well",
+            "too thin for winter", "would buy again", "arrived quickly", "material feels cheap",
+            "perfect for long runs", "keeps me warm", "zipper broke quickly"]
+
+# Details placed at the end of long reviews, beyond what the embedding model reads
+DETAILS = ["hidden key pocket", "reflective heel tab", "magnetic zipper garage", "thumbhole cuffs", "removable hood",
+           "drawcord hem", "mesh side vents", "silicone waist grip", "double stitched seams", "fold away stuff sack"]
+
+# Queries issued against the synthetic collections, mixing product and review intents
+BENCHMARK_QUERIES = [
+    "recommend me compression sleeves",
+    "waterproof rain jacket for hiking",
+    "comfortable running shoes for women",
+    "does this hoodie run small",
+    "breathable socks for the gym",
+    "good quality jeans for the price",
+    "warm wool scarf",
+    "kids sandals that last",
+]
+
+
+def parent_asin(index: int) -> str:
+    return f"B{index:09d}"
+
+
+def generate_meta(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield product metadata records shaped like meta_Amazon_Fashion.jsonl."""
+    rng = random.Random(seed)
+    for index in range(count):
+        product = rng.choice(PRODUCTS)
+        title = f"{rng.choice(ADJECTIVES)} {rng.choice(COLORS)} {product} {rng.choice(AUDIENCES)}"
+        yield {
+            "main_category": "AMAZON FASHION",
+            "title": title.title(),
+            "average_rating": round(rng.uniform(1.0, 5.0), 1),
+            "rating_number": rng.randint(0, 5000),
+            "features": [rng.choice(ADJECTIVES) for _ in range(3)],
+            "description": [f"{title} made for everyday wear."],
+            "price": round(rng.uniform(5, 150), 2) if rng.random() < 0.7 else None,
+            "images": [],
+            "videos": [],
+            "store": f"Store{rng.randint(1, 500)}",
+            "categories": [],
+            "details": {"Department": rng.choice(AUDIENCES)},
+            "parent_asin": parent_asin(index),
+            "bought_together": None,
+        }
+
+
+def generate_detailed_meta(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield products whose distinctive detail is only in features and audience only in the description.
+
+    The title names just the color and product, so a title-only index cannot tell the products
+    of one kind apart. categories[0] is the bare product kind, for building queries.
+    """
+    rng = random.Random(seed + 3)
+    for index in range(count):
+        product = rng.choice(PRODUCTS)
+        audience = rng.choice(AUDIENCES)
+        yield {
+            "main_category": "AMAZON FASHION",
+            "title": f"{rng.choice(COLORS)} {product}".title(),
+            "average_rating": round(rng.uniform(1.0, 5.0), 1),
+            "features": [rng.choice(DETAILS).capitalize(), rng.choice(ADJECTIVES).capitalize()],
+            "description": [f"Designed {audience} in {rng.choice(ADJECTIVES)} fabric."],
+            "price": round(rng.uniform(5, 150), 2),
+            "categories": [product],
+            "details": {"Department": audience},
+            "parent_asin": parent_asin(index),
+        }
+
+
+def generate_reviews(count: int, product_count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield review records shaped like Amazon_Fashion.jsonl, spread over product_count products."""
+    rng = random.Random(seed + 1)
+    for index in range(count):
+        product = rng.choice(PRODUCTS)
+        product_asin = parent_asin(rng.randrange(product_count))
+        text = ". ".join(rng.sample(OPINIONS, rng.randint(1, 4)))
+        yield {
+            "rating": float(rng.randint(1, 5)),
+            "title": f"{rng.choice(OPINIONS).capitalize()}",
+            "text": f"These {product} - {text}.",
+            "images": [],
+            "asin": product_asin,
+            "parent_asin": product_asin,
+            "user_id": f"U{rng.randrange(count * 4):012d}",
+            "timestamp": 1500000000000 + index * 1000,
+            "helpful_vote": rng.randint(0, 20),
+            "verified_purchase": rng.random() < 0.9,
+        }
+
+
+def generate_long_reviews(count: int, product_count: int, seed: int = 0,
+                          filler_words: int = 300) -> Iterator[Dict[str, Any]]:
+    """Yield reviews of more than filler_words words whose final sentence names a product detail.
+
+    The detail sentence is the only distinctive part of each review, so finding a review by it
+    requires the end of the text to be indexed.
+    """
+    rng = random.Random(seed + 2)
+    for index in range(count):
+        product = rng.choice(PRODUCTS)
+        product_asin = parent_asin(rng.randrange(product_count))
+        sentences, words = [], 0
+        while words < filler_words:
+            sentence = rng.choice(OPINIONS)
+            sentences.append(sentence)
+            words += len(sentence.split())
+        detail = f"the {rng.choice(COLORS)} {product} have a {rng.choice(DETAILS)} I did not expect"
+        yield {
+            "rating": float(rng.randint(1, 5)),
+            "title": rng.choice(OPINIONS).capitalize(),
+            "text": f"{'. '.join(sentences)}. {detail}.",
+            "images": [],
+            "asin": product_asin,
+            "parent_asin": product_asin,
+            "user_id": f"U{index:012d}",
+            "timestamp": 1600000000000 + index * 1000,
+            "helpful_vote": rng.randint(0, 20),
+            "verified_purchase": True,
+        }
+
+
+def write_jsonl(path: str, records: Iterable[Dict[str, Any]]) -> int:
+    """Write records one JSON object per line and return how many were written."""
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            written += 1
+    return written
+
+
+def write_dataset(directory: str, size: int, seed: int = 0) -> Tuple[str, str]:
+    """Write size meta and size review records; returns (meta_path, review_path)."""
+    meta_path = os.path.join(directory, "meta_Synthetic_Fashion.jsonl")
+    review_path = os.path.join(directory, "Synthetic_Fashion.jsonl")
+    write_jsonl(meta_path, generate_meta(size, seed))
+    write_jsonl(review_path, generate_reviews(size, size, seed))
+    return meta_path, review_path
@@ -0,0 +1,86 @@
+import json
+from unittest.mock import MagicMock
+
+
+QUERY_REPLY = 'action: QUERY\nparameters:\n  query_text: "running shoes"\n  collection: "product_meta"\n  n_results: 2'
+DISPLAY_REPLY = 'action: DISPLAY\nparameters:\n  message: "Here are two running shoes"'
+
+
+def _resources():
+    from chatbot import ChatResources
+    from fake_gemini import FakeGeminiEndpoint
+
+    main_model = FakeGeminiEndpoint(reply=lambda prompt: DISPLAY_REPLY if "RAG Results" in prompt else QUERY_REPLY)
+    meta_col = MagicMock()
+    meta_col.query.return_value = {"ids": [["meta_A", "meta_B"]], "documents": [["a", "b"]], "metadatas": [[{}, {}]]}
+    return ChatResources(main_model, MagicMock(), MagicMock(), meta_col, MagicMock())
+
+
+class TestBatchRunner:
+    """Test suite for the offline JSONL batch mode."""
+
+    def test_group_sessions_keeps_order_within_session(self):
+        """Test that rows sharing a session_id stay together in input order."""
+        from batch_runner import group_sessions
+
+        rows = [{"id": 1, "query": "a", "session_id": "s"}, {"id": 2, "query": "b"},
+                {"id": 3, "query": "c", "session_id": "s"}]
+        sessions = group_sessions(rows)
+        assert [row["id"] for row in sessions["s"]] == [1, 3]
+        assert [row["id"] for row in sessions["row-2"]] == [2]
+
+    def test_run_batch_writes_structured_results_without_stdout(self, tmp_path, capsys):
+        """Test that each query yields a JSONL result and nothing is printed."""
+        from batch_runner import run_batch
+
+        workload = tmp_path / "queries.jsonl"
+        workload.write_text("\n".join(json.dumps({"query": f"recommend running shoes {i}"}) for i in range(4)))
+        output = tmp_path / "results.jsonl"
+
+        summary = run_batch(str(workload), str(output), concurrency=2, resources=_resources())
+
+        results = [json.loads(line) for line in output.read_text().splitlines()]
+        assert len(results) == 4
+        assert results[0]["actions"] == ["QUERY", "DISPLAY"]
+        assert results[0]["retrieved_ids"] == ["meta_A", "meta_B"]
+        assert results[0]["final_message"] == "Here are two running shoes"
+        assert results[0]["prompt_tokens"] > 0
+        assert {"planning", "retrieval", "rag_followup"} <= set(results[0]["stage_seconds"])
+        assert summary["queries"] == 4 and summary["errors"] == 0
+        assert summary["queries_per_second"] > 0
+        assert summary["avg_documents_per_turn"] == 2
+        assert summary["model_tiers"] == {} and summary["routing_saved_usd"] == 0.0
+        assert capsys.readouterr().out == ""
+
+    def test_main_loads_its_own_resources_without_stdout(self, tmp_path, capsys, monkeypatch):
+        """Test that the CLI path, which opens the index itself, prints nothing to stdout."""
+        import sys
+
+        import batch_runner
+        import chroma_db_config
+        from chatbot import config
+
+        meta_col = MagicMock()
+        meta_col.query.return_value = {"ids": [["meta_A"]], "documents": [["a"]], "metadatas": [[{}]]}
+
+        def open_index(path):
+            return MagicMock(), meta_col, MagicMock()
+
+        # An index version with a NumPy export, so get_chromadb runs with or without chromadb installed
+        (tmp_path / "chromadbs" / "chromadb_v1" / chroma_db_config.NUMPY_EXPORT_DIRNAME).mkdir(parents=True)
+        monkeypatch.chdir(tmp_path)
+        for backend in ("chroma", "numpy"):
+            monkeypatch.setitem(chroma_db_config.VECTOR_BACKENDS, backend, open_index)
+        monkeypatch.setattr("chatbot.get_embedding_function", lambda: lambda texts: [[1.0, 0.0] for _ in texts])
+        for field in ("output_mode", "model_backend", "trace_file", "model_routing"):
+            monkeypatch.setattr(config, field, getattr(config, field))
+        workload = tmp_path / "queries.jsonl"
+        workload.write_text(json.dumps({"query": "recommend running shoes"}) + "\n")
+        monkeypatch.setattr(sys, "argv", ["batch_runner.py", str(workload), "-o", str(tmp_path / "results.jsonl"),
+                                          "--model-backend", "fake"])
+
+        batch_runner.main()
+
+        assert capsys.readouterr().out == ""
+        assert [json.loads(line)["query"] for line in (tmp_path / "results.jsonl").read_text().splitlines()] == \
+            ["recommend running shoes"]
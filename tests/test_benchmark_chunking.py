@@ -0,0 +1,78 @@
+"""Index size versus recall for long-review chunking.
+
+Run with `pytest tests/test_benchmark_chunking.py --benchmark -s`. Synthetic reviews of ~300
+words end with the only sentence that identifies them, past what the embedding model reads.
+The same reviews are indexed whole and with several window sizes, and each index reports its
+vector count, size on disk, recall@5 of the reviewed product for the identifying sentence
+(after collapsing hits per product) and query latency.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from chunking import collapse_results
+from metrics import percentile
+from tests.synthetic_data import generate_long_reviews, write_jsonl
+
+
+REVIEW_COUNT = 1000
+QUERY_COUNT = 100
+TOP_K = 5
+OVERFETCH = 4
+
+# None indexes each review whole; the others are (chunk_words, chunk_overlap)
+CHUNK_SETTINGS = [None, (128, 32), (64, 16)]
+
+
+def _directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+@pytest.mark.benchmark
+def test_chunking_size_recall_tradeoff(tmp_path):
+    """Chunked indexes should recall reviews by their last sentence at least as well as whole-review indexes."""
+    chromadb = pytest.importorskip("chromadb")
+    builder = pytest.importorskip("chroma_db_processor.build_vector_db_cpu")
+
+    reviews = list(generate_long_reviews(REVIEW_COUNT, product_count=REVIEW_COUNT))
+    review_path = str(tmp_path / "Long_Reviews.jsonl")
+    meta_path = str(tmp_path / "meta_Empty.jsonl")
+    write_jsonl(review_path, reviews)
+    write_jsonl(meta_path, [])
+    queries = [(review["text"].rstrip(".").rsplit(". ", 1)[-1], review["parent_asin"]) for review in reviews[:QUERY_COUNT]]
+
+    results = {}
+    for setting in CHUNK_SETTINGS:
+        label = "whole" if setting is None else f"{setting[0]}w/{setting[1]}"
+        chunk_words, chunk_overlap = setting or (None, 0)
+        db_path = str(tmp_path / f"chromadb_{label.replace('/', '_')}")
+        client = chromadb.PersistentClient(path=db_path)
+        meta_col = client.get_or_create_collection(name="product_meta")
+        review_col = client.get_or_create_collection(name="product_review")
+        builder.populate_chroma_db(meta_col, review_col, review_path=review_path, meta_path=meta_path,
+                                   chunk_words=chunk_words, chunk_overlap=chunk_overlap)
+
+        hits, latencies = 0, []
+        for query, expected_asin in queries:
+            started = time.perf_counter()
+            found = review_col.query(query_texts=[query], n_results=TOP_K * OVERFETCH)
+            found = collapse_results(found, TOP_K, "parent_asin")
+            latencies.append(time.perf_counter() - started)
+            hits += expected_asin in [metadata["parent_asin"] for metadata in found["metadatas"][0]]
+
+        results[label] = {
+            "vectors": review_col.count(),
+            "disk_bytes": _directory_bytes(db_path),
+            f"recall_at_{TOP_K}": hits / len(queries),
+            "query_p50_seconds": percentile(latencies, 50),
+            "query_p95_seconds": percentile(latencies, 95),
+        }
+
+    print(f"\nChunking tradeoff over {REVIEW_COUNT} reviews: {json.dumps(results, indent=2)}")
+    whole = results["whole"]
+    for label, result in results.items():
+        assert result["vectors"] >= whole["vectors"]
+        assert result[f"recall_at_{TOP_K}"] >= whole[f"recall_at_{TOP_K}"], label
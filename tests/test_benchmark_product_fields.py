@@ -0,0 +1,79 @@
+"""Recall and refinement turns for title-only versus multi-field product indexing.
+
+Run with `pytest tests/test_benchmark_product_fields.py --benchmark -s`. Synthetic products
+have generic titles ("Navy Hoodie"), a distinctive detail only in their features and the
+audience only in their description. Each product is searched for in up to MAX_TURNS turns,
+the way a shopper refines after a miss:
+
+    1. "<kind> with <detail>"
+    2. adds the audience from the description
+    3. adds the full title
+
+A query is resolved at the first turn whose top TOP_K fused hits contain the product. The
+index is built title-only and with title, features and description, and each reports recall@k
+at the first turn, the share resolved within MAX_TURNS, and the average turns per resolved
+query. Every unresolved turn is one more LLM round trip in the chat loop.
+"""
+
+import json
+
+import pytest
+
+from product_fields import PRODUCT_FIELDS, fuse_field_results
+from tests.synthetic_data import generate_detailed_meta, write_jsonl
+
+
+PRODUCT_COUNT = 500
+QUERY_COUNT = 100
+TOP_K = 5
+OVERFETCH = 4
+MAX_TURNS = 3
+
+
+def _turn_queries(product):
+    kind, detail = product["categories"][0], product["features"][0].lower()
+    audience = product["details"]["Department"]
+    return [f"{kind} with {detail}", f"{kind} with {detail} {audience}",
+            f"{product['title'].lower()} with {detail} {audience}"]
+
+
+@pytest.mark.benchmark
+def test_multi_field_indexing_recall_and_turns(tmp_path):
+    """Multi-field indexing should recall at least as well and resolve at least as many queries."""
+    chromadb = pytest.importorskip("chromadb")
+    builder = pytest.importorskip("chroma_db_processor.build_vector_db_cpu")
+
+    products = list(generate_detailed_meta(PRODUCT_COUNT))
+    meta_path, review_path = str(tmp_path / "meta_Detailed.jsonl"), str(tmp_path / "Empty_Reviews.jsonl")
+    write_jsonl(meta_path, products)
+    write_jsonl(review_path, [])
+
+    results = {}
+    for label, meta_fields in (("title", ("title",)), ("multi_field", PRODUCT_FIELDS)):
+        client = chromadb.PersistentClient(path=str(tmp_path / f"chromadb_{label}"))
+        meta_col = client.get_or_create_collection(name="product_meta")
+        review_col = client.get_or_create_collection(name="product_review")
+        builder.populate_chroma_db(meta_col, review_col, review_path=review_path, meta_path=meta_path,
+                                   meta_fields=meta_fields)
+
+        first_turn_hits, turns_taken = 0, []
+        for product in products[:QUERY_COUNT]:
+            for turn, query in enumerate(_turn_queries(product)[:MAX_TURNS], start=1):
+                found = fuse_field_results(meta_col.query(query_texts=[query], n_results=TOP_K * OVERFETCH), TOP_K)
+                if product["parent_asin"] in [metadata["parent_asin"] for metadata in found["metadatas"][0]]:
+                    first_turn_hits += turn == 1
+                    turns_taken.append(turn)
+                    break
+
+        results[label] = {
+            "vectors": meta_col.count(),
+            f"recall_at_{TOP_K}": first_turn_hits / QUERY_COUNT,
+            "resolved_rate": len(turns_taken) / QUERY_COUNT,
+            "avg_turns_per_resolved_query": sum(turns_taken) / max(1, len(turns_taken)),
+        }
+
+    print(f"\nProduct field indexing over {PRODUCT_COUNT} products: {json.dumps(results, indent=2)}")
+    title, multi = results["title"], results["multi_field"]
+    assert multi["vectors"] > title["vectors"]
+    assert multi[f"recall_at_{TOP_K}"] >= title[f"recall_at_{TOP_K}"]
+    assert multi["resolved_rate"] >= title["resolved_rate"]
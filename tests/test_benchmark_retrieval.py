@@ -0,0 +1,158 @@
+"""Retrieval benchmarks over synthetic collections of increasing size.
+
+Run with `pytest tests/test_benchmark_retrieval.py --benchmark [--benchmark-sizes 10000,100000]`.
+Each size builds temporary collections through the CPU builder, then measures ingest
+throughput, query latency and memory, plus the recall of Chroma's approximate review search
+against exact NumPy brute force over an export of the same embeddings. Results are compared against
+tests/benchmark_baseline.json and a metric that regresses beyond the tolerance fails the
+run; `--benchmark-save` records the current results as the new baseline instead.
+"""
+
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+import pytest
+
+from metrics import percentile
+from tests.synthetic_data import BENCHMARK_QUERIES, write_dataset
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+QUERY_ROUNDS = 5
+
+# Metrics compared against the baseline and whether higher values are better
+COMPARED_METRICS = {
+    "ingest_docs_per_second": True,
+    "meta_query_p50_seconds": False,
+    "meta_query_p95_seconds": False,
+    "review_query_p95_seconds": False,
+    "review_recall_at_5": True,
+    "rss_growth_bytes": False,
+}
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (Linux), falling back to the peak reported by getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _query_latencies(collection, rounds: int = QUERY_ROUNDS) -> list:
+    latencies = []
+    for _ in range(rounds):
+        for query in BENCHMARK_QUERIES:
+            started = time.perf_counter()
+            collection.query(query_texts=[query], n_results=5)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def _recall_at_k(collection, exact, k: int = 5) -> float:
+    """Share of the exact top-k review ids that the approximate collection also returns."""
+    from chroma_db_config import get_embedding_function
+
+    embeddings = get_embedding_function()(BENCHMARK_QUERIES)
+    approximate = collection.query(query_embeddings=embeddings, n_results=k, include=[])["ids"]
+    truth = exact.query(query_embeddings=embeddings, n_results=k, include=[])["ids"]
+    found = sum(len(set(got) & set(expected)) for got, expected in zip(approximate, truth))
+    return found / max(1, sum(len(expected) for expected in truth))
+
+
+def find_regressions(baseline: dict, size: int, result: dict) -> list:
+    """Compare a result to the baseline for the same size; returns human-readable regressions."""
+    expected = baseline.get("results", {}).get(str(size))
+    if not expected:
+        return []
+    tolerance = baseline.get("tolerance", 0.25)
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        if metric not in expected or metric not in result:
+            continue
+        limit = expected[metric] * (1 - tolerance) if higher_is_better else expected[metric] * (1 + tolerance)
+        regressed = result[metric] < limit if higher_is_better else result[metric] > limit
+        if regressed:
+            regressions.append(f"{metric}: {result[metric]:.4g} vs baseline {expected[metric]:.4g} (limit {limit:.4g})")
+    return regressions
+
+
+@pytest.fixture(scope="session")
+def benchmark_baseline(request):
+    with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    measured = {}
+    yield baseline, measured
+
+    if request.config.getoption("--benchmark-save") and measured:
+        baseline.setdefault("results", {}).update(measured)
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+@pytest.mark.benchmark
+def test_retrieval_benchmark(benchmark_size, benchmark_baseline, tmp_path_factory, request):
+    """Build collections of benchmark_size meta and review records and check them against the baseline."""
+    chromadb = pytest.importorskip("chromadb")
+    builder = pytest.importorskip("chroma_db_processor.build_vector_db_cpu")
+    baseline, measured = benchmark_baseline
+
+    directory = tmp_path_factory.mktemp(f"benchmark_{benchmark_size}")
+    meta_path, review_path = write_dataset(str(directory), benchmark_size)
+    client = chromadb.PersistentClient(path=str(directory / "chromadb"))
+    meta_col = client.get_or_create_collection(name="product_meta")
+    review_col = client.get_or_create_collection(name="product_review")
+
+    rss_before = _rss_bytes()
+    tracemalloc.start()
+    started = time.perf_counter()
+    builder.populate_chroma_db(meta_col, review_col, review_path=review_path, meta_path=meta_path)
+    ingest_seconds = time.perf_counter() - started
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    document_count = meta_col.count() + review_col.count()
+    assert document_count == 2 * benchmark_size
+
+    meta_latencies = _query_latencies(meta_col)
+    review_latencies = _query_latencies(review_col)
+
+    pytest.importorskip("numpy")
+    from numpy_search import NumpyCollection, export_collection
+    export_collection(review_col, str(directory / "numpy_review"))
+    exact_review_col = NumpyCollection(str(directory / "numpy_review"), "product_review")
+    result = {
+        "documents": document_count,
+        "ingest_seconds": ingest_seconds,
+        "ingest_docs_per_second": document_count / ingest_seconds,
+        "meta_query_p50_seconds": percentile(meta_latencies, 50),
+        "meta_query_p95_seconds": percentile(meta_latencies, 95),
+        "meta_query_p99_seconds": percentile(meta_latencies, 99),
+        "review_query_p50_seconds": percentile(review_latencies, 50),
+        "review_query_p95_seconds": percentile(review_latencies, 95),
+        "review_query_p99_seconds": percentile(review_latencies, 99),
+        "review_recall_at_5": _recall_at_k(review_col, exact_review_col),
+        "rss_growth_bytes": max(0, _rss_bytes() - rss_before),
+        "python_peak_bytes": python_peak,
+    }
+    measured[str(benchmark_size)] = result
+    print(f"\n{benchmark_size} records: {json.dumps(result, indent=2)}")
+
+    if not request.config.getoption("--benchmark-save"):
+        regressions = find_regressions(baseline, benchmark_size, result)
+        assert not regressions, f"Regressions at {benchmark_size} records:\n" + "\n".join(regressions)
+
+
+def test_find_regressions_respects_direction_and_tolerance():
+    """Test that slower queries and lower throughput beyond the tolerance are reported."""
+    baseline = {"tolerance": 0.2, "results": {"10": {"ingest_docs_per_second": 100.0, "meta_query_p95_seconds": 0.010}}}
+
+    assert find_regressions(baseline, 10, {"ingest_docs_per_second": 85.0, "meta_query_p95_seconds": 0.0115}) == []
+    regressions = find_regressions(baseline, 10, {"ingest_docs_per_second": 70.0, "meta_query_p95_seconds": 0.013})
+    assert [line.split(":")[0] for line in regressions] == ["ingest_docs_per_second", "meta_query_p95_seconds"]
+    assert find_regressions(baseline, 1000, {"ingest_docs_per_second": 1.0}) == []
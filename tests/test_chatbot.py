@@ -151,4 +151,345 @@ parameters:
         captured = capsys.readouterr()
 
         assert "Test message" in captured.out
-        assert "provide more details" not in captured.out.lower()
\ No newline at end of file
+        assert "provide more details" not in captured.out.lower()
+
+class TestJsonOutputMode:
+    """Test suite for schema-constrained JSON responses."""
+
+    def test_parse_json_query_response(self):
+        """Test that a valid QUERY object is validated into normalized parameters."""
+        from chatbot import parse_json_response, ActionType
+
+        result = parse_json_response(
+            '{"action": "QUERY", "parameters": {"query_text": "running shoes", "collection": "product_meta", "n_results": "3"}}'
+        )
+        assert result.action == ActionType.QUERY
+        assert result.parameters == {"query_text": "running shoes", "collection": "product_meta", "n_results": 3}
+
+    def test_parse_json_display_drops_empty_fields(self):
+        """Test that DISPLAY parameters are validated through DisplayParameters."""
+        from chatbot import parse_json_response, ActionType
+
+        result = parse_json_response('{"action": "display", "parameters": {"message": "Here you go"}}')
+        assert result.action == ActionType.DISPLAY
+        assert result.parameters == {"message": "Here you go", "needs_refinement": False}
+
+    def test_parse_json_rejects_invalid_json(self):
+        """Test that malformed JSON raises InvalidActionError so the turn is retried."""
+        from chatbot import parse_json_response, InvalidActionError
+
+        with pytest.raises(InvalidActionError, match="not valid JSON"):
+            parse_json_response("action: QUERY")
+
+    def test_parse_json_rejects_missing_parameters(self):
+        """Test that schema violations raise InvalidActionError."""
+        from chatbot import parse_json_response, InvalidActionError
+
+        with pytest.raises(InvalidActionError, match="Invalid parameters for QUERY"):
+            parse_json_response('{"action": "QUERY", "parameters": {"collection": "product_meta"}}')
+        with pytest.raises(InvalidActionError, match="Invalid parameters for QUERY"):
+            parse_json_response('{"action": "QUERY", "parameters": {"query_text": "x", "collection": "orders"}}')
+
+    def test_parse_failures_are_counted_per_mode(self):
+        """Test that parse failures are counted separately for YAML and JSON modes."""
+        from chatbot import parse_json_response, parse_yaml_response, InvalidActionError
+        from metrics import registry
+
+        yaml_failures = registry.counter("chatbot_parse_failures_total", labels={"mode": "yaml"})
+        json_failures = registry.counter("chatbot_parse_failures_total", labels={"mode": "json"})
+        yaml_before, json_before = yaml_failures.value, json_failures.value
+
+        parse_yaml_response("not: [valid")
+        with pytest.raises(InvalidActionError):
+            parse_json_response("{")
+
+        assert yaml_failures.value == yaml_before + 1
+        assert json_failures.value == json_before + 1
+
+
+class TestPlanCacheIntegration:
+    """Test suite for reusing cached plans in process_user_input."""
+
+    def test_repeated_first_question_skips_planning_call(self):
+        """Test that a second session asking the same question reuses the cached QUERY plan."""
+        from chatbot import ChatResources, EcommerceChatbot
+        from fake_gemini import FakeGeminiEndpoint
+        from plan_cache import SemanticPlanCache
+
+        replies = {
+            "recommend running shoes": 'action: QUERY\nparameters:\n  query_text: "running shoes"\n  collection: "product_meta"\n  n_results: 5',
+        }
+        main_model = FakeGeminiEndpoint(reply=lambda prompt: replies.get(prompt, 'action: DISPLAY\nparameters:\n  message: "Found some"'))
+        meta_col = MagicMock()
+        meta_col.query.return_value = {"ids": [["meta_1"]], "documents": [["shoe"]], "metadatas": [[{}]]}
+        cache = SemanticPlanCache(lambda texts: [[1.0, 0.0] for _ in texts])
+        resources = ChatResources(main_model, MagicMock(), MagicMock(), meta_col, MagicMock(), plan_cache=cache)
+
+        for _ in range(2):
+            EcommerceChatbot(resources=resources, output=lambda text: None).process_user_input("recommend running shoes")
+
+        planning_calls = [call for call in main_model.calls if call == "recommend running shoes"]
+        assert len(planning_calls) == 1
+        assert meta_col.query.call_count == 2
+        assert cache.hits == 1
+
+
+class TestTracing:
+    """Test suite for per-turn tracing spans."""
+
+    def test_turn_traces_embed_and_search_separately(self):
+        """Test that a QUERY turn records planning, embed and search spans under one turn span."""
+        from chatbot import ChatResources, EcommerceChatbot
+        from fake_gemini import FakeGeminiEndpoint
+        from tracing import InMemorySpanExporter, tracer
+
+        main_model = FakeGeminiEndpoint(reply=lambda prompt: (
+            'action: DISPLAY\nparameters:\n  message: "Found some"' if "RAG Results" in prompt else
+            'action: QUERY\nparameters:\n  query_text: "running shoes"\n  collection: "product_meta"\n  n_results: 5'))
+        meta_col = MagicMock()
+        meta_col.query.return_value = {"ids": [["meta_1"]], "documents": [["shoe"]], "metadatas": [[{}]]}
+        resources = ChatResources(main_model, MagicMock(), MagicMock(), meta_col, MagicMock(),
+                                  embedding_function=lambda texts: [[0.5, 0.5] for _ in texts])
+        exporter = InMemorySpanExporter()
+        tracer.add_exporter(exporter)
+        try:
+            EcommerceChatbot(resources=resources, output=lambda text: None).process_user_input("running shoes")
+        finally:
+            tracer.remove_exporter(exporter)
+
+        spans = {span.name: span for span in exporter.spans}
+        turn = spans["turn"]
+        assert {"planning", "parse", "retrieval", "embed", "search", "rag_followup", "display"} <= set(spans)
+        assert spans["retrieval"].parent_id == turn.span_id
+        assert spans["embed"].parent_id == spans["retrieval"].span_id
+        assert all(span.trace_id == turn.trace_id for span in exporter.spans)
+        meta_col.query.assert_called_once_with(query_embeddings=[[0.5, 0.5]], n_results=5)
+        assert tracer.latency_summary()["search"]["count"] >= 1
+
+
+class TestRetrievalCollapse:
+    """Test suite for collapsing retrieval hits per review or product."""
+
+    def test_query_overfetches_and_collapses_per_product(self):
+        """Test that collapse_hits_by fetches extra hits and keeps one per parent_asin."""
+        import chatbot
+        from chatbot import ChatResources, EcommerceChatbot
+
+        review_col = MagicMock()
+        review_col.query.return_value = {
+            "ids": [["r1", "r2", "r3"]],
+            "documents": [["a", "b", "c"]],
+            "metadatas": [[{"parent_asin": "A"}, {"parent_asin": "A"}, {"parent_asin": "B"}]],
+        }
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), review_col)
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        with patch.object(chatbot.config, "collapse_hits_by", "parent_asin"):
+            results = bot._query_collection(review_col, "comfortable socks", 2)
+
+        review_col.query.assert_called_once_with(query_texts=["comfortable socks"],
+                                                 n_results=2 * chatbot.config.retrieval_overfetch)
+        assert results["ids"] == [["r1", "r3"]]
+
+    def test_mmr_fetches_embeddings_and_drops_them_after_reranking(self):
+        """Test that MMR diversification requests embeddings and keeps them out of the results."""
+        import chatbot
+        from chatbot import ChatResources, EcommerceChatbot
+
+        review_col = MagicMock()
+        review_col.query.return_value = {
+            "ids": [["r1", "r2", "r3"]],
+            "documents": [["a", "b", "c"]],
+            "metadatas": [[{"parent_asin": "A"}, {"parent_asin": "A"}, {"parent_asin": "B"}]],
+            "distances": [[0.1, 0.2, 0.3]],
+            "embeddings": [[[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]]],
+        }
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), review_col)
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        with patch.object(chatbot.config, "diversify_strategy", "mmr"):
+            results = bot._query_collection(review_col, "comfortable socks", 2)
+
+        assert "embeddings" in review_col.query.call_args.kwargs["include"]
+        assert results["ids"] == [["r1", "r3"]]
+        assert results["embeddings"] is None
+
+    def test_meta_field_fusion_applies_only_to_the_meta_collection(self):
+        """Test that meta_field_fusion over-fetches product_meta and fuses field hits per product."""
+        import chatbot
+        from chatbot import ChatResources, EcommerceChatbot
+
+        meta_col = MagicMock()
+        meta_col.name = "product_meta"
+        meta_col.query.return_value = {
+            "ids": [["m1#features", "m2", "m1"]],
+            "documents": [["thumbhole cuffs", "red hoodie", "grey hoodie"]],
+            "metadatas": [[{"parent_asin": "A", "field": "features", "title": "grey hoodie"},
+                           {"parent_asin": "B", "field": "title"}, {"parent_asin": "A", "field": "title"}]],
+        }
+        review_col = MagicMock()
+        review_col.name = "product_review"
+        review_col.query.return_value = {"ids": [["r1"]], "documents": [["a"]], "metadatas": [[{"parent_asin": "A"}]]}
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), meta_col, review_col)
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        with patch.object(chatbot.config, "meta_field_fusion", True):
+            meta_results = bot._query_collection(meta_col, "hoodie with thumbholes", 2)
+            bot._query_collection(review_col, "hoodie with thumbholes", 2)
+
+        assert meta_col.query.call_args.kwargs["n_results"] == 2 * chatbot.config.retrieval_overfetch
+        assert review_col.query.call_args.kwargs["n_results"] == 2
+        assert meta_results["ids"] == [["m1#features", "m2"]]
+        assert meta_results["documents"][0][0] == "grey hoodie | features: thumbhole cuffs"
+
+    def test_retrieval_cutoff_drops_far_hits_per_collection(self):
+        """Test that a collection's calibrated cutoff drops hits beyond its distance threshold."""
+        from chatbot import ChatResources, EcommerceChatbot
+        from retrieval_cutoff import RetrievalCutoff
+
+        review_col = MagicMock()
+        review_col.name = "product_review"
+        review_col.query.return_value = {
+            "ids": [["r1", "r2", "r3"]],
+            "documents": [["a", "b", "c"]],
+            "metadatas": [[{"parent_asin": "A"}, {"parent_asin": "B"}, {"parent_asin": "C"}]],
+            "distances": [[0.2, 0.3, 1.4]],
+        }
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), review_col,
+                                  retrieval_cutoffs={"product_review": RetrievalCutoff(max_distance=0.8)})
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        results = bot._query_collection(review_col, "comfortable socks", 3)
+
+        assert results["ids"] == [["r1", "r2"]]
+        assert results["distances"] == [[0.2, 0.3]]
+
+    def test_parent_asins_fetch_reviews_through_the_join_index(self, tmp_path):
+        """Test that a QUERY scoped to products fetches their reviews by ID instead of searching."""
+        from chatbot import ChatResources, EcommerceChatbot, parse_json_response
+        from review_join import ReviewJoinIndex
+
+        join_index = ReviewJoinIndex(str(tmp_path / "review_join.sqlite"))
+        join_index.add(["r1", "r2", "r3"], [{"parent_asin": "A"}, {"parent_asin": "B"}, {"parent_asin": "C"}])
+        review_col = MagicMock()
+        review_col.get.return_value = {"ids": ["r1", "r2"], "documents": ["soft", "itchy"],
+                                       "metadatas": [{"parent_asin": "A"}, {"parent_asin": "B"}]}
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), review_col,
+                                  review_join=join_index)
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        response = parse_json_response('{"action": "QUERY", "parameters": {"query_text": "is it soft", '
+                                       '"collection": "product_review", "n_results": 2, "parent_asins": ["A", "B"]}}')
+        bot.handle_query_action(response.parameters, "is it soft")
+
+        review_col.query.assert_not_called()
+        assert review_col.get.call_args.kwargs["ids"] == ["r1", "r2"]
+        join_index.close()
+
+    def test_joined_reviews_go_through_the_distance_cutoff(self, tmp_path):
+        """Test that ranked reviews fetched through the join index are cut like searched ones."""
+        from chatbot import ChatResources, EcommerceChatbot
+        from retrieval_cutoff import RetrievalCutoff
+        from review_join import ReviewJoinIndex
+
+        join_index = ReviewJoinIndex(str(tmp_path / "review_join.sqlite"))
+        join_index.add(["r1", "r2", "r3"], [{"parent_asin": "A"}] * 3)
+        review_col = MagicMock()
+        review_col.name = "product_review"
+        review_col.get.return_value = {"ids": ["r1", "r2", "r3"], "documents": ["soft", "warm", "itchy"],
+                                       "metadatas": [{"parent_asin": "A"}] * 3,
+                                       "embeddings": [[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]]}
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), review_col,
+                                  embedding_function=lambda texts: [[1.0, 0.0] for _ in texts],
+                                  retrieval_cutoffs={"product_review": RetrievalCutoff(max_distance=0.5)},
+                                  review_join=join_index)
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        results = bot._product_reviews(review_col, "is it soft", ["A"], 3)
+
+        assert results["ids"] == [["r1", "r2"]]
+        assert results["distances"][0] == pytest.approx([0.0, 0.4])
+        join_index.close()
+
+
+class TestModelRouting:
+    """Test suite for planning simple turns on a template or the light model."""
+
+    QUERY_REPLY = 'action: QUERY\nparameters:\n  query_text: "running shoes"\n  collection: "product_meta"\n  n_results: 2'
+    DISPLAY_REPLY = 'action: DISPLAY\nparameters:\n  message: "The second one is waterproof"'
+
+    def _bot(self, light_reply):
+        from chatbot import ChatResources, EcommerceChatbot
+        from fake_gemini import FakeGeminiEndpoint
+        from model_router import ModelRouter
+
+        main_model = FakeGeminiEndpoint(reply=lambda prompt: self.DISPLAY_REPLY if "RAG Results" in prompt
+                                        else self.QUERY_REPLY)
+        light_model = FakeGeminiEndpoint(reply=light_reply)
+        meta_col = MagicMock()
+        meta_col.query.return_value = {"ids": [["meta_A"]], "documents": [["a"]], "metadatas": [[{}]]}
+        resources = ChatResources(main_model, MagicMock(), MagicMock(), meta_col, MagicMock(),
+                                  light_model=light_model, router=ModelRouter(cost_budget_usd=0.0))
+        return EcommerceChatbot(resources=resources, output=lambda text: None), main_model, light_model
+
+    def test_greeting_is_answered_from_a_template(self):
+        """Test that a greeting makes no model call but still lands in the history."""
+        bot, main_model, light_model = self._bot(self.DISPLAY_REPLY)
+
+        turn = bot.process_user_input("Hi there!")
+
+        assert main_model.calls == [] and light_model.calls == []
+        assert turn.model_tier == "template" and turn.actions == ["DISPLAY"]
+        assert turn.final_message.startswith("Hello")
+        assert len(bot.conversation.history) == 2
+        assert turn.routing_saved_usd > 0
+
+    def test_short_follow_up_is_planned_on_the_light_model(self):
+        """Test that a mid-session follow-up is planned by the light model and kept in the main history."""
+        bot, main_model, light_model = self._bot(self.DISPLAY_REPLY)
+        bot.process_user_input("running shoes")
+        main_calls = len(main_model.calls)
+
+        turn = bot.process_user_input("which one is waterproof?")
+
+        assert len(main_model.calls) == main_calls
+        assert light_model.calls == ["which one is waterproof?"]
+        assert turn.turn_kind == "clarification" and turn.model_tier == "light"
+        assert turn.final_message == "The second one is waterproof"
+        assert len(bot.conversation.history) == 6
+
+    def test_unparseable_light_plan_is_escalated_to_the_full_model(self):
+        """Test that the retry after a bad light plan goes to the full model (JSON mode retries bad plans)."""
+        import json
+        import chatbot
+        from models import OutputMode
+
+        bot, main_model, light_model = self._bot("not json")
+        main_model.reply = lambda prompt: json.dumps({"action": "DISPLAY", "parameters": {"message": "Sure"}})
+
+        with patch.object(chatbot.config, "output_mode", OutputMode.JSON):
+            bot.process_user_input("running shoes")
+            turn = bot.process_user_input("the second one")
+
+        assert len(light_model.calls) == 1
+        assert turn.model_tier == "full" and turn.final_message == "Sure"
+
+    def test_unparseable_light_plan_is_escalated_in_yaml_mode(self):
+        """Test that a light plan hitting the YAML fallback is re-planned instead of shown raw."""
+        bot, main_model, light_model = self._bot("this is not a plan")
+        main_model.reply = lambda prompt: self.DISPLAY_REPLY
+
+        bot.process_user_input("running shoes")
+        turn = bot.process_user_input("the second one")
+
+        assert len(light_model.calls) == 1
+        assert turn.model_tier == "full" and turn.final_message == "The second one is waterproof"
+        assert "this is not a plan" not in (turn.final_message or "")
+
+    def test_comprehensive_classification_stays_on_the_summarization_model(self):
+        """Test that routing does not send the classifier prompt to the light planner."""
+        bot, main_model, light_model = self._bot(self.DISPLAY_REPLY)
+        bot.summarization_model.generate_content.return_value.text = "COMPREHENSIVE"
+
+        assert bot._classify_comprehensive_request("tell me more about the shoes") is True
+        assert light_model.calls == []
@@ -0,0 +1,72 @@
+import pytest
+
+from chunking import chunk_documents, chunk_text, collapse_results
+
+
+class TestChunkText:
+    """Test suite for overlapping-window chunking."""
+
+    def test_short_text_is_one_chunk(self):
+        """Test that text within the window is returned unchanged."""
+        assert chunk_text("fits true to size", max_words=8, overlap=2) == ["fits true to size"]
+
+    def test_windows_overlap_and_cover_the_end(self):
+        """Test that consecutive windows share overlap words and the last word is indexed."""
+        words = [f"w{i}" for i in range(20)]
+        chunks = chunk_text(" ".join(words), max_words=8, overlap=3)
+
+        assert chunks[0].split() == words[:8]
+        assert chunks[1].split()[:3] == words[5:8]
+        assert chunks[-1].split()[-1] == "w19"
+        assert len(chunks) == 4
+
+    def test_overlap_must_be_smaller_than_window(self):
+        """Test that a window that would never advance is rejected."""
+        with pytest.raises(ValueError):
+            chunk_text("a b c", max_words=4, overlap=4)
+
+    def test_chunk_documents_ids_and_metadata(self):
+        """Test that the first chunk keeps the review id and every chunk records its review."""
+        docs, ids, metadatas = chunk_documents(
+            ["one two three four five six", "short"], ["review_A_1", "review_B_2"],
+            [{"parent_asin": "A"}, {"parent_asin": "B"}], max_words=4, overlap=1)
+
+        assert ids == ["review_A_1", "review_A_1#1", "review_B_2"]
+        assert docs[1] == "four five six"
+        assert metadatas[1] == {"parent_asin": "A", "review_id": "review_A_1", "chunk_index": 1, "chunk_count": 2}
+        assert metadatas[2]["chunk_count"] == 1
+
+
+class TestCollapseResults:
+    """Test suite for collapsing query hits per review or product."""
+
+    RESULTS = {
+        "ids": [["r1", "r1#1", "r2", "r3", "r4"]],
+        "documents": [["a", "b", "c", "d", "e"]],
+        "metadatas": [[{"parent_asin": "A", "review_id": "r1"}, {"parent_asin": "A", "review_id": "r1"},
+                       {"parent_asin": "A", "review_id": "r2"}, {"parent_asin": "B", "review_id": "r3"}, None]],
+        "distances": [[0.1, 0.2, 0.3, 0.4, 0.5]],
+        "embeddings": None,
+        "included": ["documents", "metadatas", "distances"],
+    }
+
+    def test_collapse_by_review_keeps_best_chunk(self):
+        """Test that only the best-ranked chunk of each review is kept."""
+        collapsed = collapse_results(self.RESULTS, n_results=3, key="review_id")
+
+        assert collapsed["ids"] == [["r1", "r2", "r3"]]
+        assert collapsed["distances"] == [[0.1, 0.3, 0.4]]
+        assert collapsed["embeddings"] is None
+        assert collapsed["included"] == ["documents", "metadatas", "distances"]
+
+    def test_collapse_by_product_treats_missing_key_as_own_group(self):
+        """Test that products are distinct and hits without metadata are kept."""
+        collapsed = collapse_results(self.RESULTS, n_results=5, key="parent_asin")
+
+        assert collapsed["ids"] == [["r1", "r3", "r4"]]
+        assert collapsed["documents"] == [["a", "d", "e"]]
+
+    def test_unknown_key_is_rejected(self):
+        """Test that only supported metadata keys can be collapsed on."""
+        with pytest.raises(ValueError):
+            collapse_results(self.RESULTS, n_results=5, key="store")
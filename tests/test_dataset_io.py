@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import dataset_io
+from dataset_io import detect_compression, open_dataset
+
+
+RECORDS = [{"parent_asin": f"B{i:09d}", "text": f"review number {i} " * 5} for i in range(2000)]
+
+
+def write_plain(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in RECORDS:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def gzip_file(tmp_path):
+    path = tmp_path / "reviews.jsonl.gz"
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for record in RECORDS:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+def read_all(path, **kwargs):
+    with open_dataset(path, buffer_size=4096, **kwargs) as reader:
+        lines = [json.loads(line) for line in reader]
+        return lines, reader.tell(), reader.decompressor
+
+
+class TestOpenDataset:
+    """Test suite for streaming plain and compressed datasets."""
+
+    def test_detect_compression(self):
+        """Test that the compression is inferred from the extension."""
+        assert detect_compression("meta.jsonl") is None
+        assert detect_compression("meta.jsonl.gz") == "gzip"
+        assert detect_compression("meta.jsonl.ZST") == "zstd"
+
+    def test_plain_file_offsets(self, tmp_path):
+        """Test that a plain file is read fully and tell() reaches its size."""
+        path = write_plain(tmp_path / "reviews.jsonl")
+        lines, offset, decompressor = read_all(path)
+        assert lines == RECORDS
+        assert offset == os.path.getsize(path)
+        assert decompressor is None
+
+    @pytest.mark.parametrize("parallel", [True, False])
+    def test_gzip_streams_with_compressed_offsets(self, gzip_file, parallel):
+        """Test gzip input both through a decompressor process and in-process."""
+        if parallel and not (shutil.which("pigz") or shutil.which("gzip")):
+            pytest.skip("no gzip binary installed")
+        lines, offset, decompressor = read_all(gzip_file, parallel=parallel)
+        assert lines == RECORDS
+        assert offset == os.path.getsize(gzip_file)
+        assert (decompressor != "in-process") == parallel
+
+    def test_zstd_streams(self, tmp_path):
+        """Test zstd input through the zstd binary."""
+        if not shutil.which("zstd"):
+            pytest.skip("no zstd binary installed")
+        plain = write_plain(tmp_path / "reviews.jsonl")
+        subprocess.run(["zstd", "-q", plain, "-o", plain + ".zst"], check=True)
+        lines, offset, _ = read_all(plain + ".zst")
+        assert lines == RECORDS
+        assert offset == os.path.getsize(plain + ".zst")
+
+    def test_stopping_early_stops_the_decompressor(self, gzip_file):
+        """Test that closing before the end kills the child process without an error."""
+        with open_dataset(gzip_file) as reader:
+            first = next(iter(reader))
+            process = reader._process
+        assert json.loads(first) == RECORDS[0]
+        assert process is None or process.poll() is not None
+
+    def test_corrupt_input_raises(self, tmp_path):
+        """Test that a truncated archive surfaces as an error instead of silently ending."""
+        path = tmp_path / "broken.jsonl.gz"
+        path.write_bytes(b"\x1f\x8b\x08\x00not really gzip")
+        with pytest.raises((IOError, EOFError, gzip.BadGzipFile)):
+            read_all(str(path))
+
+    def test_chatty_decompressor_does_not_stall(self, gzip_file, monkeypatch):
+        """Test that a decompressor writing more to stderr than a pipe holds still streams to the end."""
+        script = ("import gzip, sys; sys.stderr.write('warning\\n' * 100000); sys.stderr.flush(); "
+                  "sys.stdout.buffer.write(gzip.decompress(sys.stdin.buffer.read()))")
+        monkeypatch.setattr(dataset_io, "decompressor_command", lambda compression: [sys.executable, "-c", script])
+        result = []
+        reader = threading.Thread(target=lambda: result.append(read_all(gzip_file)), daemon=True)
+
+        reader.start()
+        reader.join(timeout=30)
+
+        assert not reader.is_alive()
+        assert result[0][0] == RECORDS
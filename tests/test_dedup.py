@@ -0,0 +1,103 @@
+import pytest
+
+from dedup import NearDuplicateIndex, ReviewDeduplicator, estimated_jaccard, normalize_text, shingles
+
+
+LONG_REVIEW = ("I bought these compression sleeves for running and they fit true to size. "
+               "The material is breathable and they stayed in place for my whole marathon training block.")
+
+
+def review(parent_asin, user_id):
+    return {"parent_asin": parent_asin, "user_id": user_id, "timestamp": 1}
+
+
+class TestNearDuplicateIndex:
+    """Test suite for MinHash/LSH near-duplicate detection."""
+
+    def test_normalization_makes_trivial_edits_exact_duplicates(self):
+        """Test that case, punctuation and spacing differences collapse to one text."""
+        assert normalize_text("Great  product!!!") == normalize_text("great product")
+
+    def test_signature_similarity_tracks_jaccard(self):
+        """Test that MinHash estimates are high for near-identical and low for unrelated texts."""
+        index = NearDuplicateIndex()
+        near = LONG_REVIEW.replace("whole marathon", "entire marathon")
+        signature = lambda text: index.hasher.signature(shingles(normalize_text(text)))
+
+        assert estimated_jaccard(signature(LONG_REVIEW), signature(near)) > 0.6
+        assert estimated_jaccard(signature(LONG_REVIEW), signature("zipper broke after one week of use")) < 0.2
+
+    def test_exact_near_and_new(self):
+        """Test that texts are classified as new, exact duplicates or near duplicates."""
+        index = NearDuplicateIndex(threshold=0.7)
+        assert index.add(LONG_REVIEW, "review_1", "A:1:1", {"parent_asin": "A"}) == (None, "new")
+        first, kind = index.add(LONG_REVIEW.upper(), "review_2", "B:2:1", {})
+        assert kind == "exact" and first.doc_id == "review_1"
+        near_cluster, kind = index.add(LONG_REVIEW + " Would buy again.", "review_3", "C:3:1", {})
+        assert kind == "near" and near_cluster is first
+        assert index.add("The zipper broke after a week.", "review_4", "D:4:1", {})[1] == "new"
+        assert first.source_ids == ["B:2:1", "C:3:1"] and first.count == 3
+
+    def test_bands_must_divide_permutations(self):
+        """Test that an invalid LSH layout is rejected."""
+        with pytest.raises(ValueError):
+            NearDuplicateIndex(num_perm=64, bands=6)
+
+
+class TestReviewDeduplicator:
+    """Test suite for dropping duplicate reviews from ingest batches."""
+
+    def test_filter_batch_and_representative_metadata(self):
+        """Test that duplicates are dropped and counted on the representative."""
+        deduplicator = ReviewDeduplicator()
+        docs = ["great product", "Great product!", LONG_REVIEW, "great   PRODUCT"]
+        reviews = [review("A", "u1"), review("A", "u2"), review("C", "u3"), review("A", "u4")]
+        ids = ["review_A_1", "review_A_2", "review_C_3", "review_A_4"]
+        metadatas = [{"parent_asin": r["parent_asin"]} for r in reviews]
+
+        kept_docs, kept_reviews, kept_ids, kept_metadatas = deduplicator.filter_batch(docs, reviews, ids, metadatas)
+
+        assert kept_ids == ["review_A_1", "review_C_3"]
+        assert kept_metadatas == [{"parent_asin": "A"}, {"parent_asin": "C"}]
+        assert list(deduplicator.representative_updates()) == [
+            ("review_A_1", {"parent_asin": "A", "duplicate_count": 3, "duplicate_ids": "A:u2:1,A:u4:1"}),
+        ]
+
+        report = deduplicator.report(seconds_per_doc=0.5)
+        assert report["dedup_ratio"] == pytest.approx(0.5)
+        assert report["estimated_seconds_saved"] == pytest.approx(1.0)
+
+    def test_duplicates_of_other_products_are_kept(self):
+        """Test that the same text under a different parent_asin is not folded into another product."""
+        deduplicator = ReviewDeduplicator()
+        docs = [LONG_REVIEW, LONG_REVIEW, LONG_REVIEW + " Would buy again."]
+        reviews = [review("A", "u1"), review("B", "u2"), review("B", "u3")]
+        metadatas = [{"parent_asin": r["parent_asin"]} for r in reviews]
+
+        _, _, kept_ids, _ = deduplicator.filter_batch(docs, reviews, ["r1", "r2", "r3"], metadatas)
+
+        assert kept_ids == ["r1", "r2"]
+        assert deduplicator.near_duplicates == 1 and deduplicator.exact_duplicates == 0
+
+    def test_index_keeps_digests_and_packed_signatures(self):
+        """Test that neither review texts, signature tuples nor cluster records of unique reviews are retained."""
+        index = NearDuplicateIndex()
+        index.add(LONG_REVIEW, "r1", "A:1:1", {"parent_asin": "A"}, scope="A")
+
+        assert all(isinstance(key, bytes) and len(key) == 16 for key in index._exact)
+        assert len(index._signatures) == index.num_perm and index._signatures.itemsize == 4
+        assert index.clusters == {} and len(index) == 1
+
+    def test_source_ids_are_capped_but_counted(self):
+        """Test that a heavily duplicated review keeps at most MAX_SOURCE_IDS source IDs but counts them all."""
+        from dedup import MAX_SOURCE_IDS
+
+        deduplicator = ReviewDeduplicator()
+        count = MAX_SOURCE_IDS + 10
+        reviews = [review("A", f"u{i}") for i in range(count)]
+        deduplicator.filter_batch(["great product"] * count, reviews, [f"r{i}" for i in range(count)],
+                                  [{"parent_asin": "A"}] * count)
+
+        [(doc_id, metadata)] = deduplicator.representative_updates()
+        assert doc_id == "r0" and metadata["duplicate_count"] == count
+        assert len(metadata["duplicate_ids"].split(",")) == MAX_SOURCE_IDS
@@ -0,0 +1,52 @@
+import pytest
+
+from diversify import diversify_results, mmr_order
+
+
+def review_results():
+    """Six hits over three products; A's reviews are the nearest and near-identical."""
+    return {
+        "ids": [["a1", "a2", "a3", "b1", "c1", "b2"]],
+        "documents": [["a one", "a two", "a three", "b one", "c one", "b two"]],
+        "metadatas": [[{"parent_asin": asin} for asin in ["A", "A", "A", "B", "C", "B"]]],
+        "distances": [[0.10, 0.11, 0.12, 0.30, 0.40, 0.45]],
+        "embeddings": [[[1.0, 0.0], [1.0, 0.01], [0.99, 0.0], [0.0, 1.0], [0.7, 0.7], [0.1, 1.0]]],
+    }
+
+
+class TestDiversifyResults:
+    """Test suite for per-product caps and MMR re-ranking."""
+
+    def test_cap_keeps_best_hits_per_product(self):
+        """Test that the per-product cap spreads slots across products in rank order."""
+        assert diversify_results(review_results(), 3, "cap")["ids"] == [["a1", "b1", "c1"]]
+        assert diversify_results(review_results(), 4, "cap", per_group=2)["ids"] == [["a1", "a2", "b1", "c1"]]
+
+    def test_mmr_prefers_dissimilar_hits(self):
+        """Test that MMR picks the nearest hit, then hits unlike those already chosen."""
+        results = diversify_results(review_results(), 3, "mmr", per_group=3, mmr_lambda=0.5)
+
+        assert results["ids"][0][0] == "a1"
+        assert results["ids"][0][1] == "b1"
+        assert {"a2", "a3"}.isdisjoint(results["ids"][0][:2])
+
+    def test_mmr_with_lambda_one_is_relevance_order(self):
+        """Test that lambda=1 ignores redundancy and only applies the cap."""
+        results = diversify_results(review_results(), 3, "mmr", per_group=2, mmr_lambda=1.0)
+        assert results["ids"] == [["a1", "a2", "b1"]]
+        assert results["distances"] == [[0.10, 0.11, 0.30]]
+
+    def test_mmr_without_embeddings_falls_back_to_cap(self):
+        """Test that results fetched without embeddings are capped per product."""
+        results = review_results()
+        results["embeddings"] = None
+        assert diversify_results(results, 2, "mmr")["ids"] == [["a1", "b1"]]
+
+    def test_unknown_strategy_is_rejected(self):
+        """Test that only supported strategies are accepted."""
+        with pytest.raises(ValueError):
+            diversify_results(review_results(), 3, "random")
+
+    def test_mmr_order_stops_when_every_group_is_capped(self):
+        """Test that fewer than n_results are returned when the cap exhausts all groups."""
+        assert mmr_order([1.0, 0.9], [[1.0, 0.0], [0.0, 1.0]], ["A", "A"], n_results=2) == [0]
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+import yaml
+
+
+class TestLocalResponder:
+    """Test suite for the rule-based local model responder."""
+
+    def test_planner_queries_product_meta(self):
+        """Test that a product request becomes a QUERY on product_meta."""
+        from fake_gemini import LocalResponder
+
+        reply = yaml.safe_load(LocalResponder("planner")("recommend compression sleeves"))
+        assert reply["action"] == "QUERY"
+        assert reply["parameters"]["collection"] == "product_meta"
+        assert reply["parameters"]["query_text"] == "recommend compression sleeves"
+
+    def test_planner_routes_review_questions_and_summaries(self):
+        """Test that review questions and 'tell me more' requests pick the right action."""
+        from fake_gemini import LocalResponder
+
+        responder = LocalResponder("planner")
+        assert yaml.safe_load(responder("what do people say about these socks"))["parameters"]["collection"] == "product_review"
+        assert yaml.safe_load(responder("tell me more about running gear"))["action"] == "SUMMARIZE"
+
+    def test_planner_displays_snippet_after_rag(self):
+        """Test that a RAG follow-up prompt yields a DISPLAY with a snippet from the results."""
+        from fake_gemini import LocalResponder
+
+        prompt = ("User's last query: \"shoes\"\n        RAG Results: {'ids': [['meta_1']], "
+                  "'documents': [['lightweight trail shoe']]}\n\n        Response MUST be in JSON format.")
+        reply = json.loads(LocalResponder("planner", output_mode=_json_mode())(prompt))
+        assert reply["action"] == "DISPLAY"
+        assert reply["parameters"]["data"][0]["content"] == "lightweight trail shoe"
+
+    def test_summarizer_classifies_requests(self):
+        """Test that classification prompts get COMPREHENSIVE or STANDARD."""
+        from fake_gemini import LocalResponder
+
+        responder = LocalResponder("summarizer")
+        assert responder('Classify whether...\nUser request: "tell me more about shoes"\nClassification:') == "COMPREHENSIVE"
+        assert responder('Classify whether...\nUser request: "brief summary"\nClassification:') == "STANDARD"
+
+    def test_recordings_take_precedence(self, tmp_path):
+        """Test that recorded replies override the rules."""
+        from fake_gemini import LocalResponder, load_recordings
+
+        path = tmp_path / "recordings.jsonl"
+        path.write_text(json.dumps({"match": "sleeves", "response": "action: DISPLAY\nparameters:\n  message: recorded"}))
+        reply = LocalResponder("planner", recordings=load_recordings(str(path)))("best compression sleeves")
+        assert yaml.safe_load(reply)["parameters"]["message"] == "recorded"
+
+
+def _json_mode():
+    from models import OutputMode
+    return OutputMode.JSON
+
+
+class TestFakeBackend:
+    """Test suite for the fake model backend behind configure_gemini."""
+
+    def test_configure_gemini_fake_backend(self):
+        """Test that the fake backend works without the Gemini SDK or an API key."""
+        from gemini_config import configure_gemini
+
+        main_model, summarization_model = configure_gemini(backend="fake")
+        chat = main_model.start_chat()
+        chat.send_message("recommend running shoes")
+        assert yaml.safe_load(chat.last.text)["action"] == "QUERY"
+        assert chat.last.usage_metadata.prompt_token_count > 0
+
+    def test_unknown_backend_is_rejected(self):
+        """Test that an unknown backend name raises ValueError."""
+        from gemini_config import configure_gemini
+
+        with pytest.raises(ValueError, match="Unknown model backend"):
+            configure_gemini(backend="nope")
+
+    def test_latency_and_tokens_are_deterministic(self):
+        """Test that sampled latency and token counts depend only on prompt and seed."""
+        from fake_gemini import FakeGeminiEndpoint
+
+        endpoint = FakeGeminiEndpoint(reply="x" * 400, latency=0.5, latency_sigma=0.8,
+                                      completion_token_sigma=0.5, seed=7)
+        assert endpoint.sample_latency("prompt a") == endpoint.sample_latency("prompt a")
+        assert endpoint.sample_latency("prompt a") != endpoint.sample_latency("prompt b")
+
+        endpoint.latency = 0.0
+        first = endpoint.generate_content("prompt a").usage_metadata.candidates_token_count
+        assert first == endpoint.generate_content("prompt a").usage_metadata.candidates_token_count
+        assert first != 100
+
+    def test_reading_history_clears_last_like_the_sdk(self):
+        """Test that history commits the last exchange and resets last, as the Gemini SDK does."""
+        from fake_gemini import FakeGeminiEndpoint
+
+        chat = FakeGeminiEndpoint(reply="ok").start_chat()
+        response = chat.send_message("hello")
+
+        assert chat.last is response
+        assert [content.role for content in chat.history] == ["user", "model"]
+        assert chat.last is None
+        chat.send_message("again")
+        assert len(chat.history) == 4
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+
+def _no_sleep(seconds):
+    pass
+
+
+class TestTokenBucket:
+    """Test suite for the token bucket rate limiter."""
+
+    def test_acquire_waits_for_refill(self):
+        """Test that acquiring beyond capacity waits for the refill rate."""
+        from gemini_client import TokenBucket
+
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate_per_second=2.0, capacity=2.0, clock=lambda: now[0], sleep=sleep)
+        assert bucket.acquire(2) == 0.0
+        waited = bucket.acquire(1)
+        assert waited == pytest.approx(0.5)
+        assert slept == [pytest.approx(0.5)]
+
+    def test_oversized_request_is_capped_at_capacity(self):
+        """Test that a request larger than the bucket still completes."""
+        from gemini_client import TokenBucket
+
+        bucket = TokenBucket(rate_per_second=1.0, capacity=5.0, sleep=_no_sleep)
+        assert bucket.acquire(50) == 0.0
+
+
+class TestRetryPolicy:
+    """Test suite for backoff and retry of Gemini calls."""
+
+    def _wrap(self, endpoint, max_attempts=3):
+        from gemini_client import RateLimiter, RateLimitedModel, RetryPolicy
+
+        limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=10_000_000)
+        retry = RetryPolicy(max_attempts=max_attempts, base_delay=0.01, max_delay=0.1, sleep=_no_sleep)
+        return RateLimitedModel(endpoint, limiter, retry)
+
+    def test_retries_throttled_calls(self):
+        """Test that 429 responses are retried until the call succeeds."""
+        from fake_gemini import FakeGeminiEndpoint
+
+        endpoint = FakeGeminiEndpoint(reply="STANDARD", fail_times=2)
+        response = self._wrap(endpoint).generate_content("classify this")
+        assert response.text == "STANDARD"
+        assert len(endpoint.calls) == 3
+
+    def test_raises_rate_limit_error_after_max_attempts(self):
+        """Test that persistent throttling surfaces as RateLimitError."""
+        from exceptions import GeminiAPIError, RateLimitError
+        from fake_gemini import FakeGeminiEndpoint
+
+        endpoint = FakeGeminiEndpoint(fail_times=10)
+        with pytest.raises(RateLimitError):
+            self._wrap(endpoint, max_attempts=3).generate_content("prompt")
+        assert len(endpoint.calls) == 3
+        assert issubclass(RateLimitError, GeminiAPIError)
+
+    def test_non_retryable_errors_propagate(self):
+        """Test that non-retryable errors are raised immediately."""
+        from fake_gemini import FakeGeminiEndpoint
+
+        endpoint = FakeGeminiEndpoint(fail_times=1, error=ValueError)
+        with pytest.raises(ValueError):
+            self._wrap(endpoint).generate_content("prompt")
+        assert len(endpoint.calls) == 1
+
+    def test_chat_session_history_unchanged_by_failed_attempts(self):
+        """Test that retried chat messages appear in history only once."""
+        from fake_gemini import FakeGeminiEndpoint
+
+        endpoint = FakeGeminiEndpoint(reply="action: DISPLAY", fail_times=1)
+        chat = self._wrap(endpoint).start_chat()
+        chat.send_message("hello")
+        assert chat.last.text == "action: DISPLAY"
+        assert len(chat.history) == 2
+
+    def test_backoff_is_bounded_by_max_delay(self):
+        """Test that jittered backoff never exceeds max_delay."""
+        from gemini_client import RetryPolicy
+
+        retry = RetryPolicy(max_attempts=10, base_delay=1.0, max_delay=4.0, sleep=_no_sleep)
+        assert all(0 <= retry.backoff(attempt) <= 4.0 for attempt in range(10))
+
+
+class TestRequestCoalescing:
+    """Test suite for single-flight coalescing of identical calls."""
+
+    def test_identical_concurrent_calls_share_one_request(self):
+        """Test that concurrent identical prompts hit the endpoint once."""
+        from fake_gemini import FakeGeminiEndpoint
+        from gemini_client import wrap_models
+
+        endpoint = FakeGeminiEndpoint(reply="COMPREHENSIVE", latency=0.2)
+        (model,) = wrap_models(endpoint)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(model.generate_content("same prompt").text))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ["COMPREHENSIVE"] * 5
+        assert len(endpoint.calls) == 1
+
+    def test_different_prompts_are_not_coalesced(self):
+        """Test that distinct prompts are sent separately."""
+        from fake_gemini import FakeGeminiEndpoint
+        from gemini_client import wrap_models
+
+        endpoint = FakeGeminiEndpoint()
+        (model,) = wrap_models(endpoint)
+        model.generate_content("a")
+        model.generate_content("b")
+        assert len(endpoint.calls) == 2
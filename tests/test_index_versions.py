@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from exceptions import IndexVersionError, IngestError
+from index_versions import IndexManifest, IndexWatcher, build_and_activate
+from ingest_metrics import StageFailures
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestIndexManifest:
+    """Test suite for versioned index directories and the active-version manifest."""
+
+    def test_without_manifest_falls_back_to_legacy_index(self, tmp_path):
+        """Test that an index root without a manifest resolves to chromadb_v1."""
+        manifest = IndexManifest(str(tmp_path))
+        assert manifest.active_version() is None
+        assert manifest.active_path() == os.path.join(str(tmp_path), "chromadb_v1")
+
+    def test_activate_retires_previous_version(self, tmp_path):
+        """Test that activating a version records the old one as retired."""
+        clock = FakeClock()
+        manifest = IndexManifest(str(tmp_path), clock=clock)
+        blue = manifest.new_version()
+        manifest.activate(blue)
+        clock.now += 10
+        green = manifest.new_version()
+
+        assert manifest.activate(green) == blue
+        contents = json.loads((tmp_path / "manifest.json").read_text())
+        assert contents["active"] == green
+        assert contents["versions"][blue]["retired_at"] == clock.now
+        assert manifest.active_path() == os.path.join(str(tmp_path), green)
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_activate_unknown_version_raises(self, tmp_path):
+        """Test that a missing version directory cannot be activated."""
+        with pytest.raises(IndexVersionError):
+            IndexManifest(str(tmp_path)).activate("chromadb_missing")
+
+    def test_cleanup_waits_for_grace_period(self, tmp_path):
+        """Test that retired versions are only deleted once the grace period has passed."""
+        clock = FakeClock()
+        manifest = IndexManifest(str(tmp_path), clock=clock)
+        blue = manifest.new_version()
+        manifest.activate(blue)
+        clock.now += 1
+        green = manifest.new_version()
+        manifest.activate(green)
+
+        assert manifest.cleanup(grace_seconds=60) == []
+        clock.now += 61
+        assert manifest.cleanup(grace_seconds=60) == [blue]
+        assert not (tmp_path / blue).exists()
+        assert (tmp_path / green).exists()
+        assert blue not in manifest.read()["versions"]
+
+
+    def test_failed_worker_keeps_previous_version_active(self, tmp_path):
+        """Test that a build whose pipeline thread raised is never activated and is retired."""
+        clock = FakeClock()
+        manifest = IndexManifest(str(tmp_path), clock=clock)
+        blue = manifest.new_version()
+        manifest.activate(blue)
+        clock.now += 1
+
+        def build(path):
+            # Same shape as the builders: worker errors are collected and re-raised after join()
+            failures = StageFailures()
+
+            def inserter():
+                with failures.guard("inserter_reviews"):
+                    raise RuntimeError("upsert rejected")
+
+            workers = [threading.Thread(target=inserter), threading.Thread(target=lambda: None)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            failures.raise_if_failed()
+
+        with pytest.raises(IngestError, match="inserter_reviews"):
+            build_and_activate(manifest, build)
+
+        assert manifest.active_version() == blue
+        green = next(version for version in manifest.read()["versions"] if version != blue)
+        assert manifest.read()["versions"][green]["retired_at"] == clock.now
+        clock.now += 61
+        assert manifest.cleanup(grace_seconds=60) == [green]
+
+    def test_successful_build_is_activated(self, tmp_path):
+        """Test that build_and_activate returns the build result and switches the active version."""
+        manifest = IndexManifest(str(tmp_path))
+
+        result = build_and_activate(manifest, lambda path: os.path.basename(path))
+
+        assert manifest.active_version() == result
+
+
+class TestIndexWatcher:
+    """Test suite for swapping running chatbots to a newly activated index."""
+
+    def test_check_swaps_only_on_change(self, tmp_path):
+        """Test that the callback fires once per newly activated version."""
+        clock = FakeClock()
+        manifest = IndexManifest(str(tmp_path), clock=clock)
+        swaps = []
+        watcher = IndexWatcher(manifest, swaps.append)
+
+        assert watcher.check() is False
+        clock.now += 1
+        version = manifest.new_version()
+        manifest.activate(version)
+        assert watcher.check() is True
+        assert watcher.check() is False
+        assert swaps == [os.path.join(str(tmp_path), version)]
+
+    def test_chat_service_swap_keeps_running_turn_resources(self):
+        """Test that a swap replaces the collections for new turns without touching captured resources."""
+        from chatbot import ChatResources
+        from server import ChatService, WorkerPool
+        from session_store import create_session_store
+
+        old = ChatResources(MagicMock(), MagicMock(), "old-client", "old-meta", "old-review")
+        service = ChatService(old, create_session_store("memory"), WorkerPool(1, 1))
+        captured_by_running_turn = service.resources
+
+        with patch("chatbot.get_chromadb", return_value=("new-client", "new-meta", "new-review")) as get_chromadb:
+            service.swap_index("/indexes/chromadb_2")
+
+        get_chromadb.assert_called_once_with("/indexes/chromadb_2")
+        assert service.resources.product_review_collection == "new-review"
+        assert service.resources.main_model is old.main_model
+        assert captured_by_running_turn.product_review_collection == "old-review"
@@ -0,0 +1,104 @@
+import json
+import queue
+import urllib.request
+
+import pytest
+
+from ingest_metrics import IngestProgress, serve_progress
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    reviews = tmp_path / "reviews.jsonl"
+    meta = tmp_path / "meta.jsonl"
+    reviews.write_bytes(b"x" * 1000)
+    meta.write_bytes(b"y" * 1000)
+    return {"reviews": str(reviews), "meta": str(meta)}
+
+
+class TestIngestProgress:
+    """Test suite for live ingest metrics."""
+
+    def test_rates_and_byte_offset_eta(self, input_files):
+        """Test per-stage throughput and an ETA from the bytes read so far."""
+        clock = FakeClock()
+        job_queue = queue.Queue(maxsize=10)
+        job_queue.put("batch")
+        progress = IngestProgress(input_files, queues={"job": job_queue}, clock=clock)
+
+        clock.now += 10
+        progress.advance("reviews", 400)
+        progress.advance("meta", 100)
+        progress.record("encoder", 2000, seconds=4.0)
+        snapshot = progress.snapshot()
+
+        assert snapshot["fraction_read"] == pytest.approx(0.25)
+        assert snapshot["eta_seconds"] == pytest.approx(30.0)
+        assert snapshot["stages"]["encoder"]["docs_per_second"] == pytest.approx(200.0)
+        assert snapshot["stages"]["encoder"]["busy_seconds"] == pytest.approx(4.0)
+        assert snapshot["queues"]["job"] == {"depth": 1, "maxsize": 10}
+
+    def test_recent_rate_uses_sliding_window(self, input_files):
+        """Test that the recent rate reflects only the last window of progress."""
+        clock = FakeClock()
+        progress = IngestProgress(input_files, rate_window_seconds=5.0, clock=clock)
+
+        progress.record("inserter_meta", 1000)
+        progress.snapshot()
+        clock.now += 10
+        progress.snapshot()
+        clock.now += 2
+        progress.record("inserter_meta", 100)
+
+        assert progress.snapshot()["stages"]["inserter_meta"]["recent_docs_per_second"] == pytest.approx(50.0)
+
+    def test_finish_writes_summary_with_gpu_probe(self, input_files, tmp_path):
+        """Test that finish() writes the final JSON summary including GPU utilization."""
+        progress = IngestProgress(input_files, gpu_probe=lambda: 87.0)
+        progress.advance("reviews", 1000)
+        progress.advance("meta", 1000)
+        summary_path = tmp_path / "summary.json"
+
+        summary = progress.finish(str(summary_path))
+
+        assert summary["finished"] and summary["eta_seconds"] == 0
+        assert json.loads(summary_path.read_text())["gpu_percent"] == 87.0
+
+    def test_http_endpoint_serves_progress_and_metrics(self, input_files):
+        """Test the /progress JSON and /metrics text endpoints."""
+        progress = IngestProgress(input_files)
+        progress.record("encoder", 5)
+        httpd = serve_progress(progress, port=0)
+        base = f"http://127.0.0.1:{httpd.server_address[1]}"
+        try:
+            body = json.loads(urllib.request.urlopen(f"{base}/progress").read())
+            metrics = urllib.request.urlopen(f"{base}/metrics").read().decode("utf-8")
+        finally:
+            httpd.shutdown()
+
+        assert body["stages"]["encoder"]["docs"] == 5
+        assert 'ingest_docs_total{stage="encoder"}' in metrics
+
+    def test_stage_failures_reach_the_summary(self, input_files):
+        """Test that a failed stage is listed in the snapshot and re-raised as IngestError."""
+        from exceptions import IngestError
+
+        progress = IngestProgress(files=input_files)
+        assert not progress.failures
+        progress.failures.raise_if_failed()
+
+        with progress.failures.guard("encoder"):
+            raise RuntimeError("CUDA out of memory")
+
+        assert progress.snapshot()["failures"] == [{"stage": "encoder", "error": "RuntimeError('CUDA out of memory')"}]
+        with pytest.raises(IngestError, match="encoder") as raised:
+            progress.failures.raise_if_failed()
+        assert isinstance(raised.value.__cause__, RuntimeError)
@@ -0,0 +1,76 @@
+import pytest
+
+from model_router import ModelRouter, classify_turn, template_reply
+from models import ModelTier, TurnKind
+
+
+HISTORY = [{'role': 'user', 'parts': ['running shoes']}, {'role': 'model', 'parts': ['action: QUERY']}]
+
+
+class TestClassifyTurn:
+    """Test suite for judging how demanding a user message is."""
+
+    @pytest.mark.parametrize("message", ["hi", "Hello there!", "thanks so much", "Bye"])
+    def test_greetings(self, message):
+        """Test that greetings, thanks and farewells are recognised with or without history."""
+        assert classify_turn(message, has_history=False) == TurnKind.GREETING
+
+    def test_first_turn_is_a_request(self):
+        """Test that a short first message still needs the full model."""
+        assert classify_turn("red shoes", has_history=False) == TurnKind.REQUEST
+
+    def test_short_mid_session_messages(self):
+        """Test that short questions are clarifications and other short messages follow-ups."""
+        assert classify_turn("which one is waterproof?", has_history=True) == TurnKind.CLARIFICATION
+        assert classify_turn("the second one", has_history=True) == TurnKind.FOLLOW_UP
+
+    def test_long_or_synthesis_messages_are_requests(self):
+        """Test that long messages and review/summary asks are never routed down."""
+        assert classify_turn("what do reviewers say?", has_history=True) == TurnKind.REQUEST
+        assert classify_turn("I need trail running shoes for wide feet under fifty dollars",
+                             has_history=True) == TurnKind.REQUEST
+
+    def test_template_replies_match_the_greeting(self):
+        """Test that thanks and farewells get their own canned reply."""
+        assert template_reply("thank you!").startswith("You're welcome")
+        assert template_reply("goodbye").startswith("Goodbye")
+        assert template_reply("hey").startswith("Hello")
+
+
+class TestModelRouter:
+    """Test suite for budgeted tier selection."""
+
+    def test_greetings_use_templates_and_requests_the_full_model(self):
+        """Test that kinds without a choice of tier ignore the budget."""
+        router = ModelRouter(latency_budget_seconds=0.0, cost_budget_usd=0.0)
+
+        assert router.route("hello").tier == ModelTier.TEMPLATE
+        decision = router.route("summarize the reviews", HISTORY)
+        assert decision.tier == ModelTier.FULL and not decision.within_budget
+
+    def test_budget_picks_the_most_capable_affordable_tier(self):
+        """Test that a follow-up goes to the full model only when it fits the budget."""
+        generous = ModelRouter(latency_budget_seconds=5.0, cost_budget_usd=1.0)
+        tight = ModelRouter(latency_budget_seconds=1.0, cost_budget_usd=1.0)
+
+        assert generous.route("the second one", HISTORY).tier == ModelTier.FULL
+        assert tight.route("the second one", HISTORY).tier == ModelTier.LIGHT
+
+    def test_cost_budget_grows_with_the_prompt(self):
+        """Test that a long history pushes a follow-up off the full model."""
+        router = ModelRouter(latency_budget_seconds=5.0, cost_budget_usd=0.0002)
+        long_history = HISTORY + [{'role': 'model', 'parts': ['x' * 40000]}]
+
+        assert router.route("the second one", HISTORY).tier == ModelTier.FULL
+        assert router.route("the second one", long_history).tier == ModelTier.LIGHT
+
+    def test_record_learns_latency_and_reports_savings(self):
+        """Test that observed latency moves the estimate and light turns report USD saved."""
+        router = ModelRouter(latency_budget_seconds=1.0, smoothing=0.5)
+        decision = router.route("the second one", HISTORY)
+
+        saved = router.record(decision, seconds=0.1, prompt_tokens=2000, completion_tokens=100)
+
+        assert saved == pytest.approx(router.cost(ModelTier.FULL, 2000, 100) - router.cost(ModelTier.LIGHT, 2000, 100))
+        assert router.expected_latency(ModelTier.LIGHT) == pytest.approx(0.3)
+        assert router.record(router.escalate(decision), seconds=1.0) == 0.0
@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from chroma_db_config import NUMPY_EXPORT_DIRNAME, get_chromadb
+from numpy_search import EmbeddingExportWriter, NumpyClient, NumpyCollection, NumpySearchEngine, export_collection
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(1).normal(size=(300, 16)).astype(np.float32)
+
+
+def write_export(directory, vectors, metric="l2", batch=64):
+    writer = EmbeddingExportWriter(str(directory), "product_review", metric)
+    for start in range(0, len(vectors), batch):
+        positions = range(start, min(len(vectors), start + batch))
+        writer.append([f"review_{p}" for p in positions], [f"doc {p}" for p in positions],
+                      [{"parent_asin": f"B{p % 5}"} for p in positions], vectors[start:start + batch])
+    return writer.close()
+
+
+class PagedCollection:
+    """The subset of the Chroma collection API export_collection uses."""
+
+    name = "product_meta"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def get(self, include=None, limit=None, offset=0):
+        positions = range(offset, min(len(self.vectors), offset + limit))
+        return {
+            "ids": [f"meta_{p}" for p in positions],
+            "documents": [f"title {p}" for p in positions],
+            "metadatas": [{"parent_asin": f"B{p}"} for p in positions],
+            "embeddings": [self.vectors[p].tolist() for p in positions],
+        }
+
+
+class TestEmbeddingExport:
+    """Test suite for writing .npy memmaps with a parallel id/metadata table."""
+
+    def test_export_is_a_loadable_memmap(self, tmp_path, vectors):
+        """Test that appended batches form one contiguous float32 matrix in row order."""
+        info = write_export(tmp_path, vectors)
+
+        loaded = np.load(tmp_path / "embeddings.npy", mmap_mode="r")
+        assert info == {"count": 300, "dim": 16, "metric": "l2", "collection": "product_review"}
+        assert loaded.shape == (300, 16) and loaded.dtype == np.float32
+        np.testing.assert_array_equal(loaded, vectors)
+        assert json.loads((tmp_path / "info.json").read_text())["count"] == 300
+
+    def test_mismatched_dimensions_are_rejected(self, tmp_path, vectors):
+        """Test that every batch must have the dimension of the first."""
+        writer = EmbeddingExportWriter(str(tmp_path))
+        writer.append(["a"], ["doc"], [{}], vectors[:1])
+        with pytest.raises(ValueError):
+            writer.append(["b"], ["doc"], [{}], vectors[:1, :8])
+
+    def test_export_collection_pages_through_get(self, tmp_path, vectors):
+        """Test that an existing collection is exported page by page."""
+        info = export_collection(PagedCollection(vectors[:45]), str(tmp_path), page_size=10)
+
+        collection = NumpyCollection(str(tmp_path), "product_meta")
+        assert info["count"] == 45
+        assert collection.get(ids=["meta_44"])["metadatas"] == [{"parent_asin": "B44"}]
+
+    def test_metadata_updates_reach_the_table(self, tmp_path, vectors):
+        """Test that metadata changed after export (e.g. dedup counts) is stored."""
+        writer = EmbeddingExportWriter(str(tmp_path))
+        writer.append(["a", "b"], ["doc a", "doc b"], [{"n": 1}, {"n": 1}], vectors[:2])
+        writer.update_metadatas(["b"], [{"n": 3}])
+        writer.close()
+
+        assert NumpyCollection(str(tmp_path), "c").get(ids=["a", "b"])["metadatas"] == [{"n": 1}, {"n": 3}]
+
+
+class TestNumpySearchEngine:
+    """Test suite for exact blocked top-k search."""
+
+    @pytest.mark.parametrize("metric", ["l2", "cosine", "ip"])
+    def test_blocked_threaded_search_matches_brute_force(self, tmp_path, vectors, metric):
+        """Test that small blocks across threads give the same neighbours and distances as one matmul."""
+        write_export(tmp_path, vectors, metric)
+        engine = NumpySearchEngine(str(tmp_path), threads=4, block_rows=37)
+        queries = np.random.default_rng(2).normal(size=(5, 16)).astype(np.float32)
+
+        positions, distances = engine.search(queries, 7)
+
+        if metric == "l2":
+            expected = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+        elif metric == "cosine":
+            unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            expected = 1 - (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ unit.T
+        else:
+            expected = 1 - queries @ vectors.T
+        np.testing.assert_array_equal(positions, np.argsort(expected, axis=1, kind="stable")[:, :7])
+        np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :7], rtol=1e-4, atol=1e-4)
+
+    def test_k_is_capped_by_the_row_count(self, tmp_path, vectors):
+        """Test that asking for more neighbours than rows returns every row."""
+        write_export(tmp_path, vectors[:3])
+        positions, _ = NumpySearchEngine(str(tmp_path), block_rows=2).search(vectors[0], 10)
+        assert positions.shape == (1, 3) and positions[0, 0] == 0
+
+
+class TestNumpyCollection:
+    """Test suite for the Chroma-compatible read-only collection."""
+
+    def test_query_returns_chroma_shaped_results(self, tmp_path, vectors):
+        """Test that a query by embedding returns ids, documents, metadatas and distances per query."""
+        write_export(tmp_path, vectors)
+        collection = NumpyCollection(str(tmp_path), "product_review")
+
+        results = collection.query(query_embeddings=[vectors[42].tolist()], n_results=3)
+
+        assert results["ids"][0][0] == "review_42"
+        assert results["documents"][0][0] == "doc 42"
+        assert results["metadatas"][0][0] == {"parent_asin": "B2"}
+        assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-4)
+        assert results["embeddings"] is None and collection.count() == 300
+
+    def test_query_texts_use_the_embedding_function(self, tmp_path, vectors):
+        """Test that text queries are embedded before searching."""
+        write_export(tmp_path, vectors)
+        collection = NumpyCollection(str(tmp_path), "product_review", embedding_function=lambda texts: [vectors[7]])
+
+        assert collection.query(query_texts=["anything"], n_results=1)["ids"] == [["review_7"]]
+
+    def test_where_filters_and_writes_are_rejected(self, tmp_path, vectors):
+        """Test that unsupported Chroma features fail loudly instead of returning wrong results."""
+        write_export(tmp_path, vectors)
+        collection = NumpyCollection(str(tmp_path), "product_review")
+
+        with pytest.raises(ValueError):
+            collection.query(query_embeddings=[vectors[0]], where={"parent_asin": "B1"})
+        with pytest.raises(NotImplementedError):
+            collection.upsert(ids=["x"], documents=["x"])
+
+    def test_get_pages_in_row_order(self, tmp_path, vectors):
+        """Test that get with limit/offset walks the rows in export order."""
+        write_export(tmp_path, vectors)
+        page = NumpyCollection(str(tmp_path), "product_review").get(limit=2, offset=10, include=["embeddings"])
+
+        assert page["ids"] == ["review_10", "review_11"]
+        np.testing.assert_allclose(page["embeddings"], vectors[10:12])
+
+
+class TestNumpyBackend:
+    """Test suite for serving an exported index version through get_chromadb."""
+
+    def test_numpy_backend_opens_both_collections(self, tmp_path, vectors, monkeypatch):
+        """Test that CHATBOT_VECTOR_BACKEND=numpy serves the export inside the index version."""
+        for name in ("product_meta", "product_review"):
+            writer = EmbeddingExportWriter(str(tmp_path / NUMPY_EXPORT_DIRNAME / name), name)
+            writer.append([f"{name}_0"], ["doc"], [{}], vectors[:1])
+            writer.close()
+        monkeypatch.setenv("CHATBOT_VECTOR_BACKEND", "numpy")
+        monkeypatch.setattr("chroma_db_config.get_embedding_function", lambda: None)
+
+        client, meta, reviews = get_chromadb(str(tmp_path))
+
+        assert isinstance(client, NumpyClient)
+        assert (meta.name, reviews.name) == ("product_meta", "product_review")
+        assert reviews.query(query_embeddings=[vectors[0]], n_results=1)["ids"] == [["product_review_0"]]
+
+    def test_unknown_backend_is_rejected(self, tmp_path):
+        """Test that a misspelt backend name is reported."""
+        with pytest.raises(ValueError):
+            get_chromadb(str(tmp_path), backend="faiss")
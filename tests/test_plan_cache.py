@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def _embedder(vectors):
+    """Embedding function returning fixed vectors per text."""
+    return lambda texts: [vectors[text] for text in texts]
+
+
+def _plan():
+    from models import ActionType, GeminiResponse
+    return GeminiResponse(action=ActionType.QUERY,
+                          parameters={"query_text": "running shoes", "collection": "product_meta", "n_results": 5})
+
+
+class TestSemanticPlanCache:
+    """Test suite for the semantic plan cache."""
+
+    def test_similar_input_hits(self):
+        """Test that a near-identical request reuses the cached plan."""
+        from plan_cache import SemanticPlanCache
+
+        cache = SemanticPlanCache(_embedder({"recommend running shoes": [1.0, 0.0],
+                                             "recommend some running shoes": [0.99, 0.05]}))
+        cache.put(cache.embed("recommend running shoes"), "recommend running shoes", "action: QUERY", _plan())
+
+        cached = cache.get(cache.embed("recommend some running shoes"))
+        assert cached is not None
+        assert cached.response_text == "action: QUERY"
+        assert cache.hit_rate == 1.0
+
+    def test_dissimilar_input_misses(self):
+        """Test that unrelated requests fall below the similarity threshold."""
+        from plan_cache import SemanticPlanCache
+
+        cache = SemanticPlanCache(_embedder({"running shoes": [1.0, 0.0], "winter coats": [0.0, 1.0]}))
+        cache.put(cache.embed("running shoes"), "running shoes", "action: QUERY", _plan())
+
+        assert cache.get(cache.embed("winter coats")) is None
+        assert cache.hit_rate == 0.0
+
+    def test_entries_expire_after_ttl(self):
+        """Test that entries are dropped once their TTL has passed."""
+        from plan_cache import SemanticPlanCache
+
+        now = [0.0]
+        cache = SemanticPlanCache(_embedder({"shoes": [1.0]}), ttl_seconds=10, clock=lambda: now[0])
+        cache.put(cache.embed("shoes"), "shoes", "action: QUERY", _plan())
+        now[0] = 11.0
+
+        assert cache.get(cache.embed("shoes")) is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test that the size limit evicts the least recently used plan."""
+        from plan_cache import SemanticPlanCache
+
+        cache = SemanticPlanCache(_embedder({"a": [1.0, 0.0, 0.0], "b": [0.0, 1.0, 0.0], "c": [0.0, 0.0, 1.0]}),
+                                  max_entries=2)
+        for text in ("a", "b"):
+            cache.put(cache.embed(text), text, text, _plan())
+        cache.get(cache.embed("a"))  # "b" is now least recently used
+        cache.put(cache.embed("c"), "c", "c", _plan())
+
+        assert len(cache) == 2
+        assert cache.get(cache.embed("b")) is None
+        assert cache.get(cache.embed("a")) is not None
+
+    def test_concurrent_lookups_return_their_own_plans(self):
+        """Test that lookups racing with puts and evictions only return the plan cached for their input."""
+        from plan_cache import SemanticPlanCache
+
+        dim = 16
+        vectors = {f"q{i}": [1.0 if j == i else 0.0 for j in range(dim)] for i in range(dim)}
+        cache = SemanticPlanCache(_embedder(vectors), max_entries=8)
+
+        def worker(offset):
+            mismatches = 0
+            for step in range(200):
+                text = f"q{(offset + step) % dim}"
+                embedding = cache.embed(text)
+                cached = cache.get(embedding)
+                if cached is None:
+                    cache.put(embedding, text, text, _plan())
+                elif cached.user_input != text:
+                    mismatches += 1
+            return mismatches
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            mismatches = list(pool.map(worker, range(8)))
+
+        assert mismatches == [0] * 8
+        assert cache.hits + cache.misses == 8 * 200
+        assert len(cache) <= 8
+        assert int(cache._live.sum()) == len(cache)
+
+    def test_cache_is_opt_in(self, monkeypatch):
+        """Test that no plan cache is created unless plan_cache_enabled is set."""
+        from chatbot import config, create_plan_cache
+
+        embedder = _embedder({})
+        assert create_plan_cache(embedder) is None
+        monkeypatch.setattr(config, "plan_cache_enabled", True)
+        assert create_plan_cache(embedder) is not None
+
+    @pytest.mark.parametrize("text,expected", [
+        ("recommend running shoes", True),
+        ("best compression sleeves", True),
+        ("tell me more about that one", False),
+        ("are there cheaper options", False),
+    ])
+    def test_is_context_free(self, text, expected):
+        """Test detection of messages that refer back to earlier turns."""
+        from plan_cache import is_context_free
+        assert is_context_free(text) is expected
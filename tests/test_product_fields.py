@@ -0,0 +1,100 @@
+import pytest
+
+from product_fields import PRODUCT_FIELDS, expand_product_fields, field_text, fuse_field_results, parse_fields
+
+
+PRODUCT = {
+    "parent_asin": "B1",
+    "title": "Grey Hoodie",
+    "features": ["Thumbhole cuffs", "", "Kangaroo pocket"],
+    "description": [],
+}
+
+
+def meta_results(hits):
+    """Chroma-shaped single-query result from (id, document, metadata, distance) tuples."""
+    return {
+        "ids": [[hit[0] for hit in hits]],
+        "documents": [[hit[1] for hit in hits]],
+        "metadatas": [[hit[2] for hit in hits]],
+        "distances": [[hit[3] for hit in hits]],
+        "included": ["documents", "metadatas", "distances"],
+    }
+
+
+class TestProductFieldDocuments:
+    """Test suite for indexing each product field as its own document."""
+
+    def test_field_text_joins_lists_and_lowercases(self):
+        """Test that list fields become one lowercased string and empty fields become empty."""
+        assert field_text(PRODUCT, "features") == "thumbhole cuffs kangaroo pocket"
+        assert field_text(PRODUCT, "description") == ""
+        assert field_text({}, "title") == ""
+
+    def test_expand_keeps_the_product_id_for_the_title(self):
+        """Test that the title keeps the id, other fields get '#<field>' ids, and empty fields are skipped."""
+        docs, ids, metadatas = expand_product_fields([PRODUCT], ["meta_B1"], [{"parent_asin": "B1"}])
+
+        assert ids == ["meta_B1", "meta_B1#features"]
+        assert docs == ["grey hoodie", "thumbhole cuffs kangaroo pocket"]
+        assert metadatas == [{"parent_asin": "B1", "field": "title"},
+                             {"parent_asin": "B1", "field": "features", "title": "grey hoodie"}]
+
+    def test_parse_fields_always_includes_the_title(self):
+        """Test that field lists are validated, ordered and always index the title."""
+        assert parse_fields("description, features") == PRODUCT_FIELDS
+        assert parse_fields("title") == ("title",)
+        with pytest.raises(ValueError):
+            parse_fields("title,price")
+
+
+class TestFieldFusion:
+    """Test suite for reciprocal rank fusion of field hits into one hit per product."""
+
+    def test_products_matching_several_fields_outrank_single_matches(self):
+        """Test that a product matched by title and features beats one with only the top title hit."""
+        results = meta_results([
+            ("b", "red hoodie", {"parent_asin": "B", "field": "title"}, 0.10),
+            ("a#features", "thumbhole cuffs", {"parent_asin": "A", "field": "features", "title": "grey hoodie"}, 0.20),
+            ("a", "grey hoodie", {"parent_asin": "A", "field": "title"}, 0.30),
+        ])
+
+        fused = fuse_field_results(results, 2)
+
+        assert fused["ids"] == [["a#features", "b"]]
+        assert fused["distances"] == [[0.20, 0.10]]
+        assert fused["documents"][0][0] == "grey hoodie | features: thumbhole cuffs"
+        assert fused["metadatas"][0][0]["matched_fields"] == "title,features"
+        assert fused["metadatas"][0][0]["fused_score"] > fused["metadatas"][0][1]["fused_score"]
+        assert fused["included"] == results["included"]
+
+    def test_unmatched_title_comes_from_metadata(self):
+        """Test that a product found only by its description is still named by its title."""
+        results = meta_results([
+            ("a#description", "made for trail runs", {"parent_asin": "A", "field": "description", "title": "shoes"}, 0.1),
+        ])
+
+        assert fuse_field_results(results, 5)["documents"] == [["shoes | description: made for trail runs"]]
+
+    def test_title_only_index_keeps_the_ranking(self):
+        """Test that hits without field metadata are ranked as before, one per product."""
+        results = meta_results([
+            ("m1", "socks", {"parent_asin": "A"}, 0.1),
+            ("m2", "more socks", {"parent_asin": "A"}, 0.2),
+            ("m3", "sandals", {"parent_asin": "B"}, 0.3),
+        ])
+
+        fused = fuse_field_results(results, 5)
+
+        assert fused["ids"] == [["m1", "m3"]]
+        assert fused["documents"] == [["socks", "sandals"]]
+
+    def test_weights_change_the_winner(self):
+        """Test that weighting features above titles promotes feature matches."""
+        results = meta_results([
+            ("b", "red hoodie", {"parent_asin": "B", "field": "title"}, 0.10),
+            ("a#features", "thumbhole cuffs", {"parent_asin": "A", "field": "features", "title": "grey hoodie"}, 0.20),
+        ])
+
+        assert fuse_field_results(results, 1)["ids"] == [["b"]]
+        assert fuse_field_results(results, 1, weights={"title": 0.5, "features": 1.0})["ids"] == [["a#features"]]
@@ -0,0 +1,118 @@
+import json
+import pstats
+import sys
+import threading
+import time
+
+import pytest
+
+from profiling import Profiler
+
+
+def busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+class TestProfiler:
+    """Test suite for the opt-in profiling hooks."""
+
+    def test_disabled_sections_are_a_shared_noop(self):
+        """Test that sections cost nothing until profiling is enabled."""
+        profiler = Profiler()
+        assert profiler.section("turn") is profiler.section("planning")
+        with profiler.section("turn"):
+            pass
+        assert profiler.close() is None
+
+    def test_unknown_mode_is_rejected(self, tmp_path):
+        """Test that an unknown profile mode raises ValueError."""
+        with pytest.raises(ValueError, match="Unknown profile mode"):
+            Profiler().enable("perf", str(tmp_path))
+
+    def test_cprofile_mode_merges_sections_by_name(self, tmp_path):
+        """Test that cProfile data of every thread is merged into one .prof per section."""
+        profiler = Profiler()
+        profiler.enable("cprofile", str(tmp_path))
+
+        def encoder():
+            with profiler.section("encoder"):
+                busy(0.01)
+
+        threads = [threading.Thread(target=encoder) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = json.loads(open(profiler.close()).read())
+
+        assert summary["sections"]["encoder"]["calls"] == 3
+        assert "busy" in {func[2] for func in pstats.Stats(str(tmp_path / "encoder.prof")).stats}
+        assert summary["peak_traced_bytes"] > 0
+
+    @pytest.mark.skipif(sys.version_info < (3, 12), reason="one profiler per process only from Python 3.12")
+    def test_concurrent_cprofile_sections_fall_back_to_sampling(self, tmp_path):
+        """Test that a thread entering a section while another holds the profiler is sampled instead."""
+        profiler = Profiler()
+        profiler.enable("cprofile", str(tmp_path), sample_interval=0.001)
+        holding, done = threading.Event(), threading.Event()
+        errors = []
+
+        def holder():
+            with profiler.section("producer"):
+                holding.set()
+                done.wait(5)
+
+        def encoder():
+            try:
+                with profiler.section("encoder"):
+                    busy(0.1)
+            except Exception as e:
+                errors.append(e)
+
+        first = threading.Thread(target=holder)
+        first.start()
+        holding.wait(5)
+        second = threading.Thread(target=encoder)
+        second.start()
+        second.join()
+        done.set()
+        first.join()
+        summary = json.loads(open(profiler.close()).read())
+
+        assert errors == []
+        assert summary["sections"]["encoder"]["calls"] == 1
+        assert summary["sections"]["encoder"]["samples"] > 0
+        lines = (tmp_path / "encoder.collapsed").read_text().splitlines()
+        assert any(line.startswith("encoder;") and "busy" in line for line in lines)
+        assert (tmp_path / "producer.prof").exists()
+
+    def test_memory_peak_is_reached_inside_the_section(self, tmp_path):
+        """Test that memory allocated and freed within a section still counts towards its peak."""
+        profiler = Profiler()
+        profiler.enable("cprofile", str(tmp_path))
+        with profiler.section("load"):
+            buffer = bytearray(8 * 1024 * 1024)
+            del buffer
+        with profiler.section("idle"):
+            pass
+        summary = json.loads(open(profiler.close()).read())
+
+        assert summary["sections"]["load"]["peak_traced_bytes"] >= 8 * 1024 * 1024
+        assert summary["sections"]["idle"]["peak_traced_bytes"] < 8 * 1024 * 1024
+        assert summary["peak_traced_bytes"] >= 8 * 1024 * 1024
+
+    def test_sample_mode_writes_collapsed_stacks(self, tmp_path):
+        """Test that sampled stacks are prefixed with the section path."""
+        profiler = Profiler()
+        profiler.enable("sample", str(tmp_path), sample_interval=0.001)
+        with profiler.section("turn"):
+            with profiler.section("planning"):
+                busy(0.1)
+        summary = json.loads(open(profiler.close()).read())
+
+        lines = (tmp_path / "turn.collapsed").read_text().splitlines()
+        assert any(line.startswith("turn;planning;") and "busy" in line for line in lines)
+        assert summary["sections"]["planning"]["samples"] > 0
+        assert summary["sections"]["turn"]["samples"] >= summary["sections"]["planning"]["samples"]
@@ -0,0 +1,176 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from quantized_index import (QuantizedCollection, QuantizedIndex, evaluate, export_quantized_index, normalize,
+                             quantize)
+
+
+class InMemoryCollection:
+    """The subset of the Chroma collection API the side index uses."""
+
+    name = "product_review"
+
+    def __init__(self, vectors):
+        self.ids = [f"review_{i}" for i in range(len(vectors))]
+        self.vectors = [list(map(float, vector)) for vector in vectors]
+        self.query_calls = 0
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, ids=None, include=None, limit=None, offset=0):
+        positions = [self.ids.index(doc_id) for doc_id in ids] if ids is not None else \
+            list(range(offset, min(len(self.ids), offset + (limit or len(self.ids)))))
+        return {
+            "ids": [self.ids[p] for p in positions],
+            "embeddings": [self.vectors[p] for p in positions],
+            "documents": [f"doc {p}" for p in positions],
+            "metadatas": [{"parent_asin": f"B{p % 7}"} for p in positions],
+        }
+
+    def query(self, **kwargs):
+        self.query_calls += 1
+        return {"ids": [[]]}
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(500, 32)).astype(np.float32)
+
+
+class TestQuantization:
+    """Test suite for float16/int8 quantization."""
+
+    @pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 2e-2)])
+    def test_round_trip_error_is_small(self, vectors, dtype, tolerance):
+        """Test that dequantized unit vectors stay close to the originals."""
+        unit = normalize(vectors)
+        codes, scales = quantize(unit, dtype)
+        restored = codes.astype(np.float32) * (scales[:, None] if scales is not None else 1.0)
+        assert np.abs(restored - unit).max() < tolerance
+
+    def test_unknown_dtype_is_rejected(self, vectors):
+        """Test that only supported quantization types are accepted."""
+        with pytest.raises(ValueError):
+            quantize(vectors, "int4")
+
+
+class TestQuantizedCollection:
+    """Test suite for first-pass search over the side index with exact re-scoring."""
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    @pytest.mark.parametrize("keep_exact", [True, False])
+    def test_rescored_results_match_exact_search(self, tmp_path, vectors, dtype, keep_exact):
+        """Test that re-scored top-k equals exact cosine top-k, with or without exact.npy."""
+        collection = InMemoryCollection(vectors)
+        export_quantized_index(collection, str(tmp_path), dtype, keep_exact=keep_exact, page_size=128)
+        wrapped = QuantizedCollection(collection, QuantizedIndex(str(tmp_path), block_rows=100))
+        query = vectors[3] + 0.1
+
+        results = wrapped.query(query_embeddings=[query.tolist()], n_results=5)
+
+        exact = np.argsort(-(normalize(vectors) @ normalize(query)))[:5]
+        assert results["ids"] == [[f"review_{i}" for i in exact]]
+        assert results["documents"][0][0] == f"doc {exact[0]}"
+        assert results["distances"][0] == sorted(results["distances"][0])
+        assert collection.query_calls == 0
+
+    @pytest.mark.parametrize("metric", ["l2", "cosine"])
+    def test_distances_match_chroma_metric(self, tmp_path, vectors, metric):
+        """Test that reported distances are on the collection's scale, as Chroma and numpy_search report them."""
+        unit = normalize(vectors)
+        collection = InMemoryCollection(unit)
+        export_quantized_index(collection, str(tmp_path), "float16", metric=metric)
+        wrapped = QuantizedCollection(collection, QuantizedIndex(str(tmp_path)))
+        query = unit[3]
+
+        results = wrapped.query(query_embeddings=[query.tolist()], n_results=3)
+
+        positions = [int(doc_id.split("_")[1]) for doc_id in results["ids"][0]]
+        if metric == "l2":
+            expected = ((unit[positions] - query) ** 2).sum(axis=1)
+        else:
+            expected = 1.0 - unit[positions] @ query
+        assert results["distances"][0] == pytest.approx(expected.tolist(), abs=1e-5)
+
+    def test_int8_codes_are_a_quarter_of_float32(self, tmp_path, vectors):
+        """Test that the scanned int8 index is about four times smaller than float32."""
+        export_quantized_index(InMemoryCollection(vectors), str(tmp_path), "int8")
+        index = QuantizedIndex(str(tmp_path))
+        assert index.nbytes < vectors.nbytes / 3
+
+    def test_stale_index_and_filters_fall_back_to_chroma(self, tmp_path, vectors):
+        """Test that a side index missing rows, or a where filter, queries Chroma directly."""
+        collection = InMemoryCollection(vectors[:100])
+        export_quantized_index(collection, str(tmp_path), "int8")
+        index = QuantizedIndex(str(tmp_path))
+
+        QuantizedCollection(collection, index).query(query_embeddings=[[0.0] * 32], where={"parent_asin": "B1"})
+        collection.ids.append("review_new")
+        collection.vectors.append([1.0] * 32)
+        stale = QuantizedCollection(collection, index)
+        stale.query(query_embeddings=[[1.0] * 32], n_results=3)
+
+        assert stale.stale
+        assert collection.query_calls == 2
+
+    def test_streaming_insert_marks_a_live_wrapper_stale(self, tmp_path, vectors):
+        """Test that rows added after construction are noticed at the next staleness check."""
+        collection = InMemoryCollection(vectors[:100])
+        export_quantized_index(collection, str(tmp_path), "int8")
+        wrapped = QuantizedCollection(collection, QuantizedIndex(str(tmp_path)), stale_check_seconds=0)
+        wrapped.query(query_embeddings=[[1.0] * 32], n_results=3)
+        assert collection.query_calls == 0
+
+        collection.ids.append("review_new")
+        collection.vectors.append([1.0] * 32)
+        wrapped.query(query_embeddings=[[1.0] * 32], n_results=3)
+
+        assert wrapped.stale
+        assert collection.query_calls == 1
+
+    def test_ids_are_read_from_disk_by_row(self, tmp_path, vectors):
+        """Test that row ids come from ids.sqlite in the requested order, not a list held in memory."""
+        export_quantized_index(InMemoryCollection(vectors), str(tmp_path), "int8", page_size=128)
+        index = QuantizedIndex(str(tmp_path))
+
+        assert not (tmp_path / "ids.json").exists()
+        assert len(index) == 500
+        assert index.ids_at([499, 0, 130]) == ["review_499", "review_0", "review_130"]
+        assert index.ids_at([]) == []
+
+    def test_evaluate_reports_memory_and_recall(self, tmp_path, vectors):
+        """Test that the evaluation reports memory reduction and near-perfect re-scored recall."""
+        collection = InMemoryCollection(vectors)
+        export_quantized_index(collection, str(tmp_path), "int8")
+
+        report = evaluate(collection, QuantizedIndex(str(tmp_path)), query_count=20, k=5)
+
+        assert report["memory_reduction"] > 0.7
+        assert report["rescored_recall_at_5"] >= report["first_pass_recall_at_5"]
+        assert report["rescored_recall_at_5"] > 0.95
+
+    def test_side_index_survives_an_index_swap(self, tmp_path, vectors):
+        """Test that server and session index swaps keep the review collection wrapped in the side index."""
+        from unittest.mock import MagicMock, patch
+
+        import chatbot
+        from chatbot import ChatResources, EcommerceChatbot
+        from server import ChatService, WorkerPool
+        from session_store import create_session_store
+
+        export_quantized_index(InMemoryCollection(vectors), str(tmp_path / "side"), "int8")
+        new_reviews = InMemoryCollection(vectors)
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock())
+        service = ChatService(resources, create_session_store("memory"), WorkerPool(1, 1))
+        bot = EcommerceChatbot(resources=resources, output=lambda text: None)
+
+        with patch.object(chatbot.config, "review_side_index", str(tmp_path / "side")), \
+             patch("chatbot.get_chromadb", return_value=(MagicMock(), MagicMock(), new_reviews)):
+            service.swap_index(str(tmp_path / "chromadb_2"))
+            bot.use_index(str(tmp_path / "chromadb_2"))
+
+        for collection in (service.resources.product_review_collection, bot.product_review_collection):
+            assert isinstance(collection, QuantizedCollection)
+            assert collection._collection is new_reviews
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from metrics import registry
+from query_embedder import MicroBatchEmbedder
+
+
+class RecordingEmbedder:
+    """Embedding function that records the batches it is called with."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        with self._lock:
+            self.batches.append(list(input))
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return [[float(len(text)), 1.0] for text in input]
+
+
+def run_concurrently(embedder, requests):
+    """Call embedder from one thread per request; returns the results in request order."""
+    results = [None] * len(requests)
+    errors = []
+    start = threading.Barrier(len(requests))
+
+    def call(index):
+        start.wait()
+        try:
+            results[index] = embedder(requests[index])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class TestMicroBatchEmbedder:
+    """Test suite for batching concurrent query embeddings."""
+
+    def test_concurrent_queries_share_one_batch(self):
+        """Test that callers inside one window are embedded together and get their own rows back."""
+        inner = RecordingEmbedder()
+        embedder = MicroBatchEmbedder(inner, max_batch_size=64, max_wait_seconds=0.5)
+        requests = [["a" * (index + 1)] for index in range(8)]
+
+        results, errors = run_concurrently(embedder, requests)
+
+        assert not errors
+        assert len(inner.batches) < len(requests)
+        assert sum(len(batch) for batch in inner.batches) == 8
+        assert results == [[[float(index + 1), 1.0]] for index in range(8)]
+
+    def test_full_batch_does_not_wait_for_the_window(self):
+        """Test that reaching max_batch_size closes the window early."""
+        inner = RecordingEmbedder()
+        embedder = MicroBatchEmbedder(inner, max_batch_size=4, max_wait_seconds=30.0)
+
+        results, errors = run_concurrently(embedder, [["x"], ["yy"], ["zzz"], ["wwww"]])
+
+        assert not errors
+        assert results[3] == [[4.0, 1.0]]
+
+    def test_multi_text_calls_keep_their_slices(self):
+        """Test that a call with several texts receives all of its embeddings in order."""
+        embedder = MicroBatchEmbedder(RecordingEmbedder(), max_wait_seconds=0.0)
+
+        assert embedder(["ab", "abcd"]) == [[2.0, 1.0], [4.0, 1.0]]
+        assert embedder([]) == []
+
+    def test_errors_reach_every_caller_in_the_batch(self):
+        """Test that a failing embedding call is raised to each waiting caller."""
+        embedder = MicroBatchEmbedder(RecordingEmbedder(fail=True), max_batch_size=3, max_wait_seconds=30.0)
+
+        _, errors = run_concurrently(embedder, [["a"], ["b"], ["c"]])
+
+        assert len(errors) == 3 and all(isinstance(error, RuntimeError) for error in errors)
+
+    def test_batch_size_and_wait_are_exported(self):
+        """Test that batch sizes and waits are recorded in the metrics registry."""
+        batch_sizes = registry.histogram("query_embedder_batch_size")
+        before = batch_sizes.count
+
+        MicroBatchEmbedder(RecordingEmbedder(), max_wait_seconds=0.0)(["a", "b"])
+
+        assert batch_sizes.count == before + 1
+        assert "query_embedder_wait_seconds_bucket" in registry.render()
@@ -0,0 +1,74 @@
+import json
+
+from retrieval_cutoff import (RetrievalCutoff, apply_cutoff, calibrate, cutoff_report, load_cutoffs,
+                              read_logged_distances, save_cutoffs)
+from tracing import Tracer
+
+
+def query_result(distances):
+    ids = [f"r{position}" for position in range(len(distances))]
+    return {
+        "ids": [ids],
+        "documents": [[f"doc {id}" for id in ids]],
+        "metadatas": [[{"parent_asin": id} for id in ids]],
+        "distances": [list(distances)],
+    }
+
+
+class TestRetrievalCutoff:
+    """Test suite for cutting retrieval results at a distance threshold or gap."""
+
+    def test_max_distance_drops_far_hits(self):
+        """Test that hits farther than max_distance are dropped."""
+        assert RetrievalCutoff(max_distance=0.5).keep([0.1, 0.4, 0.6, 0.9]) == [0, 1]
+
+    def test_gap_ends_the_list_at_the_first_large_jump(self):
+        """Test that a jump of at least min_gap drops every hit after it."""
+        assert RetrievalCutoff(min_gap=0.3).keep([0.10, 0.15, 0.60, 0.62]) == [0, 1]
+
+    def test_min_results_are_always_kept(self):
+        """Test that the nearest min_results hits survive any cutoff."""
+        assert RetrievalCutoff(max_distance=0.05, min_results=2).keep([0.3, 0.4, 0.5]) == [0, 1]
+
+    def test_apply_cutoff_keeps_result_lists_aligned(self):
+        """Test that ids, documents, metadatas and distances are cut together."""
+        results = apply_cutoff(query_result([0.1, 0.2, 0.8]), RetrievalCutoff(max_distance=0.5))
+
+        assert results["ids"] == [["r0", "r1"]]
+        assert results["documents"] == [["doc r0", "doc r1"]]
+        assert results["distances"] == [[0.1, 0.2]]
+
+    def test_calibrate_uses_distance_and_gap_percentiles(self):
+        """Test that calibration fits max_distance and min_gap to the logged distances."""
+        samples = [[0.1, 0.2, 0.3], [0.2, 0.3, 0.9]]
+
+        cutoff = calibrate(samples, distance_quantile=50, gap_quantile=100, min_results=2)
+
+        assert 0.2 <= cutoff.max_distance <= 0.3
+        assert abs(cutoff.min_gap - 0.6) < 1e-9
+        assert cutoff.min_results == 2
+        assert cutoff_report(samples, cutoff)["avg_hits_after"] < 3
+
+    def test_logged_distances_round_trip_through_a_trace_file(self, tmp_path):
+        """Test that cutoff spans written by the tracer are read back per collection."""
+        tracer = Tracer()
+        path = tmp_path / "spans.jsonl"
+        tracer.export_to(str(path))
+        with tracer.span("cutoff", collection="product_review", distances=[0.1, 0.25]):
+            pass
+        with tracer.span("search", collection="product_review"):
+            pass
+
+        assert read_logged_distances(str(path)) == {"product_review": [[0.1, 0.25]]}
+        assert {"key": "distances", "value": {"arrayValue": {"values": [{"doubleValue": 0.1},
+                                                                        {"doubleValue": 0.25}]}}} \
+            in json.loads(path.read_text().splitlines()[0])["attributes"]
+
+    def test_cutoffs_file_round_trip(self, tmp_path):
+        """Test that saved cutoffs load back unchanged."""
+        path = str(tmp_path / "retrieval_cutoffs.json")
+        cutoffs = {"product_meta": RetrievalCutoff(max_distance=0.7, min_gap=0.2, min_results=1)}
+
+        save_cutoffs(path, cutoffs)
+
+        assert load_cutoffs(path) == cutoffs
@@ -0,0 +1,117 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from review_join import JOIN_INDEX_FILENAME, ReviewJoinIndex, fetch_product_reviews, open_review_join
+
+
+class FakeReviewCollection:
+    """Review collection answering get-by-IDs from a dict, with embeddings.
+
+    Like Chroma, it does not return the rows in the order the IDs were requested.
+    """
+
+    def __init__(self, reviews):
+        # id -> (document, metadata, embedding)
+        self.reviews = reviews
+        self.get_calls = []
+
+    def get(self, ids=None, include=None, **kwargs):
+        self.get_calls.append(list(ids))
+        found = sorted((doc_id for doc_id in ids if doc_id in self.reviews), reverse=True)
+        return {
+            "ids": found,
+            "documents": [self.reviews[doc_id][0] for doc_id in found],
+            "metadatas": [self.reviews[doc_id][1] for doc_id in found],
+            "embeddings": [self.reviews[doc_id][2] for doc_id in found] if "embeddings" in include else None,
+        }
+
+
+def review(parent_asin, text, embedding):
+    return text, {"parent_asin": parent_asin}, embedding
+
+
+@pytest.fixture
+def join_index(tmp_path):
+    index = ReviewJoinIndex(str(tmp_path / JOIN_INDEX_FILENAME))
+    index.add(["r1", "r2", "r3", "r4"],
+              [{"parent_asin": "A"}, {"parent_asin": "A"}, {"parent_asin": "B"}, {"parent_asin": "A"}])
+    yield index
+    index.close()
+
+
+class TestReviewJoinIndex:
+    """Test suite for the parent_asin -> review ID join index."""
+
+    def test_review_ids_per_product(self, join_index):
+        """Test that reviews are grouped by product, re-adds are ignored and limits apply per product."""
+        join_index.add(["r1", "r5"], [{"parent_asin": "A"}, {}])
+
+        assert join_index.review_ids(["A", "B", "missing"]) == {"A": ["r1", "r2", "r4"], "B": ["r3"]}
+        assert join_index.review_ids(["A"], limit=2) == {"A": ["r1", "r2"]}
+        assert join_index.count("A") == 3
+
+    def test_open_review_join_reads_an_index_version(self, tmp_path, join_index):
+        """Test that a built index opens read-only and a version without one gives None."""
+        reader = open_review_join(str(tmp_path))
+
+        assert reader.review_ids(["B"]) == {"B": ["r3"]}
+        assert open_review_join(str(tmp_path / "other_version")) is None
+        reader.close()
+
+
+class TestFetchProductReviews:
+    """Test suite for fetching reviews of specific products."""
+
+    def test_unranked_fetch_takes_reviews_round_robin(self, join_index):
+        """Test that without a query embedding reviews come by ID, alternating across products."""
+        collection = FakeReviewCollection({
+            "r1": review("A", "soft", [0.0]), "r2": review("A", "warm", [0.0]),
+            "r3": review("B", "itchy", [0.0]), "r4": review("A", "thin", [0.0]),
+        })
+
+        results = fetch_product_reviews(collection, ["A", "B"], n_results=3, join_index=join_index)
+
+        assert results["ids"] == [["r1", "r3", "r2"]]
+        assert results["documents"] == [["soft", "itchy", "warm"]]
+        assert results["distances"] is None
+
+    def test_products_without_reviews_give_an_empty_result(self, join_index):
+        """Test that no candidates means no collection.get call, which Chroma would reject."""
+        collection = MagicMock()
+
+        results = fetch_product_reviews(collection, ["missing"], join_index=join_index)
+        ranked = fetch_product_reviews(collection, ["missing"], join_index=join_index, query_embedding=[1.0])
+
+        collection.get.assert_not_called()
+        assert results["ids"] == [[]] and results["distances"] is None
+        assert ranked["ids"] == [[]] and ranked["distances"] == [[]]
+
+    def test_ranked_fetch_orders_the_subset_by_similarity(self, join_index):
+        """Test that with a query embedding only the products' reviews are ranked, nearest first."""
+        collection = FakeReviewCollection({
+            "r1": review("A", "soft", [1.0, 0.0]), "r2": review("A", "warm", [0.0, 1.0]),
+            "r3": review("B", "itchy", [0.6, 0.8]), "r4": review("A", "thin", [0.9, 0.1]),
+        })
+
+        results = fetch_product_reviews(collection, ["A"], n_results=2, join_index=join_index,
+                                         query_embedding=[0.0, 1.0])
+
+        assert collection.get_calls == [["r1", "r2", "r4"]]
+        assert results["ids"] == [["r2", "r4"]]
+        assert results["distances"][0][0] == 0.0
+        assert results["distances"][0][1] == pytest.approx(0.81 + 0.81)
+
+    def test_without_join_index_filters_on_parent_asin(self):
+        """Test that a missing join index falls back to a where filter on parent_asin."""
+        collection = MagicMock()
+        collection.get.return_value = {"ids": ["r1"], "documents": ["soft"], "metadatas": [{"parent_asin": "A"}]}
+
+        results = fetch_product_reviews(collection, ["A", "B"], n_results=4)
+        fetch_product_reviews(collection, ["A"], n_results=4, query_embedding=[1.0, 0.0])
+
+        collection.get.assert_called_once_with(where={"parent_asin": {"$in": ["A", "B"]}}, limit=4,
+                                               include=["documents", "metadatas"])
+        collection.query.assert_called_once_with(query_embeddings=[[1.0, 0.0]], n_results=4,
+                                                 where={"parent_asin": {"$in": ["A"]}})
+        assert results["ids"] == [["r1"]]
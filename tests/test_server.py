@@ -0,0 +1,241 @@
+import json
+import threading
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+
+class TestSessionStores:
+    """Test suite for the in-memory and SQLite session stores."""
+
+    @pytest.fixture(params=["memory", "sqlite"])
+    def store(self, request, tmp_path):
+        from session_store import create_session_store
+        if request.param == "memory":
+            return create_session_store("memory")
+        return create_session_store(f"sqlite:///{tmp_path / 'sessions.db'}")
+
+    def test_unknown_session_returns_none(self, store):
+        """Test that loading an unknown session returns None."""
+        assert store.load("missing") is None
+
+    def test_save_and_load_round_trip(self, store):
+        """Test that saved history is returned unchanged."""
+        history = [{"role": "user", "text": "running shoes"}, {"role": "model", "text": "action: QUERY"}]
+        store.save("s1", history)
+        assert store.load("s1") == history
+
+    def test_delete_forgets_session(self, store):
+        """Test that deleted sessions can no longer be loaded."""
+        store.save("s1", [{"role": "user", "text": "hi"}])
+        store.delete("s1")
+        assert store.load("s1") is None
+
+    def test_unknown_spec_raises(self):
+        """Test that an unknown store spec is rejected."""
+        from session_store import create_session_store
+        with pytest.raises(ValueError, match="Unknown session store"):
+            create_session_store("redis://localhost")
+
+
+class TestMetrics:
+    """Test suite for the Prometheus-style metrics registry."""
+
+    def test_render_counter_and_histogram(self):
+        """Test that counters and histograms render in exposition format."""
+        from metrics import MetricsRegistry
+
+        metrics = MetricsRegistry()
+        metrics.counter("turns_total", "Turns").inc(3)
+        latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        latency.observe(0.05)
+        latency.observe(0.5)
+
+        rendered = metrics.render()
+        assert "# TYPE turns_total counter" in rendered
+        assert "turns_total 3.0" in rendered
+        assert 'latency_seconds_bucket{le="0.1"} 1' in rendered
+        assert 'latency_seconds_bucket{le="+Inf"} 2' in rendered
+        assert "latency_seconds_count 2" in rendered
+
+    def test_registry_returns_same_metric_for_same_name(self):
+        """Test that metrics are shared by name and labels."""
+        from metrics import MetricsRegistry
+
+        metrics = MetricsRegistry()
+        assert metrics.counter("a", labels={"x": "1"}) is metrics.counter("a", labels={"x": "1"})
+        assert metrics.counter("a", labels={"x": "1"}) is not metrics.counter("a", labels={"x": "2"})
+
+
+class TestChatServer:
+    """Test suite for the HTTP serving mode."""
+
+    @pytest.fixture
+    def server(self):
+        from chatbot import ChatResources
+        from models import ServerConfig
+        from server import make_server
+
+        main_model = MagicMock()
+        chat = main_model.start_chat.return_value
+        chat.last.text = 'action: DISPLAY\nparameters:\n  message: "Hello there"'
+        chat.send_message.return_value = chat.last
+        main_model.start_chat.return_value.history = []
+        resources = ChatResources(main_model, MagicMock(), MagicMock(), MagicMock(), MagicMock())
+
+        httpd = make_server(ServerConfig(port=0), resources=resources)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        yield httpd, main_model
+        httpd.shutdown()
+        httpd.server_close()
+
+    def _url(self, httpd, path):
+        host, port = httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def test_chat_streams_reply_chunks(self, server):
+        """Test that POST /chat streams NDJSON chunks ending with a done marker."""
+        httpd, main_model = server
+        request = urllib.request.Request(
+            self._url(httpd, "/chat"),
+            data=json.dumps({"session_id": "s1", "message": "hi"}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            events = [json.loads(line) for line in response.read().decode("utf-8").splitlines()]
+
+        assert events[-1] == {"type": "done", "session_id": "s1"}
+        assert any("Hello there" in event.get("text", "") for event in events)
+
+    def test_sessions_share_resources(self, server):
+        """Test that every session starts its chat on the shared main model."""
+        httpd, main_model = server
+        for session_id in ("a", "b"):
+            request = urllib.request.Request(
+                self._url(httpd, "/chat"),
+                data=json.dumps({"session_id": session_id, "message": "hi"}).encode("utf-8"),
+            )
+            urllib.request.urlopen(request).read()
+
+        assert main_model.start_chat.call_count == 2
+
+    def test_sessions_are_stored_as_compact_state(self, server):
+        """Test that the store holds a SessionState dict that the next turn resumes from."""
+        httpd, main_model = server
+        store = httpd.RequestHandlerClass.service.store
+        for message in ("hi", "anything in blue?"):
+            request = urllib.request.Request(
+                self._url(httpd, "/chat"),
+                data=json.dumps({"session_id": "s1", "message": message}).encode("utf-8"),
+            )
+            urllib.request.urlopen(request).read()
+
+        data = store.load("s1")
+        assert data["v"] == 1
+        assert [turn[0] for turn in data["turns"]] == ["hi", "anything in blue?"]
+        history = main_model.start_chat.call_args.kwargs["history"]
+        assert history[0] == {"role": "user", "parts": ["hi"]}
+
+    def test_metrics_endpoint(self, server):
+        """Test that /metrics exposes turn counters."""
+        httpd, _ = server
+        with urllib.request.urlopen(self._url(httpd, "/metrics")) as response:
+            body = response.read().decode("utf-8")
+        assert "chatbot_turns_total" in body
+
+
+class TestChatService:
+    """Test suite for per-session serialization and error handling."""
+
+    def _service(self, store=None):
+        from chatbot import ChatResources
+        from server import ChatService
+
+        resources = ChatResources(MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock())
+        return ChatService(resources, store or MagicMock(), MagicMock())
+
+    def test_session_locks_are_a_fixed_pool(self):
+        """Test that abandoned sessions leave nothing behind and a session always gets the same lock."""
+        from server import SESSION_LOCK_STRIPES
+
+        service = self._service()
+        locks = {id(service._session_lock(f"session-{i}")) for i in range(10000)}
+
+        assert len(locks) <= SESSION_LOCK_STRIPES
+        assert len(service._session_locks) == SESSION_LOCK_STRIPES
+        assert service._session_lock("s1") is service._session_lock("s1")
+
+    def test_turn_errors_are_logged_not_sent_to_clients(self, caplog):
+        """Test that an unexpected error reaches the log while the client gets the generic message."""
+        store = MagicMock()
+        store.load.side_effect = RuntimeError("sqlite:///var/lib/chatbot/sessions.db is locked")
+        chunks = []
+
+        with caplog.at_level("ERROR", logger="server"):
+            self._service(store)._run_turn("s1", "hi", chunks.append)
+
+        assert chunks == ["I'm sorry, an unexpected error occurred while processing your request. Please try again."]
+        assert "sessions.db is locked" in caplog.text
+
+
+class TestServerCommandLine:
+    """Test suite for the server's command line."""
+
+    @pytest.fixture
+    def start(self, monkeypatch):
+        import dataclasses
+        import sys
+
+        import chatbot
+        import server
+
+        monkeypatch.setattr(chatbot, "config", dataclasses.replace(chatbot.config))
+        monkeypatch.setattr(server, "make_server", MagicMock())
+
+        def start(*argv):
+            monkeypatch.setattr(sys, "argv", ["server.py", *argv])
+            server.start_server()
+            return chatbot.config
+
+        return start
+
+    def test_retrieval_options_are_shared_with_the_chatbot(self, start):
+        """Test that the server accepts the chatbot's retrieval options, and --serve from chatbot.py."""
+        config = start("--serve", "--review-side-index", "indexes/review_int8", "--diversify", "mmr", "--plan-cache")
+
+        assert config.review_side_index == "indexes/review_int8"
+        assert config.diversify_strategy == "mmr"
+        assert config.plan_cache_enabled
+
+    def test_query_embedding_batching_is_on_only_for_the_server(self, start):
+        """Test that the server waits for query embedding batches by default and the chatbot does not."""
+        from models import ChatbotConfig, ServerConfig
+
+        assert ChatbotConfig().query_embed_wait_ms == 0
+        assert start().query_embed_wait_ms == ServerConfig().query_embed_wait_ms > 0
+        assert start("--query-embed-wait-ms", "0").query_embed_wait_ms == 0
+
+    def test_mistyped_options_are_rejected(self, start, capsys):
+        """Test that an unknown flag is an error rather than silently ignored."""
+        with pytest.raises(SystemExit):
+            start("--workes", "8")
+        assert "unrecognized arguments: --workes" in capsys.readouterr().err
+
+
+class TestWorkerPool:
+    """Test suite for server backpressure."""
+
+    def test_pool_rejects_when_saturated(self):
+        """Test that submissions beyond max_pending raise ServerOverloadedError."""
+        from exceptions import ServerOverloadedError
+        from server import WorkerPool
+
+        release = threading.Event()
+        pool = WorkerPool(max_workers=1, max_pending=1)
+        pool.submit(release.wait)
+        with pytest.raises(ServerOverloadedError):
+            pool.submit(lambda: None)
+        release.set()
+        pool.shutdown()
@@ -0,0 +1,96 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from models import TurnRecord
+from session_state import MAX_TURNS, SessionState, load_session_state
+
+
+QUERY_REPLY = 'action: QUERY\nparameters:\n  query_text: "trail running shoes"\n  collection: "product_meta"\n  n_results: 2'
+DISPLAY_REPLY = 'action: DISPLAY\nparameters:\n  message: "Here are two trail shoes"'
+
+
+def query_turn():
+    return TurnRecord(user_input="trail running shoes under $80", actions=["QUERY", "DISPLAY"],
+                      retrieved_ids=["A1", "B2"], queries=["trail running shoes"],
+                      messages=["Here are two trail shoes"])
+
+
+class TestSessionState:
+    """Test suite for compact conversation state."""
+
+    def test_record_turn_keeps_digest_ids_and_constraints(self):
+        """Test that a turn leaves a digest, its retrieved IDs and the stated constraints."""
+        state = SessionState()
+        state.record_turn(query_turn())
+        state.record_turn(TurnRecord(user_input="thanks", actions=["DISPLAY"], messages=["You're welcome!"]))
+
+        assert [digest.user for digest in state.turns] == ["trail running shoes under $80", "thanks"]
+        assert state.turns[0].actions == ["QUERY", "DISPLAY"] and state.turns[0].query == "trail running shoes"
+        assert state.last_retrieved_ids == ["A1", "B2"]
+        assert state.constraints == {"query": "trail running shoes", "max_price": "80"}
+
+    def test_only_recent_turns_are_kept(self):
+        """Test that the state keeps at most MAX_TURNS digests, newest last."""
+        state = SessionState()
+        for index in range(MAX_TURNS + 3):
+            state.record_turn(TurnRecord(user_input=f"message {index}"))
+
+        assert len(state.turns) == MAX_TURNS
+        assert state.turns[-1].user == f"message {MAX_TURNS + 2}"
+
+    def test_dict_round_trip_through_json(self):
+        """Test that the compact form survives JSON and rebuilds the same state."""
+        state = SessionState()
+        state.record_turn(query_turn())
+
+        restored = SessionState.from_dict(json.loads(json.dumps(state.to_dict())))
+
+        assert restored == state
+
+    def test_unknown_version_is_rejected(self):
+        """Test that a state written by an incompatible version is not misread."""
+        with pytest.raises(ValueError, match="Unsupported session state version"):
+            SessionState.from_dict({"v": 99, "turns": []})
+
+    def test_legacy_history_drops_rag_payloads(self):
+        """Test that stored full histories load without their RAG follow-up prompts."""
+        records = [
+            {"role": "user", "text": "trail running shoes"},
+            {"role": "model", "text": QUERY_REPLY},
+            {"role": "user", "text": "Based on the user's last query... RAG Results: {'ids': [['A1']]}"},
+            {"role": "model", "text": DISPLAY_REPLY},
+        ]
+
+        state = load_session_state(records)
+
+        assert len(state.turns) == 1
+        assert state.turns[0].user == "trail running shoes"
+        assert "Here are two trail shoes" in state.turns[0].reply
+        assert load_session_state(None) == SessionState()
+
+
+class TestSessionResume:
+    """Test suite for continuing a conversation from its compact state in a new chatbot."""
+
+    def test_resumed_chat_has_digests_but_no_rag_results(self):
+        """Test that a second chatbot resumes from the state without the first one's RAG prompt."""
+        from chatbot import ChatResources, EcommerceChatbot
+        from fake_gemini import FakeGeminiEndpoint
+
+        main_model = FakeGeminiEndpoint(reply=lambda prompt: DISPLAY_REPLY if "RAG Results" in prompt else QUERY_REPLY)
+        meta_col = MagicMock()
+        meta_col.query.return_value = {"ids": [["A1", "B2"]], "documents": [["a" * 2000, "b" * 2000]],
+                                       "metadatas": [[{}, {}]]}
+        resources = ChatResources(main_model, MagicMock(), MagicMock(), meta_col, MagicMock())
+        first = EcommerceChatbot(resources=resources, output=lambda text: None)
+        first.process_user_input("trail running shoes under $80")
+
+        data = json.loads(json.dumps(first.state.to_dict()))
+        second = EcommerceChatbot(resources=resources, output=lambda text: None, state=load_session_state(data))
+
+        history_text = " ".join(part.text for content in second.conversation.history for part in content.parts)
+        assert "RAG Results" not in history_text
+        assert "trail running shoes under $80" in history_text and "A1" in history_text
+        assert len(json.dumps(data)) * 4 < len(str(first.conversation.history))
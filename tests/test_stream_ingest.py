@@ -0,0 +1,168 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from document_ids import last_per_id, meta_document_id, review_document_id
+from review_join import ReviewJoinIndex
+from stream_ingest import JsonlTailer, OffsetStore, StreamIngester, meta_document
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def review(index, text="fits well"):
+    return {"parent_asin": f"B{index:03d}", "user_id": f"U{index}", "timestamp": index, "text": text}
+
+
+def append(path, *records, partial=""):
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.write(partial)
+
+
+def upserted_ids(collection):
+    return [doc_id for call in collection.upsert.call_args_list for doc_id in call.kwargs["ids"]]
+
+
+class TestStreamIngest:
+    """Test suite for tailing, micro-batching and durable offsets."""
+
+    @pytest.fixture
+    def stream(self, tmp_path):
+        source = tmp_path / "incoming.jsonl"
+        source.write_text("")
+        offsets_path = str(tmp_path / "offsets.json")
+        clock = FakeClock()
+        collection = MagicMock()
+
+        def make_ingester(batch_size=3):
+            tailer = JsonlTailer(str(source), OffsetStore(offsets_path), clock=clock)
+            return StreamIngester(collection, tailer, batch_size=batch_size, max_wait_seconds=2.0, clock=clock)
+
+        return source, clock, collection, make_ingester
+
+    def test_flushes_on_size_and_on_wait(self, stream):
+        """Test that a full batch flushes immediately and a partial one after max_wait."""
+        source, clock, collection, make_ingester = stream
+        ingester = make_ingester()
+        append(source, review(1), review(2), review(3), review(4))
+
+        assert ingester.poll() == 3
+        assert ingester.poll() == 0
+        clock.now += 2.0
+        assert ingester.poll() == 1
+        assert collection.upsert.call_count == 2
+
+    def test_partial_line_waits_for_newline(self, stream):
+        """Test that a line still being written is not ingested until it is complete."""
+        source, clock, collection, make_ingester = stream
+        ingester = make_ingester(batch_size=1)
+        append(source, review(1), partial='{"parent_asin": "B002", "text": "hal')
+
+        assert ingester.poll() == 1
+        with open(source, 'a', encoding='utf-8') as f:
+            f.write('f written", "user_id": "U2", "timestamp": 2}\n')
+        assert ingester.poll() == 1
+        assert collection.upsert.call_args.kwargs["documents"] == ["half written"]
+
+    def test_restart_resumes_from_committed_offset(self, stream):
+        """Test that a new ingester skips records whose upsert was committed."""
+        source, clock, collection, make_ingester = stream
+        append(source, review(1), review(2))
+        make_ingester(batch_size=2).poll()
+        append(source, review(3))
+
+        restarted = make_ingester(batch_size=1)
+        assert restarted.poll() == 1
+        assert upserted_ids(collection)[-1].startswith("review_B003_")
+        assert len(upserted_ids(collection)) == 3
+
+    def test_failed_upsert_is_replayed_with_same_ids(self, stream):
+        """Test that records are read again after a failed upsert and keep stable IDs."""
+        source, clock, collection, make_ingester = stream
+        ingester = make_ingester(batch_size=2)
+        append(source, review(1), review(2))
+        collection.upsert.side_effect = [RuntimeError("chroma unavailable"), None]
+
+        with pytest.raises(RuntimeError):
+            ingester.poll()
+        assert ingester.poll() == 2
+        first, second = (call.kwargs["ids"] for call in collection.upsert.call_args_list)
+        assert first == second
+
+    def test_review_upserts_are_recorded_in_the_join_index(self, stream, tmp_path):
+        """Test that streamed reviews become fetchable by parent_asin once upserted."""
+        source, clock, collection, _ = stream
+        join_index = ReviewJoinIndex(str(tmp_path / "review_join.sqlite"))
+        tailer = JsonlTailer(str(source), OffsetStore(str(tmp_path / "offsets.json")), clock=clock)
+        ingester = StreamIngester(collection, tailer, batch_size=2, clock=clock, join_index=join_index)
+        append(source, review(1), review(2))
+
+        ingester.poll()
+
+        assert join_index.review_ids(["B001", "B002"]) == {"B001": [upserted_ids(collection)[0]],
+                                                            "B002": [upserted_ids(collection)[1]]}
+        join_index.close()
+
+    def test_truncated_file_is_read_from_start(self, stream):
+        """Test that a file replaced by a shorter one is ingested again from byte 0."""
+        source, clock, collection, make_ingester = stream
+        ingester = make_ingester(batch_size=2)
+        append(source, review(1), review(2))
+        ingester.poll()
+
+        source.write_text(json.dumps(review(9)) + "\n")
+        assert ingester.poll() == 0
+        clock.now += 2.0
+        assert ingester.poll() == 1
+        assert upserted_ids(collection)[-1].startswith("review_B009_")
+
+    def test_directory_source_and_skipped_records(self, tmp_path):
+        """Test that every *.jsonl in a directory is tailed and records without text are skipped."""
+        (tmp_path / "a.jsonl").write_text(json.dumps(review(1)) + "\n")
+        (tmp_path / "b.jsonl").write_text(json.dumps(review(2, text="")) + "\nnot json\n")
+        (tmp_path / "notes.txt").write_text("ignored\n")
+        collection = MagicMock()
+        ingester = StreamIngester(collection, JsonlTailer(str(tmp_path), OffsetStore(str(tmp_path / "o.json"))),
+                                  batch_size=2)
+
+        assert ingester.poll() == 1
+        offsets = json.loads((tmp_path / "o.json").read_text())["files"]
+        assert set(offsets) == {str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl")}
+
+    def test_ids_match_the_builders_and_repeats_collapse(self, stream):
+        """Test that streamed IDs are the builders' IDs and a repeated record is upserted once."""
+        source, clock, collection, make_ingester = stream
+        ingester = make_ingester(batch_size=2)
+        append(source, review(1, "first"), review(1, "edited"))
+
+        assert ingester.poll() == 2
+        assert collection.upsert.call_args.kwargs["ids"] == [review_document_id(review(1))]
+        assert collection.upsert.call_args.kwargs["documents"] == ["edited"]
+        assert meta_document({"parent_asin": "B001", "title": "Hat"})[1] == meta_document_id({"parent_asin": "B001"})
+        assert last_per_id(["a", "b", "a"], [1, 2, 3]) == (["b", "a"], [2, 3])
+
+    def test_new_index_version_replays_the_stream(self, stream, tmp_path):
+        """Test that offsets committed against one index version are dropped for another."""
+        source, clock, collection, make_ingester = stream
+        offsets_path = str(tmp_path / "offsets.json")
+        offsets = OffsetStore(offsets_path)
+        assert not offsets.follow("chromadbs/v1")
+        ingester = StreamIngester(collection, JsonlTailer(str(source), offsets, clock=clock), batch_size=2, clock=clock)
+        append(source, review(1), review(2))
+        assert ingester.poll() == 2
+
+        assert not OffsetStore(offsets_path).follow("chromadbs/v1")
+        assert offsets.follow("chromadbs/v2")
+        ingester.tailer.rewind()
+
+        assert ingester.poll() == 2
+        assert upserted_ids(collection)[2:] == upserted_ids(collection)[:2]
+        assert OffsetStore(offsets_path).index_path == "chromadbs/v2"
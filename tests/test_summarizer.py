@@ -0,0 +1,93 @@
+import threading
+import time
+
+
+def _results(prefix, count):
+    return {
+        "ids": [[f"{prefix}_{i}" for i in range(count)]],
+        "documents": [[f"{prefix} document {i} " + "x" * 200 for i in range(count)]],
+        "metadatas": [[{"parent_asin": f"B{i:04d}"} for i in range(count)]],
+    }
+
+
+class TestChunking:
+    """Test suite for splitting retrieved results into token-sized chunks."""
+
+    def test_format_results_keeps_metadata(self):
+        """Test that each document becomes one labelled line with its metadata."""
+        from summarizer import format_results
+
+        items = format_results(_results("review", 2), "product_review")
+        assert len(items) == 2
+        assert items[0].startswith("[product_review] (parent_asin=B0000) review document 0")
+
+    def test_chunks_respect_token_budget(self):
+        """Test that no chunk exceeds the budget and no item is lost."""
+        from summarizer import CHARS_PER_TOKEN, chunk_items
+
+        items = [f"item {i} " + "y" * 150 for i in range(40)]
+        chunks = chunk_items(items, chunk_tokens=200)
+        assert all(len(chunk) <= 200 * CHARS_PER_TOKEN for chunk in chunks)
+        assert sum(chunk.count("item ") for chunk in chunks) == 40
+
+    def test_oversized_item_is_split(self):
+        """Test that a single item larger than a chunk is split rather than dropped."""
+        from summarizer import chunk_items
+
+        chunks = chunk_items(["z" * 1000], chunk_tokens=100)
+        assert "".join(chunks) == "z" * 1000
+
+
+class TestMapReduceSummarizer:
+    """Test suite for the parallel map-reduce summarizer."""
+
+    def test_every_document_reaches_a_map_call(self):
+        """Test that nothing is truncated: all documents are summarized."""
+        from fake_gemini import FakeGeminiEndpoint
+        from summarizer import MapReduceSummarizer
+
+        endpoint = FakeGeminiEndpoint(reply="- note")
+        result = MapReduceSummarizer(endpoint, chunk_tokens=300).summarize(
+            "tell me more about running shoes", _results("meta", 20), _results("review", 30))
+
+        prompts = "\n".join(endpoint.calls)
+        assert all(f"meta document {i} " in prompts for i in range(20))
+        assert all(f"review document {i} " in prompts for i in range(30))
+        assert result.chunk_count == len(endpoint.calls) - 1  # one reduce call
+        assert result.response.text == "- note"
+        assert result.map_seconds >= 0 and result.reduce_seconds >= 0
+
+    def test_usage_covers_every_call(self):
+        """Test that token usage sums the map, combine and reduce calls, not only the final response."""
+        from fake_gemini import FakeGeminiEndpoint, make_response
+        from summarizer import MapReduceSummarizer
+
+        endpoint = FakeGeminiEndpoint(reply="- " + "n" * 300)
+        result = MapReduceSummarizer(endpoint, chunk_tokens=200).summarize(
+            "tell me more", _results("meta", 10), _results("review", 10))
+
+        expected = [make_response(prompt, "- " + "n" * 300).usage_metadata for prompt in endpoint.calls]
+        assert len(endpoint.calls) > result.chunk_count + 1  # at least one combine round ran
+        assert result.usage_metadata.prompt_token_count == sum(u.prompt_token_count for u in expected)
+        assert result.usage_metadata.candidates_token_count == sum(u.candidates_token_count for u in expected)
+        assert result.usage_metadata.prompt_token_count > result.response.usage_metadata.prompt_token_count
+
+    def test_map_parallelism_is_bounded(self):
+        """Test that no more than max_workers chunk summaries run at once."""
+        from fake_gemini import FakeGeminiEndpoint
+        from summarizer import MapReduceSummarizer
+
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def reply(prompt):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return "- note"
+
+        MapReduceSummarizer(FakeGeminiEndpoint(reply=reply), chunk_tokens=100, max_workers=3).summarize(
+            "summary", _results("meta", 20), _results("review", 20))
+        assert 1 < peak[0] <= 3
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from tracing import InMemorySpanExporter, Tracer
+
+
+class TestTracer:
+    """Test suite for nested spans, exporters and latency summaries."""
+
+    def test_spans_nest_within_a_trace(self):
+        """Test that child spans share the trace id and point at their parent."""
+        tracer, exporter = Tracer(), InMemorySpanExporter()
+        tracer.add_exporter(exporter)
+
+        with tracer.span("turn") as turn:
+            with tracer.span("planning", model="main"):
+                pass
+        with tracer.span("turn") as second:
+            pass
+
+        planning = exporter.spans[0]
+        assert planning.parent_id == turn.span_id
+        assert planning.trace_id == turn.trace_id
+        assert planning.attributes == {"model": "main"}
+        assert second.parent_id is None and second.trace_id != turn.trace_id
+        assert tracer.current_span() is None
+
+    def test_errors_are_recorded_and_reraised(self):
+        """Test that an exception marks the span as failed without being swallowed."""
+        tracer, exporter = Tracer(), InMemorySpanExporter()
+        tracer.add_exporter(exporter)
+
+        with pytest.raises(ValueError):
+            with tracer.span("parse"):
+                raise ValueError("bad yaml")
+
+        assert exporter.spans[0].error == "ValueError: bad yaml"
+        assert exporter.spans[0].to_otel()["status"]["code"] == "STATUS_CODE_ERROR"
+
+    def test_json_lines_export(self, tmp_path):
+        """Test that spans are written as OpenTelemetry-style JSON lines."""
+        tracer = Tracer()
+        path = tmp_path / "spans.jsonl"
+        tracer.export_to(str(path))
+
+        with tracer.span("search", collection="product_meta", n_results=5):
+            pass
+
+        record = json.loads(path.read_text().strip())
+        assert record["name"] == "search"
+        assert record["endTimeUnixNano"] >= record["startTimeUnixNano"]
+        assert {"key": "n_results", "value": {"intValue": "5"}} in record["attributes"]
+
+    def test_latency_summary_percentiles(self):
+        """Test that p50/p95/p99 are aggregated per span name."""
+        tracer = Tracer(window=3)
+        for _ in range(5):
+            with tracer.span("embed"):
+                pass
+
+        summary = tracer.latency_summary()
+        assert summary["embed"]["count"] == 3
+        assert summary["embed"]["p50"] <= summary["embed"]["p99"]
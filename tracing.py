@@ -0,0 +1,182 @@
+"""Per-turn tracing spans for the chat pipeline.
+
+Spans nest per thread (turn -> planning, parse, retrieval -> embed/search, ...). Finished
+spans feed a per-name latency window for p50/p95/p99 summaries and the chatbot_span_seconds
+histogram, and can be exported as JSON lines shaped like OpenTelemetry span records.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Protocol
+
+from metrics import registry, summarize_latencies
+
+
+@dataclass
+class Span:
+    """A timed operation within a trace."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_otel(self) -> Dict[str, Any]:
+        """Render the span as an OpenTelemetry-style JSON record."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+        }
+
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otel_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter(Protocol):
+    """Receives every finished span."""
+
+    def export(self, span: Span) -> None:
+        ...
+
+
+class JsonLinesSpanExporter:
+    """Appends finished spans to a file, one OpenTelemetry-style JSON record per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_otel()) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in a list (tests and ad-hoc inspection)."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+class Tracer:
+    """Creates nested spans and aggregates their latencies by name."""
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._exporters: List[SpanExporter] = []
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        with self._lock:
+            self._exporters.append(exporter)
+
+    def remove_exporter(self, exporter: SpanExporter) -> None:
+        with self._lock:
+            self._exporters.remove(exporter)
+
+    def export_to(self, path: str) -> JsonLinesSpanExporter:
+        """Start writing finished spans to a JSON lines file."""
+        exporter = JsonLinesSpanExporter(path)
+        self.add_exporter(exporter)
+        return exporter
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current_span(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time a block as a child of the current span (or as a new trace)."""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        stack.append(span)
+        span.start_ns = time.time_ns()
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            span.end_ns = span.start_ns + int(elapsed * 1e9)
+            stack.pop()
+            self._finish(span, elapsed)
+
+    def _finish(self, span: Span, elapsed: float) -> None:
+        registry.histogram("chatbot_span_seconds", "Duration of chat pipeline spans",
+                           labels={"span": span.name}).observe(elapsed)
+        with self._lock:
+            window = self._latencies.get(span.name)
+            if window is None:
+                window = self._latencies[span.name] = deque(maxlen=self.window)
+            window.append(elapsed)
+            exporters = list(self._exporters)
+        for exporter in exporters:
+            exporter.export(span)
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, mean and p50/p95/p99 per span name over the recent window."""
+        with self._lock:
+            snapshot = {name: list(values) for name, values in self._latencies.items()}
+        return {name: summarize_latencies(values) for name, values in sorted(snapshot.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+
+
+# Process-wide tracer shared by the chatbot, server and batch runner
+tracer = Tracer()